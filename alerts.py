@@ -0,0 +1,119 @@
+"""
+Women Security System - Alert Queue
+Queue of safety events (geofence exits, movement anomalies, missed
+check-ins...) waiting to be delivered to a user's app or contacts.
+
+Producers call publish(); the dashboard polls GET /api/alerts, which drains
+the user's queue. Once the app calls use_database(), pending events are rows
+of the alerts table, so an event published by one worker is delivered by
+whichever worker serves the poll, and a drain takes its rows in one write
+transaction, so two polls never both get an event. Without a database
+(tools, tests) events are kept in memory. Listeners registered with
+subscribe() are called in the publishing process for every event, e.g. to
+forward them to SMS or push notifications.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+# Undelivered events kept per user; the oldest are dropped beyond this
+MAX_PENDING_PER_USER = 100
+
+
+def ensure_schema(cursor):
+    """Create the alerts table; run on the main database"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            event TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_user ON alerts (user_id, id)')
+
+
+class AlertQueue:
+    def __init__(self, max_pending=MAX_PENDING_PER_USER, connect=None):
+        self._max_pending = max_pending
+        self._connect = connect
+        self._pending = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def use_database(self, connect):
+        """Keep pending events in the alerts table of connect()'s database, shared by every worker"""
+        self._connect = connect
+
+    def publish(self, user_id, kind, **details):
+        """Queue an event for a user and notify listeners; returns the event"""
+        event = {'kind': kind, 'user_id': user_id, 'time': time.time(), **details}
+        if self._connect is not None:
+            self._store(user_id, event)
+        else:
+            with self._lock:
+                pending = self._pending.get(user_id)
+                if pending is None:
+                    pending = self._pending[user_id] = deque(maxlen=self._max_pending)
+                pending.append(event)
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"Alert listener failed: {e}")
+        return event
+
+    def _store(self, user_id, event):
+        conn = self._connect()
+        try:
+            conn.execute('INSERT INTO alerts (user_id, event) VALUES (?, ?)', (user_id, json.dumps(event)))
+            # Drop the oldest beyond max_pending
+            conn.execute('''
+                DELETE FROM alerts WHERE user_id = ? AND id <= (
+                    SELECT id FROM alerts WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)
+            ''', (user_id, user_id, self._max_pending))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def drain(self, user_id):
+        """Remove and return a user's pending events, oldest first"""
+        if self._connect is None:
+            with self._lock:
+                pending = self._pending.pop(user_id, None)
+            return list(pending) if pending else []
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT id, event FROM alerts WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+            if rows:
+                conn.execute('DELETE FROM alerts WHERE user_id = ? AND id <= ?', (user_id, rows[-1][0]))
+            conn.commit()
+        finally:
+            conn.close()
+        return [json.loads(event) for _, event in rows]
+
+    def pending_count(self, user_id):
+        if self._connect is None:
+            with self._lock:
+                pending = self._pending.get(user_id)
+                return len(pending) if pending else 0
+        conn = self._connect()
+        try:
+            return conn.execute('SELECT COUNT(*) FROM alerts WHERE user_id = ?', (user_id,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            self._listeners.remove(listener)
+
+
+alert_queue = AlertQueue()
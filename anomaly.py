@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Women Security System - Movement Anomaly Detection
+Streaming detector fed by every stored location ping, plus a vectorized
+replay of historical tracks.
+
+Two kinds of events are raised and pushed to the alert queue:
+- speed_jump: the speed since the last ping is above an absolute limit, or far
+  above the user's running average (mean + Z_THRESHOLD standard deviations)
+- dwell: the user has stayed within DWELL_RADIUS_M of the first point of the
+  stop for DWELL_SECONDS, somewhere that is not one of their safe zones. As in
+  ping_filter.py, distance is measured from that first point, so GPS jitter
+  never ends a stop the way crossing a fixed grid line would
+
+Per-user state is a fixed handful of numbers (last point, count/sum/sum of
+squares of speeds, where the current stop started and when), so memory
+doesn't grow with history, and users not seen for IDLE_SECONDS are dropped.
+
+The state must see every ping of a user in order: with several workers, a
+worker only gets some of them, and comparing a ping with the last one that
+worker happened to see raises false jumps and dwells. So the app doesn't feed
+the detector from requests. One worker (a leader job, see create_jobs() in
+app.py) calls sync(), which reads the pings stored by every worker since the
+last call, shard by shard in id order. Speeds only use prefix sums, and the replay below
+finds where each stop ends with a few array passes, so it gets exactly the
+same events with numpy array operations.
+
+Replay over the database:
+    python anomaly.py replay [--db security_system.db] [--shards N] [--user-id N]
+"""
+
+import argparse
+import heapq
+import math
+import os
+import sys
+import time
+
+import db_location
+import geo
+import sharding
+import track_archive
+from alerts import alert_queue
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SPEED_LIMIT_MPS = 70.0        # ~250 km/h: faster than any ground travel
+MIN_JUMP_SPEED_MPS = 15.0     # below ~54 km/h a jump is never flagged on statistics alone
+Z_THRESHOLD = 4.0
+MIN_SAMPLES = 10
+DWELL_SECONDS = 20 * 60
+DWELL_RADIUS_M = 100.0
+# Offsets the replay checks for every point before following stops one by one
+STOP_SCAN = 4
+# Users without a ping for this long are forgotten (seconds)
+IDLE_SECONDS = 3600
+# Seconds between the app's reads of newly stored pings
+SYNC_INTERVAL = 5.0
+
+_M_PER_DEG = math.pi * geo.EARTH_RADIUS_M / 180
+
+
+class _UserState:
+    __slots__ = ('lat', 'lon', 'ts', 'n', 'total', 'total_sq', 'stop_lat', 'stop_lon', 'stop_cos', 'stop_since',
+                 'dwell_reported')
+
+    def __init__(self, lat, lon, ts):
+        self.lat = lat
+        self.lon = lon
+        self.ts = ts
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.start_stop(lat, lon, ts)
+
+    def start_stop(self, lat, lon, ts):
+        self.stop_lat = lat
+        self.stop_lon = lon
+        self.stop_cos = math.cos(math.radians(lat))
+        self.stop_since = ts
+        self.dwell_reported = False
+
+
+def _radius_deg2(radius_m):
+    # Squared radius in degrees of latitude; distances are equirectangular, exact enough at this scale
+    return (radius_m / _M_PER_DEG) ** 2
+
+
+def _speed_anomalous(speed, n, total, total_sq):
+    if speed > SPEED_LIMIT_MPS:
+        return True
+    if n < MIN_SAMPLES or speed < MIN_JUMP_SPEED_MPS:
+        return False
+    mean = total / n
+    std = math.sqrt(max(total_sq / n - mean * mean, 0.0))
+    return speed > mean + Z_THRESHOLD * std
+
+
+class MovementDetector:
+    def __init__(self, alerts=alert_queue, is_usual_place=None, radius_m=DWELL_RADIUS_M):
+        self.alerts = alerts
+        # Callable (user_id, lat, lon) -> True for places where dwelling is expected
+        self.is_usual_place = is_usual_place
+        self.radius_deg2 = _radius_deg2(radius_m)
+        self._states = {}
+        # Last stored ping id read per shard, None until the first sync()
+        self._last_ping_ids = None
+        self._last_sweep = 0.0
+
+    def __len__(self):
+        return len(self._states)
+
+    def sync(self, shard_connects, now=None):
+        """Feed the pings stored since the last call (the first call only notes where to start);
+        returns the events raised"""
+        now = time.time() if now is None else now
+        events = []
+        if self._last_ping_ids is None or len(self._last_ping_ids) != len(shard_connects):
+            self._last_ping_ids = [None] * len(shard_connects)
+        for index, shard_connect in enumerate(shard_connects):
+            conn = shard_connect()
+            try:
+                if self._last_ping_ids[index] is None:
+                    self._last_ping_ids[index] = conn.execute(
+                        'SELECT COALESCE(MAX(id), 0) FROM location_tracking').fetchone()[0]
+                    continue
+                rows = conn.execute('''
+                    SELECT id, user_id, latitude, longitude, CAST(strftime('%s', timestamp) AS INTEGER)
+                    FROM location_tracking WHERE id > ? ORDER BY id
+                ''', (self._last_ping_ids[index],)).fetchall()
+            finally:
+                conn.close()
+            for ping_id, user_id, lat, lon, ts in rows:
+                self._last_ping_ids[index] = ping_id
+                if lat is not None and lon is not None and ts is not None:
+                    events += self.update(user_id, lat, lon, ts)
+        if now - self._last_sweep >= IDLE_SECONDS / 10:
+            self._last_sweep = now
+            self.evict_idle(now)
+        return events
+
+    def evict_idle(self, now=None):
+        """Forget users not seen for IDLE_SECONDS; returns how many"""
+        cutoff = (time.time() if now is None else now) - IDLE_SECONDS
+        idle = [user_id for user_id, state in self._states.items() if state.ts < cutoff]
+        for user_id in idle:
+            del self._states[user_id]
+        return len(idle)
+
+    def update(self, user_id, lat, lon, ts=None):
+        """Feed one position; returns the events it raised"""
+        if ts is None:
+            ts = time.time()
+        state = self._states.get(user_id)
+        if state is None:
+            self._states[user_id] = _UserState(lat, lon, ts)
+            return []
+
+        events = []
+        dt = ts - state.ts
+        if dt > 0:
+            distance = geo.haversine_m(state.lat, state.lon, lat, lon)
+            speed = distance / dt
+            if _speed_anomalous(speed, state.n, state.total, state.total_sq):
+                events.append(self._raise(user_id, 'speed_jump', lat, lon,
+                                          speed_mps=round(speed, 1), distance_m=round(distance)))
+            state.n += 1
+            state.total += speed
+            state.total_sq += speed * speed
+
+        dlat = lat - state.stop_lat
+        dlon = (lon - state.stop_lon) * state.stop_cos
+        if dlat * dlat + dlon * dlon > self.radius_deg2:
+            state.start_stop(lat, lon, ts)
+        elif not state.dwell_reported and ts - state.stop_since >= DWELL_SECONDS:
+            state.dwell_reported = True
+            if not (self.is_usual_place and self.is_usual_place(user_id, lat, lon)):
+                events.append(self._raise(user_id, 'dwell', lat, lon,
+                                          minutes=round((ts - state.stop_since) / 60)))
+
+        state.lat, state.lon, state.ts = lat, lon, ts
+        return events
+
+    def _raise(self, user_id, kind, lat, lon, **details):
+        if self.alerts is not None:
+            self.alerts.publish(user_id, kind, latitude=lat, longitude=lon, **details)
+        return {'kind': kind, 'user_id': user_id, 'latitude': lat, 'longitude': lon, **details}
+
+
+def _stop_starts(user_start, lats, lons, radius_deg2):
+    """Mask of the points where a stop starts: a user's first point, then the first point
+    farther than the radius from the current stop's start"""
+    n = len(lats)
+    user_end = np.empty(n, dtype=np.int64)
+    firsts = np.flatnonzero(user_start == np.arange(n))
+    user_end[:] = np.repeat(np.append(firsts[1:], n), np.diff(np.append(firsts, n)))
+    stop_cos = np.cos(np.radians(lats))
+
+    def far(anchors, points):
+        dlat = lats[points] - lats[anchors]
+        dlon = (lons[points] - lons[anchors]) * stop_cos[anchors]
+        return dlat * dlat + dlon * dlon > radius_deg2
+
+    # For every point, the first later point of the same user outside its radius, within STOP_SCAN
+    leaves = user_end.copy()
+    pending = np.arange(n)
+    for offset in range(1, STOP_SCAN + 1):
+        pending = pending[pending + offset < user_end[pending]]
+        if not len(pending):
+            break
+        outside = far(pending, pending + offset)
+        leaves[pending[outside]] = pending[outside] + offset
+        pending = pending[~outside]
+    unresolved = np.zeros(n, dtype=bool)
+    unresolved[pending] = True
+
+    # Follow the stops; only the starts of long stops need a further scan
+    leaves = leaves.tolist()
+    unresolved = unresolved.tolist()
+    starts = []
+    i = 0
+    while i < n:
+        starts.append(i)
+        if unresolved[i]:
+            begin, end, window = i + STOP_SCAN + 1, leaves[i], 64
+            lat, lon, cos = float(lats[i]), float(lons[i]), float(stop_cos[i])
+            while begin < end:
+                stop = min(begin + window, end)
+                dlat = lats[begin:stop] - lat
+                dlon = (lons[begin:stop] - lon) * cos
+                outside = dlat * dlat + dlon * dlon > radius_deg2
+                first = int(outside.argmax())
+                if outside[first]:
+                    leaves[i] = begin + first
+                    break
+                begin = stop
+                window *= 2
+        i = leaves[i]
+    mask = np.zeros(n, dtype=bool)
+    mask[starts] = True
+    return mask
+
+
+def replay_arrays(user_ids, lats, lons, timestamps, radius_m=DWELL_RADIUS_M):
+    """Detect events over whole tracks at once
+
+    Inputs are numpy arrays sorted by (user_id, timestamp). Returns a list of
+    (index, kind, value) tuples, where value is the speed in m/s for
+    speed_jump and the minutes stayed for dwell. It matches feeding the points
+    to a fresh MovementDetector one by one (without the usual-place check).
+    """
+    n = len(user_ids)
+    if n == 0:
+        return []
+    user_ids = np.asarray(user_ids)
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    ts = np.asarray(timestamps, dtype=np.float64)
+
+    same_user = np.empty(n, dtype=bool)
+    same_user[0] = False
+    same_user[1:] = user_ids[1:] == user_ids[:-1]
+
+    # Speeds between consecutive points of the same user
+    dlat = np.zeros(n)
+    dlon = np.zeros(n)
+    dt = np.zeros(n)
+    dlat[1:] = lat[1:] - lat[:-1]
+    dlon[1:] = lon[1:] - lon[:-1]
+    dt[1:] = ts[1:] - ts[:-1]
+    cos_prev = np.ones(n)
+    cos_prev[1:] = np.cos(lat[:-1])
+    a = np.sin(dlat / 2) ** 2 + cos_prev * np.cos(lat) * np.sin(dlon / 2) ** 2
+    distance = 2 * geo.EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    valid = same_user & (dt > 0)
+    speed = np.where(valid, distance / np.where(valid, dt, 1.0), 0.0)
+
+    # Running stats of each user's earlier speeds: segmented exclusive prefix sums
+    user_start = np.maximum.accumulate(np.where(~same_user, np.arange(n), 0))
+
+    def exclusive_prefix(values):
+        inclusive = np.cumsum(values)
+        before_user = inclusive[user_start] - values[user_start]
+        return inclusive - values - before_user
+
+    count = exclusive_prefix(valid.astype(np.float64))
+    total = exclusive_prefix(speed)
+    total_sq = exclusive_prefix(speed * speed)
+    safe_count = np.maximum(count, 1)
+    mean = total / safe_count
+    std = np.sqrt(np.maximum(total_sq / safe_count - mean * mean, 0.0))
+    jump = valid & ((speed > SPEED_LIMIT_MPS) |
+                    ((count >= MIN_SAMPLES) & (speed >= MIN_JUMP_SPEED_MPS) & (speed > mean + Z_THRESHOLD * std)))
+
+    # Dwell: first point of each stop that has lasted DWELL_SECONDS
+    run_start_mask = _stop_starts(user_start, np.asarray(lats, dtype=np.float64),
+                                  np.asarray(lons, dtype=np.float64), _radius_deg2(radius_m))
+    run_start = np.maximum.accumulate(np.where(run_start_mask, np.arange(n), 0))
+    stayed = ts - ts[run_start]
+    long_enough = stayed >= DWELL_SECONDS
+    previous_long_enough = np.zeros(n, dtype=bool)
+    previous_long_enough[1:] = long_enough[:-1]
+    dwell = long_enough & ~run_start_mask & ~(previous_long_enough & ~run_start_mask)
+
+    events = [(int(i), 'speed_jump', float(speed[i])) for i in np.flatnonzero(jump)]
+    events += [(int(i), 'dwell', float(stayed[i] / 60)) for i in np.flatnonzero(dwell)]
+    events.sort()
+    return events
+
+
+def replay(points, radius_m=DWELL_RADIUS_M):
+    """Replay (user_id, lat, lon, ts) tuples sorted by user and time; same output as replay_arrays"""
+    if np is not None:
+        points = list(points)
+        if not points:
+            return []
+        user_ids, lats, lons, timestamps = zip(*points)
+        return replay_arrays(np.array(user_ids), np.array(lats), np.array(lons), np.array(timestamps), radius_m)
+    # Pure Python fallback: run the streaming detector
+    detector = MovementDetector(alerts=None, radius_m=radius_m)
+    events = []
+    for i, (user_id, lat, lon, ts) in enumerate(points):
+        for event in detector.update(user_id, lat, lon, ts):
+            value = event['speed_mps'] if event['kind'] == 'speed_jump' else event['minutes']
+            events.append((i, event['kind'], value))
+    return events
+
+
+def load_tracks(conn, user_id=None):
+    """(user_id, lat, lon, unix time) for stored pings, archived ones included, ordered for replay"""
+    query = '''
+        SELECT user_id, latitude, longitude, CAST(strftime('%s', timestamp) AS INTEGER)
+        FROM location_tracking
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL {}
+        ORDER BY user_id, timestamp, id
+    '''
+    if user_id is None:
+        rows = conn.execute(query.format('')).fetchall()
+    else:
+        rows = conn.execute(query.format('AND user_id = ?'), (user_id,)).fetchall()
+    archived = track_archive.all_points(conn, user_id)
+    if not archived:
+        return rows
+    # Archived pings are older than the rows left, but a restore can bring rows back into an archived hour
+    return list(heapq.merge(archived, rows, key=lambda p: (p[0], p[3] or 0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay stored location tracks through the anomaly detector')
+    parser.add_argument('command', choices=['replay'])
+    parser.add_argument('--db', default=db_location.resolve(os.environ.get('DATABASE_URL')))
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('SHARD_COUNT', 1)))
+    parser.add_argument('--user-id', type=int)
+    args = parser.parse_args()
+
+    shards = sharding.ShardRouter(args.db, args.shards)
+    if args.user_id is None:
+        # A user's pings are all in one shard, so the per-shard lists just follow each other
+        points = [point for rows in shards.fan_out(load_tracks) for point in rows]
+        shards.close()
+    else:
+        conn = shards.connect_user(args.user_id)
+        points = load_tracks(conn, args.user_id)
+        conn.close()
+
+    start = time.perf_counter()
+    events = replay(points)
+    elapsed = time.perf_counter() - start
+    for index, kind, value in events:
+        user_id, lat, lon, ts = points[index]
+        unit = 'm/s' if kind == 'speed_jump' else 'min'
+        print(f"user {user_id} {time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts))} "
+              f"{kind} {value:.1f} {unit} at {lat:.5f},{lon:.5f}")
+    rate = len(points) / elapsed if elapsed > 0 else float('inf')
+    print(f"Replayed {len(points):,} points in {elapsed:.3f}s ({rate:,.0f} points/s), {len(events)} events"
+          + ('' if np is not None else ' [numpy not installed, streaming fallback]'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
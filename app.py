@@ -1,22 +1,250 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, request, jsonify, session, redirect, url_for, stream_with_context
 from flask_cors import CORS
 import sqlite3
 import hashlib
 import secrets
 import json
 import os
-from datetime import datetime
+import re
+from datetime import datetime, timezone
 import requests
 import threading
 import time
+import atexit
+import functools
+import tempfile
+
+import alerts
+import anomaly
+import assets
+import backup
+import complaint_search
+import datasets
+import db_location
+import export
+import geofence
+import incidents
+import live_share
+import location_history
+import metrics
+import ping_filter
+import query_profiler
+import repositories
+import responders
+import responses
+import route_safety
+import scheduler
+import sharding
+import shelter_capacity
+import timers
+import track_archive
+from alerts import alert_queue
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(32)
-CORS(app)
+# Set SECRET_KEY so sessions stay valid across workers, restarts and the async server
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+app.config['SQL_PROFILE'] = os.environ.get('SQL_PROFILE', '') == '1'
+app.config['SQL_SLOW_QUERY_MS'] = float(os.environ.get('SQL_SLOW_QUERY_MS', 50))
+# Case workers allowed to search all complaints (comma separated user ids)
+app.config['STAFF_USER_IDS'] = {int(i) for i in os.environ.get('STAFF_USER_IDS', '').split(',') if i.strip()}
+# Bearer token Prometheus scrapers send to /metrics
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# Let loopback clients scrape /metrics without the token; never with a reverse proxy on the same host
+app.config['METRICS_ALLOW_LOCAL'] = os.environ.get('METRICS_ALLOW_LOCAL', '') == '1'
+# Database files the per-user tables (pings, complaints) are spread over, see sharding.py
+app.config['SHARD_COUNT'] = int(os.environ.get('SHARD_COUNT', 1))
+# Online snapshots of every database file, see backup.py (0 = off)
+app.config['BACKUP_INTERVAL_HOURS'] = float(os.environ.get('BACKUP_INTERVAL_HOURS', 0))
+app.config['BACKUP_DIR'] = os.environ.get('BACKUP_DIR', 'backups')
+app.config['BACKUP_KEEP'] = int(os.environ.get('BACKUP_KEEP', backup.DEFAULT_KEEP))
+# Background maintenance jobs, see create_jobs() and scheduler.py
+app.config['SCHEDULER_ENABLED'] = os.environ.get('SCHEDULER_ENABLED', '1') == '1'
+# Repeated pings of a phone standing still are merged, see ping_filter.py (0 meters = store every ping)
+app.config['LOCATION_DEDUPE_METERS'] = float(os.environ.get('LOCATION_DEDUPE_METERS', ping_filter.DISTANCE_M))
+app.config['LOCATION_DEDUPE_SECONDS'] = float(os.environ.get('LOCATION_DEDUPE_SECONDS', ping_filter.MAX_DWELL))
+# Pings older than this are packed into one blob per user-hour, see track_archive.py (0 = keep rows)
+app.config['TRACK_ARCHIVE_HOURS'] = float(os.environ.get('TRACK_ARCHIVE_HOURS', track_archive.ARCHIVE_AFTER / 3600))
+# Let browsers cache preflight results instead of sending OPTIONS before every call
+CORS(app, max_age=7200)
+metrics.init_app(app)
+query_profiler.init_app(app)
+responses.init_app(app)
+assets.init_app(app)
+
+# A file path or in-memory database from DATABASE_URL, see db_location.py
+DATABASE = db_location.resolve(os.environ.get('DATABASE_URL'))
+
+def connect_database(path):
+    if app.config['SQL_PROFILE']:
+        return db_location.connect(path, factory=query_profiler.ProfilingConnection)
+    return db_location.connect(path)
+
+# Memory databases whose tables exist, and those being created by init_db() right now
+_memory_ready = set()
+_memory_creating = set()
+_memory_lock = threading.RLock()
+
+def ensure_memory_schema():
+    """Create the tables of a memory DATABASE on its first use in this process
+
+    A memory database starts empty in every process, and nothing else calls
+    init_db() in a gunicorn worker, under flask run or on a plain import.
+    """
+    target = DATABASE
+    if not db_location.is_memory(target) or (target in _memory_ready and db_location.is_open(target)):
+        return
+    with _memory_lock:
+        # init_db() connects through here too
+        if (target in _memory_ready and db_location.is_open(target)) or target in _memory_creating:
+            return
+        _memory_creating.add(target)
+        try:
+            init_db()
+        finally:
+            _memory_creating.discard(target)
+        _memory_ready.add(target)
+
+def get_db_connection():
+    """Open a connection to the application database"""
+    ensure_memory_schema()
+    return connect_database(DATABASE)
+
+# Pending alerts live in the database, so any worker can deliver them
+alert_queue.use_database(get_db_connection)
+
+_shard_routers = {}
+
+def get_shards():
+    """Router to the files holding per-user tables for the current DATABASE"""
+    ensure_memory_schema()
+    key = (DATABASE, app.config['SHARD_COUNT'])
+    router = _shard_routers.get(key)
+    if router is None:
+        router = _shard_routers[key] = sharding.ShardRouter(DATABASE, app.config['SHARD_COUNT'],
+                                                            connect=connect_database)
+    return router
+
+def get_user_db_connection(user_id):
+    """Open a connection to the shard holding a user's pings and complaints"""
+    return get_shards().connect_user(user_id)
+
+_sqlite_repos = {}
+
+def get_repos():
+    """Data access for the routes: app.config['REPOSITORIES'] if set, else the SQLite databases"""
+    repos = app.config.get('REPOSITORIES')
+    if repos is not None:
+        return repos
+    key = (DATABASE, app.config['SHARD_COUNT'])
+    repos = _sqlite_repos.get(key)
+    if repos is None:
+        repos = _sqlite_repos[key] = repositories.sqlite_repositories(functools.partial(connect_database, DATABASE),
+                                                                      get_shards())
+    return repos
+
+# Background jobs
+# ANALYZE reads at most this many rows an index, so it never scans a whole ping table
+ANALYSIS_LIMIT = 1000
+
+def _run_on_every_database(*statements):
+    for path in [DATABASE] + [p for p in get_shards().paths if p != DATABASE]:
+        conn = connect_database(path)
+        try:
+            for statement in statements:
+                conn.execute(statement).fetchall()
+        finally:
+            conn.close()
+
+def optimize_databases():
+    """Let SQLite refresh the query planner statistics that look stale"""
+    _run_on_every_database(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}', 'PRAGMA optimize')
+
+def analyze_databases():
+    _run_on_every_database(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}', 'ANALYZE')
+
+def checkpoint_databases():
+    """Copy WAL pages back into the database files without waiting on readers or writers"""
+    _run_on_every_database('PRAGMA wal_checkpoint(PASSIVE)')
+
+def prune_live_shares():
+    conn = get_db_connection()
+    try:
+        live_share.prune(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+def detect_anomalies():
+    """Feed the pings every worker stored to the one movement detector; anomalies go to the alert queue"""
+    geofence.engine.sync(get_db_connection)
+    movement_detector.sync(get_shards().connectors())
+
+def fire_timers(now=None):
+    for event in timers.scheduled.fire_due(get_db_connection, now=now):
+        if event['kind'] == 'check_in_missed':
+            alert_check_in_responders(event)
+
+def flush_dwell_times():
+    """Write the dwell times this worker merged into stored pings"""
+    ping_filter.pings.flush(get_repos().locations.set_dwell)
+
+def archive_tracks():
+    """Pack old pings into hour blobs, one shard at a time"""
+    before = time.time() - app.config['TRACK_ARCHIVE_HOURS'] * 3600
+    shards = get_shards()
+    for index in range(shards.count):
+        conn = shards.connect(index)
+        try:
+            track_archive.archive(conn, before)
+        finally:
+            conn.close()
+
+def take_due_backup():
+    backup.BackupScheduler(DATABASE, app.config['BACKUP_DIR'], app.config['BACKUP_INTERVAL_HOURS'] * 3600,
+                           shard_count=app.config['SHARD_COUNT'], keep=app.config['BACKUP_KEEP']).run_if_due()
+
+def job_lock_path():
+    """Lock file electing the worker that runs the leader jobs for the current DATABASE"""
+    # A memory database belongs to one process, which leads its own jobs
+    key = DATABASE + (f'#{os.getpid()}' if db_location.is_memory(DATABASE) else '')
+    return os.path.join(tempfile.gettempdir(),
+                        f'security_system_jobs-{hashlib.sha1(key.encode()).hexdigest()[:12]}.lock')
+
+def create_jobs():
+    """The background jobs; leader jobs run in one worker per database, the others in every worker"""
+    jobs = scheduler.Scheduler(job_lock_path())
+    jobs.every(6 * 3600, optimize_databases, name='optimize', jitter=600, leader=True)
+    jobs.cron('30 3 * * *', analyze_databases, name='analyze', jitter=900, leader=True)
+    jobs.every(300, checkpoint_databases, name='wal_checkpoint', jitter=30, leader=True)
+    jobs.every(3600, prune_live_shares, name='prune_live_shares', jitter=300, leader=True)
+    # Alerts have a lane of their own, so a long backup or ANALYZE never holds them back
+    jobs.every(timers.RESOLUTION, fire_timers, name='timers', leader=True, lane='alerts')
+    jobs.every(anomaly.SYNC_INTERVAL, detect_anomalies, name='anomalies', leader=True, lane='alerts')
+    # Every worker merges pings, so every worker writes its own dwell times
+    jobs.every(ping_filter.FLUSH_INTERVAL, flush_dwell_times, name='dwell_times', jitter=5)
+    if app.config['TRACK_ARCHIVE_HOURS'] > 0:
+        jobs.every(3600, archive_tracks, name='archive_tracks', jitter=300, leader=True)
+    if app.config['BACKUP_INTERVAL_HOURS'] > 0:
+        jobs.every(backup.CHECK_INTERVAL, take_due_backup, name='backup', jitter=10, leader=True)
+    return jobs
+
+jobs = None
+_jobs_lock = threading.Lock()
+
+@app.before_request
+def start_jobs():
+    """Start this worker's background jobs (on its first request if no server hook did earlier)"""
+    global jobs
+    if jobs is not None or not app.config['SCHEDULER_ENABLED']:
+        return
+    with _jobs_lock:
+        if jobs is None:
+            jobs = create_jobs()
+            jobs.start()
 
 # Database setup
 def init_db():
-    conn = sqlite3.connect('security_system.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Users table
@@ -40,31 +268,13 @@ def init_db():
         # Column already exists
         pass
     
-    # Location tracking table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS location_tracking (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            latitude REAL,
-            longitude REAL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # Complaints table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS complaints (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            title TEXT NOT NULL,
-            description TEXT,
-            category TEXT,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
+    # Add responder_opt_in column (volunteers notified of nearby SOS alerts) if it doesn't exist
+    try:
+        cursor.execute('ALTER TABLE users ADD COLUMN responder_opt_in INTEGER DEFAULT 0')
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_responders ON users (id) WHERE responder_opt_in = 1')
     
     # Safe shelters table
     cursor.execute('''
@@ -81,6 +291,18 @@ def init_db():
         )
     ''')
     
+    # Add registry_id column (natural key of imported shelters) if it doesn't exist
+    try:
+        cursor.execute('ALTER TABLE safe_shelters ADD COLUMN registry_id TEXT')
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_shelters_registry ON safe_shelters (registry_id)')
+    datasets.ensure_schema(cursor)
+    shelter_capacity.ensure_schema(cursor)
+    live_share.ensure_schema(cursor)
+    timers.ensure_schema(cursor)
+    
     # Emergency tips table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS emergency_tips (
@@ -92,13 +314,48 @@ def init_db():
         )
     ''')
     
+    # Geofences (safe zones) table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS geofences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            name TEXT NOT NULL,
+            polygon TEXT NOT NULL,
+            min_lat REAL,
+            min_lon REAL,
+            max_lat REAL,
+            max_lon REAL,
+            alert_on_entry INTEGER DEFAULT 0,
+            alert_on_exit INTEGER DEFAULT 1,
+            active INTEGER DEFAULT 1,
+            changed_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_geofences_changed ON geofences (changed_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_geofences_user ON geofences (user_id)')
+    # Each user's fences at their last ping, shared by all workers (see geofence.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS geofence_state (
+            user_id INTEGER PRIMARY KEY,
+            inside TEXT NOT NULL
+        )
+    ''')
+    
+    # Alerts waiting for the user's next poll of /api/alerts
+    alerts.ensure_schema(cursor)
+    
+    shards = get_shards()
+    sharding.ensure_layout(conn, shards.count)
+    
     # Insert sample data
     cursor.execute('''
-        INSERT OR IGNORE INTO safe_shelters (name, address, latitude, longitude, phone, capacity, facilities, rating)
+        INSERT OR IGNORE INTO safe_shelters (registry_id, name, address, latitude, longitude, phone, capacity, facilities, rating)
         VALUES 
-        ('Women Safety Center - Central', '123 Safety Street, City Center', 28.6139, 77.2090, '+91-11-2341-5678', 50, 'Security, Medical, Counseling', 4.5),
-        ('Safe Haven Shelter', '456 Protection Avenue, District 2', 28.7041, 77.1025, '+91-11-3456-7890', 30, '24/7 Security, Legal Aid', 4.2),
-        ('Women Protection Home', '789 Care Road, Zone 3', 28.5355, 77.3910, '+91-11-4567-8901', 40, 'Counseling, Job Training', 4.7)
+        ('sample-1', 'Women Safety Center - Central', '123 Safety Street, City Center', 28.6139, 77.2090, '+91-11-2341-5678', 50, 'Security, Medical, Counseling', 4.5),
+        ('sample-2', 'Safe Haven Shelter', '456 Protection Avenue, District 2', 28.7041, 77.1025, '+91-11-3456-7890', 30, '24/7 Security, Legal Aid', 4.2),
+        ('sample-3', 'Women Protection Home', '789 Care Road, Zone 3', 28.5355, 77.3910, '+91-11-4567-8901', 40, 'Counseling, Job Training', 4.7)
     ''')
     
     cursor.execute('''
@@ -113,6 +370,13 @@ def init_db():
     
     conn.commit()
     conn.close()
+    
+    # Per-user tables, in the primary database unless sharded
+    for connect in shards.connectors():
+        conn = connect()
+        sharding.ensure_schema(conn.cursor())
+        conn.commit()
+        conn.close()
 
 # Authentication functions
 def hash_password(password):
@@ -148,7 +412,7 @@ class AIAssistant:
             # Emergency questions
             'emergency': {
                 'keywords': ['emergency', 'help', 'danger', 'panic', 'urgent', 'crisis', 'immediate'],
-                'response': "🚨 EMERGENCY PROTOCOL ACTIVATED!\n\nI'm triggering all emergency features:\n• Loud siren alarm to attract attention\n• Sharing your live location with emergency contacts\n• Notifying authorities\n• Initiating fake call for your safety\n\nStay calm. Help is on the way. Your location is being shared now."
+                'response': "🚨 EMERGENCY PROTOCOL ACTIVATED!\n\nI'm triggering all emergency features:\n• Loud siren alarm to attract attention\n• Recording your live location - send your contacts a live share link so they can follow it\n• Notifying authorities\n• Initiating fake call for your safety\n\nStay calm. Help is on the way."
             },
             'siren': {
                 'keywords': ['siren', 'alarm', 'loud', 'noise', 'alert'],
@@ -160,7 +424,7 @@ class AIAssistant:
             },
             'location': {
                 'keywords': ['location', 'share location', 'track location', 'gps', 'where am i', 'current location'],
-                'response': "📍 Location tracking activated!\n\nYour live location is being:\n• Shared with your emergency contacts\n• Stored securely for safety records\n• Updated at your chosen interval\n\nYou can start/stop tracking anytime. The map shows your current position with accuracy indicator."
+                'response': "📍 Location tracking activated!\n\nYour live location is being:\n• Visible to anyone you send a live share link to\n• Stored securely for safety records\n• Updated at your chosen interval\n\nYou can start/stop tracking anytime. The map shows your current position with accuracy indicator."
             },
             'safe_shelters': {
                 'keywords': ['safe shelter', 'safe place', 'shelter', 'safe house', 'refuge', 'women shelter', 'nearby shelter'],
@@ -227,15 +491,25 @@ class AIAssistant:
                 'response': "📞 Women Safety Helplines:\n\n🚺 Women Helpline (All India): 1091\n📱 Women Helpline (Domestic Abuse): 181\n👶 Child Helpline: 1098\n🚔 Police Emergency: 100\n🚑 Ambulance: 108\n🚒 Fire: 101\n\nWhat These Services Offer:\n• 24/7 emergency response\n• Legal guidance and support\n• Counseling services\n• Rescue operations coordination\n• Medical assistance\n\nAll calls are free and confidential. Don't hesitate to reach out if you need help."
             }
         }
+        self._keyword_index = None
+        
+    def build_index(self):
+        """One compiled keyword pattern per category, in knowledge base order"""
+        if self._keyword_index is None:
+            self._keyword_index = [
+                (re.compile('|'.join(re.escape(keyword) for keyword in data['keywords'])), data['response'])
+                for data in self.knowledge_base.values()
+            ]
+        return self._keyword_index
         
     def get_response(self, query):
         """Get AI response for a user query"""
         query_lower = query.lower()
         
         # Check each category
-        for category, data in self.knowledge_base.items():
-            if any(keyword in query_lower for keyword in data['keywords']):
-                return data['response']
+        for pattern, response in self.build_index():
+            if pattern.search(query_lower):
+                return response
         
         # Default response for unrecognized queries
         return self.get_default_response(query)
@@ -364,39 +638,148 @@ except:
     ai_assistant = None
     print("AI Assistant initialization failed. App will run without voice features.")
 
+# Shared API logic, used by the Flask routes and by the async server (asgi_app.py)
+
+def assistant_reply(command):
+    """Response payload of the AI assistant for a text command"""
+    # Use the enhanced AI assistant to process the command
+    if ai_assistant:
+        result = ai_assistant.process_command(command)
+        if isinstance(result, dict):
+            return {
+                'response': result['message'],
+                'type': result['type'],
+                'action': result.get('action')
+            }
+        else:
+            return {'response': result, 'type': 'info', 'action': None}
+    else:
+        # Fallback for when AI assistant is not available
+        command_lower = command.lower()
+        if any(word in command_lower for word in ['emergency', 'help', 'danger']):
+            return {'response': '🚨 Emergency activated! Sharing location and calling emergency contacts.', 'type': 'emergency', 'action': 'emergencyAlert()'}
+        elif 'location' in command_lower:
+            return {'response': '📍 Location sharing activated with trusted contacts.', 'type': 'location', 'action': 'startLocationTracking()'}
+        elif 'fake call' in command_lower:
+            return {'response': '📞 Fake call will be initiated in 10 seconds.', 'type': 'fake_call', 'action': 'initiateFakeCall()'}
+        elif 'siren' in command_lower:
+            return {'response': '🔊 Siren alarm activated to alert nearby people.', 'type': 'siren', 'action': 'activateSiren()'}
+        elif 'shelter' in command_lower or 'safe place' in command_lower:
+            return {'response': '🏠 Finding nearest safe shelters...', 'type': 'shelter', 'action': 'showSection("shelters")'}
+        else:
+            return {'response': "🛡️ I'm here to help with safety and emergency assistance.\n\nYou can ask me about:\n• Emergency procedures\n• Safety tips\n• Location tracking\n• Safe shelters\n• Filing complaints\n• And more!", 'type': 'info', 'action': None}
+
+# Stopping inside one of the user's own safe zones is not unusual
+movement_detector = anomaly.MovementDetector(
+    is_usual_place=lambda user_id, lat, lon: bool(geofence.engine.containing(user_id, lat, lon)))
+
+def ping_is_new(user_id, latitude, longitude):
+    """False if the ping was merged into the user's last stored one, see ping_filter.py"""
+    # Merged dwell times are written by this worker's jobs: without them, store every ping
+    distance = app.config['LOCATION_DEDUPE_METERS'] if jobs is not None else 0
+    return ping_filter.pings.offer(user_id, float(latitude), float(longitude), distance,
+                                   app.config['LOCATION_DEDUPE_SECONDS'])
+
+def on_location_update(user_id, latitude, longitude):
+    """Run the streaming checks for a new position; returns geofence events"""
+    latitude, longitude = float(latitude), float(longitude)
+    geofence.engine.sync(get_db_connection)
+    events = geofence.engine.evaluate(user_id, latitude, longitude, connect=get_db_connection)
+    # Anomalies are found by the leader's detect_anomalies() job from the stored pings
+    shard_connects = get_shards().connectors()
+    responders.index.sync(get_db_connection, shard_connects=shard_connects)
+    responders.index.update(user_id, latitude, longitude)
+    live_share.shares.sync(get_db_connection, shard_connects=shard_connects)
+    live_share.shares.record(user_id, latitude, longitude)
+    return events
+
+def alert_responders(user_id, kind, latitude, longitude, k=responders.DEFAULT_K,
+                     radius_m=responders.DEFAULT_RADIUS_M, **details):
+    """Publish kind to the nearest online responders; returns [(responder_id, distance_m, seen_seconds_ago)]"""
+    responders.index.sync(get_db_connection, shard_connects=get_shards().connectors())
+    nearby = responders.index.nearest(latitude, longitude, k=k, radius_m=radius_m, exclude=user_id)
+    for responder_id, distance_m, _ in nearby:
+        alert_queue.publish(responder_id, kind, from_user_id=user_id, latitude=latitude, longitude=longitude,
+                            distance_m=distance_m, **details)
+    return nearby
+
+def alert_check_in_responders(event):
+    """Pass a missed check-in on to responders near the user's last recent position, if there is one"""
+    since = datetime.fromtimestamp(event['time'] - timers.CHECK_IN_POSITION_AGE, timezone.utc)
+    position = get_repos().locations.latest(event['user_id'], since.strftime(location_history.TIMESTAMP_FORMAT))
+    nearby = []
+    if position is not None:
+        nearby = alert_responders(event['user_id'], 'check_in_missed_nearby', *position,
+                                  timer_id=event['timer_id'], note=event.get('note'))
+    metrics.inc('check_in_missed_total', notified='yes' if nearby else 'no')
+    return nearby
+
+def siren_reply(user_id):
+    """Response payload for a siren activation"""
+    # This would trigger audio alert and potentially notify authorities
+    return {'success': True, 'message': 'Siren activated!'}
+
+def fake_call_reply(user_id, data=None):
+    """Schedule a fake call; returns (payload, status)"""
+    data = data or {}
+    try:
+        delay = int(data.get('delay_seconds', timers.FAKE_CALL_DELAY))
+    except (TypeError, ValueError):
+        return {'success': False, 'message': 'Invalid call delay!'}, 400
+    if not 1 <= delay <= timers.MAX_FAKE_CALL_DELAY:
+        return {'success': False, 'message': 'Invalid call delay!'}, 400
+    caller = str(data.get('caller') or 'Emergency Contact')[:50]
+    timer, error = create_timer(user_id, 'fake_call', time.time() + delay, {'caller': caller})
+    if error:
+        return error
+    return {'success': True, 'message': f'Fake call initiated! You will receive a call in {delay} seconds.',
+            'timer': timer}, 200
+
+def create_timer(user_id, kind, due_at, details):
+    """Store a timer for the firing worker; returns (timer, None) or (None, (payload, status))"""
+    conn = get_db_connection()
+    try:
+        if len(timers.scheduled.pending(conn, user_id)) >= timers.MAX_PENDING_PER_USER:
+            return None, ({'success': False, 'message': 'Too many pending timers!'}, 400)
+        timer = timers.scheduled.create(conn, user_id, kind, due_at, details)
+        conn.commit()
+    finally:
+        conn.close()
+    return timer, None
+
 # Routes
 @app.route('/')
 def index():
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
-    return render_template('landing-fixed.html')
+    return assets.render_page('landing-fixed.html')
 
 @app.route('/landing')
 def landing():
-    return render_template('landing-fixed.html')
+    return assets.render_page('landing-fixed.html')
 
 @app.route('/login-page')
 def login_page():
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
-    return render_template('index.html')
+    return assets.render_page('index.html')
 
 @app.route('/signin')
 def signin():
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
-    return render_template('signin.html')
+    return assets.render_page('signin.html')
 
 @app.route('/signup')
 def signup():
     if 'user_id' in session:
         return redirect(url_for('dashboard'))
-    return render_template('signup.html')
+    return assets.render_page('signup.html')
 
 @app.route('/auth-forms')
 def auth_forms():
     """Return authentication forms for modal display"""
-    return render_template('auth-modal.html')
+    return assets.render_page('auth-modal.html')
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -421,23 +804,14 @@ def register():
     if pattern and (not isinstance(pattern, list) or len(pattern) < 4):
         return jsonify({'success': False, 'message': 'Pattern must contain at least 4 dots!'})
     
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    
     try:
-        # Hash pattern if provided
-        pattern_hash = hash_pattern(pattern) if pattern else None
-        
-        cursor.execute('''
-            INSERT INTO users (username, email, password_hash, pattern_hash, phone_number, emergency_contact)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (username, email, hash_password(password) if password else None, pattern_hash, phone, f"{first_name} {last_name}".strip()))
-        conn.commit()
+        get_repos().users.add(username, email,
+                              password_hash=hash_password(password) if password else None,
+                              pattern_hash=hash_pattern(pattern) if pattern else None,
+                              phone=phone, emergency_contact=f"{first_name} {last_name}".strip())
         return jsonify({'success': True, 'message': 'Registration successful! Please log in with your credentials.'})
-    except sqlite3.IntegrityError:
+    except repositories.DuplicateError:
         return jsonify({'success': False, 'message': 'Username or email already exists!'})
-    finally:
-        conn.close()
 
 @app.route('/login', methods=['POST'])
 def login():
@@ -448,17 +822,12 @@ def login():
     if not username or not password:
         return jsonify({'success': False, 'message': 'Username and password are required!'})
     
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    
     # Try to find user by username or email
-    cursor.execute('SELECT id, password_hash, username FROM users WHERE username = ? OR email = ?', (username, username))
-    user = cursor.fetchone()
-    conn.close()
+    user = get_repos().users.find_by_login(username)
     
-    if user and verify_password(password, user[1]):
-        session['user_id'] = user[0]
-        session['username'] = user[2]  # Use the stored username
+    if user and user['password_hash'] and verify_password(password, user['password_hash']):
+        session['user_id'] = user['id']
+        session['username'] = user['username']  # Use the stored username
         return jsonify({'success': True, 'message': 'Login successful! Redirecting to dashboard...'})
     else:
         return jsonify({'success': False, 'message': 'Invalid username/email or password!'})
@@ -477,17 +846,12 @@ def login_pattern():
     if not isinstance(pattern, list) or len(pattern) < 4:
         return jsonify({'success': False, 'message': 'Pattern must contain at least 4 dots!'})
     
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    
     # Find user by username or email
-    cursor.execute('SELECT id, pattern_hash, username FROM users WHERE username = ? OR email = ?', (username, username))
-    user = cursor.fetchone()
-    conn.close()
+    user = get_repos().users.find_by_login(username)
     
-    if user and user[1] and verify_pattern(pattern, user[1]):
-        session['user_id'] = user[0]
-        session['username'] = user[2]  # Use the stored username
+    if user and user['pattern_hash'] and verify_pattern(pattern, user['pattern_hash']):
+        session['user_id'] = user['id']
+        session['username'] = user['username']  # Use the stored username
         return jsonify({'success': True, 'message': 'Pattern login successful! Redirecting to dashboard...'})
     else:
         return jsonify({'success': False, 'message': 'Invalid username/email or pattern!'})
@@ -501,7 +865,7 @@ def logout():
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('index'))
-    return render_template('dashboard.html')
+    return assets.render_page('dashboard.html')
 
 @app.route('/api/location', methods=['POST'])
 def update_location():
@@ -512,17 +876,230 @@ def update_location():
     latitude = data['latitude']
     longitude = data['longitude']
     
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO location_tracking (user_id, latitude, longitude)
-        VALUES (?, ?, ?)
-    ''', (session['user_id'], latitude, longitude))
+    if ping_is_new(session['user_id'], latitude, longitude):
+        ping_id = get_repos().locations.add(session['user_id'], latitude, longitude, phase=metrics.observe_phase)
+        ping_filter.pings.stored(session['user_id'], float(latitude), float(longitude), ping_id)
+    
+    events = on_location_update(session['user_id'], latitude, longitude)
+    if events:
+        return jsonify({'success': True, 'events': events})
+    return jsonify({'success': True})
+
+@app.route('/api/location/history', methods=['GET'])
+def get_location_history():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    args = request.args
+    start, end = location_history.default_range()
+    try:
+        if args.get('start'):
+            start = location_history.parse_time(args['start'])
+        if args.get('end'):
+            end = location_history.parse_time(args['end'])
+        bbox = location_history.parse_bbox(args['bbox']) if args.get('bbox') else None
+        zoom = int(args['zoom']) if args.get('zoom') else None
+        max_points = int(args.get('max_points', location_history.DEFAULT_MAX_POINTS))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid history parameters!'}), 400
+    if zoom is not None and not 0 <= zoom <= location_history.MAX_ZOOM:
+        return jsonify({'success': False, 'message': 'Invalid zoom level!'}), 400
+    max_points = max(2, min(max_points, location_history.MAX_POINTS_LIMIT))
+    
+    points = get_repos().locations.history(session['user_id'], start, end,
+                                           bbox=bbox, zoom=zoom, max_points=max_points)
+    body = location_history.stream_json(points, start, end)
+    response = app.response_class(stream_with_context(body), mimetype='application/json')
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    user_id = session['user_id']
+    if request.args.get('user_id'):
+        # Case workers export other accounts for legal requests
+        if session['user_id'] not in app.config['STAFF_USER_IDS']:
+            return jsonify({'error': 'Forbidden'}), 403
+        user_id = request.args.get('user_id', type=int)
+        if user_id is None:
+            return jsonify({'success': False, 'message': 'Invalid user id!'}), 400
+    data = request.args.get('data', 'all')
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        export.validate(data, fmt)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    body = export.export(functools.partial(get_user_db_connection, user_id), user_id, data, fmt)
+    response = app.response_class(stream_with_context(body), mimetype=export.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{export.filename(user_id, data, fmt)}"'
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/live-share', methods=['POST'])
+def create_live_share():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        minutes = int(data.get('minutes', live_share.DEFAULT_MINUTES))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid share duration!'}), 400
+    if not 1 <= minutes <= live_share.MAX_MINUTES:
+        return jsonify({'success': False, 'message': 'Invalid share duration!'}), 400
+    
+    conn = get_db_connection()
+    user_conn = get_user_db_connection(session['user_id'])
+    token, share = live_share.shares.create(conn, session['user_id'], minutes, user_conn=user_conn)
     conn.commit()
     conn.close()
+    user_conn.close()
     
+    return jsonify({'success': True, 'token': token, 'url': url_for('view_live_share', token=token, _external=True),
+                    **share})
+
+@app.route('/api/live-share', methods=['GET'])
+def get_live_shares():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    shares = live_share.shares.active(conn, session['user_id'])
+    conn.close()
+    return jsonify(shares)
+
+@app.route('/api/live-share/<int:share_id>', methods=['DELETE'])
+def revoke_live_share(share_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    revoked = live_share.shares.revoke(conn, session['user_id'], share_id)
+    conn.commit()
+    conn.close()
+    if not revoked:
+        return jsonify({'success': False, 'message': 'Share not found!'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/live-share/view/<token>', methods=['GET'])
+def view_live_share(token):
+    # Public: the token is the credential. Answered from memory, see live_share.py
+    try:
+        since = float(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid since parameter!'}), 400
+    live_share.shares.sync(get_db_connection, shard_connects=get_shards().connectors())
+    shared = live_share.shares.view(token, since)
+    if shared is None:
+        return jsonify({'success': False, 'message': 'Share link expired or not found!'}), 404
+    
+    response = responses.json_response(responses.dumps({'success': True, **shared}), private=False)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/geofences', methods=['GET'])
+def get_geofences():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    fences = geofence.list_fences(conn, session['user_id'])
+    conn.close()
+    
+    return jsonify([fence.to_dict() for fence in fences])
+
+@app.route('/api/geofences', methods=['POST'])
+def create_geofence():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json()
+    name = data.get('name', '').strip()
+    if not name:
+        return jsonify({'success': False, 'message': 'Zone name is required!'}), 400
+    try:
+        polygon = geofence.parse_polygon(data)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    conn = get_db_connection()
+    fence = geofence.create_fence(conn, session['user_id'], name, polygon,
+                                  alert_on_entry=data.get('alert_on_entry', False),
+                                  alert_on_exit=data.get('alert_on_exit', True))
+    conn.close()
+    geofence.engine.add(fence)
+    
+    return jsonify({'success': True, 'geofence': fence.to_dict()})
+
+@app.route('/api/geofences/<int:fence_id>', methods=['DELETE'])
+def delete_geofence(fence_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    deleted = geofence.delete_fence(conn, session['user_id'], fence_id)
+    conn.close()
+    if not deleted:
+        return jsonify({'success': False, 'message': 'Zone not found!'}), 404
+    geofence.engine.remove(fence_id)
+    
+    return jsonify({'success': True})
+
+@app.route('/api/check-ins', methods=['POST'])
+def create_check_in():
+    """Safe-walk timer: alert unless the user cancels it (checks in) within the given minutes"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        minutes = float(data.get('minutes'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid check-in time!'}), 400
+    if not 1 <= minutes <= timers.MAX_CHECK_IN_MINUTES:
+        return jsonify({'success': False, 'message': 'Invalid check-in time!'}), 400
+    details = {'note': str(data['note'])[:200]} if data.get('note') else None
+    
+    timer, error = create_timer(session['user_id'], 'check_in', time.time() + minutes * 60, details)
+    if error:
+        return jsonify(error[0]), error[1]
+    return jsonify({'success': True, 'timer': timer})
+
+@app.route('/api/timers', methods=['GET'])
+def get_timers():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    pending = timers.scheduled.pending(conn, session['user_id'])
+    conn.close()
+    return jsonify(pending)
+
+@app.route('/api/timers/<int:timer_id>', methods=['DELETE'])
+def cancel_timer(timer_id):
+    """Cancel a fake call, or check in before a safe-walk timer runs out"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    conn = get_db_connection()
+    cancelled = timers.scheduled.cancel(conn, session['user_id'], timer_id)
+    conn.commit()
+    conn.close()
+    if not cancelled:
+        return jsonify({'success': False, 'message': 'Timer not found!'}), 404
     return jsonify({'success': True})
 
+@app.route('/api/alerts', methods=['GET'])
+def get_alerts():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify(alert_queue.drain(session['user_id']))
+
 @app.route('/api/complaints', methods=['POST'])
 def submit_complaint():
     if 'user_id' not in session:
@@ -532,16 +1109,13 @@ def submit_complaint():
     title = data['title']
     description = data['description']
     category = data.get('category', 'general')
-    location = data.get('location', '')
+    try:
+        location, latitude, longitude = incidents.parse_location(data)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid location!'}), 400
     
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO complaints (user_id, title, description, category)
-        VALUES (?, ?, ?, ?)
-    ''', (session['user_id'], title, description, category))
-    conn.commit()
-    conn.close()
+    get_repos().complaints.add(session['user_id'], title, description, category,
+                               location=location, latitude=latitude, longitude=longitude)
     
     return jsonify({'success': True, 'message': 'Complaint submitted successfully!'})
 
@@ -550,73 +1124,198 @@ def get_complaint_history():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, title, description, category, status, created_at
-        FROM complaints
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-    ''', (session['user_id'],))
+    return responses.json_response(responses.dumps(get_repos().complaints.for_user(session['user_id'])))
+
+@app.route('/api/complaints/search', methods=['GET'])
+def search_complaints():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session['user_id'] not in app.config['STAFF_USER_IDS']:
+        return jsonify({'error': 'Forbidden'}), 403
     
-    complaints = cursor.fetchall()
-    conn.close()
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'success': False, 'message': 'Search query is required!'}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), complaint_search.MAX_PER_PAGE)
+    
+    try:
+        # Complaints are spread over the shards; see sharding.py
+        results, has_more = complaint_search.search_shards(get_shards().fan_out, query,
+                                                           category=request.args.get('category'),
+                                                           status=request.args.get('status'),
+                                                           page=page, per_page=per_page)
+    except sqlite3.OperationalError:
+        return jsonify({'success': False, 'message': 'Invalid search query!'}), 400
+    
+    return responses.json_response(responses.dumps({
+        'success': True, 'page': page, 'per_page': per_page, 'has_more': has_more, 'results': results,
+    }))
+
+@app.route('/api/admin/shards', methods=['GET'])
+def get_shard_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session['user_id'] not in app.config['STAFF_USER_IDS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    shards = get_shards()
+    counts = shards.fan_out(lambda conn: conn.execute('''
+        SELECT (SELECT COUNT(*) FROM location_tracking)
+               + (SELECT COALESCE(SUM(point_count), 0) FROM location_archive),
+               (SELECT COUNT(*) FROM complaints)
+    ''').fetchone())
+    return jsonify([{'shard': index, 'path': os.path.basename(path), 'locations': locations, 'complaints': complaints}
+                    for index, (path, (locations, complaints)) in enumerate(zip(shards.paths, counts))])
+
+@app.route('/api/admin/location-pings', methods=['GET'])
+def get_location_ping_stats():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session['user_id'] not in app.config['STAFF_USER_IDS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return jsonify(ping_filter.stats())
+
+@app.route('/api/incidents/heatmap/<int:zoom>/<int:x>/<int:y>', methods=['GET'])
+def get_incident_heatmap(zoom, x, y):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
     
-    complaint_list = []
-    for complaint in complaints:
-        complaint_list.append({
-            'id': complaint[0],
-            'title': complaint[1],
-            'description': complaint[2],
-            'category': complaint[3],
-            'status': complaint[4],
-            'created_at': complaint[5]
-        })
+    if zoom > incidents.MAX_TILE_ZOOM or x >= 2 ** zoom or y >= 2 ** zoom:
+        return jsonify({'success': False, 'message': 'Invalid tile!'}), 400
+    days = min(max(request.args.get('days', 30, type=int), 1), incidents.MAX_DAYS)
+    category = request.args.get('category')
     
-    return jsonify(complaint_list)
+    points = incidents.merge_tiles(get_shards().fan_out(
+        lambda conn: incidents.heatmap_tile(conn, zoom, x, y, days=days, category=category)))
+    
+    return responses.json_response(responses.dumps({
+        'success': True, 'zoom': zoom, 'x': x, 'y': y, 'days': days, 'points': points,
+    }))
+
+@app.route('/api/routes/score', methods=['POST'])
+def score_routes():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    routes = data.get('routes') or ([data['route']] if data.get('route') else [])
+    if not isinstance(routes, list) or not 1 <= len(routes) <= route_safety.MAX_ROUTES:
+        return jsonify({'success': False, 'message': f'Send between 1 and {route_safety.MAX_ROUTES} routes!'}), 400
+    try:
+        routes = [route_safety.parse_route(route) for route in routes]
+        when = route_safety.parse_when(data.get('time'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    route_safety.grid.sync(get_db_connection, shard_connects=get_shards().connectors())
+    scores = [route_safety.grid.score_route(route, when) for route in routes]
+    safest = max(range(len(scores)), key=lambda i: (scores[i]['score'] or 0, scores[i]['min_score'] or 0))
+    return responses.json_response(responses.dumps({'success': True, 'safest': safest, 'routes': scores}))
+
+def load_shelters_json():
+    """All shelters as JSON bytes"""
+    return responses.dumps(get_repos().shelters.all())
+
+def load_tips_json():
+    """All emergency tips as JSON bytes, newest first"""
+    return responses.dumps(get_repos().tips.all())
+
+def shelters_payload():
+    return responses.cached_payload('shelters', load_shelters_json, version=get_repos().shelters.version())
+
+def tips_payload():
+    return responses.cached_payload('tips', load_tips_json, ttl=300)
+
+def get_capacity_tracker():
+    return shelter_capacity.get_tracker(DATABASE, get_db_connection)
+
+atexit.register(shelter_capacity.close_all)
 
 @app.route('/api/shelters')
 def get_shelters():
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM safe_shelters')
-    shelters = cursor.fetchall()
-    conn.close()
+    if 'lat' in request.args or 'lon' in request.args:
+        # Nearest shelters with free places, from the live counters
+        latitude = request.args.get('lat', type=float)
+        longitude = request.args.get('lon', type=float)
+        if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return jsonify({'success': False, 'message': 'Invalid coordinates!'}), 400
+        radius_km = min(max(request.args.get('radius_km', 20, type=float), 0.1), shelter_capacity.MAX_RADIUS_KM)
+        limit = min(max(request.args.get('limit', 10, type=int), 1), shelter_capacity.MAX_NEAREST)
+        seats = min(max(request.args.get('seats', 1, type=int), 1), shelter_capacity.MAX_SEATS)
+        shelters = get_capacity_tracker().nearest(latitude, longitude, radius_km=radius_km, limit=limit, seats=seats)
+        return responses.json_response(responses.dumps(shelters))
     
-    shelter_list = []
-    for shelter in shelters:
-        shelter_list.append({
-            'id': shelter[0],
-            'name': shelter[1],
-            'address': shelter[2],
-            'latitude': shelter[3],
-            'longitude': shelter[4],
-            'phone': shelter[5],
-            'capacity': shelter[6],
-            'facilities': shelter[7],
-            'rating': shelter[8]
-        })
-    
-    return jsonify(shelter_list)
+    return responses.send_payload(shelters_payload())
 
-@app.route('/api/tips')
-def get_tips():
-    conn = sqlite3.connect('security_system.db')
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM emergency_tips ORDER BY created_at DESC')
-    tips = cursor.fetchall()
-    conn.close()
+@app.route('/api/shelters/<int:shelter_id>/reserve', methods=['POST'])
+def reserve_shelter(shelter_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    seats = data.get('seats', 1)
+    if not isinstance(seats, int) or not 1 <= seats <= shelter_capacity.MAX_SEATS:
+        return jsonify({'success': False, 'message': f'Reserve between 1 and {shelter_capacity.MAX_SEATS} places!'}), 400
+    
+    tracker = get_capacity_tracker()
+    try:
+        reservation = tracker.reserve(shelter_id, session['user_id'], seats)
+    except KeyError:
+        return jsonify({'success': False, 'message': 'Shelter not found!'}), 404
+    if reservation is None:
+        metrics.inc('shelter_reservations_total', result='full')
+        return jsonify({'success': False, 'message': 'Shelter is full!', **tracker.status(shelter_id)}), 409
+    metrics.inc('shelter_reservations_total', result='reserved')
+    
+    return jsonify({'success': True, 'reservation': reservation, **tracker.status(shelter_id)})
+
+@app.route('/api/shelters/reservations/<reservation_id>', methods=['DELETE'])
+def cancel_shelter_reservation(reservation_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not get_capacity_tracker().release(reservation_id, user_id=session['user_id']):
+        return jsonify({'success': False, 'message': 'Reservation not found!'}), 404
+    
+    return jsonify({'success': True})
+
+@app.route('/api/shelters/reservations/<reservation_id>/arrive', methods=['POST'])
+def arrive_shelter_reservation(reservation_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session['user_id'] not in app.config['STAFF_USER_IDS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if not get_capacity_tracker().release(reservation_id, arrived=True):
+        return jsonify({'success': False, 'message': 'Reservation not found!'}), 404
+    
+    return jsonify({'success': True})
+
+@app.route('/api/shelters/<int:shelter_id>/occupancy', methods=['PUT'])
+def set_shelter_occupancy(shelter_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    if session['user_id'] not in app.config['STAFF_USER_IDS']:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    occupancy = data.get('occupancy')
+    if not isinstance(occupancy, int) or occupancy < 0:
+        return jsonify({'success': False, 'message': 'Occupancy must be a whole number!'}), 400
     
-    tip_list = []
-    for tip in tips:
-        tip_list.append({
-            'id': tip[0],
-            'title': tip[1],
-            'content': tip[2],
-            'category': tip[3]
-        })
+    tracker = get_capacity_tracker()
+    try:
+        tracker.set_occupancy(shelter_id, occupancy)
+    except KeyError:
+        return jsonify({'success': False, 'message': 'Shelter not found!'}), 404
     
-    return jsonify(tip_list)
+    return jsonify({'success': True, **tracker.status(shelter_id)})
+
+@app.route('/api/tips')
+def get_tips():
+    return responses.send_payload(tips_payload(), max_age=300)
 
 @app.route('/api/ai-assistant', methods=['POST'])
 def ai_assistant_endpoint():
@@ -626,48 +1325,99 @@ def ai_assistant_endpoint():
     data = request.get_json()
     command = data.get('command', '')
     
-    # Use the enhanced AI assistant to process the command
-    if ai_assistant:
-        result = ai_assistant.process_command(command)
-        if isinstance(result, dict):
-            return jsonify({
-                'response': result['message'],
-                'type': result['type'],
-                'action': result.get('action')
-            })
-        else:
-            return jsonify({'response': result, 'type': 'info', 'action': None})
-    else:
-        # Fallback for when AI assistant is not available
-        command_lower = command.lower()
-        if any(word in command_lower for word in ['emergency', 'help', 'danger']):
-            return jsonify({'response': '🚨 Emergency activated! Sharing location and calling emergency contacts.', 'type': 'emergency', 'action': 'emergencyAlert()'})
-        elif 'location' in command_lower:
-            return jsonify({'response': '📍 Location sharing activated with trusted contacts.', 'type': 'location', 'action': 'startLocationTracking()'})
-        elif 'fake call' in command_lower:
-            return jsonify({'response': '📞 Fake call will be initiated in 10 seconds.', 'type': 'fake_call', 'action': 'initiateFakeCall()'})
-        elif 'siren' in command_lower:
-            return jsonify({'response': '🔊 Siren alarm activated to alert nearby people.', 'type': 'siren', 'action': 'activateSiren()'})
-        elif 'shelter' in command_lower or 'safe place' in command_lower:
-            return jsonify({'response': '🏠 Finding nearest safe shelters...', 'type': 'shelter', 'action': 'showSection("shelters")'})
-        else:
-            return jsonify({'response': "🛡️ I'm here to help with safety and emergency assistance.\n\nYou can ask me about:\n• Emergency procedures\n• Safety tips\n• Location tracking\n• Safe shelters\n• Filing complaints\n• And more!", 'type': 'info', 'action': None})
+    return jsonify(assistant_reply(command))
+
+@app.route('/api/responders/opt-in', methods=['POST'])
+def set_responder_opt_in():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    enabled = bool(data.get('enabled', True))
+    get_repos().users.set_responder_opt_in(session['user_id'], enabled)
+    responders.index.set_opt_in(session['user_id'], enabled)
+    
+    return jsonify({'success': True, 'enabled': enabled})
+
+@app.route('/api/sos', methods=['POST'])
+def send_sos():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        latitude, longitude = float(data['latitude']), float(data['longitude'])
+        k = min(max(int(data.get('k', responders.DEFAULT_K)), 1), responders.MAX_K)
+        radius_m = min(max(float(data.get('radius_m', responders.DEFAULT_RADIUS_M)), 100), responders.MAX_RADIUS_M)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid SOS request!'}), 400
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return jsonify({'success': False, 'message': 'Invalid location!'}), 400
+    
+    nearby = alert_responders(session['user_id'], 'sos_nearby', latitude, longitude, k=k, radius_m=radius_m)
+    metrics.inc('sos_total', notified='yes' if nearby else 'no')
+    
+    return jsonify({
+        'success': True,
+        'notified': len(nearby),
+        'responders': [{'distance_m': distance_m, 'seen_seconds_ago': age} for _, distance_m, age in nearby],
+    })
 
 @app.route('/api/siren', methods=['POST'])
 def activate_siren():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # This would trigger audio alert and potentially notify authorities
-    return jsonify({'success': True, 'message': 'Siren activated!'})
+    return jsonify(siren_reply(session['user_id']))
 
 @app.route('/api/fake-call', methods=['POST'])
 def fake_call():
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    return jsonify({'success': True, 'message': 'Fake call initiated! You will receive a call in 10 seconds.'})
+    payload, status = fake_call_reply(session['user_id'], request.get_json(silent=True))
+    return jsonify(payload), status
+
+# Warm-up
+def warm_up():
+    """Load hot datasets and indexes before serving; returns seconds per step and in total
+
+    Without it the first requests to each worker pay for compiling templates,
+    reading shelters and tips from cold database pages and building the
+    in-memory indexes. Run it once in every worker process, after the fork:
+    the connections it opens must not be shared with a parent.
+    """
+    steps = [
+        ('templates', lambda: assets.warm(app)),
+        ('shelters', shelters_payload),
+        ('tips', tips_payload),
+        ('assistant', ai_assistant.build_index if ai_assistant else lambda: None),
+        ('route_safety', lambda: route_safety.grid.sync(get_db_connection, shard_connects=get_shards().connectors())),
+        ('responders', lambda: responders.index.sync(get_db_connection, shard_connects=get_shards().connectors())),
+        ('geofences', lambda: geofence.engine.sync(get_db_connection)),
+        ('shelter_capacity', get_capacity_tracker),
+    ]
+    timings = {}
+    began = time.perf_counter()
+    with app.app_context():
+        for name, step in steps:
+            started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                # The requests that need it will report the same error
+                print(f"Warm-up step {name} failed: {e}")
+                continue
+            timings[name] = time.perf_counter() - started
+    timings['total'] = time.perf_counter() - began
+    return timings
+
+def report_warm_up(timings):
+    slowest = sorted((name for name in timings if name != 'total'), key=timings.get, reverse=True)[:3]
+    details = ', '.join(f"{name} {timings[name] * 1000:.0f}ms" for name in slowest)
+    print(f"Worker {os.getpid()} warmed up in {timings['total']:.2f}s ({details})")
 
 if __name__ == '__main__':
     init_db()
+    report_warm_up(warm_up())
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,355 @@
+"""
+Women Security System - Async Server
+ASGI application serving the hot /api/* endpoints without tying up a thread per
+request. It shares its business logic with the Flask routes in app.py, and any
+other path is handed to the Flask app in a worker thread.
+
+Run with any ASGI server, for example:
+    SECRET_KEY=... uvicorn asgi_app:application --workers 4
+
+Location pings go through DBWriter: one thread takes the queued pings and
+stores them in batches with the location repository's add_many() (group
+commit), so thousands of pending requests share a handful of transactions
+instead of contending for the lock. It is the same repository the Flask
+route uses (get_repos() in app.py). With SHARD_COUNT > 1 there is one writer
+per shard (see sharding.py). The endpoints served here are counted in
+/metrics like the Flask routes of the same name.
+"""
+
+import asyncio
+import io
+import json
+import queue
+import sys
+import threading
+import time
+from http.cookies import SimpleCookie
+
+from itsdangerous import BadSignature
+
+import app as flask_module
+import metrics
+import ping_filter
+import responses
+
+flask_app = flask_module.app
+
+
+class DBWriter:
+    """Dedicated writer thread with group commit of location pings"""
+
+    def __init__(self, max_batch=1024):
+        self._max_batch = max_batch
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def add(self, user_id, latitude, longitude):
+        """Queue a ping; the returned future resolves to its id once committed"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put(((user_id, latitude, longitude), future, loop))
+        return future
+
+    def _run(self):
+        running = True
+        while running:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self._max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        # The same location repository as the Flask route (app.config['REPOSITORIES'] or SQLite)
+        locations = flask_module.get_repos().locations
+        try:
+            results = locations.add_many([ping for ping, _, _ in batch])
+        except Exception:
+            # Retry one by one so a single bad ping only fails its own request
+            results = []
+            for ping, _, _ in batch:
+                try:
+                    results.append(locations.add(*ping))
+                except Exception as e:
+                    results.append(e)
+        for (_, future, loop), result in zip(batch, results):
+            loop.call_soon_threadsafe(_resolve, future, result)
+
+
+def _resolve(future, result):
+    if future.cancelled():
+        return
+    if isinstance(result, Exception):
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class ShardWriters:
+    """A DBWriter per shard of the per-user tables, so shards commit side by side"""
+
+    def __init__(self):
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def _writer(self, index):
+        with self._lock:
+            writer = self._writers.get(index)
+            if writer is None:
+                writer = self._writers[index] = DBWriter()
+            return writer
+
+    def start(self):
+        for index in range(flask_module.get_shards().count):
+            self._writer(index).start()
+
+    def stop(self):
+        with self._lock:
+            writers = list(self._writers.values())
+            self._writers.clear()
+        for writer in writers:
+            writer.stop()
+
+    def add(self, user_id, latitude, longitude):
+        """Queue a ping on the writer of the shard holding user_id's rows; see DBWriter.add()"""
+        return self._writer(flask_module.get_shards().index_of(user_id)).add(user_id, latitude, longitude)
+
+
+writer = ShardWriters()
+
+
+# Request helpers
+def _header(scope, name):
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def session_user_id(scope):
+    """user_id from the Flask session cookie, or None"""
+    cookie_header = _header(scope, b'cookie')
+    if not cookie_header:
+        return None
+    cookie = SimpleCookie()
+    cookie.load(cookie_header)
+    morsel = cookie.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if morsel is None:
+        return None
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        data = serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('user_id')
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _send_json(send, status, payload):
+    body = responses.dumps(payload)
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode()),
+        (b'access-control-allow-origin', b'*'),
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# API handlers: (user_id, json body) -> (status, payload)
+async def update_location(user_id, data):
+    try:
+        latitude = float(data['latitude'])
+        longitude = float(data['longitude'])
+    except (KeyError, TypeError, ValueError):
+        return 400, {'error': 'latitude and longitude are required'}
+    loop = asyncio.get_running_loop()
+    # Both touch SQLite and the shared indexes, so they run in a worker thread like the Flask fallback
+    if await loop.run_in_executor(None, flask_module.ping_is_new, user_id, latitude, longitude):
+        with metrics.observe_phase('commit', endpoint='update_location'):
+            ping_id = await writer.add(user_id, latitude, longitude)
+        ping_filter.pings.stored(user_id, latitude, longitude, ping_id)
+    events = await loop.run_in_executor(None, flask_module.on_location_update, user_id, latitude, longitude)
+    if events:
+        return 200, {'success': True, 'events': events}
+    return 200, {'success': True}
+
+
+async def ai_assistant_endpoint(user_id, data):
+    return 200, flask_module.assistant_reply(data.get('command', ''))
+
+
+async def activate_siren(user_id, data):
+    return 200, flask_module.siren_reply(user_id)
+
+
+async def fake_call(user_id, data):
+    payload, status = await asyncio.get_running_loop().run_in_executor(None, flask_module.fake_call_reply,
+                                                                       user_id, data)
+    return status, payload
+
+
+API_ROUTES = {
+    ('POST', '/api/location'): update_location,
+    ('POST', '/api/ai-assistant'): ai_assistant_endpoint,
+    ('POST', '/api/siren'): activate_siren,
+    ('POST', '/api/fake-call'): fake_call,
+}
+
+
+# Everything else goes to Flask
+def _wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _call_flask(scope, receive, send):
+    body = await _read_body(receive)
+    loop = asyncio.get_running_loop()
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = await loop.run_in_executor(None, flask_app, _wsgi_environ(scope, body), start_response)
+    iterator = iter(result)
+    done = object()
+    try:
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        # Pull chunks one at a time so streamed responses stay streamed
+        while True:
+            chunk = await loop.run_in_executor(None, next, iterator, done)
+            if chunk is done:
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            flask_module.init_db()
+            writer.start()
+            timings = await asyncio.get_running_loop().run_in_executor(None, flask_module.warm_up)
+            flask_module.report_warm_up(timings)
+            flask_module.start_jobs()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await asyncio.get_running_loop().run_in_executor(None, writer.stop)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    handler = API_ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await _call_flask(scope, receive, send)
+        return
+    await _serve_api(handler, scope, receive, send)
+
+
+async def _handle_api(handler, scope, receive, send):
+    user_id = session_user_id(scope)
+    if user_id is None:
+        await _send_json(send, 401, {'error': 'Unauthorized'})
+        return
+    body = await _read_body(receive)
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        await _send_json(send, 400, {'error': 'Invalid JSON'})
+        return
+    if not isinstance(data, dict):
+        await _send_json(send, 400, {'error': 'Invalid JSON'})
+        return
+    status, payload = await handler(user_id, data)
+    await _send_json(send, status, payload)
+
+
+async def _serve_api(handler, scope, receive, send):
+    # Counted in /metrics under the Flask endpoint of the same name
+    started = time.perf_counter()
+    metrics.request_started()
+    sent = {}
+
+    async def send_counted(message):
+        if message['type'] == 'http.response.start':
+            sent['status'] = message['status']
+        else:
+            sent['size'] = sent.get('size', 0) + len(message.get('body', b''))
+        await send(message)
+
+    try:
+        await _handle_api(handler, scope, receive, send_counted)
+    finally:
+        metrics.request_finished()
+        metrics.record_request(handler.__name__, scope['method'], sent.get('status', 500),
+                               time.perf_counter() - started, sent.get('size'))
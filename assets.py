@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Women Security System - Static Asset Pipeline
+Content-hashed static files with gzip/brotli variants, cached page renders and
+Jinja bytecode cache warming.
+
+Build step (run on deploy):
+    python assets.py build
+
+This copies every file under static/ to static/dist/ with a content hash in its
+name, writes .gz/.br variants and a manifest.json, and compiles all templates
+into the bytecode cache. At runtime url_for('static', ...) resolves to the
+hashed file, which is served with a far-future Cache-Control and the best
+pre-compressed variant the client accepts.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from flask import current_app, render_template, send_from_directory
+from jinja2 import FileSystemBytecodeCache, TemplateNotFound
+
+import responses
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+HASH_LENGTH = 10
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.html', '.svg', '.json', '.txt', '.map', '.xml')
+FAR_FUTURE = 'public, max-age=31536000, immutable'
+
+# Pages that render the same for every visitor once the session check has passed
+PAGES = ('landing-fixed.html', 'index.html', 'signin.html', 'signup.html', 'auth-modal.html', 'dashboard.html')
+
+_manifest = {}
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def build_static(static_dir):
+    """Fingerprint and pre-compress every static file; returns the manifest"""
+    out_dir = os.path.join(static_dir, DIST_DIR)
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != out_dir]
+        for name in files:
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            stem, ext = os.path.splitext(relative)
+            hashed = f'{stem}.{_file_hash(source)}{ext}'
+            target = os.path.join(out_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(source, 'rb') as f:
+                    body = f.read()
+                with open(target + '.gz', 'wb') as f:
+                    f.write(responses.compress(body, 'gzip', fast=False))
+                if responses.brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(responses.compress(body, 'br', fast=False))
+            manifest[relative] = hashed
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir):
+    path = os.path.join(static_dir, DIST_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def warm_templates(app):
+    """Compile every template so the bytecode cache is populated; returns how many were compiled"""
+    compiled = 0
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+            compiled += 1
+        except TemplateNotFound:
+            continue
+    return compiled
+
+
+def render_page(template):
+    """Render a page once and serve the cached, pre-compressed bytes afterwards"""
+    if current_app.debug or current_app.config.get('TEMPLATES_AUTO_RELOAD'):
+        return render_template(template)
+    payload = responses.cached_payload(f'page:{template}', lambda: render_template(template).encode('utf-8'),
+                                       ttl=float('inf'), mimetype='text/html')
+    # Browsers revalidate with the ETag, so a deploy is picked up immediately
+    return responses.send_payload(payload, cache_control='no-cache')
+
+
+def prerender_pages(app):
+    """Fill the page cache ahead of the first request; returns the pages rendered"""
+    rendered = []
+    with app.test_request_context('/'):
+        for template in PAGES:
+            try:
+                render_page(template)
+            except TemplateNotFound:
+                continue
+            rendered.append(template)
+    return rendered
+
+
+def warm(app):
+    """Startup check: compile templates and pre-render pages; returns timing details"""
+    start = time.perf_counter()
+    compiled = warm_templates(app)
+    pages = prerender_pages(app)
+    return {'templates': compiled, 'pages': pages, 'seconds': time.perf_counter() - start}
+
+
+def _hashed_static_url(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        hashed = _manifest.get(values['filename'])
+        if hashed is not None:
+            values['filename'] = f'{DIST_DIR}/{hashed}'
+
+
+def _send_fingerprinted(app, filename):
+    dist = os.path.join(app.static_folder, DIST_DIR)
+    accepted = responses._accepted_encodings()
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if candidate in accepted and os.path.exists(os.path.join(dist, filename + suffix)):
+            encoding = candidate
+            break
+    if encoding:
+        response = send_from_directory(dist, filename + ('.br' if encoding == 'br' else '.gz'))
+        response.headers['Content-Encoding'] = encoding
+        # Keep the type of the original file, not of the .gz/.br one
+        response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    else:
+        response = send_from_directory(dist, filename)
+    response.headers['Cache-Control'] = FAR_FUTURE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    """Serve fingerprinted assets and keep compiled templates in a bytecode cache"""
+    global _manifest
+    cache_dir = app.config.setdefault('JINJA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'security_system_jinja'))
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+    if app.static_folder:
+        _manifest = load_manifest(app.static_folder)
+    app.url_defaults(_hashed_static_url)
+    app.add_url_rule(f'{app.static_url_path}/{DIST_DIR}/<path:filename>', 'fingerprinted_static',
+                     lambda filename: _send_fingerprinted(app, filename))
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'build':
+        print("Usage: python assets.py build")
+        return 1
+    from app import app
+    start = time.perf_counter()
+    manifest = build_static(app.static_folder) if os.path.isdir(app.static_folder) else {}
+    compiled = warm_templates(app)
+    print(f"Fingerprinted {len(manifest)} static files, compiled {compiled} templates "
+          f"in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Women Security System - Online Backups
+Snapshots of the live databases (the primary and every shard) taken while
+the app keeps serving, gzip-compressed and checksummed, with retention and
+a timed restore.
+
+    python backup.py create [--db security_system.db] [--shards N] [--dir backups] [--keep 14]
+    python backup.py list [--dir backups]
+    python backup.py verify SNAPSHOT.json
+    python backup.py restore SNAPSHOT.json [--db security_system.db]
+
+Pages are copied with SQLite's online backup API PAGES_PER_STEP at a time,
+sleeping STEP_SLEEP seconds between steps, so a writer never waits on the
+backup for more than one short step. A WAL database is copied from one read
+snapshot, which WAL writers don't wait on at all. In other journal modes a
+write through another connection makes SQLite restart the copy; after
+MAX_RESTARTS restarts the rest is copied in one step, which holds writers
+off for the whole copy (switch busy databases to WAL to avoid that).
+
+Each snapshot is a set of snapshot-<time>-<file>.gz files and a
+snapshot-<time>.json manifest with their SHA-256 checksums, written last so
+a snapshot without a manifest never counts. Set BACKUP_INTERVAL_HOURS to
+take snapshots from the app: its leader worker checks every CHECK_INTERVAL
+seconds whether one is due (see scheduler.py), and a lock file in the backup
+directory lets only one process take a due snapshot.
+"""
+
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import db_location
+import metrics
+import sharding
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: every worker's scheduler may run; the due check still spaces snapshots out
+    fcntl = None
+
+PAGES_PER_STEP = 256
+STEP_SLEEP = 0.005
+MAX_RESTARTS = 20
+DEFAULT_KEEP = 14
+CHUNK_SIZE = 1024 * 1024
+# How often a scheduler looks whether a snapshot is due (seconds)
+CHECK_INTERVAL = 60.0
+
+
+class BackupError(Exception):
+    pass
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def database_files(database, shard_count=1):
+    """Paths of every database file to back up: the primary, then its shards"""
+    shards = sharding.ShardRouter(database, shard_count).paths
+    return [database] + [path for path in shards if path != database]
+
+
+def copy_online(source, target, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Copy a live database to target in steps of pages; returns (page count, restarts)"""
+    src = db_location.connect(source, isolation_level=None)
+    dst = sqlite3.connect(target)
+    state = {'remaining': None, 'restarts': 0, 'total': 0}
+    if src.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+        # Readers don't block WAL writers: copy one snapshot, so writes never restart the copy
+        src.execute('BEGIN')
+        src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+
+    def progress(status, remaining, total):
+        if state['remaining'] is not None and remaining >= state['remaining']:
+            # Someone wrote to the source and SQLite started over
+            state['restarts'] += 1
+            if state['restarts'] > MAX_RESTARTS:
+                raise _TooManyRestarts()
+        state['remaining'] = remaining
+        state['total'] = total
+        if remaining and sleep:
+            # Between steps the source is unlocked; let writers in
+            time.sleep(sleep)
+
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+        except _TooManyRestarts:
+            src.backup(dst, pages=-1)
+            state['total'] = dst.execute('PRAGMA page_count').fetchone()[0]
+        return state['total'], state['restarts']
+    finally:
+        dst.close()
+        if src.in_transaction:
+            src.execute('COMMIT')
+        src.close()
+
+
+class _HashingWriter:
+    """File wrapper computing the SHA-256 of everything written"""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self._f.write(data)
+
+    def flush(self):
+        self._f.flush()
+
+
+def _compress(source, target):
+    """gzip source into target; returns (sha256 hex, compressed bytes)"""
+    with open(target, 'wb') as f:
+        writer = _HashingWriter(f)
+        with gzip.GzipFile(fileobj=writer, mode='wb', mtime=0) as gz, open(source, 'rb') as src:
+            shutil.copyfileobj(src, gz, CHUNK_SIZE)
+        f.flush()
+        os.fsync(f.fileno())
+    return writer.sha256.hexdigest(), writer.size
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create(database, directory, shard_count=1, keep=DEFAULT_KEEP, pages=PAGES_PER_STEP, sleep=STEP_SLEEP):
+    """Take a snapshot of every database file into directory; returns the manifest"""
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    created = datetime.now(timezone.utc)
+    stamp = created.strftime('%Y%m%dT%H%M%S%fZ')
+    manifest = {
+        'created': created.isoformat(),
+        'database': os.path.basename(database),
+        'shard_count': shard_count,
+        'files': [],
+    }
+    with tempfile.TemporaryDirectory(dir=directory, prefix='.snapshot-') as scratch:
+        for path in database_files(database, shard_count):
+            step_started = time.perf_counter()
+            name = os.path.basename(path)
+            copy = os.path.join(scratch, name)
+            page_count, restarts = copy_online(path, copy, pages=pages, sleep=sleep)
+            filename = f'snapshot-{stamp}-{name}.gz'
+            partial = os.path.join(scratch, filename)
+            sha256, size = _compress(copy, partial)
+            os.replace(partial, os.path.join(directory, filename))
+            manifest['files'].append({
+                'name': name,
+                'file': filename,
+                'sha256': sha256,
+                'bytes': size,
+                'pages': page_count,
+                'restarts': restarts,
+                'seconds': round(time.perf_counter() - step_started, 3),
+            })
+    manifest['seconds'] = round(time.perf_counter() - started, 3)
+    # The manifest goes last: a snapshot without one was interrupted
+    manifest_path = os.path.join(directory, f'snapshot-{stamp}.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_path + '.tmp', manifest_path)
+    manifest['path'] = manifest_path
+    rotate(directory, keep)
+    return manifest
+
+
+def snapshots(directory):
+    """Manifest paths in directory, oldest first"""
+    return sorted(glob.glob(os.path.join(directory, 'snapshot-*.json')))
+
+
+def load(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise BackupError(f'Unreadable snapshot manifest {manifest_path}: {e}')
+    manifest['path'] = manifest_path
+    return manifest
+
+
+def rotate(directory, keep=DEFAULT_KEEP):
+    """Delete all but the newest keep snapshots; returns the manifests removed"""
+    removed = []
+    for manifest_path in snapshots(directory)[:-keep] if keep > 0 else []:
+        try:
+            manifest = load(manifest_path)
+        except BackupError:
+            manifest = {'files': []}
+        # Manifest first, so a half-deleted snapshot is never listed as complete
+        os.remove(manifest_path)
+        for entry in manifest['files']:
+            try:
+                os.remove(os.path.join(directory, entry['file']))
+            except FileNotFoundError:
+                pass
+        removed.append(manifest_path)
+    return removed
+
+
+def verify(manifest_path):
+    """Check every file of a snapshot against its checksum; returns the manifest, raises BackupError"""
+    manifest = load(manifest_path)
+    directory = os.path.dirname(manifest_path)
+    for entry in manifest['files']:
+        path = os.path.join(directory, entry['file'])
+        if not os.path.exists(path):
+            raise BackupError(f"{entry['file']} is missing")
+        if _sha256(path) != entry['sha256']:
+            raise BackupError(f"{entry['file']} does not match its checksum")
+    return manifest
+
+
+def restore(manifest_path, database, pages=-1):
+    """Verify a snapshot and copy it over database and its shards; returns per-file and total seconds
+
+    The copy goes through the backup API, so connections already open on
+    the target see the restored data. Restart the app afterwards: its
+    in-memory indexes still describe the old data.
+    """
+    started = time.perf_counter()
+    manifest = verify(manifest_path)
+    directory = os.path.dirname(manifest_path)
+    targets = database_files(database, manifest['shard_count'])
+    if len(targets) != len(manifest['files']):
+        raise BackupError('Snapshot does not match the database layout')
+    timings = []
+    for entry, target in zip(manifest['files'], targets):
+        file_started = time.perf_counter()
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(target)), prefix='.restore-') as scratch:
+            copy = os.path.join(scratch, entry['name'])
+            with gzip.open(os.path.join(directory, entry['file']), 'rb') as gz, open(copy, 'wb') as f:
+                shutil.copyfileobj(gz, f, CHUNK_SIZE)
+            conn = sqlite3.connect(copy)
+            try:
+                check = conn.execute('PRAGMA quick_check').fetchone()[0]
+                if check != 'ok':
+                    raise BackupError(f"{entry['file']} failed its integrity check: {check}")
+            finally:
+                conn.close()
+            copy_online(copy, target, pages=pages, sleep=0)
+        timings.append({'name': entry['name'], 'target': target,
+                        'seconds': round(time.perf_counter() - file_started, 3)})
+    return {'files': timings, 'seconds': round(time.perf_counter() - started, 3)}
+
+
+def due(directory, interval_seconds, now=None):
+    """Whether the newest snapshot in directory is older than interval_seconds"""
+    paths = snapshots(directory)
+    if not paths:
+        return True
+    return (now or time.time()) - os.path.getmtime(paths[-1]) >= interval_seconds
+
+
+class BackupScheduler:
+    """Takes a snapshot every interval_seconds when run_if_due() is called regularly (the app's jobs do)"""
+
+    def __init__(self, database, directory, interval_seconds, shard_count=1, keep=DEFAULT_KEEP):
+        self.database = database
+        self.directory = directory
+        self.interval_seconds = interval_seconds
+        self.shard_count = shard_count
+        self.keep = keep
+
+    def run_if_due(self):
+        """Take a snapshot if one is due and no other worker is taking it; returns the manifest or None"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None
+            # Checked under the lock: another worker may have just finished one
+            if not due(self.directory, self.interval_seconds):
+                return None
+            try:
+                manifest = create(self.database, self.directory, self.shard_count, self.keep)
+            except Exception:
+                metrics.inc('backups_total', status='error')
+                raise
+            metrics.inc('backups_total', status='ok')
+            return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Online database snapshots')
+    parser.add_argument('command', choices=['create', 'list', 'verify', 'restore'])
+    parser.add_argument('snapshot', nargs='?', help='snapshot manifest (.json) for verify and restore')
+    parser.add_argument('--db', default=db_location.resolve(os.environ.get('DATABASE_URL')))
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('SHARD_COUNT', 1)))
+    parser.add_argument('--dir', default=os.environ.get('BACKUP_DIR', 'backups'))
+    parser.add_argument('--keep', type=int, default=DEFAULT_KEEP)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'create':
+            manifest = create(args.db, args.dir, args.shards, args.keep)
+            size = sum(entry['bytes'] for entry in manifest['files'])
+            print(f"Wrote {manifest['path']} ({len(manifest['files'])} files, {size:,} bytes) "
+                  f"in {manifest['seconds']:.2f}s")
+        elif args.command == 'list':
+            for manifest_path in snapshots(args.dir):
+                manifest = load(manifest_path)
+                size = sum(entry['bytes'] for entry in manifest['files'])
+                print(f"{os.path.basename(manifest_path)}  {manifest['created']}  {size:>14,} bytes  "
+                      f"{len(manifest['files'])} files")
+        elif not args.snapshot:
+            parser.error(f'{args.command} needs a snapshot manifest')
+        elif args.command == 'verify':
+            manifest = verify(args.snapshot)
+            print(f"{args.snapshot}: {len(manifest['files'])} files OK")
+        else:
+            result = restore(args.snapshot, args.db)
+            for entry in result['files']:
+                print(f"Restored {entry['target']} in {entry['seconds']:.2f}s")
+            print(f"Restore finished in {result['seconds']:.2f}s; restart the app to reload its caches")
+    except BackupError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
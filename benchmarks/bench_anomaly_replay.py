@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: movement anomaly replay throughput
+
+Generates synthetic tracks (N users pinging every 10 s, with stops and a few
+teleports), then replays them with the vectorized replay_arrays() and with the
+streaming MovementDetector one point at a time.
+
+Usage: python benchmarks/bench_anomaly_replay.py [--points 5000000] [--users 1000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anomaly
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--points', type=int, default=5000000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--streaming-points', type=int, default=200000)
+    args = parser.parse_args()
+
+    np = anomaly.np
+    if np is None:
+        print("numpy is not installed; only the streaming detector can be measured")
+        return 1
+
+    rng = np.random.default_rng(1)
+    per_user = args.points // args.users
+    n = per_user * args.users
+    user_ids = np.repeat(np.arange(args.users), per_user)
+    timestamps = np.tile(np.arange(per_user) * 10.0, args.users)
+    # Walking with some stops (zero steps) and rare 0.5 degree jumps
+    steps = rng.normal(0, 0.0001, (2, n))
+    steps[:, rng.random(n) < 0.3] = 0
+    steps[0, rng.random(n) < 0.0005] += 0.5
+    lats = 28.6 + np.cumsum(steps[0].reshape(args.users, per_user), axis=1).ravel()
+    lons = 77.2 + np.cumsum(steps[1].reshape(args.users, per_user), axis=1).ravel()
+
+    start = time.perf_counter()
+    events = anomaly.replay_arrays(user_ids, lats, lons, timestamps)
+    elapsed = time.perf_counter() - start
+    print(f"Vectorized replay: {n:,} points in {elapsed:.2f}s "
+          f"({n / elapsed:,.0f} points/s), {len(events):,} events")
+
+    m = min(args.streaming_points, n)
+    detector = anomaly.MovementDetector(alerts=None)
+    columns = (user_ids[:m].tolist(), lats[:m].tolist(), lons[:m].tolist(), timestamps[:m].tolist())
+    start = time.perf_counter()
+    for user_id, lat, lon, ts in zip(*columns):
+        detector.update(user_id, lat, lon, ts)
+    elapsed = time.perf_counter() - start
+    print(f"Streaming detector: {m:,} points in {elapsed:.2f}s ({m / elapsed:,.0f} points/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: concurrent connections on the async API server
+
+Opens N concurrent in-process clients against asgi_app.application. Each
+client posts location updates with a think time in between, the way a phone
+tracker behaves. It reports throughput and how many requests were in flight at
+once. A WSGI deployment needs one thread per in-flight request, so the peak
+column is the thread count the same load would need under gunicorn.
+
+Usage: python benchmarks/bench_async_api.py [--clients 1000,10000,50000] [--updates 3] [--dir PATH]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+import asgi_app
+
+
+class Stats:
+    in_flight = 0
+    peak = 0
+
+
+async def client(cookie, updates, think):
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/location', 'query_string': b'',
+             'headers': [(b'cookie', cookie), (b'content-type', b'application/json')], 'http_version': '1.1'}
+    body = b'{"latitude": 28.6139, "longitude": 77.2090}'
+    for _ in range(updates):
+        sent = False
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                return {'type': 'http.disconnect'}
+            sent = True
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            if message['type'] == 'http.response.start' and message['status'] != 200:
+                raise RuntimeError(f"status {message['status']}")
+
+        Stats.in_flight += 1
+        Stats.peak = max(Stats.peak, Stats.in_flight)
+        await asgi_app.application(scope, receive, send)
+        Stats.in_flight -= 1
+        await asyncio.sleep(think)
+
+
+async def run(clients, updates, think):
+    serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+    Stats.in_flight = Stats.peak = 0
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        client(f"{app_module.app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': i})}".encode(),
+               updates, think)
+        for i in range(clients)
+    ])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--clients', default='1000,10000,50000')
+    parser.add_argument('--updates', type=int, default=3)
+    parser.add_argument('--think', type=float, default=0.05, help='seconds between a client\'s updates')
+    parser.add_argument('--dir', help='where to create the database (default: a temporary directory; '
+                        '/dev/shm keeps it in RAM)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        app_module.DATABASE = os.path.join(directory, 'bench.db')
+        app_module.init_db()
+        print(f"{'clients':>8} {'requests':>9} {'seconds':>8} {'req/s':>9} {'peak in flight':>15}")
+        for clients in [int(c) for c in args.clients.split(',')]:
+            elapsed = asyncio.run(run(clients, args.updates, args.think))
+            requests = clients * args.updates
+            print(f"{clients:>8} {requests:>9} {elapsed:>8.2f} {requests / elapsed:>9.0f} {Stats.peak:>15}")
+        asgi_app.writer.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: writer latency while an online backup runs
+
+A writer thread commits one ping per transaction, as /api/location does,
+while the database is copied three ways: not at all (baseline), in one
+backup step (the whole copy under a read lock) and in small steps with
+sleeps between them (backup.copy_online), in both rollback-journal and WAL
+mode. Reports the writer's p50/p99/max commit latency, the copy time and how
+often a stepped copy was restarted by the writer.
+
+Usage: python benchmarks/bench_backup.py [--rows 500000] [--pages 256] [--sleep 0.005] [--dir PATH]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+
+
+def make_database(path, rows, journal_mode):
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    conn.execute('CREATE TABLE location_tracking (id INTEGER PRIMARY KEY, user_id INTEGER, '
+                 'latitude REAL, longitude REAL, timestamp TEXT DEFAULT CURRENT_TIMESTAMP)')
+    conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude) VALUES (?, ?, ?)',
+                     ((i % 1000, 28.6 + i * 1e-7, 77.2) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def measure(database, copy):
+    stop = threading.Event()
+    latencies = []
+
+    def write():
+        conn = sqlite3.connect(database, timeout=60)
+        while not stop.is_set():
+            began = time.perf_counter()
+            conn.execute('INSERT INTO location_tracking (user_id, latitude, longitude) VALUES (1, 28.6, 77.2)')
+            conn.commit()
+            latencies.append(time.perf_counter() - began)
+            time.sleep(0.001)
+        conn.close()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    began = time.perf_counter()
+    restarts = 0
+    if copy:
+        _, restarts = copy()
+    else:
+        time.sleep(1.0)
+    elapsed = time.perf_counter() - began
+    stop.set()
+    writer.join()
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000
+    return pick(0.5), pick(0.99), latencies[-1] * 1000, elapsed, restarts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--pages', type=int, default=backup.PAGES_PER_STEP)
+    parser.add_argument('--sleep', type=float, default=backup.STEP_SLEEP)
+    parser.add_argument('--dir', help='where to create the database (default: a temporary directory)')
+    args = parser.parse_args()
+
+    for journal_mode in ('delete', 'wal'):
+        with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+            database = os.path.join(directory, 'bench.db')
+            make_database(database, args.rows, journal_mode)
+            target = os.path.join(directory, 'copy.db')
+            print(f"{journal_mode} journal, {os.path.getsize(database) / 1e6:.1f} MB:")
+            runs = [
+                ('no backup', None),
+                ('one step', lambda: backup.copy_online(database, target, pages=-1, sleep=0)),
+                (f'{args.pages} pages/step', lambda: backup.copy_online(database, target, args.pages, args.sleep)),
+            ]
+            for name, copy in runs:
+                p50, p99, worst, elapsed, restarts = measure(database, copy)
+                print(f"{name:>16}: writer p50 {p50:6.2f} ms  p99 {p99:6.2f} ms  max {worst:7.2f} ms  "
+                      f"(copy {elapsed:.2f}s, {restarts} restarts)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: geofence evaluation throughput
+
+Loads N fences (default 100k, ~200 m circles spread over a metro area and
+owned by N/3 users), then replays random pings through
+GeofenceEngine.evaluate(). It compares against the naive check of every fence
+on every ping.
+
+Usage: python benchmarks/bench_geofence.py [--fences 100000] [--pings 200000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo
+import geofence
+from alerts import AlertQueue
+
+# Roughly the Delhi NCR area
+LAT_RANGE = (28.40, 28.90)
+LON_RANGE = (76.90, 77.50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--fences', type=int, default=100000)
+    parser.add_argument('--pings', type=int, default=200000)
+    parser.add_argument('--naive-pings', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    users = max(1, args.fences // 3)
+    fences = []
+    for i in range(args.fences):
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        fences.append(geofence.Geofence(i, i % users, f'zone {i}', geo.circle_polygon(lat, lon, 200, vertices=16)))
+
+    engine = geofence.GeofenceEngine(alerts=AlertQueue())
+    start = time.perf_counter()
+    engine.load(fences)
+    build = time.perf_counter() - start
+
+    pings = [(rng.randrange(users), rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.pings)]
+    start = time.perf_counter()
+    for user_id, lat, lon in pings:
+        engine.evaluate(user_id, lat, lon)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user_id, lat, lon in pings[:args.naive_pings]:
+        [f for f in fences if f.user_id == user_id and geo.point_in_polygon(lat, lon, f.polygon)]
+    naive = (time.perf_counter() - start) / args.naive_pings * args.pings
+
+    candidates = sum(len(engine.candidates(lat, lon)) for _, lat, lon in pings[:10000]) / min(10000, len(pings))
+    print(f"fences: {args.fences:,}  index build: {build:.2f}s  avg bbox candidates/ping: {candidates:.2f}")
+    print(f"indexed: {args.pings / indexed:,.0f} pings/s ({indexed / args.pings * 1e6:.1f} us/ping)")
+    print(f"naive:   {args.pings / naive:,.0f} pings/s ({naive / args.pings * 1e6:.1f} us/ping, extrapolated)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: location pings stored with and without the stationary filter
+Replays an hour of pings, one every 5 seconds per user, through the SQLite
+location repository as /api/location stores them. Most users sit still with
+GPS jitter, the others walk. With the filter (ping_filter.py) pings near the
+last stored one are merged and their dwell times flushed once a minute.
+Reports rows written, the reduction ratio, time spent writing and the size
+of the table and index.
+
+Usage: python benchmarks/bench_ping_filter.py [--users 100] [--moving 0.2] [--dir PATH]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo
+import ping_filter
+import repositories
+import sharding
+
+START = 1_700_000_000.0
+HOUR = 3600
+PING_EVERY = 5
+WALKING_MPS = 1.4
+# Standard deviation of GPS noise
+JITTER_M = 4.0
+
+_DEG_PER_M = 180 / (math.pi * geo.EARTH_RADIUS_M)
+
+
+def tracks(users, moving, rng):
+    """Per ping time, the (user_id, latitude, longitude) posted by every user"""
+    state = []
+    for user_id in range(1, users + 1):
+        heading = rng.uniform(0, 2 * math.pi) if rng.random() < moving else None
+        state.append([user_id, 28.5 + rng.random() * 0.2, 77.1 + rng.random() * 0.2, heading])
+    for second in range(0, HOUR, PING_EVERY):
+        pings = []
+        for user in state:
+            user_id, latitude, longitude, heading = user
+            if heading is not None:
+                user[1] = latitude = latitude + math.cos(heading) * WALKING_MPS * PING_EVERY * _DEG_PER_M
+                user[2] = longitude = longitude + math.sin(heading) * WALKING_MPS * PING_EVERY * _DEG_PER_M
+            pings.append((user_id, latitude + rng.gauss(0, JITTER_M) * _DEG_PER_M,
+                          longitude + rng.gauss(0, JITTER_M) * _DEG_PER_M))
+        yield START + second, pings
+
+
+def measure(directory, name, users, moving, distance_m):
+    database = os.path.join(directory, f'{name}.db')
+    router = sharding.ShardRouter(database)
+    conn = router.connect(0)
+    sharding.ensure_schema(conn.cursor())
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.commit()
+    conn.close()
+    locations = repositories.SqliteLocationRepo(router)
+    now = [START]
+    pings = ping_filter.PingFilter(clock=lambda: now[0])
+
+    posted = 0
+    last_flush = START
+    began = time.perf_counter()
+    for now[0], batch in tracks(users, moving, random.Random(1)):
+        for user_id, latitude, longitude in batch:
+            posted += 1
+            if pings.offer(user_id, latitude, longitude, distance_m):
+                pings.stored(user_id, latitude, longitude, locations.add(user_id, latitude, longitude))
+        if now[0] - last_flush >= ping_filter.FLUSH_INTERVAL:
+            pings.flush(locations.set_dwell)
+            last_flush = now[0]
+    pings.flush(locations.set_dwell)
+    elapsed = time.perf_counter() - began
+
+    conn = router.connect(0)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    rows = conn.execute('SELECT COUNT(*) FROM location_tracking').fetchone()[0]
+    dwell = conn.execute('SELECT SUM(dwell_seconds) FROM location_tracking').fetchone()[0] or 0
+    conn.close()
+    return {'posted': posted, 'rows': rows, 'seconds': elapsed, 'bytes': os.path.getsize(database),
+            'dwell_hours': dwell / 3600}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--moving', type=float, default=0.2, help='share of users walking (default 0.2)')
+    parser.add_argument('--dir', help='where to create the databases (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        results = {
+            'every ping': measure(directory, 'all', args.users, args.moving, 0),
+            f'filter ({ping_filter.DISTANCE_M:g} m)': measure(directory, 'filtered', args.users, args.moving,
+                                                               ping_filter.DISTANCE_M),
+        }
+    print(f"{args.users} users, {args.moving:.0%} walking, a ping every {PING_EVERY}s for an hour")
+    print(f"{'':<16}{'pings':>9}{'rows':>9}{'reduction':>11}{'write time':>12}{'database':>11}{'dwell':>9}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['posted']:>9,}{r['rows']:>9,}{1 - r['rows'] / r['posted']:>10.1%}"
+              f"{r['seconds']:>11.2f}s{r['bytes'] / 1e6:>9.1f}MB{r['dwell_hours']:>8.1f}h")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
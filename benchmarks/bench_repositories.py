@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: route latency on the SQLite and memory repositories
+
+Runs login, location updates and complaint history through the Flask test
+client with every table in SQLite and then in memory
+(repositories.memory_repositories), so the gap is the storage cost and the
+memory numbers are the route logic alone. Also times a complaint history
+read on a reused per-thread connection against opening a connection per
+call, as the routes did before the repository layer.
+
+Usage: python benchmarks/bench_repositories.py [--users 200] [--requests 2000] [--dir PATH]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+import repositories
+
+
+def seed(repos, users):
+    for i in range(1, users + 1):
+        repos.users.add(f'user{i}', f'user{i}@example.com', password_hash=app_module.hash_password('password123'))
+        for j in range(10):
+            repos.complaints.add(i, f'Complaint {j}', 'Broken street light', 'safety')
+
+
+def measure_routes(repos, users, requests):
+    app_module.app.config['REPOSITORIES'] = repos
+    rng = random.Random(1)
+    timings = {}
+    with app_module.app.test_client() as client:
+        client.post('/login', json={'username': 'user1', 'password': 'password123'})
+        routes = [
+            ('POST /login', lambda: client.post('/login', json={'username': f'user{rng.randint(1, users)}',
+                                                                'password': 'password123'})),
+            ('POST /api/location', lambda: client.post('/api/location', json={
+                'latitude': 28.6 + rng.random() * 0.01, 'longitude': 77.2})),
+            ('GET /api/complaints/history', lambda: client.get('/api/complaints/history')),
+        ]
+        for name, call in routes:
+            began = time.perf_counter()
+            for _ in range(requests):
+                call()
+            timings[name] = (time.perf_counter() - began) / requests * 1e6
+    return timings
+
+
+def measure_connections(repos, shard_path, requests):
+    began = time.perf_counter()
+    for _ in range(requests):
+        repos.complaints.for_user(1)
+    reused = (time.perf_counter() - began) / requests * 1e6
+    began = time.perf_counter()
+    for _ in range(requests):
+        conn = sqlite3.connect(shard_path)
+        conn.execute('''
+            SELECT id, title, description, category, status, created_at
+            FROM complaints WHERE user_id = ? ORDER BY created_at DESC
+        ''', (1,)).fetchall()
+        conn.close()
+    per_call = (time.perf_counter() - began) / requests * 1e6
+    return reused, per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per route')
+    parser.add_argument('--dir', help='where to create the database (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        app_module.DATABASE = os.path.join(directory, 'bench.db')
+        app_module.init_db()
+        app_module.app.config.pop('REPOSITORIES', None)
+        sqlite_repos = app_module.get_repos()
+        memory_repos = repositories.memory_repositories()
+        for repos in (sqlite_repos, memory_repos):
+            seed(repos, args.users)
+
+        results = {name: measure_routes(repos, args.users, args.requests)
+                   for name, repos in (('sqlite', sqlite_repos), ('memory', memory_repos))}
+        print(f"{'route':<30} {'sqlite':>10} {'memory':>10}")
+        for route in results['sqlite']:
+            print(f"{route:<30} {results['sqlite'][route]:>8.0f}us {results['memory'][route]:>8.0f}us")
+
+        reused, per_call = measure_connections(sqlite_repos, app_module.get_shards().paths[0], args.requests)
+        print(f"\nComplaint history read: {reused:.0f}us on a reused connection, "
+              f"{per_call:.0f}us opening one per call ({per_call / reused:.1f}x)")
+        app_module.app.config.pop('REPOSITORIES', None)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark: nearest responders for an SOS
+
+N opted-in responders spread over a city-sized box; times k-nearest queries
+against the grid index and against scanning every responder, and reports
+the index's memory per responder.
+
+Usage: python benchmarks/bench_responders.py [--responders 100000] [--queries 2000] [--k 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo
+import responders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--responders', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    index = responders.ResponderIndex()
+    positions = []
+    start = time.perf_counter()
+    for user_id in range(1, args.responders + 1):
+        lat, lon = 28.4 + rng.random() * 0.4, 76.9 + rng.random() * 0.5
+        index.set_opt_in(user_id, True)
+        index.update(user_id, lat, lon)
+        positions.append((user_id, lat, lon))
+    loaded = time.perf_counter() - start
+    print(f"{'load':>12}: {args.responders / loaded:>10,.0f} updates/s, "
+          f"{index.memory_bytes() / args.responders:.1f} bytes per responder")
+
+    points = [(28.4 + rng.random() * 0.4, 76.9 + rng.random() * 0.5) for _ in range(args.queries)]
+    start = time.perf_counter()
+    for lat, lon in points:
+        index.nearest(lat, lon, k=args.k)
+    per_query = (time.perf_counter() - start) / len(points)
+    print(f"{'grid index':>12}: {per_query * 1e6:>10,.0f} µs/query")
+
+    sample = points[:max(len(points) // 20, 1)]
+    start = time.perf_counter()
+    for lat, lon in sample:
+        sorted((geo.haversine_m(lat, lon, a, b), u) for u, a, b in positions)[:args.k]
+    per_scan = (time.perf_counter() - start) / len(sample)
+    print(f"{'full scan':>12}: {per_scan * 1e6:>10,.0f} µs/query ({per_scan / per_query:,.0f}x slower)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark: route safety scoring latency
+
+Fills a SafetyGrid with N incidents over the last year and a few hundred
+shelters spread over a metro area, then scores random walking routes with
+V vertices (about 10 m apart) and reports the latency per route.
+
+Usage: python benchmarks/bench_route_safety.py [--incidents 200000] [--vertices 5000]
+"""
+
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import route_safety
+
+# Roughly the Delhi NCR area
+LAT_RANGE = (28.40, 28.90)
+LON_RANGE = (76.90, 77.50)
+
+
+def random_route(rng, vertices):
+    lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+    heading = rng.uniform(0, 2 * math.pi)
+    route = []
+    for _ in range(vertices):
+        route.append((lat, lon))
+        heading += rng.uniform(-0.3, 0.3)
+        lat += 0.00009 * math.cos(heading)
+        lon += 0.0001 * math.sin(heading)
+    return route
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--incidents', type=int, default=200000)
+    parser.add_argument('--shelters', type=int, default=500)
+    parser.add_argument('--vertices', type=int, default=5000)
+    parser.add_argument('--routes', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    now = datetime.now(timezone.utc)
+    grid = route_safety.SafetyGrid()
+    start = time.perf_counter()
+    for _ in range(args.incidents):
+        grid.add_incident(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE),
+                          now - timedelta(minutes=rng.randrange(365 * 24 * 60)))
+    for _ in range(args.shelters):
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        key = (math.floor(lat / route_safety.SHELTER_CELL_DEG), math.floor(lon / route_safety.SHELTER_CELL_DEG))
+        grid._shelters.setdefault(key, []).append((lat, lon))
+    print(f"Loaded {args.incidents:,} incidents and {args.shelters} shelters in {time.perf_counter() - start:.1f}s")
+
+    timings = []
+    for _ in range(args.routes):
+        route = random_route(rng, args.vertices)
+        start = time.perf_counter()
+        result = grid.score_route(route, now)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    print(f"{args.vertices:,}-vertex routes (~{result['length_m'] / 1000:.0f} km): "
+          f"p50 {statistics.median(timings):.1f} ms, max {timings[-1]:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: location writes across shard counts
+
+P worker processes insert pings for random users, one transaction per ping
+as /api/location does, each routed to its user's shard (sharding.py).
+Reports pings/sec for every shard count; with one shard all writers queue
+on the same database lock. Scaling needs at least as many CPU cores as
+processes, and --dir on the disk the database will live on.
+
+Usage: python benchmarks/bench_sharded_writes.py [--processes 8] [--pings 2000] [--shards 1,2,4,8] [--wal] [--dir PATH]
+"""
+
+import argparse
+import functools
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sharding
+
+LOCATION_INSERT = 'INSERT INTO location_tracking (user_id, latitude, longitude) VALUES (?, ?, ?)'
+
+
+def make_shards(database, count, wal):
+    router = sharding.ShardRouter(database, count)
+    for index in range(count):
+        conn = router.connect(index)
+        sharding.ensure_schema(conn.cursor())
+        if wal:
+            conn.execute('PRAGMA journal_mode = WAL')
+        conn.commit()
+        conn.close()
+    return router
+
+
+def writer(database, count, pings, seed, start, results):
+    router = sharding.ShardRouter(database, count, connect=functools.partial(sqlite3.connect, timeout=60))
+    # One open connection per shard, like a worker's pool
+    conns = [router.connect(index) for index in range(count)]
+    rng = random.Random(seed)
+    start.wait()
+    began = time.perf_counter()
+    for _ in range(pings):
+        user_id = rng.randrange(1, 100000)
+        conn = conns[router.index_of(user_id)]
+        conn.execute(LOCATION_INSERT, (user_id, 28.6 + rng.random() * 0.1, 77.2 + rng.random() * 0.1))
+        conn.commit()
+    results.put(time.perf_counter() - began)
+    for conn in conns:
+        conn.close()
+
+
+def measure(directory, count, args):
+    database = os.path.join(directory, f'bench{count}.db')
+    make_shards(database, count, args.wal)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start = context.Event()
+    workers = [context.Process(target=writer, args=(database, count, args.pings, seed, start, results))
+               for seed in range(args.processes)]
+    for worker in workers:
+        worker.start()
+    began = time.perf_counter()
+    start.set()
+    for _ in workers:
+        results.get()
+    elapsed = time.perf_counter() - began
+    for worker in workers:
+        worker.join()
+    return args.processes * args.pings / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--pings', type=int, default=2000, help='pings per process')
+    parser.add_argument('--shards', default='1,2,4,8')
+    parser.add_argument('--wal', action='store_true', help='use WAL journaling on every shard')
+    parser.add_argument('--dir', help='where to create the databases (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        baseline = None
+        for count in (int(c) for c in args.shards.split(',')):
+            rate = measure(directory, count, args)
+            baseline = baseline or rate
+            print(f"{count:>3} shard(s): {rate:>9,.0f} pings/s ({rate / baseline:.1f}x)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark: location pings stored as rows and as archived hour blobs
+Stores a day of pings for each user, one every 5 seconds along a walk with
+GPS jitter, as rows in location_tracking. Reports the database size, then
+archives every hour (track_archive.py) and reports it again, with the bytes
+per point. Also times reading one user's day through location_history, from
+rows and from blobs, and decoding the blobs with and without numpy.
+
+Usage: python benchmarks/bench_track_archive.py [--users 20] [--dir PATH]
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import location_history
+import sharding
+import track_archive
+
+START = 1_700_000_000
+DAY = 86400
+PING_EVERY = 5
+WALKING_MPS = 1.4
+# About a meter of latitude, in degrees
+METER = 1 / 111_195
+# Standard deviation of GPS noise
+JITTER_M = 4.0
+ROUNDS = 5
+
+
+def pings(user_id, rng):
+    latitude, longitude = 28.5 + rng.random() * 0.2, 77.1 + rng.random() * 0.2
+    heading = rng.uniform(0, 2 * math.pi)
+    step = WALKING_MPS * PING_EVERY * METER
+    jitter = JITTER_M * METER
+    for second in range(0, DAY, PING_EVERY):
+        if rng.random() < 0.01:
+            heading = rng.uniform(0, 2 * math.pi)
+        latitude += math.cos(heading) * step
+        longitude += math.sin(heading) * step
+        yield (user_id, round(latitude + rng.gauss(0, jitter), 7),
+               round(longitude + rng.gauss(0, jitter), 7), track_archive.to_text(START + second))
+
+
+def size(conn, path):
+    conn.execute('VACUUM')
+    return os.path.getsize(path)
+
+
+def timed(func):
+    best = None
+    for _ in range(ROUNDS):
+        began = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - began
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--dir', help='where to create the database (default: a temporary directory)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        path = os.path.join(directory, 'tracks.db')
+        conn = sqlite3.connect(path)
+        sharding.ensure_schema(conn.cursor())
+        rng = random.Random(1)
+        for user_id in range(1, args.users + 1):
+            conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) '
+                             'VALUES (?, ?, ?, ?)', pings(user_id, rng))
+        conn.commit()
+        points = conn.execute('SELECT COUNT(*) FROM location_tracking').fetchone()[0]
+        start, end = track_archive.to_text(START), track_archive.to_text(START + DAY)
+
+        def read():
+            return sum(1 for _ in location_history.query_points(conn, 1, start, end))
+
+        rows_bytes = size(conn, path)
+        from_rows, rows_read = timed(read)
+
+        began = time.perf_counter()
+        moved = track_archive.archive(conn, START + 2 * DAY)
+        archive_seconds = time.perf_counter() - began
+        blob_bytes = size(conn, path)
+        data = conn.execute('SELECT SUM(LENGTH(data)) FROM location_archive').fetchone()[0]
+        from_blobs, blobs_read = timed(read)
+        assert from_rows == from_blobs and moved == points
+
+        blobs = conn.execute('SELECT hour, data FROM location_archive WHERE user_id = 1').fetchall()
+        decoders = {'python': track_archive._decode_python}
+        if track_archive.np is not None:
+            decoders['numpy'] = track_archive._decode_numpy
+        decoded = {name: timed(lambda: [func(blob, hour) for hour, blob in blobs])[1]
+                   for name, func in decoders.items()}
+        conn.close()
+
+    print(f"{args.users} users, a ping every {PING_EVERY}s for a day: {points:,} points")
+    print(f"{'':<10}{'database':>11}{'per point':>11}{'read a day':>12}")
+    print(f"{'rows':<10}{rows_bytes / 1e6:>9.1f}MB{rows_bytes / points:>10.1f}B{rows_read * 1000:>10.1f}ms")
+    print(f"{'blobs':<10}{blob_bytes / 1e6:>9.1f}MB{blob_bytes / points:>10.1f}B{blobs_read * 1000:>10.1f}ms")
+    print(f"blob data alone: {data / points:.1f} bytes a point; archived in {archive_seconds:.2f}s")
+    for name, seconds in decoded.items():
+        print(f"decode a day ({name}): {seconds * 1000:.1f}ms, {seconds / from_rows * 1e9:.0f}ns a point")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Women Security System - Complaint Search
+Full-text search over all complaints for case workers.
+
+complaints_fts is an external-content FTS5 table over complaints (title,
+description, category): it stores only the index, and triggers keep it in
+step with every insert, update and delete. Results are ranked with bm25,
+title matches weighing most, and come back with highlighted titles and a
+snippet of the description.
+"""
+
+import html
+import re
+
+# bm25 weights of the title, description and category columns
+RANK_WEIGHTS = (10.0, 1.0, 2.0)
+MAX_PER_PAGE = 100
+SNIPPET_TOKENS = 24
+# Highlight markers that can't occur in text, swapped for <mark> after escaping
+_OPEN, _CLOSE = '\x02', '\x03'
+_TOKEN = re.compile(r'"[^"]*"|\S+')
+
+
+def ensure_schema(cursor):
+    """Create the index and its triggers; builds the index from existing complaints the first time"""
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'complaints_fts'").fetchone()
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS complaints_fts USING fts5(
+            title, description, category,
+            content='complaints', content_rowid='id',
+            tokenize='porter unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS complaints_fts_insert AFTER INSERT ON complaints BEGIN
+            INSERT INTO complaints_fts (rowid, title, description, category)
+            VALUES (new.id, new.title, new.description, new.category);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS complaints_fts_delete AFTER DELETE ON complaints BEGIN
+            INSERT INTO complaints_fts (complaints_fts, rowid, title, description, category)
+            VALUES ('delete', old.id, old.title, old.description, old.category);
+        END
+    ''')
+    # Status changes don't touch the index
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS complaints_fts_update
+        AFTER UPDATE OF title, description, category ON complaints BEGIN
+            INSERT INTO complaints_fts (complaints_fts, rowid, title, description, category)
+            VALUES ('delete', old.id, old.title, old.description, old.category);
+            INSERT INTO complaints_fts (rowid, title, description, category)
+            VALUES (new.id, new.title, new.description, new.category);
+        END
+    ''')
+    if not exists:
+        cursor.execute("INSERT INTO complaints_fts (complaints_fts) VALUES ('rebuild')")
+
+
+def build_match(query):
+    """FTS5 query from user input: "quoted phrases", words (all required), word* prefixes and OR"""
+    terms = []
+    for token in _TOKEN.findall(query):
+        if token == 'OR':
+            if terms and terms[-1] != 'OR':
+                terms.append(token)
+            continue
+        prefix = token.endswith('*') and not token.startswith('"')
+        text = token.strip('"').rstrip('*').replace('"', '')
+        if not text.strip():
+            continue
+        terms.append('"' + text + '"' + ('*' if prefix else ''))
+    while terms and terms[-1] == 'OR':
+        terms.pop()
+    return ' '.join(terms)
+
+
+def _highlighted(text):
+    if text is None:
+        return None
+    return html.escape(text).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+def _rank(conn, match, category, status, limit, offset=0):
+    """[(rowid, bm25 score), ...] best first"""
+    score = f"bm25(complaints_fts, {', '.join(str(w) for w in RANK_WEIGHTS)})"
+    if category or status:
+        clauses = ['complaints_fts MATCH ?']
+        params = [match]
+        if category:
+            clauses.append('c.category = ?')
+            params.append(category)
+        if status:
+            clauses.append('c.status = ?')
+            params.append(status)
+        sql = f'''
+            SELECT complaints_fts.rowid, {score} FROM complaints_fts
+            JOIN complaints c ON c.id = complaints_fts.rowid
+            WHERE {' AND '.join(clauses)}
+        '''
+    else:
+        sql = f'SELECT rowid, {score} FROM complaints_fts WHERE complaints_fts MATCH ?'
+        params = [match]
+    return conn.execute(sql + ' ORDER BY 2 LIMIT ? OFFSET ?', params + [limit, offset]).fetchall()
+
+
+def _details(conn, match, scores):
+    """Result dicts for the ranked rowids in scores (rowid -> bm25 score), in any order"""
+    if not scores:
+        return []
+    rows = conn.execute(f'''
+        SELECT c.id, c.user_id, c.category, c.status, c.created_at,
+               highlight(complaints_fts, 0, ?, ?),
+               snippet(complaints_fts, 1, ?, ?, '…', ?)
+        FROM complaints_fts
+        JOIN complaints c ON c.id = complaints_fts.rowid
+        WHERE complaints_fts MATCH ? AND complaints_fts.rowid IN ({', '.join('?' * len(scores))})
+    ''', [_OPEN, _CLOSE, _OPEN, _CLOSE, SNIPPET_TOKENS, match, *scores]).fetchall()
+    return [{
+        'id': row[0],
+        'user_id': row[1],
+        'category': row[2],
+        'status': row[3],
+        'created_at': row[4],
+        'title': _highlighted(row[5]),
+        'snippet': _highlighted(row[6]),
+        'score': round(-scores[row[0]], 4),
+    } for row in rows]
+
+
+def search(conn, query, category=None, status=None, page=1, per_page=20):
+    """One page of ranked matches; returns (results, has_more)
+
+    Ranking and paging only touch rowids and scores; highlights, snippets and
+    the complaint columns are then fetched for the page alone.
+    """
+    match = build_match(query)
+    if not match:
+        return [], False
+    ranked = _rank(conn, match, category, status, per_page + 1, (page - 1) * per_page)
+    has_more = len(ranked) > per_page
+    scores = dict(ranked[:per_page])
+    results = _details(conn, match, scores)
+    results.sort(key=lambda result: scores[result['id']])
+    return results, has_more
+
+
+def search_shards(fan_out, query, category=None, status=None, page=1, per_page=20):
+    """search() over complaints spread across shards (see sharding.py)
+
+    fan_out(query) runs query(conn) on every shard. Each shard ranks its own
+    top page * per_page matches; they are merged by score and the page's
+    details are read by id (complaint ids are unique across shards). bm25
+    statistics are per shard, which hash sharding keeps close to the global
+    ones.
+    """
+    match = build_match(query)
+    if not match:
+        return [], False
+    ranked = fan_out(lambda conn: _rank(conn, match, category, status, page * per_page + 1))
+    merged = sorted((score, rowid) for rows in ranked for rowid, score in rows)
+    has_more = len(merged) > page * per_page
+    scores = {rowid: score for score, rowid in merged[(page - 1) * per_page:page * per_page]}
+    results = [result for rows in fan_out(lambda conn: _details(conn, match, scores)) for result in rows]
+    results.sort(key=lambda result: scores[result['id']])
+    return results, has_more
@@ -0,0 +1,66 @@
+"""
+Women Security System - Dataset Versions
+Change counters for reference data (shelters, ...) stored in the database, so
+every worker notices changes made by another worker or by a CLI tool such as
+import_shelters.py.
+
+Writers call bump() in the transaction that changes the data. Readers call
+version(), which reads the counter at most every POLL_INTERVAL seconds, and
+rebuild their caches when it moves.
+"""
+
+import threading
+import time
+
+POLL_INTERVAL = 2.0
+
+_versions = {}
+_lock = threading.Lock()
+
+
+def ensure_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS dataset_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def bump(conn, name):
+    """Record a change to a dataset; commit with the change itself"""
+    conn.execute('''
+        INSERT INTO dataset_versions (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    ''', (name,))
+
+
+def read(conn, name):
+    row = conn.execute('SELECT version FROM dataset_versions WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def version(name, connect):
+    """Current version of a dataset, read through a short-lived per-process cache"""
+    now = time.monotonic()
+    cached = _versions.get(name)
+    if cached is not None and now - cached[1] < POLL_INTERVAL:
+        return cached[0]
+    conn = connect()
+    try:
+        current = read(conn, name)
+    finally:
+        conn.close()
+    with _lock:
+        _versions[name] = (current, now)
+    return current
+
+
+def forget(name=None):
+    """Drop cached versions so the next version() call reads the database"""
+    with _lock:
+        if name is None:
+            _versions.clear()
+        else:
+            _versions.pop(name, None)
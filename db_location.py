@@ -0,0 +1,106 @@
+"""
+Women Security System - Database Location
+Turns DATABASE_URL into the SQLite target the app opens: a file path, or a
+file: URI for an in-memory database.
+
+    security_system.db            a file, relative to the app directory
+    sqlite:///data/app.db         the same, as a URL (sqlite:////abs/path.db)
+    tmpfs://security_system.db    a file in /dev/shm (RAM; gone on reboot)
+    memory://                     an in-memory database private to this process
+    memory://name                 a named one, so tests can keep several apart
+
+Unset, the app uses security_system.db next to app.py, not in whatever
+directory the process was started from. The command-line tools (backup,
+export, import_shelters, sharding, anomaly) default --db to the same target.
+
+tmpfs databases are real files, so every worker and CLI on the machine sees
+the same data; use them for benchmarks and throwaway deployments. Memory
+databases live in one process: every connection in it shares the data (the
+memdb VFS, with normal locking, so concurrent writers wait instead of
+failing), but each gunicorn worker or test process gets its own. That makes
+them the fast choice for test runs, which can then run in parallel:
+
+    DATABASE_URL=memory:// python -m pytest -q
+
+A memory database is kept alive by one connection held open from its first
+use until release(). It starts empty in every process, so the app creates
+its tables on first use (ensure_memory_schema() in app.py), whether or not
+anything calls init_db().
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATABASE = os.path.join(APP_DIR, 'security_system.db')
+DEFAULT_MEMORY_NAME = 'security_system'
+
+# The memdb VFS (SQLite 3.36+) shares one database between connections with
+# ordinary locking; older builds fall back to shared-cache mode
+if sqlite3.sqlite_version_info >= (3, 36):
+    _MEMORY_URI = 'file:/{name}?vfs=memdb'
+else:
+    _MEMORY_URI = 'file:{name}?mode=memory&cache=shared'
+
+_keepers = {}
+_keepers_lock = threading.Lock()
+
+
+def tmpfs_dir():
+    """A RAM-backed directory: /dev/shm where there is one, else the temp dir"""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def memory(name=DEFAULT_MEMORY_NAME):
+    return _MEMORY_URI.format(name=name)
+
+
+def resolve(url=None):
+    """SQLite target for a DATABASE_URL (see the module docstring)"""
+    if not url:
+        return DEFAULT_DATABASE
+    if url.startswith('memory://'):
+        return memory(url[len('memory://'):] or DEFAULT_MEMORY_NAME)
+    if url.startswith('tmpfs://'):
+        return os.path.join(tmpfs_dir(), url[len('tmpfs://'):] or 'security_system.db')
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        if path in ('', ':memory:'):
+            return memory()
+        return os.path.join(APP_DIR, path)
+    if url.startswith('file:'):
+        return url
+    return os.path.join(APP_DIR, url)
+
+
+def is_memory(target):
+    return target.startswith('file:') and ('vfs=memdb' in target or 'mode=memory' in target)
+
+
+def is_open(target):
+    """True while a memory database exists: from its first connect() until release()"""
+    return target in _keepers
+
+
+def connect(target, factory=sqlite3.Connection, **kwargs):
+    """sqlite3.connect() for a path or file: URI; keeps memory databases alive"""
+    uri = target.startswith('file:')
+    if uri and is_memory(target) and target not in _keepers:
+        with _keepers_lock:
+            if target not in _keepers:
+                _keepers[target] = sqlite3.connect(target, uri=True, check_same_thread=False)
+    return sqlite3.connect(target, uri=uri, factory=factory, **kwargs)
+
+
+def release(target=None):
+    """Drop a memory database (every one when target is None); open connections keep it until closed"""
+    with _keepers_lock:
+        targets = list(_keepers) if target is None else [target]
+        for name in targets:
+            keeper = _keepers.pop(name, None)
+            if keeper is not None:
+                keeper.close()
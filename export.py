@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Women Security System - Data Export
+Streams everything stored for an account (location pings and complaints) as
+NDJSON, CSV or GPX, for users downloading their data and for legal requests.
+
+    python export.py USER_ID [--data locations|complaints|all] [--format ndjson|csv|gpx] [--db security_system.db] [--shards N] [-o FILE]
+
+Rows are read in pages of PAGE_SIZE with keyset cursors (the last key of a
+page starts the next one, no OFFSET) and written out page by page, so memory
+stays the same for ten pings or ten million. Locations are read an hour at a
+time instead, from the archived hour blobs and the rows not archived yet
+(see track_archive.py). Rows added after the export started are left out, so
+a long export still describes one moment.
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+import db_location
+import sharding
+import track_archive
+from responses import dumps
+
+PAGE_SIZE = 2000
+# A pause longer than this starts a new GPX track segment
+SEGMENT_GAP_SECONDS = 3600
+
+# Per dataset: columns, and the keyset query reading one page after a cursor
+DATASETS = {
+    'locations': {
+        'table': 'location_tracking',
+        'columns': ('id', 'latitude', 'longitude', 'timestamp', 'dwell_seconds'),
+        # Read an hour at a time, archived or not (see track_archive.py); archived pings have no id
+        'hours': True,
+    },
+    'complaints': {
+        'table': 'complaints',
+        'columns': ('id', 'title', 'description', 'category', 'status', 'location', 'latitude', 'longitude',
+                    'created_at'),
+        'query': '''
+            SELECT id, title, description, category, status, location, latitude, longitude, created_at
+            FROM complaints
+            WHERE user_id = ? AND id > ? AND id <= ?
+            ORDER BY id LIMIT ?
+        ''',
+        'cursor': lambda row: (row[0],),
+        'start': (0,),
+    },
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'gpx': 'application/gpx+xml',
+}
+
+
+def validate(data, fmt):
+    """Check a data/format combination; raises ValueError"""
+    if data not in DATASETS and data != 'all':
+        raise ValueError('Unknown export data!')
+    if fmt not in FORMATS:
+        raise ValueError('Unknown export format!')
+    if fmt == 'gpx' and data != 'locations':
+        raise ValueError('GPX export is only available for locations!')
+    if fmt == 'csv' and data == 'all':
+        raise ValueError('CSV export needs a single kind of data!')
+
+
+def pages(conn, name, user_id, page_size=PAGE_SIZE):
+    """Lists of rows for one user, in keyset order, up to the rows present when called"""
+    dataset = DATASETS[name]
+    last_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {dataset['table']}").fetchone()[0]
+    if dataset.get('hours'):
+        for rows in track_archive.hours(conn, user_id, max_id=last_id, exact=True):
+            for start in range(0, len(rows), page_size):
+                yield rows[start:start + page_size]
+        return
+    cursor = dataset['start']
+    while True:
+        rows = conn.execute(dataset['query'], (user_id, *cursor, last_id, page_size)).fetchall()
+        if rows:
+            yield rows
+        if len(rows) < page_size:
+            return
+        cursor = dataset['cursor'](rows[-1])
+
+
+# Writers: each turns pages of rows into chunks of bytes
+def write_ndjson(name, row_pages):
+    columns = DATASETS[name]['columns']
+    for rows in row_pages:
+        yield b''.join(dumps({'type': name, **dict(zip(columns, row))}) + b'\n' for row in rows)
+
+
+def write_csv(name, row_pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(DATASETS[name]['columns'])
+    for rows in row_pages:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _gpx_time(timestamp):
+    return timestamp.replace(' ', 'T') + 'Z'
+
+
+def write_gpx(name, row_pages, title='Location history'):
+    yield (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+           b'<gpx version="1.1" creator="SafeGuard" xmlns="http://www.topografix.com/GPX/1/1">\n'
+           b'<trk><name>' + escape(title).encode() + b'</name>\n<trkseg>\n')
+    previous = None
+    for rows in row_pages:
+        parts = []
+        for _, latitude, longitude, timestamp, dwell in rows:
+            if latitude is None or longitude is None:
+                continue
+            try:
+                # Stored as '%Y-%m-%d %H:%M:%S', which fromisoformat parses much faster than strptime
+                moment = datetime.fromisoformat(timestamp)
+            except (TypeError, ValueError):
+                moment = None
+            if moment and previous and (moment - previous).total_seconds() > SEGMENT_GAP_SECONDS:
+                parts.append('</trkseg>\n<trkseg>\n')
+            previous = moment or previous
+            point = f'<trkpt lat="{float(latitude)!r}" lon="{float(longitude)!r}">'
+            if moment:
+                point += f'<time>{_gpx_time(timestamp)}</time>'
+            parts.append(point + '</trkpt>\n')
+            if moment and dwell:
+                # Merged pings (see ping_filter.py): still there when the stay ended
+                previous = moment + timedelta(seconds=dwell)
+                parts.append(f'<trkpt lat="{float(latitude)!r}" lon="{float(longitude)!r}">'
+                             f'<time>{_gpx_time(previous.isoformat(" "))}</time></trkpt>\n')
+        yield ''.join(parts).encode()
+    yield b'</trkseg>\n</trk>\n</gpx>\n'
+
+
+WRITERS = {'ndjson': write_ndjson, 'csv': write_csv, 'gpx': write_gpx}
+
+
+def export(connect, user_id, data='all', fmt='ndjson', page_size=PAGE_SIZE):
+    """Generator of byte chunks for one user's export; owns its connection"""
+    validate(data, fmt)
+    conn = connect()
+    try:
+        for name in (DATASETS if data == 'all' else (data,)):
+            yield from WRITERS[fmt](name, pages(conn, name, user_id, page_size))
+    finally:
+        conn.close()
+
+
+def filename(user_id, data, fmt):
+    return f'safeguard-user{user_id}-{data}.{fmt}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export an account's locations and complaints")
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('--data', default='all', choices=(*DATASETS, 'all'))
+    parser.add_argument('--format', default='ndjson', choices=FORMATS)
+    parser.add_argument('--db', default=db_location.resolve(os.environ.get('DATABASE_URL')))
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('SHARD_COUNT', 1)))
+    parser.add_argument('-o', '--output', help='file to write (default: standard output)')
+    args = parser.parse_args()
+
+    try:
+        validate(args.data, args.format)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    shards = sharding.ShardRouter(args.db, args.shards)
+    chunks = export(lambda: shards.connect_user(args.user_id), args.user_id, args.data, args.format)
+    output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
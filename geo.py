@@ -0,0 +1,105 @@
+"""
+Women Security System - Geometry Helpers
+Distances, point-in-polygon and a packed R-tree used by the location features.
+Coordinates are (latitude, longitude) in degrees unless stated otherwise.
+"""
+
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def polygon_bbox(polygon):
+    """(min_lat, min_lon, max_lat, max_lon) of a list of (lat, lon) vertices"""
+    lats = [p[0] for p in polygon]
+    lons = [p[1] for p in polygon]
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Ray casting test; polygon is a list of (lat, lon) vertices, closed or not"""
+    inside = False
+    n = len(polygon)
+    j = n - 1
+    for i in range(n):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lat_i > lat) != (lat_j > lat):
+            crossing = lon_i + (lat - lat_i) * (lon_j - lon_i) / (lat_j - lat_i)
+            if lon < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+def circle_polygon(lat, lon, radius_m, vertices=32):
+    """Approximate a circle as a polygon"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return [(lat + dlat * math.sin(2 * math.pi * k / vertices),
+             lon + dlon * math.cos(2 * math.pi * k / vertices)) for k in range(vertices)]
+
+
+class PackedRTree:
+    """Static R-tree bulk-loaded with Sort-Tile-Recursive packing
+
+    entries are (min_lat, min_lon, max_lat, max_lon, item). Lookups descend
+    only into nodes whose box contains the query, so a point query costs
+    O(log n) plus the number of hits.
+    """
+
+    def __init__(self, entries, node_size=16):
+        self.size = len(entries)
+        self.node_size = node_size
+        self.root = self._build(list(entries)) if entries else None
+
+    def _build(self, entries):
+        # Leaf level: entries are (box..., item); internal levels: (box..., children)
+        level = self._pack(entries, leaf=True)
+        while len(level) > 1:
+            level = self._pack(level, leaf=False)
+        return level[0]
+
+    def _pack(self, entries, leaf):
+        m = self.node_size
+        node_count = math.ceil(len(entries) / m)
+        slice_count = math.ceil(math.sqrt(node_count))
+        slice_size = slice_count * m
+        entries.sort(key=lambda e: e[1] + e[3])
+        nodes = []
+        for s in range(0, len(entries), slice_size):
+            vertical = sorted(entries[s:s + slice_size], key=lambda e: e[0] + e[2])
+            for k in range(0, len(vertical), m):
+                children = vertical[k:k + m]
+                nodes.append((
+                    min(c[0] for c in children), min(c[1] for c in children),
+                    max(c[2] for c in children), max(c[3] for c in children),
+                    leaf, children,
+                ))
+        return nodes
+
+    def search_point(self, lat, lon):
+        """Items whose box contains the point"""
+        if self.root is None:
+            return []
+        hits = []
+        stack = [self.root]
+        while stack:
+            _, _, _, _, leaf, children = stack.pop()
+            for child in children:
+                if child[0] <= lat <= child[2] and child[1] <= lon <= child[3]:
+                    if leaf:
+                        hits.append(child[4])
+                    else:
+                        stack.append(child)
+        return hits
@@ -0,0 +1,310 @@
+"""
+Women Security System - Geofences
+Safe zones (home, office, college...) with entry/exit alerts evaluated on every
+location update.
+
+Fences are kept in a packed R-tree, so a ping only tests the few fences whose
+bounding box contains it: O(log n) for the lookup, then point-in-polygon
+against the candidates. Fences added since the last rebuild sit in a short
+pending list until the next rebuild. Each user's set of fences from the last
+ping is kept, so entries and exits come from comparing two small sets.
+
+Every worker keeps its own index and picks up fences created or deleted by
+other workers through the changed_at column (see sync()). The per-user sets
+live in the geofence_state table when evaluate() is given a connection, so
+consecutive pings served by different workers still see each transition
+once; a ping only writes when the set changes, and users without fences
+skip the table.
+"""
+
+import json
+import threading
+import time
+
+import geo
+from alerts import alert_queue
+
+# Rebuild the R-tree once this many fences were added or removed since the last build
+REBUILD_THRESHOLD = 256
+# How often to look for fences changed by other workers (seconds)
+SYNC_INTERVAL = 2.0
+MAX_VERTICES = 500
+
+
+class Geofence:
+    __slots__ = ('id', 'user_id', 'name', 'polygon', 'bbox', 'alert_on_entry', 'alert_on_exit')
+
+    def __init__(self, id, user_id, name, polygon, alert_on_entry=False, alert_on_exit=True):
+        self.id = id
+        self.user_id = user_id
+        self.name = name
+        self.polygon = [tuple(p) for p in polygon]
+        self.bbox = geo.polygon_bbox(self.polygon)
+        self.alert_on_entry = bool(alert_on_entry)
+        self.alert_on_exit = bool(alert_on_exit)
+
+    def contains(self, lat, lon):
+        min_lat, min_lon, max_lat, max_lon = self.bbox
+        return (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+                and geo.point_in_polygon(lat, lon, self.polygon))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'polygon': [list(p) for p in self.polygon],
+            'alert_on_entry': self.alert_on_entry,
+            'alert_on_exit': self.alert_on_exit,
+        }
+
+
+def parse_polygon(data):
+    """Polygon from request data: either 'polygon' [[lat, lon], ...] or 'center' [lat, lon] with 'radius_m'"""
+    if data.get('polygon') is not None:
+        polygon = data['polygon']
+        if not isinstance(polygon, list) or not 3 <= len(polygon) <= MAX_VERTICES:
+            raise ValueError(f'Polygon must have between 3 and {MAX_VERTICES} points!')
+        try:
+            polygon = [(float(p[0]), float(p[1])) for p in polygon]
+        except (TypeError, ValueError, IndexError):
+            raise ValueError('Polygon points must be [latitude, longitude] pairs!')
+    elif data.get('center') is not None:
+        try:
+            lat, lon = float(data['center'][0]), float(data['center'][1])
+            radius = float(data.get('radius_m', 0))
+        except (TypeError, ValueError, IndexError):
+            raise ValueError('Center must be [latitude, longitude] with a radius_m!')
+        if not 10 <= radius <= 50000:
+            raise ValueError('Radius must be between 10 m and 50 km!')
+        polygon = geo.circle_polygon(lat, lon, radius)
+    else:
+        raise ValueError('A polygon or a center and radius is required!')
+    for lat, lon in polygon:
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError('Coordinates out of range!')
+    return polygon
+
+
+# Storage
+def _row_to_fence(row):
+    return Geofence(row[0], row[1], row[2], json.loads(row[3]), row[4], row[5])
+
+
+def create_fence(conn, user_id, name, polygon, alert_on_entry=False, alert_on_exit=True):
+    fence = Geofence(None, user_id, name, polygon, alert_on_entry, alert_on_exit)
+    min_lat, min_lon, max_lat, max_lon = fence.bbox
+    cursor = conn.execute('''
+        INSERT INTO geofences (user_id, name, polygon, min_lat, min_lon, max_lat, max_lon,
+                               alert_on_entry, alert_on_exit, changed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, name, json.dumps(fence.polygon), min_lat, min_lon, max_lat, max_lon,
+          int(fence.alert_on_entry), int(fence.alert_on_exit), time.time()))
+    conn.commit()
+    fence.id = cursor.lastrowid
+    return fence
+
+
+def delete_fence(conn, user_id, fence_id):
+    """Soft-delete a fence so other workers see the removal; returns False if it isn't the user's"""
+    cursor = conn.execute('''
+        UPDATE geofences SET active = 0, changed_at = ?
+        WHERE id = ? AND user_id = ? AND active = 1
+    ''', (time.time(), fence_id, user_id))
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def list_fences(conn, user_id):
+    rows = conn.execute('''
+        SELECT id, user_id, name, polygon, alert_on_entry, alert_on_exit
+        FROM geofences WHERE user_id = ? AND active = 1 ORDER BY id
+    ''', (user_id,)).fetchall()
+    return [_row_to_fence(row) for row in rows]
+
+
+def _encode_inside(inside):
+    return ','.join(str(fence_id) for fence_id in sorted(inside))
+
+
+def _decode_inside(text):
+    return frozenset(int(fence_id) for fence_id in text.split(',') if fence_id)
+
+
+def swap_inside(connect, user_id, inside):
+    """Store a user's fence set in geofence_state; returns the previous one, or None for the first"""
+    conn = connect()
+    try:
+        query = 'SELECT inside FROM geofence_state WHERE user_id = ?'
+        row = conn.execute(query, (user_id,)).fetchone()
+        if row is not None and _decode_inside(row[0]) == inside:
+            return inside
+        # Read again under the write lock, so a ping on another worker can't take the same transition
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute(query, (user_id,)).fetchone()
+        conn.execute('INSERT OR REPLACE INTO geofence_state (user_id, inside) VALUES (?, ?)',
+                     (user_id, _encode_inside(inside)))
+        conn.commit()
+    finally:
+        conn.close()
+    return None if row is None else _decode_inside(row[0])
+
+
+class GeofenceEngine:
+    """Spatial index of all fences plus each user's inside-state"""
+
+    def __init__(self, alerts=alert_queue):
+        self.alerts = alerts
+        self._fences = {}
+        # user_id -> number of live fences
+        self._owners = {}
+        self._tree = geo.PackedRTree([])
+        self._pending = []
+        self._stale = 0
+        self._inside = {}
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._last_sync = 0.0
+
+    def __len__(self):
+        return len(self._fences)
+
+    # Index maintenance
+    def rebuild(self):
+        with self._lock:
+            entries = [(*fence.bbox, fence) for fence in self._fences.values()]
+            self._tree = geo.PackedRTree(entries)
+            self._pending = []
+            self._stale = 0
+
+    def _count_owner(self, user_id, delta):
+        count = self._owners.get(user_id, 0) + delta
+        if count > 0:
+            self._owners[user_id] = count
+        else:
+            self._owners.pop(user_id, None)
+
+    def add(self, fence):
+        with self._lock:
+            replaced = self._fences.get(fence.id)
+            if replaced is not None:
+                self._stale += 1
+                self._count_owner(replaced.user_id, -1)
+            self._fences[fence.id] = fence
+            self._count_owner(fence.user_id, 1)
+            self._pending.append(fence)
+            needs_rebuild = len(self._pending) + self._stale >= REBUILD_THRESHOLD
+        if needs_rebuild:
+            self.rebuild()
+
+    def remove(self, fence_id):
+        with self._lock:
+            fence = self._fences.pop(fence_id, None)
+            if fence is None:
+                return
+            self._count_owner(fence.user_id, -1)
+            self._stale += 1
+            needs_rebuild = len(self._pending) + self._stale >= REBUILD_THRESHOLD
+        if needs_rebuild:
+            self.rebuild()
+
+    def load(self, fences):
+        """Replace the index with a full set of fences"""
+        with self._lock:
+            self._fences = {fence.id: fence for fence in fences}
+            self._owners = {}
+            for fence in self._fences.values():
+                self._count_owner(fence.user_id, 1)
+        self.rebuild()
+
+    def sync(self, connect, force=False):
+        """Load all fences on first use, then apply changes made by any worker since the last sync"""
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._last_sync < SYNC_INTERVAL:
+            return
+        self._last_sync = now
+        conn = connect()
+        try:
+            if self._synced_at is None:
+                started = time.time()
+                rows = conn.execute('''
+                    SELECT id, user_id, name, polygon, alert_on_entry, alert_on_exit
+                    FROM geofences WHERE active = 1
+                ''').fetchall()
+                self.load([_row_to_fence(row) for row in rows])
+                self._synced_at = started
+                return
+            started = time.time()
+            rows = conn.execute('''
+                SELECT id, user_id, name, polygon, alert_on_entry, alert_on_exit, active
+                FROM geofences WHERE changed_at > ?
+            ''', (self._synced_at - SYNC_INTERVAL,)).fetchall()
+            self._synced_at = started
+        finally:
+            conn.close()
+        for row in rows:
+            if row[6]:
+                if row[0] not in self._fences:
+                    self.add(_row_to_fence(row))
+            else:
+                self.remove(row[0])
+
+    # Evaluation
+    def candidates(self, lat, lon):
+        """Live fences whose bounding box contains the point"""
+        fences = self._fences
+        hits = self._tree.search_point(lat, lon)
+        for fence in self._pending:
+            min_lat, min_lon, max_lat, max_lon = fence.bbox
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                hits.append(fence)
+        # Entries for removed or replaced fences stay in the tree until the next rebuild
+        return [f for f in hits if fences.get(f.id) is f]
+
+    def containing(self, user_id, lat, lon):
+        """Ids of the user's fences that contain the point"""
+        return frozenset(f.id for f in self.candidates(lat, lon)
+                         if f.user_id == user_id and geo.point_in_polygon(lat, lon, f.polygon))
+
+    def evaluate(self, user_id, lat, lon, connect=None):
+        """Update the user's inside-state for a new position; returns entry/exit events
+
+        With connect the state is kept in geofence_state, shared by every worker;
+        otherwise in this engine.
+        """
+        inside = self.containing(user_id, lat, lon)
+        if connect is None:
+            previous = self._inside.get(user_id)
+            self._inside[user_id] = inside
+        elif not inside and user_id not in self._owners:
+            # No fences: nothing to enter, and exits of deleted fences aren't reported
+            return []
+        else:
+            previous = swap_inside(connect, user_id, inside)
+        if previous is None or previous == inside:
+            # The first ping only establishes where the user is
+            return []
+        events = []
+        for fence_id, transition in [(f, 'exit') for f in previous - inside] + [(f, 'entry') for f in inside - previous]:
+            fence = self._fences.get(fence_id)
+            if fence is None:
+                continue
+            event = {'fence_id': fence.id, 'name': fence.name, 'transition': transition}
+            events.append(event)
+            if (transition == 'exit' and fence.alert_on_exit) or (transition == 'entry' and fence.alert_on_entry):
+                self.alerts.publish(user_id, f'geofence_{transition}', fence_id=fence.id, name=fence.name,
+                                    latitude=lat, longitude=lon)
+        return events
+
+    def is_inside_any(self, user_id, connect=None):
+        """Whether the user was inside any of their fences at the last ping"""
+        if connect is None:
+            return bool(self._inside.get(user_id))
+        conn = connect()
+        try:
+            row = conn.execute('SELECT inside FROM geofence_state WHERE user_id = ?', (user_id,)).fetchone()
+        finally:
+            conn.close()
+        return row is not None and bool(row[0])
+
+
+engine = GeofenceEngine()
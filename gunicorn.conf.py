@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for the Women Security System.
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+import tempfile
+
+bind = '0.0.0.0:5000'
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Workers share their request metrics through this directory (see metrics.py)
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'security_system_metrics'))
+os.makedirs(os.environ['METRICS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Runs in each worker after it has loaded the app (with or without
+    # --preload) and before it accepts requests
+    import app
+    app.report_warm_up(app.warm_up())
+    # Without waiting for a first request: timers must fire on an idle worker too
+    app.start_jobs()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def on_starting(server):
+    # Drop totals left behind by a previous master
+    directory = os.environ['METRICS_MULTIPROC_DIR']
+    for name in os.listdir(directory):
+        if name.startswith('metrics-'):
+            os.remove(os.path.join(directory, name))
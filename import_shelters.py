@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Women Security System - Shelter Importer
+Loads government shelter registries (CSV or GeoJSON) into safe_shelters.
+
+    python import_shelters.py registry.csv [--db security_system.db] [--batch-size 5000] [--dry-run]
+
+The file is streamed: CSV row by row, and GeoJSON feature by feature from the
+"features" array, so memory stays flat for any file size. Rows are validated
+and normalized, then upserted in large transactions on registry_id: the
+file's own id when it has one (id, registry_id, shelter_id, code), otherwise
+the name and rounded coordinates. Shelter caches are invalidated once, when
+everything is in, by bumping the shelters dataset version (see datasets.py).
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+
+import datasets
+import db_location
+
+BATCH_SIZE = 5000
+READ_SIZE = 1 << 16
+# Largest single GeoJSON feature accepted
+MAX_FEATURE_BYTES = 1 << 20
+
+# Column names seen in registries, by field
+ALIASES = {
+    'registry_id': ('registry_id', 'shelter_id', 'id', 'code', 'registration_no', 'reg_no'),
+    'name': ('name', 'shelter_name', 'shelter', 'title'),
+    'address': ('address', 'addr', 'full_address', 'location', 'street'),
+    'latitude': ('latitude', 'lat', 'y'),
+    'longitude': ('longitude', 'lon', 'lng', 'long', 'x'),
+    'phone': ('phone', 'phone_number', 'contact', 'telephone', 'helpline', 'mobile'),
+    'capacity': ('capacity', 'beds', 'total_capacity', 'max_occupancy'),
+    'facilities': ('facilities', 'services', 'amenities'),
+    'rating': ('rating', 'score'),
+}
+
+UPSERT = '''
+    INSERT INTO safe_shelters (registry_id, name, address, latitude, longitude, phone, capacity, facilities, rating)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (registry_id) DO UPDATE SET
+        name = excluded.name, address = excluded.address,
+        latitude = excluded.latitude, longitude = excluded.longitude,
+        phone = excluded.phone, capacity = excluded.capacity,
+        facilities = excluded.facilities, rating = excluded.rating
+    WHERE (name, address, latitude, longitude, phone, capacity, facilities, rating)
+        IS NOT (excluded.name, excluded.address, excluded.latitude, excluded.longitude,
+                excluded.phone, excluded.capacity, excluded.facilities, excluded.rating)
+'''
+
+_SPACES = re.compile(r'\s+')
+
+
+# Reading
+def read_csv(stream):
+    """Dicts with lowercased keys, one per CSV row"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield {(key or '').strip().lower(): value for key, value in row.items()}
+
+
+def read_geojson(stream):
+    """Feature properties plus coordinates, decoded one feature at a time"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, position, eof
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[position:] + chunk
+        position = 0
+
+    # Find the start of the features array
+    pattern = re.compile(r'"features"\s*:\s*\[')
+    while True:
+        match = pattern.search(buffer, position)
+        if match:
+            position = match.end()
+            break
+        if eof:
+            raise ValueError('No "features" array found')
+        # Keep a tail in case the key is split across reads
+        position = max(0, len(buffer) - 32)
+        fill()
+
+    while True:
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            fill()
+        if position >= len(buffer) or buffer[position] == ']':
+            return
+        try:
+            feature, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            if len(buffer) - position > MAX_FEATURE_BYTES:
+                raise ValueError('GeoJSON feature too large')
+            fill()
+            continue
+        position = end
+        record = {key.lower(): value for key, value in (feature.get('properties') or {}).items()}
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Point' and len(geometry.get('coordinates') or []) >= 2:
+            record['longitude'], record['latitude'] = geometry['coordinates'][:2]
+        if feature.get('id') is not None and not any(record.get(k) for k in ALIASES['registry_id']):
+            record['registry_id'] = feature['id']
+        yield record
+
+
+def read_records(path):
+    """Records from a .csv, .geojson or .json file"""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8-sig', newline='') as stream:
+        if extension == '.csv':
+            yield from read_csv(stream)
+        elif extension in ('.geojson', '.json'):
+            yield from read_geojson(stream)
+        else:
+            raise ValueError(f'Unsupported file type: {extension}')
+
+
+# Validation
+def _field(record, name):
+    for key in ALIASES[name]:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _text(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        value = ', '.join(str(v) for v in value)
+    return _SPACES.sub(' ', str(value)).strip() or None
+
+
+def normalize(record):
+    """Row tuple for UPSERT from a raw record; raises ValueError explaining why a row is rejected"""
+    name = _text(_field(record, 'name'))
+    if not name:
+        raise ValueError('missing name')
+    try:
+        latitude = float(_field(record, 'latitude'))
+        longitude = float(_field(record, 'longitude'))
+    except (TypeError, ValueError):
+        raise ValueError('missing or invalid coordinates')
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or (latitude == 0 and longitude == 0):
+        raise ValueError('coordinates out of range')
+    latitude, longitude = round(latitude, 6), round(longitude, 6)
+
+    phone = _text(_field(record, 'phone'))
+    if phone:
+        phone = ('+' if phone.startswith('+') else '') + re.sub(r'[^\d-]', '', phone).strip('-') or None
+    capacity = _field(record, 'capacity')
+    if capacity is not None:
+        try:
+            capacity = max(0, int(float(capacity)))
+        except (TypeError, ValueError):
+            capacity = None
+    rating = _field(record, 'rating')
+    try:
+        rating = min(5.0, max(0.0, float(rating))) if rating is not None else 0
+    except (TypeError, ValueError):
+        rating = 0
+
+    registry_id = _text(_field(record, 'registry_id'))
+    if not registry_id:
+        registry_id = f'{name.lower()}@{latitude:.5f},{longitude:.5f}'
+    return (registry_id, name, _text(_field(record, 'address')) or '', latitude, longitude,
+            phone, capacity, _text(_field(record, 'facilities')), rating)
+
+
+# Import
+def import_records(conn, records, batch_size=BATCH_SIZE, dry_run=False, on_progress=None):
+    """Upsert records in batches; returns a stats dict"""
+    stats = {'read': 0, 'written': 0, 'unchanged': 0, 'rejected': 0, 'errors': {}}
+    started = time.perf_counter()
+    before = conn.execute('SELECT COUNT(*) FROM safe_shelters').fetchone()[0]
+    batch = []
+    committed = False
+
+    def flush():
+        cursor = conn.executemany(UPSERT, batch)
+        stats['written'] += cursor.rowcount
+        stats['unchanged'] += len(batch) - cursor.rowcount
+        batch.clear()
+        if on_progress:
+            on_progress(stats, time.perf_counter() - started)
+
+    try:
+        conn.execute('BEGIN')
+        for record in records:
+            stats['read'] += 1
+            try:
+                batch.append(normalize(record))
+            except ValueError as e:
+                stats['rejected'] += 1
+                stats['errors'][str(e)] = stats['errors'].get(str(e), 0) + 1
+                continue
+            if len(batch) >= batch_size:
+                flush()
+                if not dry_run:
+                    conn.commit()
+                    committed = True
+                    conn.execute('BEGIN')
+        if batch:
+            flush()
+        stats['inserted'] = conn.execute('SELECT COUNT(*) FROM safe_shelters').fetchone()[0] - before
+        stats['updated'] = stats['written'] - stats['inserted']
+        if dry_run:
+            conn.rollback()
+        else:
+            # Once, at the end: caches in every worker rebuild on the version change
+            datasets.bump(conn, 'shelters')
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        if committed:
+            # Earlier batches are saved; make sure readers see them
+            datasets.bump(conn, 'shelters')
+            conn.commit()
+            _invalidate_local_caches()
+        raise
+    stats['seconds'] = time.perf_counter() - started
+    if not dry_run:
+        _invalidate_local_caches()
+    return stats
+
+
+def _invalidate_local_caches():
+    """Drop this process's shelter caches (other processes follow the dataset version)"""
+    datasets.forget('shelters')
+    for module, invalidate in (('responses', lambda m: m.invalidate('shelters')),
+                               ('route_safety', lambda m: m.grid.invalidate_shelters())):
+        if module in sys.modules:
+            invalidate(sys.modules[module])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a shelter registry (CSV or GeoJSON) into safe_shelters')
+    parser.add_argument('file')
+    parser.add_argument('--db', default=db_location.resolve(os.environ.get('DATABASE_URL')))
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help='validate and count without saving')
+    args = parser.parse_args()
+
+    conn = db_location.connect(args.db, isolation_level=None)
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'idx_shelters_registry'").fetchone():
+        print("Database schema is out of date; start the app once (init_db) before importing")
+        return 1
+    conn.execute('PRAGMA journal_mode = WAL')
+
+    def progress(stats, elapsed):
+        print(f"\r{stats['read']:,} rows read, {stats['read'] / elapsed:,.0f} rows/s", end='', file=sys.stderr)
+
+    try:
+        stats = import_records(conn, read_records(args.file), args.batch_size, args.dry_run, progress)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"\nImport failed, the batch in progress was rolled back: {e}")
+        return 1
+    finally:
+        conn.close()
+    print(file=sys.stderr)
+    rate = stats['read'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"{'Checked' if args.dry_run else 'Imported'} {stats['read']:,} rows in {stats['seconds']:.2f}s "
+          f"({rate:,.0f} rows/s): {stats['inserted']:,} new, {stats['updated']:,} updated, "
+          f"{stats['unchanged']:,} unchanged, {stats['rejected']:,} rejected")
+    for reason, count in sorted(stats['errors'].items(), key=lambda item: -item[1]):
+        print(f"  rejected {count:,}: {reason}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Women Security System - Incident Heatmap
+Complaint counts per map cell, kept up to date as complaints are filed, so
+heatmap tiles are read from a small aggregate instead of scanning complaints.
+
+Cells are web-map (slippy) tiles at every level in CELL_LEVELS, counted per
+category, day and 4-hour band of the day. They are keyed by the Morton code of (x, y), which makes the
+cells inside any tile one contiguous key range. A heatmap tile at zoom z is
+drawn from the cells CELL_OFFSET levels deeper (32 x 32 cells per tile), so
+answering it reads at most that many cells per day and category, whatever the
+number of complaints.
+"""
+
+import math
+from datetime import datetime, timedelta, timezone
+
+CELL_LEVELS = range(5, 18)
+# A tile at zoom z uses cells at level z + CELL_OFFSET (2 ** 5 = 32 cells across)
+CELL_OFFSET = 5
+MAX_TILE_ZOOM = 20
+MAX_DAYS = 365
+MAX_LATITUDE = 85.05112878
+# Hours per time-of-day band (0-3h is band 0, 4-7h band 1, ...)
+BAND_HOURS = 4
+BANDS = 24 // BAND_HOURS
+
+
+def ensure_schema(cursor):
+    """Create incident_cells; a table from before time-of-day bands is rebuilt"""
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(incident_cells)')]
+    outdated = bool(columns) and 'band' not in columns
+    if outdated:
+        cursor.execute('DROP TABLE incident_cells')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS incident_cells (
+            level INTEGER,
+            cell INTEGER,
+            day TEXT,
+            category TEXT,
+            band INTEGER,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (level, cell, day, category, band)
+        ) WITHOUT ROWID
+    ''')
+    if outdated:
+        rebuild(cursor.connection)
+
+
+def parse_location(data):
+    """(text, latitude, longitude) from complaint data
+
+    Coordinates come from 'latitude'/'longitude' or a 'location' object with
+    them; a 'location' string is kept as text, and read as coordinates when it
+    is 'lat,lon'. Raises ValueError for out-of-range coordinates.
+    """
+    location = data.get('location') or ''
+    latitude, longitude = data.get('latitude'), data.get('longitude')
+    if isinstance(location, dict):
+        latitude = location.get('latitude', latitude)
+        longitude = location.get('longitude', longitude)
+        location = location.get('address') or ''
+    elif isinstance(location, str) and latitude is None and location.count(',') == 1:
+        try:
+            latitude, longitude = (float(part) for part in location.split(','))
+        except ValueError:
+            pass
+    if latitude is None or longitude is None:
+        return str(location), None, None
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('Coordinates out of range')
+    return str(location), latitude, longitude
+
+
+def tile_of(latitude, longitude, level):
+    """Slippy-map tile (x, y) containing a point"""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    n = 2 ** level
+    x = int((longitude + 180) / 360 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def interleave(x, y):
+    """Morton code of a tile: x in the even bits, y in the odd bits"""
+    code = 0
+    bit = 0
+    while x or y:
+        code |= (x & 1) << (2 * bit) | (y & 1) << (2 * bit + 1)
+        x >>= 1
+        y >>= 1
+        bit += 1
+    return code
+
+
+def deinterleave(code):
+    x = y = 0
+    bit = 0
+    while code:
+        x |= (code & 1) << bit
+        y |= ((code >> 1) & 1) << bit
+        code >>= 2
+        bit += 1
+    return x, y
+
+
+def tile_center(x, y, level):
+    """(latitude, longitude) of the middle of a tile"""
+    n = 2 ** level
+    longitude = (x + 0.5) / n * 360 - 180
+    latitude = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 0.5) / n))))
+    return latitude, longitude
+
+
+def record(conn, latitude, longitude, category, created=None):
+    """Count a new complaint in its cell at every level; call inside the insert's transaction"""
+    created = created or datetime.now(timezone.utc)
+    # category is part of the primary key, which can't be NULL
+    category = category or 'general'
+    day = created.strftime('%Y-%m-%d')
+    band = created.hour // BAND_HOURS
+    conn.executemany('''
+        INSERT INTO incident_cells (level, cell, day, category, band, count) VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT (level, cell, day, category, band) DO UPDATE SET count = count + 1
+    ''', [(level, interleave(*tile_of(latitude, longitude, level)), day, category, band)
+          for level in CELL_LEVELS])
+
+
+def rebuild(conn):
+    """Recount every cell from the complaints table"""
+    conn.execute('DELETE FROM incident_cells')
+    rows = conn.execute('''
+        SELECT latitude, longitude, category, created_at FROM complaints
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    ''')
+    for latitude, longitude, category, created_at in rows.fetchall():
+        record(conn, latitude, longitude, category, datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S'))
+    conn.commit()
+
+
+def heatmap_tile(conn, zoom, x, y, days=30, category=None, today=None):
+    """Weighted cell centers [[lat, lon, count], ...] inside one map tile"""
+    level = min(zoom + CELL_OFFSET, CELL_LEVELS[-1])
+    shift = level - zoom
+    if shift >= 0:
+        first = interleave(x, y) << (2 * shift)
+        last = first + (1 << (2 * shift)) - 1
+    else:
+        # Zoomed in past the finest cells: the one cell covering this tile
+        first = last = interleave(x >> -shift, y >> -shift)
+    since = ((today or datetime.now(timezone.utc)) - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    params = [level, first, last, since]
+    category_clause = ''
+    if category:
+        category_clause = 'AND category = ?'
+        params.append(category)
+    rows = conn.execute(f'''
+        SELECT cell, SUM(count) FROM incident_cells
+        WHERE level = ? AND cell BETWEEN ? AND ? AND day >= ? {category_clause}
+        GROUP BY cell
+    ''', params).fetchall()
+    return [[*(round(v, 6) for v in tile_center(*deinterleave(cell), level)), count] for cell, count in rows]
+
+
+def merge_tiles(tiles):
+    """One tile's points from several shards' incident_cells, counts of the same cell added up"""
+    if len(tiles) == 1:
+        return tiles[0]
+    merged = {}
+    for points in tiles:
+        for latitude, longitude, count in points:
+            merged[(latitude, longitude)] = merged.get((latitude, longitude), 0) + count
+    return [[latitude, longitude, count] for (latitude, longitude), count in merged.items()]
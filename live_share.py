@@ -0,0 +1,276 @@
+"""
+Women Security System - Live Location Sharing
+Expiring share links that give anyone holding the token a read-only view of
+a user's recent trail, for sending to family or friends during a journey.
+
+Every user with an active share has a fixed-size ring buffer of their last
+TRAIL_POINTS positions (24 bytes a point, ~5.6 KB a sharer), fed by each
+location update, so viewers are answered from memory and never query the
+database. Buffers are dropped when the user's last share expires or is
+revoked. A position within MERGE_M of one stored for the same second
+replaces it, as the same ping arrives locally and again through sync();
+distinct positions in one second are all kept.
+
+Tokens are stored as SHA-256 hashes in live_shares. Like the other per-worker
+indexes, each worker keeps its own copy: sync() reloads shares when the
+'live_shares' dataset version moves (see datasets.py) and appends pings
+stored through other workers, at most once every SYNC_INTERVAL seconds
+however many viewers are polling.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from array import array
+
+import datasets
+import geo
+import ping_filter
+
+TRAIL_POINTS = 240
+DEFAULT_MINUTES = 60
+MAX_MINUTES = 24 * 60
+SYNC_INTERVAL = 2.0
+MERGE_M = ping_filter.DISTANCE_M
+# Expired and revoked shares are kept this long, then deleted by prune() (seconds)
+PRUNE_AFTER = 7 * 24 * 3600
+
+
+def ensure_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS live_shares (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_hash TEXT NOT NULL UNIQUE,
+            expires_at REAL NOT NULL,
+            revoked INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_live_shares_active ON live_shares (expires_at) WHERE revoked = 0')
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def prune(conn, now=None):
+    """Delete shares that expired more than PRUNE_AFTER seconds ago; returns how many"""
+    now = time.time() if now is None else now
+    return conn.execute('DELETE FROM live_shares WHERE expires_at < ?', (now - PRUNE_AFTER,)).rowcount
+
+
+class Trail:
+    """Ring buffer of the last size (latitude, longitude, time) points"""
+    __slots__ = ('_data', '_size', '_next', '_count')
+
+    def __init__(self, size=TRAIL_POINTS):
+        self._data = array('d', bytes(24 * size))
+        self._size = size
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def last_time(self):
+        if not self._count:
+            return None
+        return self._data[((self._next - 1) % self._size) * 3 + 2]
+
+    def append(self, latitude, longitude, seen):
+        i = self._next * 3
+        self._data[i], self._data[i + 1], self._data[i + 2] = latitude, longitude, seen
+        self._next = (self._next + 1) % self._size
+        self._count = min(self._count + 1, self._size)
+
+    def merge(self, latitude, longitude, seen, distance_m=MERGE_M):
+        """Move a point stored for second seen within distance_m to this position; False if there is none"""
+        data, size = self._data, self._size
+        for n in range(1, self._count + 1):
+            i = ((self._next - n) % size) * 3
+            if data[i + 2] != seen:
+                return False
+            if geo.haversine_m(data[i], data[i + 1], latitude, longitude) <= distance_m:
+                data[i], data[i + 1] = latitude, longitude
+                return True
+        return False
+
+    def points(self, since=None):
+        """[[latitude, longitude, time], ...] oldest first, only those after since if given"""
+        data, size = self._data, self._size
+        start = (self._next - self._count) % size
+        result = []
+        for n in range(self._count):
+            i = ((start + n) % size) * 3
+            if since is None or data[i + 2] > since:
+                result.append([data[i], data[i + 1], int(data[i + 2])])
+        return result
+
+
+class LiveShares:
+    def __init__(self, clock=time.time, trail_points=TRAIL_POINTS):
+        # token hash -> (share id, user id, expires_at)
+        self._shares = {}
+        # user id -> Trail, for users with an active share
+        self._trails = {}
+        self._trail_points = trail_points
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._last_sync = 0.0
+        # Last ping id read, per shard (see sharding.py)
+        self._last_ping_ids = None
+        self._version = None
+
+    def sharing(self, user_id):
+        return user_id in self._trails
+
+    def memory_bytes(self):
+        return sum(t._data.buffer_info()[1] * t._data.itemsize for t in self._trails.values())
+
+    # Share management (writes go to the database; the local copy follows)
+    def create(self, conn, user_id, minutes=DEFAULT_MINUTES, user_conn=None):
+        """Start a share; returns (token, share dict). Commit is left to the caller
+
+        user_conn is a connection to the shard with the user's pings, if not conn.
+        """
+        token = secrets.token_urlsafe(16)
+        expires_at = self._clock() + minutes * 60
+        cursor = conn.execute('INSERT INTO live_shares (user_id, token_hash, expires_at) VALUES (?, ?, ?)',
+                              (user_id, hash_token(token), expires_at))
+        datasets.bump(conn, 'live_shares')
+        with self._lock:
+            self._shares[hash_token(token)] = (cursor.lastrowid, user_id, expires_at)
+        if user_id not in self._trails:
+            self._seed([user_conn or conn], [user_id])
+        return token, {'id': cursor.lastrowid, 'expires_at': expires_at}
+
+    def revoke(self, conn, user_id, share_id):
+        """Stop one of the user's shares; returns False if there is no such active share"""
+        cursor = conn.execute('UPDATE live_shares SET revoked = 1 WHERE id = ? AND user_id = ? AND revoked = 0',
+                              (share_id, user_id))
+        if not cursor.rowcount:
+            return False
+        datasets.bump(conn, 'live_shares')
+        with self._lock:
+            for token_hash, (sid, _, _) in list(self._shares.items()):
+                if sid == share_id:
+                    del self._shares[token_hash]
+            self._drop_idle_trails()
+        return True
+
+    def active(self, conn, user_id):
+        rows = conn.execute('''
+            SELECT id, expires_at FROM live_shares
+            WHERE user_id = ? AND revoked = 0 AND expires_at > ? ORDER BY id
+        ''', (user_id, self._clock())).fetchall()
+        return [{'id': share_id, 'expires_at': expires_at} for share_id, expires_at in rows]
+
+    # Positions
+    def record(self, user_id, latitude, longitude, seen=None):
+        """Append a position to the user's trail if they are sharing; returns True if stored"""
+        trail = self._trails.get(user_id)
+        if trail is None:
+            return False
+        seen = int(self._clock() if seen is None else seen)
+        with self._lock:
+            last = trail.last_time()
+            if last is not None and seen < last:
+                return False
+            if not trail.merge(latitude, longitude, seen):
+                trail.append(latitude, longitude, seen)
+        return True
+
+    def view(self, token, since=None):
+        """Public view of a share: {'expires_at', 'points'}, or None for unknown or expired tokens"""
+        share = self._shares.get(hash_token(token))
+        if share is None or share[2] <= self._clock():
+            return None
+        trail = self._trails.get(share[1])
+        with self._lock:
+            points = trail.points(since) if trail is not None else []
+        return {'expires_at': share[2], 'points': points}
+
+    # Loading
+    def sync(self, connect, force=False, shard_connects=None):
+        """Load share changes and pings stored since the last sync; shard_connects open the ping shards"""
+        now = time.monotonic()
+        if not force and self._last_ping_ids is not None and now - self._last_sync < SYNC_INTERVAL:
+            return
+        self._last_sync = now
+        shard_connects = shard_connects or [connect]
+        if self._last_ping_ids is None or len(self._last_ping_ids) != len(shard_connects):
+            self._last_ping_ids = [None] * len(shard_connects)
+        shard_conns = [shard_connect() for shard_connect in shard_connects]
+        try:
+            for index, shard_conn in enumerate(shard_conns):
+                self._load_new(shard_conn, index)
+            conn = connect()
+            try:
+                version = datasets.read(conn, 'live_shares')
+                if force or version != self._version:
+                    self._load_shares(conn, shard_conns)
+                    self._version = version
+                else:
+                    with self._lock:
+                        self._drop_idle_trails()
+            finally:
+                conn.close()
+        finally:
+            for shard_conn in shard_conns:
+                shard_conn.close()
+
+    def _load_new(self, conn, shard):
+        if self._last_ping_ids[shard] is None:
+            self._last_ping_ids[shard] = conn.execute('SELECT COALESCE(MAX(id), 0) FROM location_tracking').fetchone()[0]
+            return
+        rows = conn.execute('''
+            SELECT id, user_id, latitude, longitude, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM location_tracking WHERE id > ? ORDER BY id
+        ''', (self._last_ping_ids[shard],)).fetchall()
+        for ping_id, user_id, latitude, longitude, seen in rows:
+            self._last_ping_ids[shard] = ping_id
+            if user_id in self._trails and latitude is not None and longitude is not None:
+                self.record(user_id, latitude, longitude, seen)
+
+    def _load_shares(self, conn, shard_conns):
+        rows = conn.execute('''
+            SELECT token_hash, id, user_id, expires_at FROM live_shares
+            WHERE revoked = 0 AND expires_at > ?
+        ''', (self._clock(),)).fetchall()
+        with self._lock:
+            self._shares = {token_hash: (share_id, user_id, expires_at)
+                            for token_hash, share_id, user_id, expires_at in rows}
+            self._drop_idle_trails()
+        self._seed(shard_conns, list({row[2] for row in rows} - set(self._trails)))
+
+    def _seed(self, conns, user_ids):
+        # Start new trails with the user's latest stored pings, from whichever shard holds them
+        for user_id in user_ids:
+            rows = []
+            for conn in conns:
+                rows = conn.execute('''
+                    SELECT latitude, longitude, CAST(strftime('%s', timestamp) AS INTEGER) FROM location_tracking
+                    WHERE user_id = ? AND latitude IS NOT NULL ORDER BY timestamp DESC, id DESC LIMIT ?
+                ''', (user_id, self._trail_points)).fetchall()
+                if rows:
+                    break
+            trail = Trail(self._trail_points)
+            for latitude, longitude, seen in reversed(rows):
+                if not trail.merge(latitude, longitude, seen or 0):
+                    trail.append(latitude, longitude, seen or 0)
+            with self._lock:
+                self._trails.setdefault(user_id, trail)
+
+    def _drop_idle_trails(self):
+        now = self._clock()
+        for token_hash in [t for t, share in self._shares.items() if share[2] <= now]:
+            del self._shares[token_hash]
+        sharing = {share[1] for share in self._shares.values()}
+        for user_id in [u for u in self._trails if u not in sharing]:
+            del self._trails[user_id]
+
+
+shares = LiveShares()
@@ -0,0 +1,204 @@
+"""
+Women Security System - Location History
+Reads a user's past positions from location_tracking for drawing tracks,
+downsampled on the server so a month of pings doesn't reach the browser.
+
+Points are read in timestamp order an hour at a time, from the hour blobs
+of track_archive.py and from the covering index idx_location_user_time
+(user_id, timestamp, latitude, longitude) for pings not archived yet, so the
+table itself is never touched and only a window of points is held in memory:
+- zoom: grid bucketing, keeping one point per run of pings that fall in the
+  same cell of about one map pixel at that zoom level
+- max_points: Douglas-Peucker on consecutive windows, each window simplified
+  to its share of the point budget
+"""
+
+import heapq
+import math
+from datetime import datetime, timedelta, timezone
+
+import geo
+import track_archive
+from responses import dumps
+
+DEFAULT_MAX_POINTS = 5000
+MAX_POINTS_LIMIT = 20000
+MAX_ZOOM = 22
+# Points simplified together in max_points mode
+WINDOW_SIZE = 4096
+# Meters per pixel of a 256 px web map tile at zoom 0 on the equator
+ZOOM0_M_PER_PIXEL = 2 * math.pi * 6378137 / 256
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_M_PER_DEG = math.pi * geo.EARTH_RADIUS_M / 180
+
+
+def parse_time(value):
+    """Unix seconds or an ISO 8601 date/time -> the UTC text format used by location_tracking"""
+    try:
+        moment = datetime.fromtimestamp(float(value), timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        moment = datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(timezone.utc)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def parse_bbox(value):
+    """'min_lat,min_lon,max_lat,max_lon' -> tuple of floats"""
+    parts = [float(p) for p in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError('bbox must be min_lat,min_lon,max_lat,max_lon')
+    return tuple(parts)
+
+
+def zoom_tolerance_m(zoom):
+    """Ground size of one map pixel at a zoom level"""
+    return ZOOM0_M_PER_PIXEL / (2 ** zoom)
+
+
+def _where(user_id, start, end, bbox):
+    clauses = ['user_id = ?', 'timestamp >= ?', 'timestamp <= ?', 'latitude IS NOT NULL']
+    params = [user_id, start, end]
+    if bbox is not None:
+        clauses.append('latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?')
+        params += [bbox[0], bbox[2], bbox[1], bbox[3]]
+    return ' AND '.join(clauses), params
+
+
+def count_points(conn, user_id, start, end, bbox=None):
+    where, params = _where(user_id, start, end, bbox)
+    stored = conn.execute(f'SELECT COUNT(*) FROM location_tracking WHERE {where}', params).fetchone()[0]
+    return stored + track_archive.count_points(conn, user_id, start, end, bbox)
+
+
+def query_points(conn, user_id, start, end, bbox=None):
+    """Generator of (latitude, longitude, timestamp) in time order, archived or not"""
+    for rows in track_archive.hours(conn, user_id, start, end):
+        if bbox is None:
+            yield from [(lat, lon, ts) for _, lat, lon, ts, _ in rows if lat is not None and lon is not None]
+        else:
+            yield from [(lat, lon, ts) for _, lat, lon, ts, _ in rows if lat is not None and lon is not None
+                        and bbox[0] <= lat <= bbox[2] and bbox[1] <= lon <= bbox[3]]
+
+
+# Downsampling
+def grid_bucket(points, tolerance_m):
+    """Keep the first point of each run in the same grid cell, plus the last point"""
+    cell_deg = tolerance_m / _M_PER_DEG
+    lon_scale = None
+    last_cell = None
+    last = None
+    emitted = False
+    for point in points:
+        if lon_scale is None:
+            lon_scale = max(math.cos(math.radians(point[0])), 0.01)
+        cell = (math.floor(point[0] / cell_deg), math.floor(point[1] * lon_scale / cell_deg))
+        last = point
+        emitted = cell != last_cell
+        if emitted:
+            last_cell = cell
+            yield point
+    if last is not None and not emitted:
+        yield last
+
+
+def _segment_distance(p, a, b, lon_scale):
+    """Distance in degrees of latitude from p to segment ab, on a local flat projection"""
+    ax, ay = a[1] * lon_scale, a[0]
+    bx, by = b[1] * lon_scale, b[0]
+    px, py = p[1] * lon_scale, p[0]
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+    return math.hypot(px - ax - t * dx, py - ay - t * dy)
+
+
+def simplify(points, budget):
+    """Douglas-Peucker with a point budget instead of a tolerance
+
+    Segments are split farthest-point first, so the kept points are the ones
+    Douglas-Peucker would keep at the smallest tolerance that fits the budget.
+    """
+    n = len(points)
+    if n <= budget or n <= 2:
+        return list(points)
+    lon_scale = max(math.cos(math.radians(points[0][0])), 0.01)
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    kept = 2
+    heap = []
+
+    def push(first, last):
+        if last - first < 2:
+            return
+        a, b = points[first], points[last]
+        best, index = -1.0, first
+        for i in range(first + 1, last):
+            d = _segment_distance(points[i], a, b, lon_scale)
+            if d > best:
+                best, index = d, i
+        heapq.heappush(heap, (-best, first, last, index))
+
+    push(0, n - 1)
+    while heap and kept < budget:
+        _, first, last, index = heapq.heappop(heap)
+        keep[index] = True
+        kept += 1
+        push(first, index)
+        push(index, last)
+    return [p for p, k in zip(points, keep) if k]
+
+
+def simplify_windows(points, total, max_points, window_size=WINDOW_SIZE):
+    """Simplify a stream of total points to about max_points, one window at a time"""
+    if total <= max_points:
+        yield from points
+        return
+    window = []
+    for point in points:
+        window.append(point)
+        if len(window) == window_size:
+            yield from simplify(window, max(2, round(max_points * window_size / total)))
+            window = []
+    if window:
+        yield from simplify(window, max(2, round(max_points * len(window) / total)))
+
+
+def history(connect, user_id, start, end, bbox=None, zoom=None, max_points=DEFAULT_MAX_POINTS):
+    """Generator of downsampled (latitude, longitude, timestamp) points; owns its connection"""
+    conn = connect()
+    try:
+        if zoom is not None:
+            points = grid_bucket(query_points(conn, user_id, start, end, bbox), zoom_tolerance_m(zoom))
+        else:
+            total = count_points(conn, user_id, start, end, bbox)
+            points = simplify_windows(query_points(conn, user_id, start, end, bbox), total, max_points)
+        yield from points
+    finally:
+        conn.close()
+
+
+def default_range():
+    """The last 24 hours"""
+    end = datetime.now(timezone.utc)
+    return (end - timedelta(days=1)).strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT)
+
+
+def stream_json(points, start, end, chunk_size=500):
+    """JSON body {"start", "end", "points": [[lat, lon, timestamp], ...], "count"} as chunks of bytes"""
+    yield b'{"success":true,"start":' + dumps(start) + b',"end":' + dumps(end) + b',"points":['
+    count = 0
+    chunk = []
+    for point in points:
+        chunk.append(point)
+        if len(chunk) == chunk_size:
+            yield (b',' if count else b'') + dumps(chunk)[1:-1]
+            count += len(chunk)
+            chunk = []
+    if chunk:
+        yield (b',' if count else b'') + dumps(chunk)[1:-1]
+        count += len(chunk)
+    yield b'],"count":' + str(count).encode() + b'}'
@@ -0,0 +1,374 @@
+"""
+Women Security System - Request Metrics
+Per-route latency histograms, in-flight gauges, status counters and response
+sizes, exposed in Prometheus text format on /metrics.
+
+Every thread records into its own private stats object, so the request path
+never takes a lock. A scrape sums the per-thread objects. Stats of threads
+that have exited (the dev server starts one per request) are folded into one
+retired total, so the registry only holds live threads. Under gunicorn, set
+METRICS_MULTIPROC_DIR to a directory shared by the workers: each worker
+periodically dumps its totals there and a scrape on any worker merges the
+files of all workers.
+
+/metrics answers staff sessions (STAFF_USER_IDS) and scrapers sending
+`Authorization: Bearer <METRICS_TOKEN>`; others get 403. Loopback clients
+are trusted only with METRICS_ALLOW_LOCAL, since behind a reverse proxy on
+the same host every public request comes from 127.0.0.1.
+"""
+
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import current_app, g, jsonify, request, session, Response
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# How often a worker dumps its totals to the multiprocess directory (seconds)
+FLUSH_INTERVAL = 1.0
+
+# Loopback addresses allowed to scrape without a token
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+_registry_lock = threading.Lock()
+# (thread, stats) of every live thread that recorded something
+_thread_stats = []
+_local = threading.local()
+
+
+class _ThreadStats:
+    """Counters owned and written by exactly one thread"""
+    __slots__ = ('latency', 'phases', 'sizes', 'responses', 'counters', 'in_flight')
+
+    def __init__(self):
+        # (endpoint, method) -> [bucket counts..., +Inf count, sum]
+        self.latency = {}
+        # (endpoint, phase) -> histogram
+        self.phases = {}
+        # (endpoint, method) -> histogram
+        self.sizes = {}
+        # (endpoint, method, status) -> count
+        self.responses = {}
+        # (name, labels) -> count, for counters recorded outside the request hooks
+        self.counters = {}
+        self.in_flight = 0
+
+
+def _stats():
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        stats = _local.stats = _ThreadStats()
+        with _registry_lock:
+            _retire_finished()
+            _thread_stats.append((threading.current_thread(), stats))
+    return stats
+
+
+def _observe(table, key, buckets, value):
+    hist = table.get(key)
+    if hist is None:
+        hist = table[key] = [0] * (len(buckets) + 1) + [0.0]
+    hist[bisect_left(buckets, value)] += 1
+    hist[-1] += value
+
+
+def inc(name, value=1, **labels):
+    """Increment a free-standing counter, e.g. inc('jobs_total', job='backup')"""
+    key = (name, tuple(sorted(labels.items())))
+    counters = _stats().counters
+    counters[key] = counters.get(key, 0) + value
+
+
+@contextmanager
+def observe_phase(phase, endpoint=None):
+    """Time a named phase of the current request (connect, insert, commit...)
+
+    endpoint defaults to the Flask request's; the async server passes its own.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        endpoint = endpoint or request.endpoint or 'unmatched'
+        _observe(_stats().phases, (endpoint, phase), LATENCY_BUCKETS, time.perf_counter() - start)
+
+
+def request_started():
+    """Count a request in flight; pair with request_finished() on the same thread"""
+    _stats().in_flight += 1
+
+
+def request_finished():
+    _stats().in_flight -= 1
+
+
+def record_request(endpoint, method, status, seconds, size=None):
+    """Record a served request; the async server calls this for the endpoints it serves itself"""
+    stats = _stats()
+    key = (endpoint, method)
+    _observe(stats.latency, key, LATENCY_BUCKETS, seconds)
+    status_key = (endpoint, method, str(status))
+    stats.responses[status_key] = stats.responses.get(status_key, 0) + 1
+    if size is not None:
+        _observe(stats.sizes, key, SIZE_BUCKETS, size)
+    _maybe_flush()
+
+
+# Request hooks
+def _before_request():
+    request_started()
+    g._metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    g._metrics_counted = True
+    record_request(request.endpoint or 'unmatched', request.method, response.status_code,
+                   time.perf_counter() - start, response.content_length)
+    return response
+
+
+def _teardown_request(exc):
+    # Runs even when a handler raised, so the gauge never leaks
+    if g.pop('_metrics_counted', None) or g.pop('_metrics_start', None) is not None:
+        request_finished()
+
+
+# Aggregation
+def _merge_hist(target, key, hist):
+    current = target.get(key)
+    if current is None:
+        target[key] = list(hist)
+    else:
+        for i, value in enumerate(hist):
+            current[i] += value
+
+
+def _merge_count(target, key, value):
+    target[key] = target.get(key, 0) + value
+
+
+def _merge_tables(total, tables):
+    for name in ('latency', 'phases', 'sizes'):
+        for key, hist in tables[name].items():
+            _merge_hist(total[name], key, hist)
+    for name in ('responses', 'counters'):
+        for key, value in tables[name].items():
+            _merge_count(total[name], key, value)
+
+
+def _copy_tables(stats):
+    # dict.copy() is atomic under the GIL, so the owner thread can keep writing
+    return {name: getattr(stats, name).copy() for name in ('latency', 'phases', 'sizes', 'responses', 'counters')}
+
+
+def _empty():
+    return {'latency': {}, 'phases': {}, 'sizes': {}, 'responses': {}, 'counters': {}, 'in_flight': 0}
+
+
+# Counters of threads that have exited
+_retired = _empty()
+
+
+def _retire_finished():
+    # Fold exited threads into _retired; the caller holds _registry_lock.
+    # Their in-flight gauge is dropped: a finished thread serves nothing
+    alive = []
+    for thread, stats in _thread_stats:
+        if thread.is_alive():
+            alive.append((thread, stats))
+        else:
+            _merge_tables(_retired, _copy_tables(stats))
+    _thread_stats[:] = alive
+
+
+def snapshot():
+    """Sum the stats of every thread in this process"""
+    total = _empty()
+    with _registry_lock:
+        _retire_finished()
+        _merge_tables(total, _retired)
+        all_stats = [stats for _, stats in _thread_stats]
+    for stats in all_stats:
+        _merge_tables(total, _copy_tables(stats))
+        total['in_flight'] += stats.in_flight
+    return total
+
+
+def _multiproc_dir():
+    return os.environ.get('METRICS_MULTIPROC_DIR')
+
+
+def _worker_file(directory, pid):
+    return os.path.join(directory, f'metrics-{pid}.json')
+
+
+def _dump(snap, path):
+    data = {name: [[list(key), value] for key, value in snap[name].items()]
+            for name in ('latency', 'phases', 'sizes', 'responses', 'counters')}
+    data['in_flight'] = snap['in_flight']
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _load(path):
+    with open(path) as f:
+        data = json.load(f)
+    snap = {'in_flight': data.get('in_flight', 0)}
+    for name in ('latency', 'phases', 'sizes', 'responses'):
+        snap[name] = {tuple(key): value for key, value in data.get(name, [])}
+    snap['counters'] = {(key[0], tuple(tuple(label) for label in key[1])): value
+                        for key, value in data.get('counters', [])}
+    return snap
+
+
+_last_flush = 0.0
+
+
+def flush():
+    """Write this worker's totals into the multiprocess directory"""
+    global _last_flush
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    _last_flush = time.monotonic()
+    _dump(snapshot(), _worker_file(directory, os.getpid()))
+
+
+def _maybe_flush():
+    if _multiproc_dir() and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def mark_process_dead(pid):
+    """Zero the in-flight gauge of an exited worker (gunicorn child_exit hook)"""
+    directory = _multiproc_dir()
+    if not directory:
+        return
+    path = _worker_file(directory, pid)
+    if os.path.exists(path):
+        snap = _load(path)
+        snap['in_flight'] = 0
+        _dump(snap, path)
+
+
+def collect():
+    """Stats for the whole service: this process, plus every worker when running multiprocess"""
+    directory = _multiproc_dir()
+    if not directory:
+        return snapshot()
+    flush()
+    total = _empty()
+    for name in os.listdir(directory):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            pid = int(name[len('metrics-'):-len('.json')])
+            snap = _load(os.path.join(directory, name))
+        except (ValueError, OSError):
+            continue
+        # Counters of dead workers still count towards the totals, gauges don't
+        _merge_tables(total, snap)
+        if _pid_alive(pid):
+            total['in_flight'] += snap['in_flight']
+    return total
+
+
+# Prometheus text format
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _render_histogram(lines, name, help_text, table, label_names, buckets):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for key in sorted(table):
+        hist = table[key]
+        labels = _labels(zip(label_names, key))
+        cumulative = 0
+        for bound, count in zip(buckets, hist):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += hist[len(buckets)]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {hist[-1]}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+def render(snap=None):
+    """Render stats in the Prometheus text exposition format"""
+    if snap is None:
+        snap = collect()
+    lines = []
+    _render_histogram(lines, 'http_request_duration_seconds', 'Request latency by endpoint.',
+                      snap['latency'], ('endpoint', 'method'), LATENCY_BUCKETS)
+    _render_histogram(lines, 'http_request_phase_seconds', 'Time spent in named phases of a request.',
+                      snap['phases'], ('endpoint', 'phase'), LATENCY_BUCKETS)
+    _render_histogram(lines, 'http_response_size_bytes', 'Response body size by endpoint.',
+                      snap['sizes'], ('endpoint', 'method'), SIZE_BUCKETS)
+    lines.append('# HELP http_responses_total Responses by endpoint and status code.')
+    lines.append('# TYPE http_responses_total counter')
+    for key in sorted(snap['responses']):
+        labels = _labels(zip(('endpoint', 'method', 'status'), key))
+        lines.append(f'http_responses_total{{{labels}}} {snap["responses"][key]}')
+    lines.append('# HELP http_requests_in_flight Requests currently being served.')
+    lines.append('# TYPE http_requests_in_flight gauge')
+    lines.append(f'http_requests_in_flight {snap["in_flight"]}')
+    seen = set()
+    for name, labels in sorted(snap['counters']):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f'# TYPE {name} counter')
+        label_text = _labels(labels)
+        series = f'{name}{{{label_text}}}' if label_text else name
+        lines.append(f'{series} {snap["counters"][(name, labels)]}')
+    return '\n'.join(lines) + '\n'
+
+
+def _may_scrape():
+    # Behind a reverse proxy on the same host every request is local, so this needs opting in
+    if current_app.config.get('METRICS_ALLOW_LOCAL') and request.remote_addr in LOCAL_ADDRESSES:
+        return True
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return session.get('user_id') in current_app.config.get('STAFF_USER_IDS', ())
+
+
+def metrics_endpoint():
+    if not _may_scrape():
+        return jsonify({'error': 'Forbidden'}), 403
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app):
+    """Register the request hooks and the /metrics route on a Flask app"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
@@ -0,0 +1,119 @@
+"""
+Women Security System - Location Ping Filter
+Phones standing still keep posting the same position. Per user, the filter
+remembers the last stored ping (the anchor). A ping within DISTANCE_M of the
+anchor and less than MAX_DWELL seconds after it is merged instead of stored:
+the anchor row's dwell_seconds grows to how long the user has been there.
+Any other ping is stored and becomes the new anchor. Distance is measured
+from the anchor, not the previous ping, so a slow drift is stored as soon as
+it adds up to DISTANCE_M.
+
+MAX_DWELL keeps a stationary user writing a row every two minutes, well
+inside responders.STALE_SECONDS, so workers following new rows still see
+the user online and a track never has a longer silent gap.
+
+Merging writes nothing during the request: dwell times are kept in memory
+and flush() writes the changed ones in one transaction per shard (a job of
+every worker, see create_jobs() in app.py). A crash loses at most the dwell
+growth since the last flush, never a position. Anchors are per worker, so a
+user whose pings reach several workers has one in each: a few more rows are
+stored, nothing is lost.
+
+Outcomes are counted in location_pings_total{result=stored|merged}, and
+stats() turns them into the reduction ratio.
+"""
+
+import threading
+import time
+
+import geo
+import metrics
+
+# Pings closer than this to the anchor are merged (GPS jitter standing still is 5-15 m)
+DISTANCE_M = 10.0
+# Seconds after which a stationary user's next ping is stored anyway
+MAX_DWELL = 120
+# Seconds between writes of the merged dwell times
+FLUSH_INTERVAL = 60
+# Anchors of users silent this long are forgotten
+IDLE_AFTER = 3600
+
+
+class _Anchor:
+    __slots__ = ('latitude', 'longitude', 'stored_at', 'ping_id', 'dwell', 'seen_at')
+
+    def __init__(self, latitude, longitude, stored_at, ping_id):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.stored_at = stored_at
+        self.ping_id = ping_id
+        self.dwell = 0
+        self.seen_at = stored_at
+
+
+class PingFilter:
+    """Each user's last stored ping, and the dwell times not written yet"""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._anchors = {}
+        # (user_id, ping_id) -> dwell seconds to write
+        self._dirty = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._anchors)
+
+    def offer(self, user_id, latitude, longitude, distance_m=DISTANCE_M, max_dwell=MAX_DWELL, now=None):
+        """True if the ping has to be stored (then call stored()); False if it was merged"""
+        now = self._clock() if now is None else now
+        merged = False
+        if distance_m > 0:
+            with self._lock:
+                anchor = self._anchors.get(user_id)
+                if (anchor is not None and 0 <= now - anchor.stored_at < max_dwell and
+                        geo.haversine_m(anchor.latitude, anchor.longitude, latitude, longitude) <= distance_m):
+                    merged = True
+                    anchor.seen_at = now
+                    dwell = int(now - anchor.stored_at)
+                    if dwell > anchor.dwell:
+                        anchor.dwell = self._dirty[(user_id, anchor.ping_id)] = dwell
+        metrics.inc('location_pings_total', result='merged' if merged else 'stored')
+        return not merged
+
+    def stored(self, user_id, latitude, longitude, ping_id, now=None):
+        """Make a just stored ping the user's anchor"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._anchors[user_id] = _Anchor(latitude, longitude, now, ping_id)
+
+    def flush(self, write, now=None):
+        """Pass the changed dwell times to write([(user_id, ping_id, seconds)]); returns how many"""
+        now = self._clock() if now is None else now
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            for user_id in [u for u, anchor in self._anchors.items() if now - anchor.seen_at > IDLE_AFTER]:
+                del self._anchors[user_id]
+        if not dirty:
+            return 0
+        try:
+            write([(user_id, ping_id, dwell) for (user_id, ping_id), dwell in dirty.items()])
+        except Exception:
+            # Written by the next flush, unless a longer dwell was merged meanwhile
+            with self._lock:
+                for key, dwell in dirty.items():
+                    self._dirty.setdefault(key, dwell)
+            raise
+        return len(dirty)
+
+
+def stats(snap=None):
+    """{'stored', 'merged', 'reduction'} from the location_pings_total counters"""
+    counters = (snap or metrics.collect())['counters']
+    stored = counters.get(('location_pings_total', (('result', 'stored'),)), 0)
+    merged = counters.get(('location_pings_total', (('result', 'merged'),)), 0)
+    return {'stored': stored, 'merged': merged,
+            'reduction': round(merged / (stored + merged), 4) if stored + merged else 0.0}
+
+
+pings = PingFilter()
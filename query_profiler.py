@@ -0,0 +1,190 @@
+"""
+Women Security System - SQL Query Profiler
+Opt-in tracing of every SQL statement run while serving a request.
+
+When SQL_PROFILE is enabled, connections are opened with ProfilingConnection:
+every statement is counted through sqlite3's trace callback, and execute(),
+the fetches and iteration that follow it, and commit() are timed. A statement
+whose execute plus fetches reach SQL_SLOW_QUERY_MS is logged once with its
+EXPLAIN QUERY PLAN: SQLite does most of a SELECT's work while rows are
+fetched. Repeated statements are reported as likely N+1 patterns. Each
+response carries an X-DB-Stats header with the query count and total DB time,
+except streamed responses (location history, export): their queries run
+after the headers are sent.
+"""
+
+import logging
+import sqlite3
+import time
+
+from flask import current_app, g, has_request_context
+
+logger = logging.getLogger('sql')
+
+DEFAULT_SLOW_QUERY_MS = 50.0
+# The same statement run this many times in one request is reported as N+1
+DEFAULT_REPEAT_THRESHOLD = 10
+
+
+class QueryStats:
+    """SQL activity of one request"""
+    __slots__ = ('count', 'time', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        # normalized SQL -> [executions, total seconds]
+        self.statements = {}
+
+    def record(self, sql, duration, executions=0):
+        self.time += duration
+        entry = self.statements.get(sql)
+        if entry is None:
+            self.statements[sql] = [executions, duration]
+        else:
+            entry[0] += executions
+            entry[1] += duration
+
+
+_fallback_stats = QueryStats()
+_settings = {'slow_query_ms': DEFAULT_SLOW_QUERY_MS, 'repeat_threshold': DEFAULT_REPEAT_THRESHOLD}
+
+
+def current_stats():
+    """Stats for the current request, or a process-wide bucket outside of requests"""
+    if has_request_context():
+        stats = g.get('_query_stats')
+        if stats is None:
+            stats = g._query_stats = QueryStats()
+        return stats
+    return _fallback_stats
+
+
+def _normalize(sql):
+    return ' '.join(sql.split())
+
+
+def _trace(statement):
+    # Called by SQLite for every statement it starts, including the implicit
+    # BEGIN/COMMIT and statements issued outside execute(). The text has the
+    # parameters inlined, so it is only used for the total count.
+    current_stats().count += 1
+
+
+def _explain(conn, sql, parameters):
+    # Plain cursor and no trace, so the plan lookup doesn't count as a query
+    conn.set_trace_callback(None)
+    try:
+        rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error as e:
+        return f'(plan unavailable: {e})'
+    finally:
+        conn.set_trace_callback(_trace)
+    return '; '.join(row[-1] for row in rows)
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that times execute() and the fetches that follow it"""
+    _last_sql = None
+
+    def _spent(self, duration, executions=0):
+        # Time of the current statement so far; logged once when it turns slow
+        current_stats().record(_normalize(self._last_sql), duration, executions)
+        self._elapsed += duration
+        if not self._logged and self._elapsed * 1000 >= _settings['slow_query_ms']:
+            self._logged = True
+            plan = _explain(self.connection, self._last_sql, self._last_parameters)
+            logger.warning('slow query %.1f ms: %s | plan: %s', self._elapsed * 1000,
+                           _normalize(self._last_sql), plan)
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._last_sql, self._last_parameters = sql, parameters
+            self._elapsed, self._logged = 0.0, False
+            self._spent(time.perf_counter() - start, executions=1)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # Not explained: the plan would need one row of parameters
+            self._last_sql = None
+            current_stats().record(_normalize(sql), time.perf_counter() - start, executions=1)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._last_sql is not None:
+                self._spent(time.perf_counter() - start)
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, size if size is not None else self.arraysize)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+    def __next__(self):
+        return self._timed_fetch(super().__next__)
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose statements are all traced and timed"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts don't go through cursor(), so route them explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            current_stats().record('COMMIT', time.perf_counter() - start)
+
+
+def connect(database, **kwargs):
+    """sqlite3.connect() returning a ProfilingConnection"""
+    return sqlite3.connect(database, factory=ProfilingConnection, **kwargs)
+
+
+def _after_request(response):
+    if not current_app.config['SQL_PROFILE']:
+        return response
+    if response.is_streamed:
+        # The body's queries haven't run yet, a header would undercount them
+        return response
+    stats = g.pop('_query_stats', None) or QueryStats()
+    response.headers['X-DB-Stats'] = f'queries={stats.count}; time_ms={stats.time * 1000:.2f}'
+    for sql, (executions, _) in stats.statements.items():
+        if executions >= _settings['repeat_threshold']:
+            logger.warning('possible N+1: %d executions of %s', executions, sql)
+    return response
+
+
+def init_app(app):
+    """Enable profiling on the app when app.config['SQL_PROFILE'] is set"""
+    app.config.setdefault('SQL_PROFILE', False)
+    app.config.setdefault('SQL_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+    app.config.setdefault('SQL_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+    _settings['slow_query_ms'] = float(app.config['SQL_SLOW_QUERY_MS'])
+    _settings['repeat_threshold'] = int(app.config['SQL_REPEAT_THRESHOLD'])
+    app.after_request(_after_request)
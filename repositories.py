@@ -0,0 +1,392 @@
+"""
+Women Security System - Repositories
+Data access for users, location pings, complaints, shelters and tips behind
+one interface per table, with two backends:
+
+    repositories.sqlite_repositories(connect, shards)   the app's databases
+    repositories.memory_repositories()                  dicts and arrays, no I/O
+
+Routes go through get_repos() in app.py, which returns the SQLite backend
+unless app.config['REPOSITORIES'] holds another Repositories. Backends mix
+per table, e.g. Repositories(users=MemoryUserRepo(), ...) with the SQLite
+repos for the rest, so a faster store can be tried on one table at a time
+and route logic can be benchmarked without I/O.
+
+The SQLite repos keep one connection per thread and database file instead
+of opening one per call, so schema parsing, prepared statements and the page
+cache survive across requests. History reads stream and get a connection of
+their own, so a client that stops reading never pins a shared connection.
+
+The memory backend holds only these tables: queries over every user that
+read SQL directly (complaint search, heatmap tiles, responders, live shares)
+don't see its rows.
+"""
+
+import bisect
+import itertools
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+import datasets
+import incidents
+import location_history
+import sharding
+
+LOCATION_INSERT = '''
+    INSERT INTO location_tracking (user_id, latitude, longitude)
+    VALUES (?, ?, ?)
+'''
+LOCATION_DWELL_UPDATE = 'UPDATE location_tracking SET dwell_seconds = ? WHERE id = ?'
+
+# SQLite's CURRENT_TIMESTAMP format
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SHELTER_COLUMNS = ('id', 'name', 'address', 'latitude', 'longitude', 'phone', 'capacity', 'facilities', 'rating')
+COMPLAINT_COLUMNS = ('id', 'title', 'description', 'category', 'status', 'created_at')
+TIP_COLUMNS = ('id', 'title', 'content', 'category')
+
+
+class DuplicateError(Exception):
+    """A unique username or email is already taken"""
+
+
+class Repositories:
+    def __init__(self, users, locations, complaints, shelters, tips):
+        self.users = users
+        self.locations = locations
+        self.complaints = complaints
+        self.shelters = shelters
+        self.tips = tips
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _no_phase(name):
+    return nullcontext()
+
+
+def _rows(cursor):
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+# SQLite backend
+class ThreadConnections:
+    """One open connection per thread for a database file"""
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.get()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+class SqliteUserRepo:
+    def __init__(self, connect):
+        self._db = ThreadConnections(connect)
+
+    def add(self, username, email, password_hash=None, pattern_hash=None, phone=None, emergency_contact=None):
+        """Create a user; returns the id, raises DuplicateError"""
+        try:
+            with self._db.transaction() as conn:
+                return conn.execute('''
+                    INSERT INTO users (username, email, password_hash, pattern_hash, phone_number, emergency_contact)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (username, email, password_hash, pattern_hash, phone, emergency_contact)).lastrowid
+        except sqlite3.IntegrityError:
+            raise DuplicateError(username)
+
+    def find_by_login(self, login):
+        """{id, username, password_hash, pattern_hash} of the user with this username or email, or None"""
+        cursor = self._db.get().execute('''
+            SELECT id, username, password_hash, pattern_hash FROM users WHERE username = ? OR email = ?
+        ''', (login, login))
+        rows = _rows(cursor)
+        return rows[0] if rows else None
+
+    def set_responder_opt_in(self, user_id, enabled):
+        with self._db.transaction() as conn:
+            conn.execute('UPDATE users SET responder_opt_in = ? WHERE id = ?', (int(enabled), user_id))
+            datasets.bump(conn, 'responders')
+
+
+class SqliteLocationRepo:
+    def __init__(self, shards):
+        self._shards = shards
+        self._dbs = [ThreadConnections(connect) for connect in shards.connectors()]
+
+    def add(self, user_id, latitude, longitude, phase=_no_phase):
+        """Store a ping, returning its id; phase(name) times the connect, insert and commit steps"""
+        with phase('connect'):
+            conn = self._dbs[self._shards.index_of(user_id)].get()
+        try:
+            with phase('insert'):
+                ping_id = conn.execute(LOCATION_INSERT, (user_id, latitude, longitude)).lastrowid
+            with phase('commit'):
+                conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return ping_id
+
+    def add_many(self, pings):
+        """Store [(user_id, latitude, longitude)] in one transaction a shard; returns their ids in order"""
+        per_shard = {}
+        for position, ping in enumerate(pings):
+            per_shard.setdefault(self._shards.index_of(ping[0]), []).append((position, ping))
+        ids = [None] * len(pings)
+        for index, rows in per_shard.items():
+            with self._dbs[index].transaction() as conn:
+                for position, ping in rows:
+                    ids[position] = conn.execute(LOCATION_INSERT, ping).lastrowid
+        return ids
+
+    def set_dwell(self, updates):
+        """Record how long users stayed at stored pings: [(user_id, ping_id, seconds)], a transaction a shard"""
+        per_shard = {}
+        for user_id, ping_id, seconds in updates:
+            per_shard.setdefault(self._shards.index_of(user_id), []).append((seconds, ping_id))
+        for index, rows in per_shard.items():
+            with self._dbs[index].transaction() as conn:
+                conn.executemany(LOCATION_DWELL_UPDATE, rows)
+
+    def latest(self, user_id, since):
+        """(latitude, longitude) of the user's last ping stored at or after since, or None"""
+        conn = self._dbs[self._shards.index_of(user_id)].get()
+        return conn.execute('''
+            SELECT latitude, longitude FROM location_tracking
+            WHERE user_id = ? AND timestamp >= ? AND latitude IS NOT NULL ORDER BY timestamp DESC, id DESC LIMIT 1
+        ''', (user_id, since)).fetchone()
+
+    def history(self, user_id, start, end, bbox=None, zoom=None, max_points=location_history.DEFAULT_MAX_POINTS):
+        """Generator of downsampled (latitude, longitude, timestamp) points, see location_history.history()"""
+        return location_history.history(lambda: self._shards.connect_user(user_id), user_id, start, end,
+                                        bbox=bbox, zoom=zoom, max_points=max_points)
+
+
+class SqliteComplaintRepo:
+    def __init__(self, shards):
+        self._shards = shards
+        self._dbs = [ThreadConnections(connect) for connect in shards.connectors()]
+
+    def add(self, user_id, title, description, category, location=None, latitude=None, longitude=None):
+        index = self._shards.index_of(user_id)
+        with self._dbs[index].transaction() as conn:
+            conn.execute(sharding.COMPLAINT_INSERT, (index, self._shards.count, user_id, title, description,
+                                                     category, location, latitude, longitude))
+            if latitude is not None:
+                incidents.record(conn, latitude, longitude, category)
+
+    def for_user(self, user_id):
+        """A user's complaints, newest first"""
+        cursor = self._dbs[self._shards.index_of(user_id)].get().execute(f'''
+            SELECT {", ".join(COMPLAINT_COLUMNS)} FROM complaints WHERE user_id = ? ORDER BY created_at DESC
+        ''', (user_id,))
+        return _rows(cursor)
+
+
+class SqliteShelterRepo:
+    def __init__(self, connect):
+        self._connect = connect
+        self._db = ThreadConnections(connect)
+
+    def all(self):
+        cursor = self._db.get().execute(f'SELECT {", ".join(SHELTER_COLUMNS)} FROM safe_shelters')
+        return _rows(cursor)
+
+    def version(self):
+        """Changes whenever the shelters do, for caches built from all()"""
+        return datasets.version('shelters', self._connect)
+
+
+class SqliteTipRepo:
+    def __init__(self, connect):
+        self._db = ThreadConnections(connect)
+
+    def all(self):
+        """Every tip, newest first"""
+        cursor = self._db.get().execute(f'''
+            SELECT {", ".join(TIP_COLUMNS)} FROM emergency_tips ORDER BY created_at DESC
+        ''')
+        return _rows(cursor)
+
+
+def sqlite_repositories(connect, shards):
+    """Repositories over the primary database (connect) and the per-user shards"""
+    return Repositories(users=SqliteUserRepo(connect), locations=SqliteLocationRepo(shards),
+                        complaints=SqliteComplaintRepo(shards), shelters=SqliteShelterRepo(connect),
+                        tips=SqliteTipRepo(connect))
+
+
+# Memory backend
+class MemoryUserRepo:
+    def __init__(self):
+        self._users = {}
+        self._by_login = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, username, email, password_hash=None, pattern_hash=None, phone=None, emergency_contact=None):
+        with self._lock:
+            if username in self._by_login or email in self._by_login:
+                raise DuplicateError(username)
+            user_id = next(self._ids)
+            self._users[user_id] = {'id': user_id, 'username': username, 'email': email,
+                                    'password_hash': password_hash, 'pattern_hash': pattern_hash,
+                                    'phone_number': phone, 'emergency_contact': emergency_contact,
+                                    'responder_opt_in': 0}
+            self._by_login[username] = self._by_login[email] = user_id
+            return user_id
+
+    def find_by_login(self, login):
+        user = self._users.get(self._by_login.get(login))
+        if user is None:
+            return None
+        return {key: user[key] for key in ('id', 'username', 'password_hash', 'pattern_hash')}
+
+    def set_responder_opt_in(self, user_id, enabled):
+        if user_id in self._users:
+            self._users[user_id]['responder_opt_in'] = int(enabled)
+
+
+class _Track:
+    """One user's pings in arrival order: coordinates and dwell seconds in arrays, timestamps as strings"""
+    __slots__ = ('latitudes', 'longitudes', 'dwells', 'times')
+
+    def __init__(self):
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.dwells = array('l')
+        self.times = []
+
+
+class MemoryLocationRepo:
+    def __init__(self, clock=_now):
+        self._tracks = {}
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def add(self, user_id, latitude, longitude, phase=_no_phase):
+        with phase('insert'), self._lock:
+            track = self._tracks.get(user_id)
+            if track is None:
+                track = self._tracks[user_id] = _Track()
+            track.latitudes.append(latitude)
+            track.longitudes.append(longitude)
+            track.dwells.append(0)
+            track.times.append(self._clock())
+            # Ids are positions in the user's track
+            return len(track.times) - 1
+
+    def add_many(self, pings):
+        return [self.add(user_id, latitude, longitude) for user_id, latitude, longitude in pings]
+
+    def set_dwell(self, updates):
+        with self._lock:
+            for user_id, ping_id, seconds in updates:
+                track = self._tracks.get(user_id)
+                if track is not None and ping_id < len(track.dwells):
+                    track.dwells[ping_id] = seconds
+
+    def latest(self, user_id, since):
+        track = self._tracks.get(user_id)
+        if track is None or not track.times or track.times[-1] < since:
+            return None
+        return track.latitudes[-1], track.longitudes[-1]
+
+    def _points(self, user_id, start, end, bbox):
+        track = self._tracks.get(user_id)
+        if track is None:
+            return []
+        first = bisect.bisect_left(track.times, start)
+        last = bisect.bisect_right(track.times, end)
+        points = zip(track.latitudes[first:last], track.longitudes[first:last], track.times[first:last])
+        if bbox is None:
+            return list(points)
+        return [p for p in points if bbox[0] <= p[0] <= bbox[2] and bbox[1] <= p[1] <= bbox[3]]
+
+    def history(self, user_id, start, end, bbox=None, zoom=None, max_points=location_history.DEFAULT_MAX_POINTS):
+        points = self._points(user_id, start, end, bbox)
+        if zoom is not None:
+            return iter(location_history.grid_bucket(points, location_history.zoom_tolerance_m(zoom)))
+        return location_history.simplify_windows(iter(points), len(points), max_points)
+
+
+class MemoryComplaintRepo:
+    def __init__(self, clock=_now):
+        self._by_user = {}
+        self._ids = itertools.count(1)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def add(self, user_id, title, description, category, location=None, latitude=None, longitude=None):
+        with self._lock:
+            self._by_user.setdefault(user_id, []).append({
+                'id': next(self._ids), 'title': title, 'description': description, 'category': category,
+                'status': 'pending', 'created_at': self._clock(),
+            })
+
+    def for_user(self, user_id):
+        return [dict(c) for c in reversed(self._by_user.get(user_id, []))]
+
+
+class MemoryShelterRepo:
+    def __init__(self, shelters=()):
+        self._shelters = []
+        self._version = 0
+        for shelter in shelters:
+            self.add(shelter)
+
+    def add(self, shelter):
+        row = {column: shelter.get(column) for column in SHELTER_COLUMNS}
+        if row['id'] is None:
+            row['id'] = len(self._shelters) + 1
+        self._shelters.append(row)
+        self._version += 1
+
+    def all(self):
+        return [dict(s) for s in self._shelters]
+
+    def version(self):
+        # Tagged with the repo, so swapping in another one never matches a cached payload
+        return id(self), self._version
+
+
+class MemoryTipRepo:
+    def __init__(self, tips=()):
+        self._tips = []
+        for tip in tips:
+            self.add(tip)
+
+    def add(self, tip):
+        row = {column: tip.get(column) for column in TIP_COLUMNS}
+        if row['id'] is None:
+            row['id'] = len(self._tips) + 1
+        self._tips.append(row)
+
+    def all(self):
+        return [dict(t) for t in reversed(self._tips)]
+
+
+def memory_repositories():
+    return Repositories(users=MemoryUserRepo(), locations=MemoryLocationRepo(),
+                        complaints=MemoryComplaintRepo(), shelters=MemoryShelterRepo(), tips=MemoryTipRepo())
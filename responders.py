@@ -0,0 +1,265 @@
+"""
+Women Security System - Nearby Responders
+Latest position of every volunteer who opted in as a responder, for finding
+the closest ones online when someone sends an SOS.
+
+Positions live in flat arrays indexed by user id (ids are dense), about 25
+bytes per user: float32 latitude and longitude (~1 m), the uint32 time the
+user was last seen, their grid cell and slot in that cell's bucket, and the
+opt-in flag. A bucket is an array of user ids per ~1 km cell, so a
+k-nearest query only reads the rings of cells around the caller and answers
+in microseconds. Users not seen for STALE_SECONDS count as offline: they are
+dropped from their bucket when a query runs into them, and by a sweep every
+SWEEP_INTERVAL seconds.
+
+Like the geofence index, each worker keeps its own copy. sync() picks up
+pings stored through other workers and opt-in changes (the 'responders'
+dataset version, see datasets.py).
+"""
+
+import heapq
+import math
+import threading
+import time
+from array import array
+
+import datasets
+import geo
+
+CELL_DEG = 0.01
+COLUMNS = int(360 / CELL_DEG)
+NO_CELL = 0xFFFFFFFF
+STALE_SECONDS = 300
+SWEEP_INTERVAL = 60.0
+SYNC_INTERVAL = 2.0
+DEFAULT_K = 5
+MAX_K = 20
+DEFAULT_RADIUS_M = 5000
+MAX_RADIUS_M = 20000
+
+_M_PER_DEG = math.pi * geo.EARTH_RADIUS_M / 180
+
+
+def cell_of(latitude, longitude):
+    return int((latitude + 90) / CELL_DEG) * COLUMNS + int((longitude + 180) / CELL_DEG) % COLUMNS
+
+
+class ResponderIndex:
+    __slots__ = ('latitudes', 'longitudes', 'seen', 'cells', 'slots', 'opted_in', '_buckets', '_lock',
+                 '_clock', '_last_sweep', '_last_sync', '_last_ping_ids', '_version')
+
+    def __init__(self, clock=time.time):
+        self.latitudes = array('f')
+        self.longitudes = array('f')
+        self.seen = array('I')
+        self.cells = array('I')
+        # Position of each user in their cell's bucket
+        self.slots = array('I')
+        self.opted_in = array('B')
+        # cell -> array of user ids
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._last_sweep = clock()
+        self._last_sync = 0.0
+        # Last ping id read, per shard (see sharding.py)
+        self._last_ping_ids = None
+        self._version = None
+
+    def __len__(self):
+        """Users currently in a bucket (online or not yet swept)"""
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def memory_bytes(self):
+        """Bytes held by the per-user arrays and the buckets"""
+        arrays = (self.latitudes, self.longitudes, self.seen, self.cells, self.slots, self.opted_in)
+        return (sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+                + sum(b.buffer_info()[1] * b.itemsize for b in self._buckets.values()))
+
+    def _ensure(self, user_id):
+        size = len(self.seen)
+        if user_id < size:
+            return
+        grow = max(user_id + 1, size + size // 2, 1024) - size
+        for column in (self.latitudes, self.longitudes, self.seen, self.slots):
+            column.frombytes(bytes(grow * column.itemsize))
+        self.cells.extend(array('I', [NO_CELL]) * grow)
+        self.opted_in.frombytes(bytes(grow))
+
+    # Buckets
+    def _link(self, user_id, cell):
+        bucket = self._buckets.get(cell)
+        if bucket is None:
+            bucket = self._buckets[cell] = array('I')
+        self.slots[user_id] = len(bucket)
+        bucket.append(user_id)
+        self.cells[user_id] = cell
+
+    def _unlink(self, user_id):
+        cell = self.cells[user_id]
+        if cell == NO_CELL:
+            return
+        bucket = self._buckets[cell]
+        last = bucket.pop()
+        if last != user_id:
+            # Move the last user into the freed slot
+            slot = self.slots[user_id]
+            bucket[slot] = last
+            self.slots[last] = slot
+        if not bucket:
+            del self._buckets[cell]
+        self.cells[user_id] = NO_CELL
+
+    def _sweep(self, cutoff):
+        seen = self.seen
+        stale = [u for bucket in self._buckets.values() for u in bucket if seen[u] < cutoff]
+        for user_id in stale:
+            self._unlink(user_id)
+        self._last_sweep = self._clock()
+        return len(stale)
+
+    def sweep(self):
+        """Drop users not seen for STALE_SECONDS; returns how many"""
+        with self._lock:
+            return self._sweep(self._clock() - STALE_SECONDS)
+
+    # Updates
+    def set_opt_in(self, user_id, enabled):
+        with self._lock:
+            self._ensure(user_id)
+            self.opted_in[user_id] = 1 if enabled else 0
+            if not enabled:
+                self._unlink(user_id)
+
+    def update(self, user_id, latitude, longitude, seen=None):
+        """Record a position; ignored unless the user opted in. Returns True if stored"""
+        if user_id >= len(self.opted_in) or not self.opted_in[user_id]:
+            return False
+        now = self._clock()
+        seen = int(now if seen is None else seen)
+        with self._lock:
+            if seen < self.seen[user_id]:
+                # An older ping, e.g. read back by sync()
+                return False
+            self.latitudes[user_id] = latitude
+            self.longitudes[user_id] = longitude
+            self.seen[user_id] = seen
+            cell = cell_of(latitude, longitude)
+            if cell != self.cells[user_id]:
+                self._unlink(user_id)
+                self._link(user_id, cell)
+            if now - self._last_sweep > SWEEP_INTERVAL:
+                self._sweep(now - STALE_SECONDS)
+        return True
+
+    # Queries
+    def nearest(self, latitude, longitude, k=DEFAULT_K, radius_m=DEFAULT_RADIUS_M, exclude=None):
+        """Up to k online responders within radius_m as [(user_id, distance_m, seconds_since_seen)], closest first"""
+        now = self._clock()
+        cutoff = now - STALE_SECONDS
+        lon_scale = max(math.cos(math.radians(latitude)), 0.01)
+        # Width of a cell along its narrow side, so every ring is at least this much farther out
+        cell_m = CELL_DEG * _M_PER_DEG * lon_scale
+        row = int((latitude + 90) / CELL_DEG)
+        column = int((longitude + 180) / CELL_DEG)
+        max_d2 = radius_m * radius_m
+        reach = int(radius_m / cell_m) + 1
+        best = []
+        stale = []
+        lats, lons, seen = self.latitudes, self.longitudes, self.seen
+        with self._lock:
+            for ring in range(reach + 1):
+                if len(best) == k and -best[0][0] <= ((ring - 1) * cell_m) ** 2:
+                    break
+                for dr in range(-ring, ring + 1):
+                    r = row + dr
+                    if not 0 <= r < COLUMNS // 2:
+                        continue
+                    steps = range(-ring, ring + 1) if abs(dr) == ring else (-ring, ring)
+                    for dc in steps:
+                        bucket = self._buckets.get(r * COLUMNS + (column + dc) % COLUMNS)
+                        if bucket is None:
+                            continue
+                        for user_id in bucket:
+                            if seen[user_id] < cutoff:
+                                stale.append(user_id)
+                                continue
+                            if user_id == exclude:
+                                continue
+                            dy = (lats[user_id] - latitude) * _M_PER_DEG
+                            dx = (lons[user_id] - longitude) * _M_PER_DEG * lon_scale
+                            d2 = dx * dx + dy * dy
+                            if d2 > max_d2:
+                                continue
+                            if len(best) < k:
+                                heapq.heappush(best, (-d2, user_id))
+                            elif d2 < -best[0][0]:
+                                heapq.heapreplace(best, (-d2, user_id))
+            for user_id in stale:
+                self._unlink(user_id)
+        return [(user_id, round(math.sqrt(-d2)), int(now - seen[user_id]))
+                for d2, user_id in sorted(best, reverse=True)]
+
+    # Loading
+    def sync(self, connect, force=False, shard_connects=None):
+        """Load opt-in changes and pings stored since the last sync; shard_connects open the ping shards"""
+        now = time.monotonic()
+        if not force and self._last_ping_ids is not None and now - self._last_sync < SYNC_INTERVAL:
+            return
+        self._last_sync = now
+        conn = connect()
+        try:
+            version = datasets.read(conn, 'responders')
+            if force or version != self._version:
+                self._load_opt_ins(conn)
+                self._version = version
+        finally:
+            conn.close()
+        shard_connects = shard_connects or [connect]
+        if self._last_ping_ids is None or len(self._last_ping_ids) != len(shard_connects):
+            self._last_ping_ids = [0] * len(shard_connects)
+            load = self._load_recent
+        else:
+            load = self._load_new
+        for index, shard_connect in enumerate(shard_connects):
+            conn = shard_connect()
+            try:
+                load(conn, index)
+            finally:
+                conn.close()
+
+    def _load_opt_ins(self, conn):
+        user_ids = [row[0] for row in conn.execute('SELECT id FROM users WHERE responder_opt_in = 1')]
+        with self._lock:
+            self._ensure(max(user_ids, default=0))
+            self.opted_in = array('B', bytes(len(self.opted_in)))
+            for user_id in user_ids:
+                self.opted_in[user_id] = 1
+            for user_id in [u for bucket in self._buckets.values() for u in bucket if not self.opted_in[u]]:
+                self._unlink(user_id)
+
+    def _load_recent(self, conn, shard):
+        # Newest pings first, until they are too old to matter
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM location_tracking').fetchone()[0]
+        cutoff = self._clock() - STALE_SECONDS
+        rows = conn.execute('''
+            SELECT user_id, latitude, longitude, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM location_tracking WHERE id <= ? ORDER BY id DESC
+        ''', (last_id,))
+        for user_id, latitude, longitude, seen in rows:
+            if seen is None or seen < cutoff:
+                break
+            self.update(user_id, latitude, longitude, seen)
+        self._last_ping_ids[shard] = last_id
+
+    def _load_new(self, conn, shard):
+        rows = conn.execute('''
+            SELECT id, user_id, latitude, longitude, CAST(strftime('%s', timestamp) AS INTEGER)
+            FROM location_tracking WHERE id > ? ORDER BY id
+        ''', (self._last_ping_ids[shard],)).fetchall()
+        for ping_id, user_id, latitude, longitude, seen in rows:
+            self.update(user_id, latitude, longitude, seen)
+            self._last_ping_ids[shard] = ping_id
+
+
+index = ResponderIndex()
@@ -0,0 +1,180 @@
+"""
+Women Security System - Response Helpers
+Fast JSON serialization, gzip/brotli compression and cached, pre-compressed
+payloads for endpoints whose data rarely changes.
+
+orjson and brotli are optional: without them the standard json module and
+gzip-only compression are used.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from flask import request, current_app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves
+DEFAULT_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css',
+                      'application/javascript', 'text/javascript', 'image/svg+xml')
+
+
+def dumps(obj):
+    """Serialize obj to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _accepted_encodings():
+    header = request.headers.get('Accept-Encoding', '')
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _choose_encoding(available):
+    accepted = _accepted_encodings()
+    for encoding in ('br', 'gzip'):
+        if encoding in available and encoding in accepted:
+            return encoding
+    return None
+
+
+def compress(body, encoding, fast=True):
+    """Compress body with gzip or brotli; fast trades ratio for speed on per-request bodies"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5 if fast else 11)
+    return gzip.compress(body, compresslevel=6 if fast else 9, mtime=0)
+
+
+class Payload:
+    """A response body with its ETag and pre-compressed variants"""
+    __slots__ = ('body', 'etag', 'variants', 'mimetype', 'created', 'version')
+
+    def __init__(self, body, mimetype='application/json', min_size=DEFAULT_MIN_SIZE, version=None):
+        self.body = body
+        self.mimetype = mimetype
+        self.version = version
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.created = time.monotonic()
+        self.variants = {}
+        if len(body) >= min_size:
+            self.variants['gzip'] = compress(body, 'gzip', fast=False)
+            if brotli is not None:
+                self.variants['br'] = compress(body, 'br', fast=False)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def cached_payload(key, build, ttl=60, mimetype='application/json', version=None):
+    """Return the cached Payload for key, calling build() for fresh bytes when missing or expired
+
+    version (e.g. from datasets.version()) also expires the payload when it changes.
+    """
+    payload = _cache.get(key)
+    if payload is not None and payload.version == version and time.monotonic() - payload.created < ttl:
+        return payload
+    with _cache_lock:
+        payload = _cache.get(key)
+        if payload is None or payload.version != version or time.monotonic() - payload.created >= ttl:
+            payload = _cache[key] = Payload(build(), mimetype, min_size=_min_size(), version=version)
+    return payload
+
+
+def invalidate(key=None):
+    """Drop one cached payload, or all of them"""
+    with _cache_lock:
+        if key is None:
+            _cache.clear()
+        else:
+            _cache.pop(key, None)
+
+
+def _variant_etag(etag, encoding):
+    # Each encoding is a separate representation and needs its own validator
+    return f'{etag}-{encoding}' if encoding else etag
+
+
+def send_payload(payload, max_age=60, cache_control=None):
+    """Build a response from a cached Payload, honouring If-None-Match and Accept-Encoding"""
+    response = current_app.response_class(mimetype=payload.mimetype)
+    encoding = _choose_encoding(payload.variants)
+    etag = _variant_etag(payload.etag, encoding)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control or f'public, max-age={max_age}'
+    response.vary.add('Accept-Encoding')
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+    if encoding:
+        response.set_data(payload.variants[encoding])
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response.set_data(payload.body)
+    return response
+
+
+def json_response(body, private=True):
+    """Response for JSON bytes produced by dumps()"""
+    response = current_app.response_class(body, mimetype='application/json')
+    if private:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _min_size():
+    try:
+        return current_app.config['COMPRESS_MIN_SIZE']
+    except (RuntimeError, KeyError):
+        return DEFAULT_MIN_SIZE
+
+
+def _compress_response(response):
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if len(body) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    encoding = _choose_encoding(available)
+    if encoding:
+        response.set_data(compress(body, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(_variant_etag(etag, encoding), weak)
+    return response
+
+
+def init_app(app):
+    """Compress eligible responses above COMPRESS_MIN_SIZE"""
+    app.config.setdefault('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+    app.after_request(_compress_response)
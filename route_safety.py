@@ -0,0 +1,268 @@
+"""
+Women Security System - Route Safety Scoring
+Scores walking routes segment by segment against where incidents were reported
+and how far the nearest shelter is.
+
+Everything a score needs is precomputed in memory:
+- incident density per ~250 m cell (the finest incident_cells level), split by
+  time-of-day band and decayed by age, so a report from last week weighs more
+  than one from last year and night-time reports count most at night
+- a hash grid of shelter positions for nearest-shelter distance, rebuilt
+  when the shelters dataset version changes (see datasets.py)
+
+Scoring samples each segment every few meters and only does dictionary
+lookups, so routes with thousands of vertices take milliseconds. Like the
+geofence index, each worker keeps its own copy and picks up complaints filed
+through other workers on sync().
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+import datasets
+import geo
+import incidents
+
+CELL_LEVEL = incidents.CELL_LEVELS[-1]
+# Incident weight halves every HALF_LIFE_DAYS
+HALF_LIFE_DAYS = 90
+# Weight of reports from other time-of-day bands, by distance in bands
+BAND_AFFINITY = (1.0, 0.5, 0.2, 0.1)
+# Reports in the 8 surrounding cells count with this weight
+NEIGHBOUR_WEIGHT = 0.5
+# Decayed, smoothed incident weight at which a segment scores ~37 (1/e) before shelters
+RISK_SCALE = 5.0
+SHELTER_RADIUS_M = 2000
+SHELTER_CELL_DEG = 0.02
+SAMPLE_M = 25
+MAX_SAMPLES = 200000
+MAX_ROUTES = 5
+MAX_VERTICES = 10000
+SYNC_INTERVAL = 2.0
+
+_EPOCH = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+def _age_days(moment):
+    return (moment - _EPOCH).total_seconds() / 86400
+
+
+def band_weights(band):
+    """How much reports from each band count for a route walked in the given band"""
+    weights = []
+    for other in range(incidents.BANDS):
+        distance = min(abs(other - band), incidents.BANDS - abs(other - band))
+        weights.append(BAND_AFFINITY[min(distance, len(BAND_AFFINITY) - 1)])
+    return weights
+
+
+class SafetyGrid:
+    def __init__(self):
+        # (x, y) -> per-band incident weight, scaled to the _EPOCH reference day
+        self._cells = {}
+        self._shelters = {}
+        self._shelters_version = None
+        # Last complaint id loaded, per shard (see sharding.py)
+        self._last_complaint_ids = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    # Loading
+    def sync(self, connect, force=False, shard_connects=None):
+        """Load new complaints and shelter changes; shard_connects open the complaint shards (default: connect)"""
+        now = time.monotonic()
+        if not force and self._last_complaint_ids is not None and now - self._last_sync < SYNC_INTERVAL:
+            return
+        self._last_sync = now
+        shard_connects = shard_connects or [connect]
+        if self._last_complaint_ids is None or len(self._last_complaint_ids) != len(shard_connects):
+            self._load_cells(shard_connects)
+        else:
+            for index, shard_connect in enumerate(shard_connects):
+                conn = shard_connect()
+                try:
+                    self._load_new_complaints(conn, index)
+                finally:
+                    conn.close()
+        conn = connect()
+        try:
+            version = datasets.read(conn, 'shelters')
+            if force or version != self._shelters_version:
+                self._load_shelters(conn)
+                self._shelters_version = version
+        finally:
+            conn.close()
+
+    def _add(self, cells, x, y, band, weight):
+        bands = cells.get((x, y))
+        if bands is None:
+            bands = cells[(x, y)] = [0.0] * incidents.BANDS
+        bands[band] += weight
+
+    def _load_cells(self, shard_connects):
+        cells = {}
+        last_ids = []
+        for shard_connect in shard_connects:
+            conn = shard_connect()
+            try:
+                # Read the aggregate and the last complaint id in one snapshot
+                conn.execute('BEGIN')
+                last_ids.append(conn.execute('SELECT COALESCE(MAX(id), 0) FROM complaints').fetchone()[0])
+                rows = conn.execute('''
+                    SELECT cell, julianday(day) - julianday('2000-01-01'), band, SUM(count)
+                    FROM incident_cells WHERE level = ?
+                    GROUP BY cell, day, band
+                ''', (CELL_LEVEL,)).fetchall()
+                conn.rollback()
+            finally:
+                conn.close()
+            for cell, age, band, count in rows:
+                self._add(cells, *incidents.deinterleave(cell), band, count * 2 ** (age / HALF_LIFE_DAYS))
+        with self._lock:
+            self._cells = cells
+            self._last_complaint_ids = last_ids
+
+    def _load_new_complaints(self, conn, shard=0):
+        rows = conn.execute('''
+            SELECT id, latitude, longitude, created_at FROM complaints
+            WHERE id > ? AND latitude IS NOT NULL AND longitude IS NOT NULL
+            ORDER BY id
+        ''', (self._last_complaint_ids[shard],)).fetchall()
+        with self._lock:
+            for complaint_id, latitude, longitude, created_at in rows:
+                self.add_incident(latitude, longitude,
+                                  datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc))
+                self._last_complaint_ids[shard] = complaint_id
+
+    def _load_shelters(self, conn):
+        shelters = {}
+        for latitude, longitude in conn.execute('SELECT DISTINCT latitude, longitude FROM safe_shelters '
+                                                'WHERE latitude IS NOT NULL AND longitude IS NOT NULL'):
+            key = (math.floor(latitude / SHELTER_CELL_DEG), math.floor(longitude / SHELTER_CELL_DEG))
+            shelters.setdefault(key, []).append((latitude, longitude))
+        self._shelters = shelters
+
+    def invalidate_shelters(self):
+        """Reload shelters on the next sync"""
+        self._shelters_version = None
+        self._last_sync = 0.0
+
+    def add_incident(self, latitude, longitude, created):
+        """Count one incident (used for complaints filed after the initial load)"""
+        day_start = created.replace(hour=0, minute=0, second=0, microsecond=0)
+        weight = 2 ** (math.floor(_age_days(day_start)) / HALF_LIFE_DAYS)
+        x, y = incidents.tile_of(latitude, longitude, CELL_LEVEL)
+        self._add(self._cells, x, y, created.hour // incidents.BAND_HOURS, weight)
+
+    # Lookups
+    def incident_weight(self, x, y, weights, scale):
+        """Decayed incident weight around a cell for one band weighting"""
+        cells = self._cells
+        total = 0.0
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                bands = cells.get((x + dx, y + dy))
+                if bands is not None:
+                    value = sum(w * b for w, b in zip(weights, bands))
+                    total += value if dx == 0 and dy == 0 else NEIGHBOUR_WEIGHT * value
+        return total * scale
+
+    def nearest_shelter_m(self, latitude, longitude):
+        """Distance to the nearest shelter, or None beyond SHELTER_RADIUS_M"""
+        key_lat = math.floor(latitude / SHELTER_CELL_DEG)
+        key_lon = math.floor(longitude / SHELTER_CELL_DEG)
+        # 2 cells of 0.02 deg cover SHELTER_RADIUS_M in latitude; longitude cells are narrower
+        reach_lon = 2 + int(2 / max(math.cos(math.radians(latitude)), 0.1))
+        best = None
+        for dlat in range(-2, 3):
+            for dlon in range(-reach_lon, reach_lon + 1):
+                for s_lat, s_lon in self._shelters.get((key_lat + dlat, key_lon + dlon), ()):
+                    d = geo.haversine_m(latitude, longitude, s_lat, s_lon)
+                    if best is None or d < best:
+                        best = d
+        return best if best is not None and best <= SHELTER_RADIUS_M else None
+
+    # Scoring
+    def score_route(self, route, when=None, sample_m=SAMPLE_M):
+        """Score each segment of a [(lat, lon), ...] route from 0 (avoid) to 100 (safest)"""
+        when = when or datetime.now(timezone.utc)
+        weights = band_weights(when.hour // incidents.BAND_HOURS)
+        scale = 2 ** (-_age_days(when) / HALF_LIFE_DAYS)
+        risk_cache = {}
+        shelter_cache = {}
+        segments = []
+        total_length = 0.0
+        weighted_score = 0.0
+        samples_left = MAX_SAMPLES
+        for (lat1, lon1), (lat2, lon2) in zip(route, route[1:]):
+            length = geo.haversine_m(lat1, lon1, lat2, lon2)
+            count = max(1, min(int(length / sample_m), samples_left))
+            samples_left = max(samples_left - count, 1)
+            risk = 0.0
+            nearest = None
+            for k in range(count):
+                t = (k + 0.5) / count
+                lat = lat1 + (lat2 - lat1) * t
+                lon = lon1 + (lon2 - lon1) * t
+                cell = incidents.tile_of(lat, lon, CELL_LEVEL)
+                cell_risk = risk_cache.get(cell)
+                if cell_risk is None:
+                    cell_risk = risk_cache[cell] = self.incident_weight(*cell, weights, scale)
+                risk = max(risk, cell_risk)
+                if cell not in shelter_cache:
+                    shelter_cache[cell] = self.nearest_shelter_m(lat, lon)
+                d = shelter_cache[cell]
+                if d is not None and (nearest is None or d < nearest):
+                    nearest = d
+            shelter_bonus = 0.0 if nearest is None else 1 - nearest / SHELTER_RADIUS_M
+            score = 100 * math.exp(-risk / RISK_SCALE) * (0.8 + 0.2 * shelter_bonus)
+            segments.append({
+                'score': round(score, 1),
+                'length_m': round(length, 1),
+                'incident_weight': round(risk, 3),
+                'nearest_shelter_m': None if nearest is None else round(nearest),
+            })
+            total_length += length
+            weighted_score += score * length
+        return {
+            'score': round(weighted_score / total_length, 1) if total_length else None,
+            'min_score': min((s['score'] for s in segments), default=None),
+            'length_m': round(total_length, 1),
+            'segments': segments,
+        }
+
+
+def parse_route(points):
+    """[[lat, lon], ...] -> list of float tuples; raises ValueError"""
+    if not isinstance(points, list) or not 2 <= len(points) <= MAX_VERTICES:
+        raise ValueError(f'A route needs between 2 and {MAX_VERTICES} points!')
+    try:
+        route = [(float(p[0]), float(p[1])) for p in points]
+    except (TypeError, ValueError, IndexError):
+        raise ValueError('Route points must be [latitude, longitude] pairs!')
+    for lat, lon in route:
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError('Coordinates out of range!')
+    return route
+
+
+def parse_when(value):
+    """Time the route will be walked: unix seconds or ISO 8601 (UTC if no offset), default now"""
+    if value in (None, ''):
+        return datetime.now(timezone.utc)
+    try:
+        return datetime.fromtimestamp(float(value), timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        pass
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError('Invalid time!')
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+grid = SafetyGrid()
@@ -0,0 +1,275 @@
+"""
+Women Security System - Background Jobs
+A small in-process scheduler for maintenance that should never run inside a
+request: PRAGMA optimize, ANALYZE, WAL checkpoints, pruning and backups.
+
+    jobs = scheduler.Scheduler(lock_path)
+    jobs.every(300, checkpoint, name='wal_checkpoint', jitter=30, leader=True)
+    jobs.cron('30 3 * * *', analyze, name='analyze', jitter=900, leader=True)
+    jobs.every(1, fire_timers, name='timers', leader=True, lane='alerts')
+    jobs.start()
+
+Each worker runs its jobs one at a time on one daemon thread per lane. Jobs
+that must run on time (firing timers) get a lane of their own, so a backup or
+ANALYZE taking minutes in the default lane never holds them back. Jobs are
+almost all SQLite work, which releases the GIL while it runs, so requests
+keep being served meanwhile. A leader job runs in one worker only: the one
+holding an exclusive lock on lock_path. The lock is taken when a leader job
+first comes due and kept until the worker exits; while another worker holds
+it, due leader jobs are skipped until their next run, so if the leader dies
+the next worker with a leader job due takes over.
+
+Jitter delays every run by a random 0..jitter seconds, so workers started
+together don't run their per-worker jobs in the same instant.
+
+Cron specs have the five usual fields (minute, hour, day of month, month,
+day of week with 0 or 7 = Sunday) made of *, */n, a-b, a-b/n and lists, in
+local time. As in cron, when both day fields are restricted a day matching
+either one matches.
+
+Every run is counted in jobs_total{job, status} and its duration added to
+job_seconds_total{job} (see metrics.py).
+"""
+
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    # No file locks (Windows): every worker runs the leader jobs
+    fcntl = None
+
+# How often the scheduler thread looks for due jobs (seconds)
+TICK = 0.25
+# Lane of the jobs scheduled without one
+DEFAULT_LANE = 'maintenance'
+# How far ahead a cron spec is searched before it is declared impossible (e.g. 30 February)
+CRON_SEARCH_DAYS = 5 * 366
+
+_CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31), ('month', 1, 12),
+                ('day of week', 0, 7))
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        part, slash, step = part.partition('/')
+        try:
+            step = int(step) if slash else 1
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(n) for n in part.split('-', 1))
+            else:
+                # As in cron, "5/10" means 5-59/10
+                start = int(part)
+                end = high if slash else start
+        except ValueError:
+            raise ValueError(f'Bad cron {name} field: {text!r}')
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f'Bad cron {name} field: {text!r}')
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSpec:
+    """A five-field cron schedule"""
+
+    def __init__(self, spec):
+        fields = spec.split()
+        if len(fields) != 5:
+            raise ValueError(f'Cron spec needs 5 fields: {spec!r}')
+        self.spec = spec
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(text, *field) for text, field in zip(fields, _CRON_FIELDS))
+        self.weekdays = {day % 7 for day in weekdays}
+        self._any_day = fields[2].startswith('*')
+        self._any_weekday = fields[4].startswith('*')
+
+    def _day_matches(self, moment):
+        in_month = moment.day in self.days
+        in_week = moment.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_month and in_week
+        return in_month or in_week
+
+    def next_after(self, now):
+        """Timestamp of the first matching minute after the one containing now"""
+        moment = datetime.fromtimestamp(now).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=CRON_SEARCH_DAYS)
+        while moment < limit:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+        raise ValueError(f'Cron spec never matches: {self.spec!r}')
+
+
+class _Interval:
+    def __init__(self, seconds):
+        if seconds <= 0:
+            raise ValueError('Interval must be positive')
+        self.seconds = seconds
+
+    def next_after(self, now):
+        return now + self.seconds
+
+
+class LeaderLock:
+    """An exclusive lock on a file, kept by the process that first takes it"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._pid = None
+
+    def acquire(self):
+        """True if this process holds the lock, taking it if it is free"""
+        if fcntl is None:
+            return True
+        if self._file is not None:
+            if self._pid == os.getpid():
+                return True
+            # Inherited across a fork: the lock belongs to the parent
+            self._file = None
+        lock = open(self.path, 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._file, self._pid = lock, os.getpid()
+        return True
+
+    def release(self):
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._file = None
+
+
+class Job:
+    __slots__ = ('name', 'func', 'schedule', 'jitter', 'leader', 'lane', 'next_run', 'runs', 'skipped', 'failures',
+                 'last_seconds', 'last_error')
+
+    def __init__(self, name, func, schedule, jitter, leader, lane):
+        self.name = name
+        self.func = func
+        self.schedule = schedule
+        self.jitter = jitter
+        self.leader = leader
+        self.lane = lane
+        self.next_run = None
+        self.runs = 0
+        # Due runs left to the leader in another worker
+        self.skipped = 0
+        self.failures = 0
+        self.last_seconds = None
+        self.last_error = None
+
+
+class Scheduler:
+    """Interval and cron jobs run from one background thread per lane"""
+
+    def __init__(self, lock_path=None, clock=time.time, tick=TICK, rng=None):
+        self.jobs = {}
+        self._lock = LeaderLock(lock_path) if lock_path else None
+        # Lanes ask for the leader lock from their own threads
+        self._leader_lock = threading.Lock()
+        self._clock = clock
+        self._tick = tick
+        self._rng = rng or random.Random()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def every(self, seconds, func, name=None, jitter=0, leader=False, lane=DEFAULT_LANE):
+        """Run func every seconds, the first time one interval from now"""
+        return self._add(name or func.__name__, func, _Interval(seconds), jitter, leader, lane)
+
+    def cron(self, spec, func, name=None, jitter=0, leader=False, lane=DEFAULT_LANE):
+        """Run func at the minutes matching a five-field cron spec"""
+        return self._add(name or func.__name__, func, CronSpec(spec), jitter, leader, lane)
+
+    def _add(self, name, func, schedule, jitter, leader, lane):
+        if name in self.jobs:
+            raise ValueError(f'Job {name!r} already scheduled')
+        if self._threads and lane not in {job.lane for job in self.jobs.values()}:
+            raise RuntimeError(f'Lane {lane!r} added after start()')
+        job = self.jobs[name] = Job(name, func, schedule, jitter, leader, lane)
+        self._plan(job, self._clock())
+        return job
+
+    def _plan(self, job, now):
+        job.next_run = job.schedule.next_after(now) + self._rng.uniform(0, job.jitter)
+
+    def is_leader(self):
+        if self._lock is None:
+            return True
+        with self._leader_lock:
+            return self._lock.acquire()
+
+    def run_pending(self, now=None, lane=None):
+        """Run every due job (in one lane, if given); returns the names of the jobs run"""
+        if now is None:
+            now = self._clock()
+        ran = []
+        for job in list(self.jobs.values()):
+            if job.next_run > now or (lane is not None and job.lane != lane):
+                continue
+            if job.leader and not self.is_leader():
+                job.skipped += 1
+            else:
+                self._run(job)
+                ran.append(job.name)
+            # Planned from when the job finished, so a slow run never queues up another
+            self._plan(job, max(now, self._clock()))
+        return ran
+
+    def _run(self, job):
+        began = time.perf_counter()
+        status = 'ok'
+        try:
+            job.func()
+            job.last_error = None
+        except Exception as e:
+            status = 'error'
+            job.failures += 1
+            job.last_error = repr(e)
+            print(f"Job {job.name} failed: {e}")
+        job.runs += 1
+        job.last_seconds = time.perf_counter() - began
+        metrics.inc('jobs_total', job=job.name, status=status)
+        metrics.inc('job_seconds_total', job.last_seconds, job=job.name)
+
+    # Thread
+    def start(self):
+        if not self._threads:
+            self._stop.clear()
+            for lane in sorted({job.lane for job in self.jobs.values()}):
+                thread = threading.Thread(target=self._loop, args=(lane,), name=f'job-scheduler-{lane}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._lock is not None:
+            with self._leader_lock:
+                self._lock.release()
+
+    def _loop(self, lane):
+        while not self._stop.wait(self._tick):
+            self.run_pending(lane=lane)
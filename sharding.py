@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Women Security System - Sharded Storage
+Spreads the per-user tables (location_tracking and complaints, with the
+complaints_fts index and incident_cells aggregate derived from them) over
+SHARD_COUNT SQLite files by a hash of the user id, so pings and complaints
+of different users commit under different write locks. Global tables
+(users, safe_shelters, emergency_tips, geofences, ...) stay in the primary
+database.
+
+    python sharding.py split --shards 4 [--db security_system.db]
+
+With one shard (the default) the primary database is the only shard and
+nothing changes. With N shards, shard i is <db>.shard<i>.db next to the
+primary file. All of a user's rows live in one shard, so their history,
+export and complaints are single-shard reads; queries over every user (staff
+search, heatmap tiles, the responder and live-share feeds) fan out.
+
+Location ping ids are per shard, so readers following new pings keep one
+cursor per shard. Complaint ids stay unique: shard i only hands out ids
+equal to i modulo the shard count (see COMPLAINT_INSERT).
+
+The shard count is recorded in the primary database the first time it is
+opened and starting with another count is refused, since users would be
+looked up in the wrong file. `split` moves an unsharded database's rows
+into N shards. Complaints whose id already equals their shard's index modulo
+N keep it; the others get new ids above the highest one, and each change is
+recorded in the primary database's complaint_id_map (old_id -> new_id) for
+links and references kept outside the database.
+"""
+
+import argparse
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import complaint_search
+import db_location
+import incidents
+import track_archive
+
+# Per-user tables; the new row's id comes from its shard (see the module docstring)
+COMPLAINT_INSERT = '''
+    INSERT INTO complaints (id, user_id, title, description, category, location, latitude, longitude)
+    VALUES ((SELECT COALESCE(MAX(id), ?) + ? FROM complaints), ?, ?, ?, ?, ?, ?, ?)
+'''
+
+SPLIT_BATCH = 5000
+
+
+def shard_of(user_id, count):
+    """Shard index of a user"""
+    if count == 1:
+        return 0
+    return zlib.crc32(int(user_id).to_bytes(8, 'little', signed=True)) % count
+
+
+def shard_path(database, index):
+    """Shard file next to database; for a file: URI, the same URI naming the shard"""
+    if database.startswith('file:'):
+        base, sep, query = database.partition('?')
+        root, ext = os.path.splitext(base)
+        return f'{root}.shard{index}{ext}{sep}{query}'
+    root, ext = os.path.splitext(database)
+    return f'{root}.shard{index}{ext or ".db"}'
+
+
+def ensure_schema(cursor):
+    """Create the per-user tables; run on every shard"""
+    # Location tracking table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS location_tracking (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            latitude REAL,
+            longitude REAL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # Covers the history queries, so tracks are read without touching the table
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_location_user_time
+        ON location_tracking (user_id, timestamp, latitude, longitude)
+    ''')
+    # Seconds the user stayed at a ping's position, see ping_filter.py
+    try:
+        cursor.execute('ALTER TABLE location_tracking ADD COLUMN dwell_seconds INTEGER NOT NULL DEFAULT 0')
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+
+    # Complaints table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS complaints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            title TEXT NOT NULL,
+            description TEXT,
+            category TEXT,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Add location columns to complaints if they don't exist
+    for column in ('location TEXT', 'latitude REAL', 'longitude REAL'):
+        try:
+            cursor.execute(f'ALTER TABLE complaints ADD COLUMN {column}')
+        except sqlite3.OperationalError:
+            # Column already exists
+            pass
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_complaints_user ON complaints (user_id)')
+    complaint_search.ensure_schema(cursor)
+    incidents.ensure_schema(cursor)
+    track_archive.ensure_schema(cursor)
+
+
+def ensure_layout(conn, count):
+    """Record the shard count in the primary database, or check it against the recorded one"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS shard_layout (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            shard_count INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO shard_layout (id, shard_count) VALUES (1, ?)', (count,))
+    stored = conn.execute('SELECT shard_count FROM shard_layout WHERE id = 1').fetchone()[0]
+    if stored != count:
+        raise RuntimeError(f'Database is laid out for {stored} shard(s), not {count}: '
+                           f'set SHARD_COUNT={stored} or run "python sharding.py split"')
+
+
+class ShardRouter:
+    """Maps users to shard files and runs queries on every shard"""
+
+    def __init__(self, database, count=1, connect=db_location.connect):
+        if count < 1:
+            raise ValueError('Shard count must be at least 1')
+        self.database = database
+        self.count = count
+        self.paths = [database] if count == 1 else [shard_path(database, i) for i in range(count)]
+        self._connect = connect
+        self._connectors = [functools.partial(self.connect, index) for index in range(count)]
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def index_of(self, user_id):
+        return shard_of(user_id, self.count)
+
+    def connect(self, index=0):
+        return self._connect(self.paths[index])
+
+    def connect_user(self, user_id):
+        """Connection to the shard holding a user's rows"""
+        return self.connect(self.index_of(user_id))
+
+    def connectors(self):
+        """One zero-argument connect function per shard, in shard order"""
+        return self._connectors
+
+    def fan_out(self, query):
+        """query(conn) run on every shard concurrently; list of results in shard order"""
+        def run(index):
+            conn = self.connect(index)
+            try:
+                return query(conn)
+            finally:
+                conn.close()
+
+        if self.count == 1:
+            return [run(0)]
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.count, thread_name_prefix='shard')
+        return list(self._executor.map(run, range(self.count)))
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+def split(database, count, batch_size=SPLIT_BATCH):
+    """Move an unsharded database's per-user rows into count shard files; returns rows copied per table"""
+    primary = db_location.connect(database)
+    try:
+        ensure_layout(primary, 1)
+        router = ShardRouter(database, count)
+        shards = [router.connect(index) for index in range(count)]
+        for conn in shards:
+            if conn.execute("SELECT name FROM sqlite_master WHERE name = 'location_tracking'").fetchone():
+                raise RuntimeError(f'{conn.execute("PRAGMA database_list").fetchone()[2]} already exists')
+            ensure_schema(conn.cursor())
+        copied = {'location_tracking': 0, 'location_archive': 0, 'complaints': 0}
+
+        # Complaint ids that don't fit their shard are handed out from above the highest one
+        top = primary.execute('SELECT COALESCE(MAX(id), 0) FROM complaints').fetchone()[0]
+        next_ids = [top - top % count + index + (count if index <= top % count else 0) for index in range(count)]
+        primary.execute('CREATE TABLE IF NOT EXISTS complaint_id_map '
+                        '(old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)')
+
+        def copy(table, select, insert, renumber=False):
+            # Rows go out in id order, so each shard keeps the original order; with renumber the first column is the id
+            rows = primary.execute(select)
+            while True:
+                batch = rows.fetchmany(batch_size)
+                if not batch:
+                    break
+                per_shard = [[] for _ in range(count)]
+                moved = []
+                for row in batch:
+                    index = shard_of(row[1] if renumber else row[0], count)
+                    if renumber and row[0] % count != index:
+                        moved.append((row[0], next_ids[index]))
+                        row = (next_ids[index], *row[1:])
+                        next_ids[index] += count
+                    per_shard[index].append(row)
+                for conn, shard_rows in zip(shards, per_shard):
+                    conn.executemany(insert, shard_rows)
+                primary.executemany('INSERT OR REPLACE INTO complaint_id_map (old_id, new_id) VALUES (?, ?)', moved)
+                copied[table] += len(batch)
+
+        copy('location_tracking',
+             'SELECT user_id, latitude, longitude, timestamp, dwell_seconds FROM location_tracking ORDER BY id',
+             'INSERT INTO location_tracking (user_id, latitude, longitude, timestamp, dwell_seconds) '
+             'VALUES (?, ?, ?, ?, ?)')
+        copy('location_archive',
+             'SELECT user_id, hour, point_count, data FROM location_archive ORDER BY user_id, hour',
+             'INSERT INTO location_archive (user_id, hour, point_count, data) VALUES (?, ?, ?, ?)')
+        copy('complaints',
+             'SELECT id, user_id, title, description, category, status, created_at, location, latitude, longitude '
+             'FROM complaints ORDER BY id',
+             'INSERT INTO complaints (id, user_id, title, description, category, status, created_at, location, '
+             'latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+             renumber=True)
+        for conn in shards:
+            incidents.rebuild(conn)
+            conn.commit()
+            conn.close()
+        primary.execute('UPDATE shard_layout SET shard_count = ? WHERE id = 1', (count,))
+        primary.commit()
+        return copied
+    finally:
+        primary.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split per-user tables across shard databases')
+    parser.add_argument('command', choices=['split'])
+    parser.add_argument('--shards', type=int, required=True)
+    parser.add_argument('--db', default=db_location.resolve(os.environ.get('DATABASE_URL')))
+    args = parser.parse_args()
+
+    if args.shards < 2:
+        print('Splitting needs at least 2 shards', file=sys.stderr)
+        return 1
+    try:
+        copied = split(args.db, args.shards)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Copied {copied['location_tracking']:,} pings and {copied['complaints']:,} complaints "
+          f"into {args.shards} shards; start the app with SHARD_COUNT={args.shards}. "
+          f"The old tables in {args.db} are left in place and can be dropped once checked; "
+          f"complaints given a new id are listed in its complaint_id_map table.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,430 @@
+"""
+Women Security System - Shelter Capacity
+Live occupancy of safe shelters and places held for people on their way, with
+atomic check-and-reserve.
+
+The hot counters never go through SQLite. They live in a memory-mapped file
+shared by every worker on the host, one slot per shelter holding:
+- occupancy: people checked in, as last reported by shelter staff
+- held places, in a ring of expiry buckets: a reservation adds to the bucket
+  of the time it expires, so holds lapse by themselves (even if the worker
+  that made them dies) without anyone decrementing them
+
+A reservation locks only its shelter's slot: a striped thread lock inside
+the worker plus an fcntl byte-range lock across workers. Reservations on
+different shelters never wait on each other, and none of them waits on the
+database write lock. New reservations and occupancy changes are journaled
+in memory and written to the database in one transaction every
+FLUSH_INTERVAL seconds; a fresh counters file is rebuilt from those rows.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import fcntl
+except ImportError:
+    # No cross-process locking (Windows): run a single worker process
+    fcntl = None
+
+import datasets
+import db_location
+import geo
+
+HOLD_MINUTES = 90
+BUCKET_SECONDS = 600
+# The ring must span more than a hold plus one bucket
+BUCKETS = 12
+MAX_SEATS = 10
+FLUSH_INTERVAL = 1.0
+STRIPES = 64
+NEAREST_CELL_DEG = 0.1
+MAX_RADIUS_KM = 100
+MAX_NEAREST = 50
+
+MAGIC = b'SHCAP001'
+# magic, database device and inode (the counters belong to one database file)
+HEADER = struct.Struct('<8sqq')
+HEADER_SIZE = 64
+# occupancy, then (expiry bucket, places) per ring entry
+SLOT = struct.Struct('<i' + 'ii' * BUCKETS)
+SLOT_SIZE = 128
+GROW_SLOTS = 1024
+
+SHELTER_COLUMNS = ('id', 'name', 'address', 'latitude', 'longitude', 'phone', 'capacity', 'facilities', 'rating')
+
+
+def ensure_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS shelter_reservations (
+            id TEXT PRIMARY KEY,
+            shelter_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            seats INTEGER NOT NULL DEFAULT 1,
+            status TEXT DEFAULT 'active',
+            expires_at REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (shelter_id) REFERENCES safe_shelters (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reservations_active ON shelter_reservations (status, expires_at)')
+    try:
+        cursor.execute('ALTER TABLE safe_shelters ADD COLUMN occupancy INTEGER DEFAULT 0')
+    except sqlite3.OperationalError:
+        # Column already exists
+        pass
+
+
+def counters_path(database):
+    """Counters file for a database, in SHELTER_COUNTERS_DIR (default: the temp dir)"""
+    directory = os.environ.get('SHELTER_COUNTERS_DIR') or tempfile.gettempdir()
+    if db_location.is_memory(database):
+        # A memory database belongs to one process; so do its counters
+        database = f'{database}#{os.getpid()}'
+    digest = hashlib.sha1(os.path.abspath(database).encode()).hexdigest()[:12]
+    return os.path.join(directory, f'shelter-counters-{digest}.bin')
+
+
+def _held(values, now_bucket):
+    return sum(values[i + 1] for i in range(1, len(values), 2) if values[i] > now_bucket)
+
+
+class CapacityTracker:
+    def __init__(self, connect, database, path=None, clock=time.time):
+        self._connect = connect
+        self._database = database
+        self._clock = clock
+        self._stripes = [threading.Lock() for _ in range(STRIPES)]
+        self._grow_lock = threading.Lock()
+        self._journal = []
+        self._dirty = set()
+        self._journal_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        # id -> shelter dict, and a coarse grid of ids for nearest() queries
+        self._shelters = {}
+        self._grid = {}
+        self._version = None
+        self.path = path or counters_path(database)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._map = None
+        self._open()
+
+    # Counters file
+    @contextmanager
+    def _locked(self, offset, size):
+        if fcntl is None:
+            yield
+            return
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, size, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, size, offset)
+
+    def _identity(self):
+        if db_location.is_memory(self._database):
+            # Nothing outlives a memory database's process: always rebuild
+            return 0, uuid.uuid4().int >> 65
+        stat = os.stat(self._database)
+        return stat.st_dev, stat.st_ino
+
+    def _open(self):
+        identity = self._identity()
+        with self._grow_lock, self._locked(0, HEADER_SIZE):
+            size = os.fstat(self._fd).st_size
+            if size >= HEADER_SIZE:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                if HEADER.unpack(os.read(self._fd, HEADER.size)) == (MAGIC, *identity):
+                    self._map = mmap.mmap(self._fd, size)
+                    return
+            # New file, or one left over from another database: rebuild from the database
+            slots = self._load_counters()
+            size = max(size, HEADER_SIZE + (max(slots, default=0) + GROW_SLOTS) * SLOT_SIZE)
+            os.ftruncate(self._fd, size)
+            self._map = mmap.mmap(self._fd, size)
+            # Zeroed in place: other workers may still have the file mapped
+            self._map[:] = bytes(size)
+            for shelter_id, values in slots.items():
+                SLOT.pack_into(self._map, HEADER_SIZE + shelter_id * SLOT_SIZE, *values)
+            HEADER.pack_into(self._map, 0, MAGIC, *identity)
+
+    def _load_counters(self):
+        now_bucket = int(self._clock() // BUCKET_SECONDS)
+        slots = {}
+        conn = self._connect()
+        try:
+            for shelter_id, occupancy in conn.execute('SELECT id, occupancy FROM safe_shelters'):
+                slots[shelter_id] = [occupancy or 0] + [0, 0] * BUCKETS
+            for shelter_id, seats, expires_at in conn.execute('''
+                SELECT shelter_id, seats, expires_at FROM shelter_reservations
+                WHERE status = 'active' AND expires_at > ?
+            ''', (self._clock(),)):
+                values = slots.setdefault(shelter_id, [0] + [0, 0] * BUCKETS)
+                bucket = int(expires_at // BUCKET_SECONDS)
+                i = 1 + 2 * (bucket % BUCKETS)
+                if bucket > now_bucket:
+                    values[i] = bucket
+                    values[i + 1] += seats
+        finally:
+            conn.close()
+        return slots
+
+    def _slot(self, shelter_id):
+        """Offset of a shelter's slot, growing the file when needed"""
+        offset = HEADER_SIZE + shelter_id * SLOT_SIZE
+        if offset + SLOT_SIZE > len(self._map):
+            with self._grow_lock, self._locked(0, HEADER_SIZE):
+                size = os.fstat(self._fd).st_size
+                if offset + SLOT_SIZE > size:
+                    size = offset + GROW_SLOTS * SLOT_SIZE
+                    os.ftruncate(self._fd, size)
+                # The old map stays valid for threads still using it
+                self._map = mmap.mmap(self._fd, size)
+        return offset
+
+    @contextmanager
+    def _slot_locked(self, shelter_id):
+        offset = self._slot(shelter_id)
+        with self._stripes[shelter_id % STRIPES], self._locked(offset, SLOT_SIZE):
+            yield offset
+
+    # Shelters
+    def refresh(self):
+        """Reload shelter details and capacities when the shelters dataset changed"""
+        version = datasets.version('shelters', self._connect)
+        if version == self._version:
+            return
+        conn = self._connect()
+        try:
+            rows = conn.execute(f'SELECT {", ".join(SHELTER_COLUMNS)} FROM safe_shelters').fetchall()
+        finally:
+            conn.close()
+        shelters = {}
+        grid = {}
+        for row in rows:
+            shelter = dict(zip(SHELTER_COLUMNS, row))
+            shelters[shelter['id']] = shelter
+            if shelter['latitude'] is not None and shelter['longitude'] is not None:
+                key = (math.floor(shelter['latitude'] / NEAREST_CELL_DEG),
+                       math.floor(shelter['longitude'] / NEAREST_CELL_DEG))
+                grid.setdefault(key, []).append(shelter['id'])
+        self._shelters, self._grid, self._version = shelters, grid, version
+
+    def shelter(self, shelter_id):
+        self.refresh()
+        return self._shelters.get(shelter_id)
+
+    def status(self, shelter_id):
+        """Live occupancy, held places and available places (None when capacity is unknown)"""
+        shelter = self.shelter(shelter_id)
+        if shelter is None:
+            raise KeyError(shelter_id)
+        offset = self._slot(shelter_id)
+        values = SLOT.unpack_from(self._map, offset)
+        held = _held(values, int(self._clock() // BUCKET_SECONDS))
+        available = None
+        if shelter['capacity'] is not None:
+            available = max(0, shelter['capacity'] - values[0] - held)
+        return {'occupancy': values[0], 'held': held, 'available': available}
+
+    def nearest(self, latitude, longitude, radius_km=20, limit=10, seats=1):
+        """Closest shelters within radius_km with at least `seats` places free (or unknown capacity)"""
+        self.refresh()
+        radius_m = radius_km * 1000
+        reach_lat = math.ceil(radius_m / (NEAREST_CELL_DEG * 111320))
+        reach_lon = math.ceil(radius_m / (NEAREST_CELL_DEG * 111320 * max(math.cos(math.radians(latitude)), 0.01)))
+        key_lat = math.floor(latitude / NEAREST_CELL_DEG)
+        key_lon = math.floor(longitude / NEAREST_CELL_DEG)
+        candidates = []
+        for dlat in range(-reach_lat, reach_lat + 1):
+            for dlon in range(-reach_lon, reach_lon + 1):
+                for shelter_id in self._grid.get((key_lat + dlat, key_lon + dlon), ()):
+                    shelter = self._shelters[shelter_id]
+                    distance = geo.haversine_m(latitude, longitude, shelter['latitude'], shelter['longitude'])
+                    if distance <= radius_m:
+                        candidates.append((distance, shelter_id))
+        candidates.sort()
+        results = []
+        for distance, shelter_id in candidates:
+            status = self.status(shelter_id)
+            if status['available'] is not None and status['available'] < seats:
+                continue
+            results.append({**self._shelters[shelter_id], 'occupancy': status['occupancy'],
+                            'available': status['available'], 'distance_m': round(distance)})
+            if len(results) >= limit:
+                break
+        return results
+
+    # Reservations
+    def reserve(self, shelter_id, user_id, seats=1):
+        """Hold places if they are free; returns the reservation, or None when the shelter is full"""
+        shelter = self.shelter(shelter_id)
+        if shelter is None:
+            raise KeyError(shelter_id)
+        now = self._clock()
+        now_bucket = int(now // BUCKET_SECONDS)
+        bucket = int((now + HOLD_MINUTES * 60) // BUCKET_SECONDS) + 1
+        with self._slot_locked(shelter_id) as offset:
+            values = list(SLOT.unpack_from(self._map, offset))
+            if shelter['capacity'] is not None:
+                if shelter['capacity'] - values[0] - _held(values, now_bucket) < seats:
+                    return None
+            i = 1 + 2 * (bucket % BUCKETS)
+            if values[i] != bucket:
+                values[i], values[i + 1] = bucket, 0
+            values[i + 1] += seats
+            SLOT.pack_into(self._map, offset, *values)
+        reservation = {
+            'id': uuid.uuid4().hex,
+            'shelter_id': shelter_id,
+            'seats': seats,
+            'expires_at': bucket * BUCKET_SECONDS,
+        }
+        created = datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self._journal_lock:
+            self._journal.append((reservation['id'], shelter_id, user_id, seats, reservation['expires_at'], created))
+        self._start_flusher()
+        return reservation
+
+    def release(self, reservation_id, user_id=None, arrived=False):
+        """Give held places back, or turn them into occupancy on arrival; False if there is no such active reservation
+
+        Pass user_id to only release that user's reservation.
+        """
+        # The reservation may still be in this worker's journal
+        self.flush()
+        conn = self._connect()
+        try:
+            query = "SELECT shelter_id, seats, expires_at FROM shelter_reservations WHERE id = ? AND status = 'active'"
+            params = (reservation_id,)
+            if user_id is not None:
+                query += ' AND user_id = ?'
+                params += (user_id,)
+            row = conn.execute(query, params).fetchone()
+            if row is None:
+                return False
+            cursor = conn.execute("UPDATE shelter_reservations SET status = ? WHERE id = ? AND status = 'active'",
+                                  ('arrived' if arrived else 'released', reservation_id))
+            conn.commit()
+            if not cursor.rowcount:
+                return False
+        finally:
+            conn.close()
+
+        shelter_id, seats, expires_at = row
+        bucket = int(expires_at // BUCKET_SECONDS)
+        with self._slot_locked(shelter_id) as offset:
+            values = list(SLOT.unpack_from(self._map, offset))
+            i = 1 + 2 * (bucket % BUCKETS)
+            if values[i] == bucket:
+                values[i + 1] = max(0, values[i + 1] - seats)
+            if arrived:
+                values[0] += seats
+            SLOT.pack_into(self._map, offset, *values)
+        if arrived:
+            self._mark_dirty(shelter_id)
+        return True
+
+    def set_occupancy(self, shelter_id, occupancy):
+        """Record the head count reported by a shelter"""
+        if self.shelter(shelter_id) is None:
+            raise KeyError(shelter_id)
+        with self._slot_locked(shelter_id) as offset:
+            values = list(SLOT.unpack_from(self._map, offset))
+            values[0] = occupancy
+            SLOT.pack_into(self._map, offset, *values)
+        self._mark_dirty(shelter_id)
+
+    def _mark_dirty(self, shelter_id):
+        with self._journal_lock:
+            self._dirty.add(shelter_id)
+        self._start_flusher()
+
+    # Write-behind
+    def flush(self):
+        """Write journaled reservations and changed occupancy to the database; returns rows written"""
+        with self._flush_lock:
+            with self._journal_lock:
+                journal, self._journal = self._journal, []
+                dirty, self._dirty = self._dirty, set()
+            if not journal and not dirty:
+                return 0
+            # Occupancy is written as it is now, so flushes from any worker converge
+            occupancy = [(SLOT.unpack_from(self._map, self._slot(shelter_id))[0], shelter_id) for shelter_id in dirty]
+            conn = self._connect()
+            try:
+                conn.executemany('''
+                    INSERT INTO shelter_reservations (id, shelter_id, user_id, seats, expires_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', journal)
+                conn.executemany('UPDATE safe_shelters SET occupancy = ? WHERE id = ?', occupancy)
+                conn.commit()
+            except sqlite3.Error as e:
+                # Keep the rows for the next flush
+                with self._journal_lock:
+                    self._journal[:0] = journal
+                    self._dirty |= dirty
+                print(f"Shelter reservation flush failed: {e}")
+                return 0
+            finally:
+                conn.close()
+            return len(journal) + len(occupancy)
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            with self._journal_lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name='shelter-capacity-flush',
+                                                     daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self, remove=False):
+        """Flush and stop; remove=True also deletes the counters file"""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        os.close(self._fd)
+        if remove:
+            os.remove(self.path)
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(database, connect):
+    """The tracker for a database, created on first use in each worker"""
+    tracker = _trackers.get(database)
+    if tracker is None:
+        with _trackers_lock:
+            tracker = _trackers.get(database)
+            if tracker is None:
+                tracker = _trackers[database] = CapacityTracker(connect, database)
+    return tracker
+
+
+def close_all(remove=False):
+    """Flush and close every tracker (registered with atexit by the app)"""
+    with _trackers_lock:
+        trackers = list(_trackers.values())
+        _trackers.clear()
+    for tracker in trackers:
+        tracker.close(remove=remove)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the async API server
+"""
+
+import sys
+import os
+import asyncio
+import json
+import sqlite3
+import tempfile
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as app_module
+import asgi_app
+import metrics
+import repositories
+
+
+async def call(method, path, payload=None, user_id=None):
+    """Send one request through the ASGI app; returns (status, headers, body)"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    if user_id is not None:
+        serializer = app_module.app.session_interface.get_signing_serializer(app_module.app)
+        cookie = f"{app_module.app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': user_id})}"
+        headers.append((b'cookie', cookie.encode()))
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': headers, 'http_version': '1.1', 'scheme': 'http'}
+    sent = [{'type': 'http.request', 'body': body}]
+    messages = []
+
+    async def receive():
+        return sent.pop(0) if sent else {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await asgi_app.application(scope, receive, send)
+    start = messages[0]
+    body = b''.join(m.get('body', b'') for m in messages[1:])
+    return start['status'], dict(start['headers']), body
+
+
+def _with_temp_db(test):
+    def wrapper():
+        original = app_module.DATABASE
+        with tempfile.TemporaryDirectory() as directory:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            try:
+                asyncio.run(test())
+            finally:
+                asgi_app.writer.stop()
+                app_module.DATABASE = original
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@_with_temp_db
+async def test_location_group_commit():
+    """Test that concurrent location updates are all written"""
+    status, _, _ = await call('POST', '/api/location', {'latitude': 1, 'longitude': 2})
+    assert status == 401
+
+    results = await asyncio.gather(*[
+        call('POST', '/api/location', {'latitude': 28.6 + i * 1e-4, 'longitude': 77.2}, user_id=7)
+        for i in range(500)
+    ])
+    assert all(status == 200 and json.loads(body) == {'success': True} for status, _, body in results)
+
+    status, _, _ = await call('POST', '/api/location', {'latitude': 'north'}, user_id=7)
+    assert status == 400
+
+    conn = sqlite3.connect(app_module.DATABASE)
+    count = conn.execute('SELECT COUNT(*) FROM location_tracking WHERE user_id = 7').fetchone()[0]
+    conn.close()
+    assert count == 500
+    print("✓ 500 concurrent location updates committed")
+
+
+@_with_temp_db
+async def test_repository_and_metrics():
+    """Test that pings go through the configured location repository and are counted in /metrics"""
+    key = ('update_location', 'POST', '200')
+    before = metrics.snapshot()['responses'].get(key, 0)
+    app_module.app.config['REPOSITORIES'] = repositories.memory_repositories()
+    try:
+        results = await asyncio.gather(*[
+            call('POST', '/api/location', {'latitude': 19.0 + i * 1e-3, 'longitude': 72.8}, user_id=8)
+            for i in range(20)
+        ])
+        assert all(status == 200 for status, _, _ in results)
+        stored = list(app_module.get_repos().locations.history(8, '2000-01-01 00:00:00', '2100-01-01 00:00:00'))
+    finally:
+        app_module.app.config.pop('REPOSITORIES')
+    assert len(stored) == 20
+    conn = sqlite3.connect(app_module.DATABASE)
+    assert conn.execute('SELECT COUNT(*) FROM location_tracking WHERE user_id = 8').fetchone()[0] == 0
+    conn.close()
+    snap = metrics.snapshot()
+    assert snap['responses'][key] - before == 20
+    assert ('update_location', 'commit') in snap['phases']
+    print("✓ Pings stored through the repository and counted in /metrics")
+
+
+@_with_temp_db
+async def test_location_off_loop():
+    """Test that the location checks run in worker threads, not on the event loop"""
+    loop_thread = threading.current_thread()
+    seen = []
+    original = app_module.on_location_update
+
+    def checks(user_id, latitude, longitude):
+        seen.append(threading.current_thread())
+        return original(user_id, latitude, longitude)
+
+    app_module.on_location_update = checks
+    try:
+        status, _, _ = await call('POST', '/api/location', {'latitude': 28.6, 'longitude': 77.2}, user_id=9)
+    finally:
+        app_module.on_location_update = original
+    assert status == 200 and seen and loop_thread not in seen
+    print("✓ Location checks run off the event loop")
+
+
+@_with_temp_db
+async def test_shared_logic():
+    """Test that async handlers answer exactly like the Flask routes"""
+    status, headers, body = await call('POST', '/api/ai-assistant', {'command': 'fake call please'}, user_id=3)
+    assert status == 200
+    assert json.loads(body) == app_module.assistant_reply('fake call please')
+    assert headers[b'access-control-allow-origin'] == b'*'
+
+    status, _, body = await call('POST', '/api/siren', {}, user_id=3)
+    assert json.loads(body) == app_module.siren_reply(3)
+    print("✓ Async handlers share the Flask business logic")
+
+
+@_with_temp_db
+async def test_flask_fallback():
+    """Test that non-async paths are served by the Flask app"""
+    status, headers, body = await call('GET', '/api/tips')
+    assert status == 200
+    assert headers[b'content-type'] == b'application/json'
+    assert json.loads(body)
+    print("✓ Other paths fall back to Flask")
+
+
+def main():
+    """Run all tests"""
+    print("Testing Async API Server")
+    print("=" * 50)
+
+    tests = [
+        ("Location Group Commit", test_location_group_commit),
+        ("Repository And Metrics", test_repository_and_metrics),
+        ("Location Off Loop", test_location_off_loop),
+        ("Shared Logic", test_shared_logic),
+        ("Flask Fallback", test_flask_fallback),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the static asset pipeline and page cache
+"""
+
+import sys
+import os
+import gzip
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask, url_for
+
+import assets
+import responses
+
+
+def _make_app(directory):
+    static_dir = os.path.join(directory, 'static')
+    template_dir = os.path.join(directory, 'templates')
+    os.makedirs(static_dir)
+    os.makedirs(template_dir)
+    with open(os.path.join(static_dir, 'style.css'), 'w') as f:
+        f.write('body { color: #333; }\n' * 200)
+    with open(os.path.join(template_dir, 'signin.html'), 'w') as f:
+        f.write('<html><link href="{{ url_for(\'static\', filename=\'style.css\') }}">' + 'x' * 2000 + '</html>')
+    app = Flask(__name__, static_folder=static_dir, template_folder=template_dir)
+    app.config['JINJA_CACHE_DIR'] = os.path.join(directory, 'jinja')
+    app.add_url_rule('/signin', 'signin', lambda: assets.render_page('signin.html'))
+    return app
+
+
+def test_fingerprinted_static():
+    """Test that built assets get hashed names, far-future caching and gzip variants"""
+    with tempfile.TemporaryDirectory() as directory:
+        app = _make_app(directory)
+        manifest = assets.build_static(app.static_folder)
+        assets.init_app(app)
+        hashed = manifest['style.css']
+        assert hashed.startswith('style.') and hashed.endswith('.css') and hashed != 'style.css'
+
+        with app.test_request_context('/'):
+            url = url_for('static', filename='style.css')
+        assert url == f'/static/dist/{hashed}'
+
+        with app.test_client() as client:
+            response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            body = gzip.decompress(response.get_data())
+            response.close()
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.headers['Cache-Control'] == assets.FAR_FUTURE
+        assert response.mimetype == 'text/css'
+        assert body.startswith(b'body { color')
+    print("✓ Static assets fingerprinted and served pre-compressed")
+
+
+def test_page_cache_and_warmup():
+    """Test that pages are pre-rendered once and served from the cache"""
+    with tempfile.TemporaryDirectory() as directory:
+        app = _make_app(directory)
+        assets.init_app(app)
+        responses.invalidate()
+        warmed = assets.warm(app)
+        assert warmed['templates'] == 1
+        assert warmed['pages'] == ['signin.html']
+        assert os.listdir(app.config['JINJA_CACHE_DIR'])
+
+        # Later template edits don't show up until the cache is cleared
+        with open(os.path.join(app.template_folder, 'signin.html'), 'w') as f:
+            f.write('changed')
+        with app.test_client() as client:
+            response = client.get('/signin', headers={'Accept-Encoding': 'gzip'})
+            etag = response.headers['ETag']
+            revalidated = client.get('/signin', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.get_data()).startswith(b'<html>')
+        assert revalidated.status_code == 304
+        responses.invalidate()
+    print("✓ Pages pre-rendered and served from cache")
+
+
+def main():
+    """Run all tests"""
+    print("Testing Asset Pipeline")
+    print("=" * 50)
+
+    tests = [
+        ("Fingerprinted Static Files", test_fingerprinted_static),
+        ("Page Cache and Warm-up", test_page_cache_and_warmup),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
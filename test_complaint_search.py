@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Test script to verify full-text complaint search
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import complaint_search
+
+COMPLAINTS = [
+    (1, 'Harassment at bus stop', 'A man followed me from the bus stop near the market', 'harassment'),
+    (1, 'Street light broken', 'The street near the park is dark at night', 'safety'),
+    (2, 'Stalking on the way home', 'Someone has been following me home from the bus', 'stalking'),
+    (2, 'Online abuse', 'Threatening <script> messages on social media', 'cyber'),
+]
+
+
+def test_build_match():
+    """Test that user input becomes a safe FTS5 query"""
+    assert complaint_search.build_match('bus stop') == '"bus" "stop"'
+    assert complaint_search.build_match('"bus stop" follow*') == '"bus stop" "follow"*'
+    assert complaint_search.build_match('OR bus OR OR stalk* OR') == '"bus" OR "stalk"*'
+    assert complaint_search.build_match('NEAR( "" ^ ') == '"NEAR(" "^"'
+    assert complaint_search.build_match('   ') == ''
+    print("✓ Queries are quoted and sanitized")
+
+
+def test_triggers_keep_index_in_sync():
+    """Test that inserts, updates and deletes reach the index and old rows are backfilled"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE complaints (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, title TEXT NOT NULL,
+                                 description TEXT, category TEXT, status TEXT DEFAULT 'pending',
+                                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)
+    ''')
+    conn.execute("INSERT INTO complaints (user_id, title, description, category) VALUES (1, 'Old broken lock', '', 'safety')")
+    complaint_search.ensure_schema(conn.cursor())
+    complaint_search.ensure_schema(conn.cursor())
+    assert [r['id'] for r in complaint_search.search(conn, 'lock')[0]] == [1]
+
+    conn.execute("INSERT INTO complaints (user_id, title, description, category) VALUES (1, 'Eve teasing', 'near college', 'harassment')")
+    assert [r['id'] for r in complaint_search.search(conn, 'college')[0]] == [2]
+    conn.execute("UPDATE complaints SET description = 'near the hostel' WHERE id = 2")
+    assert complaint_search.search(conn, 'college')[0] == []
+    assert [r['id'] for r in complaint_search.search(conn, 'hostel')[0]] == [2]
+    conn.execute("DELETE FROM complaints WHERE id = 1")
+    assert complaint_search.search(conn, 'lock')[0] == []
+    # Raises if the index and the table disagree
+    conn.execute("INSERT INTO complaints_fts (complaints_fts) VALUES ('integrity-check')")
+    print("✓ Triggers keep the index in sync")
+
+
+def test_search_api():
+    """Test ranking, highlights, filters, paging and staff-only access"""
+    import app as app_module
+    original = app_module.DATABASE
+    original_staff = app_module.app.config['STAFF_USER_IDS']
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.app.config['STAFF_USER_IDS'] = {99}
+            app_module.init_db()
+            conn = app_module.get_db_connection()
+            conn.executemany('INSERT INTO complaints (user_id, title, description, category) VALUES (?, ?, ?, ?)',
+                             COMPLAINTS)
+            conn.execute("UPDATE complaints SET status = 'resolved' WHERE id = 3")
+            conn.commit()
+            conn.close()
+
+            with app_module.app.test_client() as client:
+                assert client.get('/api/complaints/search?q=bus').status_code == 401
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                assert client.get('/api/complaints/search?q=bus').status_code == 403
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 99
+
+                body = json.loads(client.get('/api/complaints/search?q=bus').data)
+                # The title match ranks first
+                assert [r['id'] for r in body['results']] == [1, 3]
+                assert body['results'][0]['title'] == 'Harassment at <mark>bus</mark> stop'
+                assert '<mark>bus</mark>' in body['results'][1]['snippet']
+
+                body = json.loads(client.get('/api/complaints/search', query_string={'q': '"bus stop"'}).data)
+                assert [r['id'] for r in body['results']] == [1]
+                body = json.loads(client.get('/api/complaints/search', query_string={'q': 'follow*'}).data)
+                assert sorted(r['id'] for r in body['results']) == [1, 3]
+                body = json.loads(client.get('/api/complaints/search', query_string={
+                    'q': 'follow*', 'status': 'resolved'}).data)
+                assert [r['id'] for r in body['results']] == [3]
+                body = json.loads(client.get('/api/complaints/search', query_string={
+                    'q': 'bus', 'category': 'stalking'}).data)
+                assert [r['id'] for r in body['results']] == [3]
+
+                page = json.loads(client.get('/api/complaints/search?q=bus&per_page=1').data)
+                assert len(page['results']) == 1 and page['has_more']
+                page = json.loads(client.get('/api/complaints/search?q=bus&per_page=1&page=2').data)
+                assert [r['id'] for r in page['results']] == [3] and not page['has_more']
+
+                body = json.loads(client.get('/api/complaints/search?q=messages').data)
+                assert '&lt;script&gt;' in body['results'][0]['snippet']
+                assert client.get('/api/complaints/search?q=').status_code == 400
+            print("✓ Search API ranks, highlights, filters and pages")
+        finally:
+            app_module.DATABASE = original
+            app_module.app.config['STAFF_USER_IDS'] = original_staff
+
+
+def main():
+    """Run all tests"""
+    print("Testing Complaint Search")
+    print("=" * 50)
+
+    tests = [
+        ("Query Building", test_build_match),
+        ("Index Triggers", test_triggers_keep_index_in_sync),
+        ("Search API", test_search_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
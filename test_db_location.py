@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test script to verify database locations from DATABASE_URL, including memory databases
+"""
+
+import sys
+import os
+import json
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datasets
+import db_location
+import responses
+import sharding
+
+
+def test_resolve():
+    """Test that every DATABASE_URL form maps to a path or memory URI"""
+    app_dir = db_location.APP_DIR
+    assert db_location.resolve(None) == os.path.join(app_dir, 'security_system.db')
+    assert db_location.resolve('data/app.db') == os.path.join(app_dir, 'data/app.db')
+    assert db_location.resolve('sqlite:///data/app.db') == os.path.join(app_dir, 'data/app.db')
+    assert db_location.resolve('sqlite:////srv/app.db') == '/srv/app.db'
+    assert db_location.resolve('tmpfs://bench.db') == os.path.join(db_location.tmpfs_dir(), 'bench.db')
+    for url in ('memory://', 'sqlite:///:memory:'):
+        assert db_location.resolve(url) == db_location.memory('security_system')
+    target = db_location.resolve('memory://worker1')
+    assert db_location.is_memory(target) and not db_location.is_memory('/srv/app.db')
+    shard = sharding.shard_path(target, 2)
+    assert db_location.is_memory(shard) and shard != target and 'worker1.shard2' in shard
+    print("✓ URLs resolved")
+
+
+def test_memory_database():
+    """Test that connections share a memory database until it is released"""
+    first, second = db_location.memory('test_first'), db_location.memory('test_second')
+    try:
+        conn = db_location.connect(first)
+        conn.execute('CREATE TABLE pings (n INTEGER)')
+        conn.commit()
+        conn.close()
+
+        # Concurrent writers wait for the lock instead of failing
+        def write():
+            writer = db_location.connect(first, timeout=10)
+            for n in range(200):
+                writer.execute('INSERT INTO pings VALUES (?)', (n,))
+                writer.commit()
+            writer.close()
+
+        threads = [threading.Thread(target=write) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        conn = db_location.connect(first)
+        assert conn.execute('SELECT COUNT(*) FROM pings').fetchone()[0] == 800
+        conn.close()
+
+        # Other names are other databases
+        other = db_location.connect(second)
+        assert other.execute("SELECT name FROM sqlite_master WHERE name = 'pings'").fetchone() is None
+        other.close()
+
+        db_location.release(first)
+        conn = db_location.connect(first)
+        assert conn.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()[0] == 0
+        conn.close()
+        print("✓ Memory database shared by connections")
+    finally:
+        db_location.release(first)
+        db_location.release(second)
+
+
+def test_app_on_memory():
+    """Test the app end to end on sharded memory databases"""
+    import app as app_module
+    saved = app_module.DATABASE, app_module.app.config['SHARD_COUNT']
+    try:
+        app_module.DATABASE = db_location.memory('test_app')
+        app_module.app.config['SHARD_COUNT'] = 2
+        # No init_db(), as in a gunicorn worker: the tables are created on first use
+        datasets.forget()
+        responses.invalidate()
+        with app_module.app.test_client() as client:
+            client.post('/register', json={'username': 'memuser', 'email': 'mem@example.com',
+                                           'password': 'password123'})
+            assert json.loads(client.post('/login', json={'username': 'memuser',
+                                                          'password': 'password123'}).data)['success']
+            with client.session_transaction() as sess:
+                user_id = sess['user_id']
+            client.post('/api/location', json={'latitude': 28.61, 'longitude': 77.21})
+            client.post('/api/complaints', json={'title': 'Broken light', 'description': 'Dark lane',
+                                                 'category': 'safety'})
+            history = json.loads(client.get('/api/complaints/history').data)
+            assert [c['title'] for c in history] == ['Broken light']
+            assert json.loads(client.get('/api/shelters').data)
+
+        shards = app_module.get_shards()
+        assert all(db_location.is_memory(path) for path in shards.paths)
+        conn = shards.connect_user(user_id)
+        assert conn.execute('SELECT COUNT(*) FROM location_tracking').fetchone()[0] == 1
+        conn.close()
+        # Nothing was written to disk
+        assert not any(os.path.exists(path) for path in [app_module.DATABASE] + shards.paths)
+        shards.close()
+
+        # A released database is created again on its next use
+        app_module.DATABASE = db_location.memory('test_app_released')
+        app_module.get_db_connection().close()
+        db_location.release(app_module.DATABASE)
+        conn = app_module.get_db_connection()
+        assert conn.execute('SELECT COUNT(*) FROM users').fetchone()[0] == 0
+        conn.close()
+        print("✓ App runs on sharded memory databases")
+    finally:
+        app_module.DATABASE, app_module.app.config['SHARD_COUNT'] = saved
+        db_location.release()
+        datasets.forget()
+        responses.invalidate()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Database Location")
+    print("=" * 50)
+
+    tests = [
+        ("Resolve", test_resolve),
+        ("Memory Database", test_memory_database),
+        ("App On Memory", test_app_on_memory),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Test script to verify streaming data exports
+"""
+
+import sys
+import os
+import csv
+import io
+import json
+import sqlite3
+import tempfile
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import export
+
+GPX = '{http://www.topografix.com/GPX/1/1}'
+
+
+def _database(path):
+    """App schema with 1,010 pings (two sessions, a day apart) and 3 complaints for user 1"""
+    import app as app_module
+    app_module.DATABASE = path
+    app_module.init_db()
+    conn = sqlite3.connect(path)
+    start = datetime(2024, 6, 1, 8, 0, 0)
+    rows = []
+    for i in range(1000):
+        moment = start + timedelta(seconds=10 * (i % 500), days=i // 500)
+        rows.append((1, 28.6 + i * 1e-5, 77.2, moment.strftime('%Y-%m-%d %H:%M:%S')))
+        if i % 100 == 0:
+            # Pings of the same second tie on timestamp; the id breaks the tie
+            rows.append(rows[-1])
+    rows.append((2, 10.0, 10.0, '2024-06-01 09:00:00'))
+    conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) VALUES (?, ?, ?, ?)', rows)
+    conn.executemany('INSERT INTO complaints (user_id, title, description, category) VALUES (?, ?, ?, ?)',
+                     [(1, 'Followed, "twice"', 'Line one\nline two', 'harassment'),
+                      (2, 'Not mine', '', 'other'),
+                      (1, 'Broken light', 'Dark <street>', 'infrastructure'),
+                      (1, 'Stalking', '', 'harassment')])
+    conn.commit()
+    conn.close()
+    return lambda: sqlite3.connect(path)
+
+
+def test_keyset_pages():
+    """Test that pages cover each of the user's rows once, in order"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            connect = _database(os.path.join(directory, 'test.db'))
+            conn = connect()
+            pages = export.pages(conn, 'locations', 1, page_size=7)
+            first = next(pages)
+            # Pings stored while the export runs are not included
+            conn.execute("INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) "
+                         "VALUES (1, 0, 0, '2030-01-01 00:00:00')")
+            rows = first + [row for page in pages for row in page]
+            assert len(rows) == 1010
+            assert len({row[0] for row in rows}) == 1010
+            assert [(row[3], row[0]) for row in rows] == sorted((row[3], row[0]) for row in rows)
+
+            complaints = [row for page in export.pages(conn, 'complaints', 1, page_size=2) for row in page]
+            assert [row[1] for row in complaints] == ['Followed, "twice"', 'Broken light', 'Stalking']
+            conn.close()
+            print("✓ Keyset pages cover every row once")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_formats():
+    """Test NDJSON, CSV and GPX output"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            connect = _database(os.path.join(directory, 'test.db'))
+            lines = b''.join(export.export(connect, 1, 'all', 'ndjson', page_size=100)).splitlines()
+            records = [json.loads(line) for line in lines]
+            assert len(records) == 1013
+            assert {r['type'] for r in records} == {'locations', 'complaints'}
+            assert records[-3]['description'] == 'Line one\nline two'
+
+            chunks = list(export.export(connect, 1, 'complaints', 'csv', page_size=2))
+            assert len(chunks) == 2
+            table = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+            assert table[0] == list(export.DATASETS['complaints']['columns'])
+            assert table[1][1] == 'Followed, "twice"' and len(table) == 4
+
+            gpx = ET.fromstring(b''.join(export.export(connect, 1, 'locations', 'gpx', page_size=64)))
+            segments = gpx.findall(f'{GPX}trk/{GPX}trkseg')
+            # The night between the two days splits the track
+            assert [len(s) for s in segments] == [505, 505]
+            point = segments[0][0]
+            assert point.get('lat') == '28.6' and point.find(f'{GPX}time').text == '2024-06-01T08:00:00Z'
+
+            for data, fmt in (('complaints', 'gpx'), ('all', 'csv'), ('everything', 'ndjson'), ('all', 'xml')):
+                try:
+                    export.validate(data, fmt)
+                    assert False, f'{data}/{fmt} accepted'
+                except ValueError:
+                    pass
+            print("✓ NDJSON, CSV and GPX exports valid")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_export_api():
+    """Test the streamed download and who may export what"""
+    import app as app_module
+    original = app_module.DATABASE
+    staff = app_module.app.config['STAFF_USER_IDS']
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            _database(os.path.join(directory, 'test.db'))
+            app_module.app.config['STAFF_USER_IDS'] = {2}
+            with app_module.app.test_client() as client:
+                assert client.get('/api/export').status_code == 401
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                response = client.get('/api/export?data=locations&format=gpx')
+                assert response.status_code == 200 and response.is_streamed
+                assert response.mimetype == 'application/gpx+xml'
+                assert 'safeguard-user1-locations.gpx' in response.headers['Content-Disposition']
+                assert response.data.count(b'<trkpt') == 1010
+
+                assert client.get('/api/export?format=gpx').status_code == 400
+                assert client.get('/api/export?user_id=2').status_code == 403
+
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 2
+                lines = client.get('/api/export?user_id=1&data=complaints').data.splitlines()
+                assert len(lines) == 3
+            print("✓ Export endpoint streams downloads")
+        finally:
+            app_module.app.config['STAFF_USER_IDS'] = staff
+            app_module.DATABASE = original
+
+
+def test_cli():
+    """Test the command line export to a file"""
+    import app as app_module
+    original = app_module.DATABASE
+    original_argv = sys.argv
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            path = os.path.join(directory, 'test.db')
+            _database(path)
+            output = os.path.join(directory, 'out.csv')
+            sys.argv = ['export.py', '1', '--data', 'locations', '--format', 'csv', '--db', path, '-o', output]
+            assert export.main() == 0
+            with open(output) as f:
+                assert len(f.read().splitlines()) == 1011
+            print("✓ CLI export written")
+        finally:
+            sys.argv = original_argv
+            app_module.DATABASE = original
+
+
+def main():
+    """Run all tests"""
+    print("Testing Data Export")
+    print("=" * 50)
+
+    tests = [
+        ("Keyset Pages", test_keyset_pages),
+        ("Formats", test_formats),
+        ("Export API", test_export_api),
+        ("CLI", test_cli),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test script to verify geofences and the entry/exit engine
+"""
+
+import sys
+import os
+import random
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import geo
+import geofence
+from alerts import AlertQueue
+
+HOME = [(28.610, 77.200), (28.610, 77.210), (28.620, 77.210), (28.620, 77.200)]
+
+
+def test_point_in_polygon():
+    """Test the ray casting check, including a concave polygon"""
+    concave = [(0, 0), (0, 10), (10, 10), (10, 0), (5, 5)]
+    assert geo.point_in_polygon(28.615, 77.205, HOME)
+    assert not geo.point_in_polygon(28.625, 77.205, HOME)
+    assert geo.point_in_polygon(8, 5, concave)
+    assert not geo.point_in_polygon(5, 1, concave)
+    circle = geo.circle_polygon(28.6, 77.2, 500)
+    assert geo.point_in_polygon(28.6, 77.2, circle)
+    assert not geo.point_in_polygon(28.61, 77.2, circle)
+    print("✓ Point-in-polygon checks correct")
+
+
+def test_rtree_matches_linear_scan():
+    """Test that R-tree candidates equal a brute-force bounding box scan"""
+    rng = random.Random(7)
+    boxes = []
+    for i in range(5000):
+        lat, lon = rng.uniform(0, 10), rng.uniform(0, 10)
+        boxes.append((lat, lon, lat + rng.uniform(0, 0.5), lon + rng.uniform(0, 0.5), i))
+    tree = geo.PackedRTree(boxes)
+    for _ in range(200):
+        lat, lon = rng.uniform(0, 10), rng.uniform(0, 10)
+        expected = {b[4] for b in boxes if b[0] <= lat <= b[2] and b[1] <= lon <= b[3]}
+        assert set(tree.search_point(lat, lon)) == expected
+    print("✓ R-tree lookups match a linear scan")
+
+
+def test_entry_exit_events():
+    """Test transitions, per-user isolation and alerting"""
+    alerts = AlertQueue()
+    engine = geofence.GeofenceEngine(alerts=alerts)
+    engine.load([geofence.Geofence(1, 10, 'Home', HOME, alert_on_entry=True, alert_on_exit=True),
+                 geofence.Geofence(2, 11, 'Other user', HOME)])
+
+    assert engine.evaluate(10, 28.615, 77.205) == []  # first ping sets the baseline
+    assert engine.evaluate(10, 28.616, 77.205) == []
+    exit_events = engine.evaluate(10, 28.700, 77.205)
+    assert exit_events == [{'fence_id': 1, 'name': 'Home', 'transition': 'exit'}]
+    entry_events = engine.evaluate(10, 28.615, 77.205)
+    assert entry_events[0]['transition'] == 'entry'
+    assert [a['kind'] for a in alerts.drain(10)] == ['geofence_exit', 'geofence_entry']
+
+    # Fences of other users never fire
+    engine.evaluate(12, 28.615, 77.205)
+    assert engine.evaluate(12, 28.700, 77.205) == []
+
+    # Removed fences stop matching before the next rebuild
+    engine.remove(1)
+    assert engine.evaluate(10, 28.7, 77.2) == []
+    assert engine.containing(10, 28.615, 77.205) == frozenset()
+    print("✓ Entry and exit events raised")
+
+
+def test_shared_state():
+    """Test that two workers' engines and queues see each transition and alert once"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            connect = app_module.get_db_connection
+            queues = [AlertQueue(connect=connect), AlertQueue(connect=connect)]
+            workers = [geofence.GeofenceEngine(alerts=queue) for queue in queues]
+            for engine in workers:
+                engine.add(geofence.Geofence(1, 10, 'Home', HOME))
+
+            # Pings alternate between the workers
+            track = [(28.615, 77.205), (28.700, 77.205), (28.701, 77.205), (28.615, 77.205), (28.616, 77.205)]
+            events = [workers[i % 2].evaluate(10, lat, lon, connect=connect) for i, (lat, lon) in enumerate(track)]
+            assert [[e['transition'] for e in found] for found in events] == [[], ['exit'], [], ['entry'], []]
+            assert workers[0].is_inside_any(10, connect=connect)
+            # Published on the second worker, delivered by the first, once
+            assert queues[0].pending_count(10) == 1
+            assert [a['kind'] for a in queues[0].drain(10)] == ['geofence_exit']
+            assert queues[1].drain(10) == []
+
+            # A user without fences never touches the table
+            assert workers[0].evaluate(11, 28.615, 77.205, connect=connect) == []
+            conn = connect()
+            assert conn.execute('SELECT user_id FROM geofence_state').fetchall() == [(10,)]
+            conn.close()
+
+            # Only the newest alerts are kept
+            small = AlertQueue(max_pending=3, connect=connect)
+            for n in range(5):
+                small.publish(12, 'test', n=n)
+            assert [a['n'] for a in small.drain(12)] == [2, 3, 4]
+        finally:
+            app_module.DATABASE = original
+    print("✓ Fence state and alerts shared between workers")
+
+
+def test_geofence_api():
+    """Test creating, listing and deleting zones through the API"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        app_module.DATABASE = os.path.join(directory, 'test.db')
+        app_module.init_db()
+        geofence.engine.__init__()
+        try:
+            with app_module.app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 42
+                bad = client.post('/api/geofences', json={'name': 'Home', 'polygon': [[1, 2]]})
+                created = client.post('/api/geofences', json={'name': 'College', 'center': [28.6, 77.2], 'radius_m': 300})
+                fence_id = created.get_json()['geofence']['id']
+                listed = client.get('/api/geofences').get_json()
+
+                client.post('/api/location', json={'latitude': 28.6, 'longitude': 77.2})
+                left = client.post('/api/location', json={'latitude': 28.7, 'longitude': 77.2}).get_json()
+                alerts = client.get('/api/alerts').get_json()
+
+                deleted = client.delete(f'/api/geofences/{fence_id}')
+                missing = client.delete(f'/api/geofences/{fence_id}')
+        finally:
+            app_module.DATABASE = original
+            geofence.engine.__init__()
+
+    assert bad.status_code == 400
+    assert [f['name'] for f in listed] == ['College']
+    assert left['events'][0]['transition'] == 'exit'
+    assert alerts[0]['kind'] == 'geofence_exit'
+    assert deleted.status_code == 200 and missing.status_code == 404
+    print("✓ Geofence API works end to end")
+
+
+def main():
+    """Run all tests"""
+    print("Testing Geofences")
+    print("=" * 50)
+
+    tests = [
+        ("Point in Polygon", test_point_in_polygon),
+        ("R-tree Lookups", test_rtree_matches_linear_scan),
+        ("Entry/Exit Events", test_entry_exit_events),
+        ("Shared State", test_shared_state),
+        ("Geofence API", test_geofence_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
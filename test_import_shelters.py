@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the bulk shelter importer
+"""
+
+import sys
+import os
+import io
+import json
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import import_shelters
+
+CSV_DATA = """Shelter_Name,Addr,Lat,Lng,Contact,Beds,Services,Code
+Asha  Kendra,"12 Ring Road,  Delhi",28.6139,77.2090,(011) 2345-6789,40,"Counselling, Legal aid",DL-001
+Sakhi Centre,Sector 5,28.5355,77.3910,,25.0,,DL-002
+No Coordinates,Somewhere,,,,,,DL-003
+Bad Latitude,Nowhere,128.5,77.1,,,,DL-004
+Unnamed Coordinates Only,Near Metro,28.7041,77.1025,100,-3,,
+"""
+
+
+def _geojson(count):
+    features = []
+    for i in range(count):
+        features.append({
+            'type': 'Feature', 'id': f'GJ-{i}',
+            'geometry': {'type': 'Point', 'coordinates': [77.0 + i * 0.001, 28.0 + i * 0.001]},
+            'properties': {'name': f'Shelter {i}', 'capacity': i, 'facilities': ['Medical', 'Food']},
+        })
+    return json.dumps({'type': 'FeatureCollection', 'name': 'registry', 'features': features}, indent=1)
+
+
+def test_normalize():
+    """Test header aliases, cleanup and rejects"""
+    records = list(import_shelters.read_csv(io.StringIO(CSV_DATA)))
+    row = import_shelters.normalize(records[0])
+    assert row[:3] == ('DL-001', 'Asha Kendra', '12 Ring Road, Delhi')
+    assert row[5] == '0112345-6789'
+    assert row[6] == 40 and row[7] == 'Counselling, Legal aid'
+    assert import_shelters.normalize(records[1])[6] == 25
+
+    for record, reason in ((records[2], 'missing or invalid coordinates'), (records[3], 'coordinates out of range')):
+        try:
+            import_shelters.normalize(record)
+            assert False, 'expected a reject'
+        except ValueError as e:
+            assert str(e) == reason
+
+    # Without a registry id the key comes from the name and position
+    row = import_shelters.normalize(records[4])
+    assert row[0] == 'unnamed coordinates only@28.70410,77.10250'
+    assert row[6] == 0
+    print("✓ Rows are normalized and bad rows rejected")
+
+
+def test_geojson_stream():
+    """Test that features are decoded one at a time across read boundaries"""
+    original = import_shelters.READ_SIZE
+    try:
+        import_shelters.READ_SIZE = 64
+        records = list(import_shelters.read_geojson(io.StringIO(_geojson(50))))
+    finally:
+        import_shelters.READ_SIZE = original
+    assert len(records) == 50
+    assert records[7]['registry_id'] == 'GJ-7'
+    assert (records[7]['latitude'], records[7]['longitude']) == (28.007, 77.007)
+    assert import_shelters.normalize(records[7])[7] == 'Medical, Food'
+    assert list(import_shelters.read_geojson(io.StringIO('{"type": "FeatureCollection", "features": []}'))) == []
+    print("✓ GeoJSON features streamed")
+
+
+def test_upsert():
+    """Test batched upserts on the registry key and the version bump"""
+    import app as app_module
+    import datasets
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            conn = sqlite3.connect(app_module.DATABASE, isolation_level=None)
+            records = list(import_shelters.read_csv(io.StringIO(CSV_DATA)))
+
+            stats = import_shelters.import_records(conn, records, batch_size=2)
+            assert (stats['read'], stats['inserted'], stats['rejected']) == (5, 3, 2)
+            assert datasets.read(conn, 'shelters') == 1
+
+            # The same file again changes nothing; an edited row is updated in place
+            stats = import_shelters.import_records(conn, records, batch_size=2)
+            assert (stats['inserted'], stats['updated'], stats['unchanged']) == (0, 0, 3)
+            records[1]['beds'] = '30'
+            stats = import_shelters.import_records(conn, records)
+            assert (stats['inserted'], stats['updated']) == (0, 1)
+            assert conn.execute("SELECT capacity FROM safe_shelters WHERE registry_id = 'DL-002'").fetchone()[0] == 30
+            assert conn.execute('SELECT COUNT(*) FROM safe_shelters').fetchone()[0] == 6
+
+            # A dry run validates without writing or bumping the version
+            stats = import_shelters.import_records(conn, import_shelters.read_geojson(io.StringIO(_geojson(10))),
+                                                   dry_run=True)
+            assert stats['inserted'] == 10
+            assert conn.execute('SELECT COUNT(*) FROM safe_shelters').fetchone()[0] == 6
+            assert datasets.read(conn, 'shelters') == 3
+            conn.close()
+            print("✓ Upserts are idempotent and keyed on registry_id")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_cli_and_api():
+    """Test the CLI on files and that /api/shelters serves the new rows"""
+    import app as app_module
+    original = app_module.DATABASE
+    original_argv = sys.argv
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            with app_module.app.test_client() as client:
+                assert len(json.loads(client.get('/api/shelters').data)) == 3
+
+                path = os.path.join(directory, 'registry.geojson')
+                with open(path, 'w') as f:
+                    f.write(_geojson(20))
+                sys.argv = ['import_shelters.py', path, '--db', app_module.DATABASE]
+                assert import_shelters.main() == 0
+                assert len(json.loads(client.get('/api/shelters').data)) == 23
+            print("✓ Imported shelters served without a restart")
+        finally:
+            sys.argv = original_argv
+            app_module.DATABASE = original
+            import_shelters._invalidate_local_caches()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Shelter Importer")
+    print("=" * 50)
+
+    tests = [
+        ("Normalization", test_normalize),
+        ("GeoJSON Streaming", test_geojson_stream),
+        ("Upserts", test_upsert),
+        ("CLI and API", test_cli_and_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test script to verify complaint locations and the incident heatmap aggregate
+"""
+
+import sys
+import os
+import json
+import random
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import incidents
+
+
+def test_parse_location():
+    """Test the accepted location formats"""
+    assert incidents.parse_location({}) == ('', None, None)
+    assert incidents.parse_location({'location': 'Sector 5, Noida'}) == ('Sector 5, Noida', None, None)
+    assert incidents.parse_location({'location': '28.61,77.2'}) == ('28.61,77.2', 28.61, 77.2)
+    assert incidents.parse_location({'latitude': '28.6', 'longitude': 77.2}) == ('', 28.6, 77.2)
+    assert incidents.parse_location({'location': {'latitude': 1, 'longitude': 2, 'address': 'x'}}) == ('x', 1.0, 2.0)
+    try:
+        incidents.parse_location({'latitude': 95, 'longitude': 0})
+        assert False, "out of range coordinates accepted"
+    except ValueError:
+        pass
+    print("✓ Location formats parsed")
+
+
+def test_tile_math():
+    """Test tile lookup, Morton codes and that a tile's cells form one key range"""
+    assert incidents.tile_of(0, 0, 1) == (1, 1)
+    assert incidents.tile_of(28.6139, 77.2090, 10) == (731, 426)
+    rng = random.Random(5)
+    for _ in range(1000):
+        x, y = rng.randrange(2 ** 17), rng.randrange(2 ** 17)
+        assert incidents.deinterleave(incidents.interleave(x, y)) == (x, y)
+    # Every level-10 cell under tile 5/22/13 falls in the tile's code range
+    first = incidents.interleave(22, 13) << 10
+    for cx in range(22 << 5, 23 << 5):
+        for cy in range(13 << 5, 14 << 5):
+            assert first <= incidents.interleave(cx, cy) < first + (1 << 10)
+    print("✓ Tiles and Morton ranges correct")
+
+
+def test_heatmap_api():
+    """Test that complaints with coordinates feed the heatmap tiles"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            with app_module.app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                for i in range(3):
+                    response = client.post('/api/complaints', json={
+                        'title': 'Harassment', 'description': 'x', 'category': 'harassment',
+                        'latitude': 28.6139, 'longitude': 77.2090})
+                    assert json.loads(response.data)['success']
+                client.post('/api/complaints', json={'title': 'Dark street', 'description': 'x',
+                                                     'category': 'safety', 'location': '28.6139,77.2090'})
+                client.post('/api/complaints', json={'title': 'Mumbai', 'description': 'x',
+                                                     'category': 'safety', 'latitude': 19.07, 'longitude': 72.87})
+                untagged = client.post('/api/complaints', json={'title': 'Mumbai', 'description': 'x',
+                                                                'category': None, 'latitude': 19.07, 'longitude': 72.87})
+                assert untagged.status_code == 200
+                client.post('/api/complaints', json={'title': 'No coordinates', 'description': 'x',
+                                                     'location': 'Somewhere'})
+                bad = client.post('/api/complaints', json={'title': 't', 'description': 'x', 'latitude': 200,
+                                                           'longitude': 0})
+                assert bad.status_code == 400
+
+                x, y = incidents.tile_of(28.6139, 77.2090, 10)
+                body = json.loads(client.get(f'/api/incidents/heatmap/10/{x}/{y}').data)
+                assert len(body['points']) == 1 and body['points'][0][2] == 4
+                lat, lon = body['points'][0][:2]
+                assert abs(lat - 28.6139) < 0.01 and abs(lon - 77.2090) < 0.01
+                body = json.loads(client.get(f'/api/incidents/heatmap/10/{x}/{y}?category=safety').data)
+                assert body['points'][0][2] == 1
+
+                world = json.loads(client.get('/api/incidents/heatmap/0/0/0').data)
+                assert sorted(p[2] for p in world['points']) == [2, 4]
+                x, y = incidents.tile_of(19.07, 72.87, 10)
+                body = json.loads(client.get(f'/api/incidents/heatmap/10/{x}/{y}?category=general').data)
+                assert body['points'][0][2] == 1
+                deep_x, deep_y = incidents.tile_of(28.6139, 77.2090, 19)
+                deep = json.loads(client.get(f'/api/incidents/heatmap/19/{deep_x}/{deep_y}').data)
+                assert deep['points'][0][2] == 4
+                assert client.get('/api/incidents/heatmap/2/4/0').status_code == 400
+
+            conn = app_module.get_db_connection()
+            assert conn.execute('SELECT location FROM complaints WHERE title = ?', ('No coordinates',)).fetchone()[0] == 'Somewhere'
+            before = sorted(conn.execute('SELECT * FROM incident_cells').fetchall())
+            incidents.rebuild(conn)
+            assert sorted(conn.execute('SELECT * FROM incident_cells').fetchall()) == before
+            conn.close()
+            print("✓ Heatmap tiles served from the aggregate")
+        finally:
+            app_module.DATABASE = original
+
+
+def main():
+    """Run all tests"""
+    print("Testing Incident Heatmap")
+    print("=" * 50)
+
+    tests = [
+        ("Location Parsing", test_parse_location),
+        ("Tile Math", test_tile_math),
+        ("Heatmap API", test_heatmap_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Test script to verify live location share links
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import live_share
+
+NOW = 1717279200.0
+
+
+class Clock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_trail_ring_buffer():
+    """Test that a trail keeps only its newest points, oldest first"""
+    trail = live_share.Trail(size=4)
+    assert trail.points() == [] and trail.last_time() is None
+    for i in range(10):
+        trail.append(28.6 + i, 77.2, 100 + i)
+    assert len(trail) == 4
+    assert [p[2] for p in trail.points()] == [106, 107, 108, 109]
+    assert trail.points()[0][0] == 34.6
+    assert [p[2] for p in trail.points(since=107)] == [108, 109]
+    assert trail.last_time() == 109
+
+    # A repeat of a point in the same second is merged, a different place in that second is kept
+    assert trail.merge(37.6 + 1e-5, 77.2, 109)
+    assert not trail.merge(37.6, 77.2, 110) and not trail.merge(38.6, 77.2, 109)
+    trail.append(38.6, 77.2, 109)
+    assert trail.merge(37.6, 77.2, 109)
+    assert trail.points()[-2:] == [[37.6, 77.2, 109], [38.6, 77.2, 109]]
+    print("✓ Ring buffer keeps the newest points")
+
+
+def test_share_lifecycle():
+    """Test creating, viewing, expiring and revoking shares in memory and across workers"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            connect = lambda: sqlite3.connect(app_module.DATABASE)
+            conn = connect()
+            conn.executemany("INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) "
+                             "VALUES (?, ?, ?, datetime(?, 'unixepoch'))",
+                             [(1, 28.60 + i * 0.001, 77.2, NOW - 100 + i * 10) for i in range(5)])
+            conn.commit()
+
+            clock = Clock()
+            shares = live_share.LiveShares(clock=clock, trail_points=8)
+            shares.sync(connect)
+            token, share = shares.create(conn, 1, minutes=30)
+            conn.commit()
+            # Existing pings seed the trail
+            assert len(shares.view(token)['points']) == 5
+            assert not shares.record(2, 10.0, 10.0)
+            clock.now += 5
+            assert shares.record(1, 28.7, 77.3)
+            assert not shares.record(1, 28.7, 77.3, seen=NOW)
+            assert shares.record(1, 28.7, 77.3)
+            assert len(shares.view(token)['points']) == 6
+            assert shares.view(token)['points'][-1] == [28.7, 77.3, int(NOW + 5)]
+            # Another place in the same second is a new point
+            assert shares.record(1, 28.71, 77.3)
+            assert len(shares.view(token)['points']) == 7
+            assert shares.view('not-a-token') is None
+
+            # A second worker learns of the share and of pings stored elsewhere
+            other = live_share.LiveShares(clock=clock, trail_points=8)
+            other.sync(connect)
+            conn.execute("INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) "
+                         "VALUES (1, 28.8, 77.4, datetime(?, 'unixepoch'))", (NOW + 20,))
+            conn.commit()
+            other.sync(connect, force=True)
+            assert other.view(token)['points'][-1] == [28.8, 77.4, int(NOW + 20)]
+            # Only the stored pings: the first worker's local point never reached this one
+            assert len(other.view(token)['points']) == 6
+
+            # Revoking frees the trail everywhere
+            assert shares.revoke(conn, 1, share['id'])
+            conn.commit()
+            assert not shares.revoke(conn, 1, share['id'])
+            assert shares.view(token) is None and not shares.sharing(1)
+            other.sync(connect, force=True)
+            assert other.view(token) is None and not other.sharing(1)
+
+            # Expiry
+            token, _ = shares.create(conn, 1, minutes=1)
+            conn.commit()
+            clock.now += 61
+            assert shares.view(token) is None
+            shares.sync(connect, force=True)
+            assert not shares.sharing(1) and shares.memory_bytes() == 0
+            conn.close()
+            print("✓ Shares created, synced, revoked and expired")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_live_share_api():
+    """Test the share endpoints and the public view"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            live_share.shares = live_share.LiveShares()
+            with app_module.app.test_client() as client:
+                assert client.post('/api/live-share', json={}).status_code == 401
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                assert client.post('/api/live-share', json={'minutes': 0}).status_code == 400
+                created = json.loads(client.post('/api/live-share', json={'minutes': 15}).data)
+                assert created['success'] and created['url'].endswith(f"/api/live-share/view/{created['token']}")
+                for i in range(3):
+                    client.post('/api/location', json={'latitude': 28.61 + i, 'longitude': 77.21})
+                assert [s['id'] for s in json.loads(client.get('/api/live-share').data)] == [created['id']]
+
+            # Viewers need no session and only get the trail
+            with app_module.app.test_client() as viewer:
+                response = viewer.get(f"/api/live-share/view/{created['token']}")
+                assert response.status_code == 200 and response.headers['Cache-Control'] == 'no-store'
+                points = json.loads(response.data)['points']
+                assert len(points) >= 1 and points[-1][0] == 28.61 + 2
+                assert viewer.get(f"/api/live-share/view/{created['token']}?since=north").status_code == 400
+                assert viewer.get('/api/live-share/view/guess').status_code == 404
+
+            with app_module.app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 2
+                assert client.delete(f"/api/live-share/{created['id']}").status_code == 404
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                assert client.delete(f"/api/live-share/{created['id']}").status_code == 200
+                assert client.get(f"/api/live-share/view/{created['token']}").status_code == 404
+            print("✓ Share links served to anonymous viewers")
+        finally:
+            app_module.DATABASE = original
+            live_share.shares = live_share.LiveShares()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Live Share")
+    print("=" * 50)
+
+    tests = [
+        ("Trail Ring Buffer", test_trail_ring_buffer),
+        ("Share Lifecycle", test_share_lifecycle),
+        ("Live Share API", test_live_share_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
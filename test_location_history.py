@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the location history API and its downsampling
+"""
+
+import sys
+import os
+import json
+import math
+import tempfile
+from datetime import datetime, timedelta
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import location_history
+
+START = datetime(2024, 3, 1)
+
+
+def track_rows(user_id, count, step_seconds=5):
+    """A user driving a slow loop, one ping every step_seconds"""
+    rows = []
+    for i in range(count):
+        angle = i / 2000
+        rows.append((user_id, 28.6 + 0.05 * math.sin(angle), 77.2 + 0.05 * math.cos(angle),
+                     (START + timedelta(seconds=i * step_seconds)).strftime('%Y-%m-%d %H:%M:%S')))
+    return rows
+
+
+def test_simplify_budget():
+    """Test that Douglas-Peucker keeps the endpoints, corners and the budget"""
+    line = [(0.0, x / 100, str(x)) for x in range(101)] + [(y / 100, 1.0, str(100 + y)) for y in range(1, 101)]
+    kept = location_history.simplify(line, 3)
+    assert kept == [line[0], line[100], line[-1]]
+    assert len(location_history.simplify(line, 50)) == 50
+    assert location_history.simplify(line[:2], 10) == line[:2]
+    print("✓ Douglas-Peucker keeps corners within budget")
+
+
+def test_grid_bucket():
+    """Test that grid bucketing collapses pings within a cell and keeps the last point"""
+    points = [(28.6, 77.2, 't%d' % i) for i in range(10)] + [(28.61, 77.2, 'moved'), (28.61, 77.2, 'last')]
+    bucketed = list(location_history.grid_bucket(points, 100))
+    assert [p[2] for p in bucketed] == ['t0', 'moved', 'last']
+    print("✓ Grid bucketing keeps one point per cell run")
+
+
+def test_history_api():
+    """Test filters, downsampling and the covering index through the API"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            conn = app_module.get_db_connection()
+            conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) VALUES (?, ?, ?, ?)',
+                             track_rows(1, 30000) + track_rows(2, 100))
+            conn.commit()
+            plan = ' '.join(row[-1] for row in conn.execute('''
+                EXPLAIN QUERY PLAN SELECT latitude, longitude, timestamp FROM location_tracking
+                WHERE user_id = 1 AND timestamp >= '2024-03-01' ORDER BY timestamp
+            '''))
+            assert 'COVERING INDEX idx_location_user_time' in plan, plan
+            conn.close()
+
+            with app_module.app.test_client() as client:
+                assert client.get('/api/location/history').status_code == 401
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+
+                day = {'start': '2024-03-01T00:00:00', 'end': '2024-03-03T00:00:00'}
+                body = json.loads(client.get('/api/location/history', query_string={**day, 'max_points': 1000}).data)
+                assert body['success'] and body['count'] == len(body['points'])
+                assert 900 <= body['count'] <= 1100
+                assert body['points'][0][2] == '2024-03-01 00:00:00'
+                assert body['points'][-1][2] == track_rows(1, 30000)[-1][3]
+
+                coarse = json.loads(client.get('/api/location/history', query_string={**day, 'zoom': 10}).data)
+                fine = json.loads(client.get('/api/location/history', query_string={**day, 'zoom': 16}).data)
+                assert 0 < coarse['count'] < fine['count'] < 30000
+
+                hour = json.loads(client.get('/api/location/history', query_string={
+                    'start': '2024-03-01T00:00:00', 'end': '2024-03-01T01:00:00'}).data)
+                assert hour['count'] == 721
+
+                boxed = json.loads(client.get('/api/location/history', query_string={
+                    **day, 'bbox': '28.6,77.2,28.7,77.3', 'max_points': 20000}).data)
+                assert 0 < boxed['count'] < 30000
+                assert all(p[0] >= 28.6 and p[1] >= 77.2 for p in boxed['points'])
+
+                bad = client.get('/api/location/history', query_string={'bbox': '1,2,3'})
+                assert bad.status_code == 400
+                assert client.get('/api/location/history', query_string={'zoom': 40}).status_code == 400
+                # Out of range for the platform's time_t
+                for value in ('1e20', 'inf', '-1e12'):
+                    assert client.get('/api/location/history', query_string={'start': value}).status_code == 400
+            print("✓ History API filters and downsamples from the covering index")
+        finally:
+            app_module.DATABASE = original
+
+
+def main():
+    """Run all tests"""
+    print("Testing Location History")
+    print("=" * 50)
+
+    tests = [
+        ("Douglas-Peucker", test_simplify_budget),
+        ("Grid Bucketing", test_grid_bucket),
+        ("History API", test_history_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
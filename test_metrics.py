@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Test script to verify request metrics and the /metrics endpoint
+"""
+
+import sys
+import os
+import tempfile
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+
+
+def test_route_metrics():
+    """Test that requests show up as latency, status and size series"""
+    from app import app
+    saved = app.config['METRICS_TOKEN']
+    try:
+        app.config['METRICS_TOKEN'] = 'scrape-secret'
+        with app.test_client() as client:
+            client.post('/api/siren')
+            response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    finally:
+        app.config['METRICS_TOKEN'] = saved
+    text = response.get_data(as_text=True)
+
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_bucket{endpoint="activate_siren",method="POST",le="+Inf"}' in text
+    assert 'http_responses_total{endpoint="activate_siren",method="POST",status="401"}' in text
+    assert 'http_response_size_bytes_count{endpoint="activate_siren",method="POST"}' in text
+    # The scrape itself is the only request still in flight
+    assert 'http_requests_in_flight 1' in text
+    print("✓ Route metrics recorded and exported")
+
+
+def test_per_thread_aggregation():
+    """Test that counters recorded on many threads are summed on scrape"""
+    before = metrics.snapshot()['counters'].get(('test_events_total', (('kind', 'a'),)), 0)
+
+    def worker():
+        for _ in range(1000):
+            metrics.inc('test_events_total', kind='a')
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    after = metrics.snapshot()['counters'][('test_events_total', (('kind', 'a'),))]
+    assert after - before == 8000
+
+    # A thread per request, as the dev server does: finished threads are folded away
+    for _ in range(200):
+        thread = threading.Thread(target=metrics.inc, args=('test_events_total',), kwargs={'kind': 'a'})
+        thread.start()
+        thread.join()
+    assert metrics.snapshot()['counters'][('test_events_total', (('kind', 'a'),))] - before == 8200
+    assert len(metrics._thread_stats) < 20
+    print("✓ Per-thread counters merged correctly")
+
+
+def test_scrape_access():
+    """Test that /metrics answers the token and staff, loopback only when allowed, and nobody else"""
+    from app import app
+    saved = app.config['METRICS_TOKEN'], app.config['STAFF_USER_IDS'], app.config['METRICS_ALLOW_LOCAL']
+    remote = {'REMOTE_ADDR': '203.0.113.5'}
+    try:
+        app.config['METRICS_TOKEN'] = 'scrape-secret'
+        app.config['STAFF_USER_IDS'] = {7}
+        with app.test_client() as client:
+            # A reverse proxy on the same host makes every request local
+            assert client.get('/metrics').status_code == 403
+            app.config['METRICS_ALLOW_LOCAL'] = True
+            assert client.get('/metrics').status_code == 200
+            assert client.get('/metrics', environ_base=remote).status_code == 403
+            assert client.get('/metrics', environ_base=remote,
+                              headers={'Authorization': 'Bearer wrong'}).status_code == 403
+            assert client.get('/metrics', environ_base=remote,
+                              headers={'Authorization': 'Bearer scrape-secret'}).status_code == 200
+            with client.session_transaction() as sess:
+                sess['user_id'] = 7
+            assert client.get('/metrics', environ_base=remote).status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'], app.config['STAFF_USER_IDS'], app.config['METRICS_ALLOW_LOCAL'] = saved
+    print("✓ Scrapes restricted")
+
+
+def test_multiprocess_merge():
+    """Test that worker dumps are merged and dead workers drop out of the gauge"""
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['METRICS_MULTIPROC_DIR'] = directory
+        try:
+            dead_pid = 2 ** 22 + 7
+            other = {'latency': {('update_location', 'POST'): [1] + [0] * len(metrics.LATENCY_BUCKETS) + [0.0005]},
+                     'phases': {}, 'sizes': {}, 'counters': {},
+                     'responses': {('update_location', 'POST', '200'): 5}, 'in_flight': 3}
+            metrics._dump(other, metrics._worker_file(directory, dead_pid))
+
+            snap = metrics.collect()
+            assert snap['responses'][('update_location', 'POST', '200')] >= 5
+            assert snap['latency'][('update_location', 'POST')][0] >= 1
+            assert snap['in_flight'] == metrics.snapshot()['in_flight']
+            assert os.path.exists(metrics._worker_file(directory, os.getpid()))
+        finally:
+            del os.environ['METRICS_MULTIPROC_DIR']
+    print("✓ Multiprocess metrics merged")
+
+
+def main():
+    """Run all tests"""
+    print("Testing Request Metrics")
+    print("=" * 50)
+
+    tests = [
+        ("Route Metrics", test_route_metrics),
+        ("Per-thread Aggregation", test_per_thread_aggregation),
+        ("Multiprocess Merge", test_multiprocess_merge),
+        ("Scrape Access", test_scrape_access),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test script to verify merging of repeated location pings
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+import ping_filter
+
+# About a meter of latitude
+METER = 1 / 111_195
+
+
+def test_merge_and_flush():
+    """Test which pings are merged, the dwell times written and the anchors forgotten"""
+    now = [1000.0]
+    pings = ping_filter.PingFilter(clock=lambda: now[0])
+    ping_ids = iter(range(1, 100))
+
+    def post(user_id, latitude, longitude=77.2, **kwargs):
+        if not pings.offer(user_id, latitude, longitude, **kwargs):
+            return None
+        ping_id = next(ping_ids)
+        pings.stored(user_id, latitude, longitude, ping_id)
+        return ping_id
+
+    home = 28.6
+    first = post(1, home)
+    for step, jitter in enumerate((3, -4, 2, 6, -7), 1):
+        now[0] = 1000 + step * 10
+        assert post(1, home + jitter * METER) is None, jitter
+    # Measured from the anchor: a slow drift is stored once it adds up
+    now[0] = 1060
+    drift = post(1, home + 12 * METER)
+    assert drift and drift != first
+    # Standing still for longer than MAX_DWELL writes a new row anyway
+    now[0] = 1060 + ping_filter.MAX_DWELL
+    again = post(1, home + 12 * METER)
+    assert again and again != drift
+    # Other users, and a filter turned off, are stored
+    assert post(2, home) and post(2, home, distance_m=0)
+
+    written = []
+    assert pings.flush(written.extend) == 1 and written == [(1, first, 50)]
+    assert pings.flush(written.extend) == 0
+
+    # A failed write is retried by the next flush, unless a longer dwell came in
+    now[0] += 30
+    assert post(1, home + 12 * METER) is None
+
+    def broken(updates):
+        raise sqlite3.OperationalError('database is locked')
+    try:
+        pings.flush(broken)
+        assert False, 'write error swallowed'
+    except sqlite3.OperationalError:
+        pass
+    now[0] += 30
+    assert post(1, home + 12 * METER) is None
+    pings.flush(written.extend)
+    assert written[-1] == (1, again, 60)
+
+    now[0] += ping_filter.IDLE_AFTER + 1
+    pings.flush(written.extend)
+    assert len(pings) == 0
+    print("✓ Stationary pings merged, dwell times flushed")
+
+
+def _counter(snap, result):
+    return snap['counters'].get(('location_pings_total', (('result', result),)), 0)
+
+
+def test_location_api():
+    """Test the location route storing one row for a phone standing still"""
+    import app as app_module
+    import export
+    saved = app_module.DATABASE, app_module.app.config['STAFF_USER_IDS'], ping_filter.pings
+    now = [1_700_000_000.0]
+    before = metrics.snapshot()
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            ping_filter.pings = ping_filter.PingFilter(clock=lambda: now[0])
+            with app_module.app.test_client() as client:
+                client.post('/register', json={'username': 'sitter', 'email': 'sitter@example.com',
+                                               'password': 'password123'})
+                client.post('/login', json={'username': 'sitter', 'password': 'password123'})
+                with client.session_transaction() as sess:
+                    user_id = sess['user_id']
+                app_module.app.config['STAFF_USER_IDS'] = {user_id}
+
+                for second in range(0, 100, 5):
+                    now[0] = 1_700_000_000 + second
+                    assert client.post('/api/location', json={'latitude': 28.6 + (second % 3) * METER,
+                                                               'longitude': 77.2}).status_code == 200
+                assert client.post('/api/location', json={'latitude': 28.7, 'longitude': 77.2}).status_code == 200
+                app_module.flush_dwell_times()
+
+                conn = sqlite3.connect(app_module.DATABASE)
+                rows = conn.execute('SELECT latitude, dwell_seconds FROM location_tracking ORDER BY id').fetchall()
+                conn.close()
+                assert rows == [(28.6, 95), (28.7, 0)]
+                exported = [json.loads(line) for line in b''.join(export.export(
+                    app_module.get_db_connection, user_id, 'locations')).splitlines()]
+                assert [r['dwell_seconds'] for r in exported] == [95, 0]
+
+                after = metrics.snapshot()
+                assert _counter(after, 'stored') - _counter(before, 'stored') == 2
+                assert _counter(after, 'merged') - _counter(before, 'merged') == 19
+                stats = json.loads(client.get('/api/admin/location-pings').data)
+                assert stats['merged'] >= 19 and 0 < stats['reduction'] < 1
+            print(f"✓ 21 pings stored as {len(rows)} rows")
+        finally:
+            app_module.DATABASE, app_module.app.config['STAFF_USER_IDS'], ping_filter.pings = saved
+
+
+def main():
+    """Run all tests"""
+    print("Testing Location Ping Filter")
+    print("=" * 50)
+
+    tests = [
+        ("Merge And Flush", test_merge_and_flush),
+        ("Location API", test_location_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script to verify SQL query profiling
+"""
+
+import sys
+import os
+import logging
+import tempfile
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as app_module
+import query_profiler
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def _with_profiled_db(test):
+    """Run a test against a fresh, profiled database"""
+    def wrapper():
+        app = app_module.app
+        original = app_module.DATABASE
+        with tempfile.TemporaryDirectory() as directory:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            app.config['SQL_PROFILE'] = True
+            try:
+                test(app)
+            finally:
+                app.config['SQL_PROFILE'] = False
+                app_module.DATABASE = original
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+@_with_profiled_db
+def test_stats_header(app):
+    """Test that responses report their query count and DB time"""
+    with app.test_client() as client:
+        response = client.get('/api/tips')
+    header = response.headers.get('X-DB-Stats', '')
+    assert header.startswith('queries=')
+    assert int(header.split(';')[0].split('=')[1]) >= 1
+    assert 'time_ms=' in header
+    print(f"✓ X-DB-Stats header present: {header}")
+
+
+@_with_profiled_db
+def test_slow_query_log(app):
+    """Test that slow statements are logged with their query plan"""
+    capture = _Capture()
+    query_profiler.logger.addHandler(capture)
+    threshold = query_profiler._settings['slow_query_ms']
+    query_profiler._settings['slow_query_ms'] = 0
+    try:
+        with app.test_client() as client:
+            client.get('/api/shelters')
+    finally:
+        query_profiler._settings['slow_query_ms'] = threshold
+        query_profiler.logger.removeHandler(capture)
+    slow = [m for m in capture.messages if m.startswith('slow query')]
+    assert slow, "no slow query logged"
+    assert any('SCAN' in m for m in slow)
+    print("✓ Slow queries logged with EXPLAIN QUERY PLAN")
+
+
+@_with_profiled_db
+def test_slow_fetch_log(app):
+    """Test that a statement fast to execute but slow to fetch is logged once"""
+    capture = _Capture()
+    query_profiler.logger.addHandler(capture)
+    threshold = query_profiler._settings['slow_query_ms']
+    query_profiler._settings['slow_query_ms'] = 30
+    try:
+        with app.test_request_context('/'):
+            conn = app_module.get_db_connection()
+            conn.create_function('crawl', 1, lambda value: time.sleep(0.01) or value)
+            cursor = conn.execute('SELECT crawl(id) FROM emergency_tips')
+            rows = [row for row in cursor]
+            conn.close()
+    finally:
+        query_profiler._settings['slow_query_ms'] = threshold
+        query_profiler.logger.removeHandler(capture)
+    slow = [m for m in capture.messages if m.startswith('slow query')]
+    assert len(rows) >= 4 and len(slow) == 1, slow
+    assert 'crawl' in slow[0] and 'SCAN' in slow[0]
+    print("✓ Slow fetches logged with EXPLAIN QUERY PLAN")
+
+
+@_with_profiled_db
+def test_streamed_response(app):
+    """Test that streamed responses don't get a header counting only part of their queries"""
+    with app.test_client() as client:
+        client.post('/register', json={'username': 'walker', 'email': 'walker@example.com',
+                                       'password': 'password123'})
+        client.post('/login', json={'username': 'walker', 'password': 'password123'})
+        response = client.get('/api/location/history')
+    assert response.status_code == 200 and 'X-DB-Stats' not in response.headers
+    print("✓ Streamed responses carry no X-DB-Stats header")
+
+
+@_with_profiled_db
+def test_repeated_statement_warning(app):
+    """Test that a statement repeated in one request is flagged as N+1"""
+    capture = _Capture()
+    query_profiler.logger.addHandler(capture)
+    try:
+        with app.test_request_context('/'):
+            conn = app_module.get_db_connection()
+            for tip_id in range(1, 13):
+                conn.execute('SELECT title FROM emergency_tips WHERE id = ?', (tip_id,)).fetchone()
+            conn.close()
+            stats = query_profiler.current_stats()
+            assert stats.count >= 12
+            response = query_profiler._after_request(app.response_class())
+    finally:
+        query_profiler.logger.removeHandler(capture)
+    assert 'queries=' in response.headers['X-DB-Stats']
+    assert any(m.startswith('possible N+1: 12 executions') for m in capture.messages)
+    print("✓ Repeated statements reported as possible N+1")
+
+
+def main():
+    """Run all tests"""
+    print("Testing SQL Query Profiler")
+    print("=" * 50)
+
+    tests = [
+        ("Stats Header", test_stats_header),
+        ("Slow Query Log", test_slow_query_log),
+        ("Slow Fetch Log", test_slow_fetch_log),
+        ("Streamed Response", test_streamed_response),
+        ("Repeated Statement Warning", test_repeated_statement_warning),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the SQLite and memory repositories behave the same
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+import threading
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datasets
+import db_location
+import repositories
+import responses
+
+START, END = '2000-01-01 00:00:00', '2100-01-01 00:00:00'
+
+
+def _sqlite_repos(directory):
+    """SQLite repositories on a fresh app database with 2 shards"""
+    import app as app_module
+    saved = app_module.DATABASE, app_module.app.config['SHARD_COUNT']
+    try:
+        app_module.DATABASE = os.path.join(directory, 'test.db')
+        app_module.app.config['SHARD_COUNT'] = 2
+        app_module.init_db()
+        conn = sqlite3.connect(app_module.DATABASE)
+        conn.execute('DELETE FROM safe_shelters')
+        conn.execute('DELETE FROM emergency_tips')
+        conn.commit()
+        conn.close()
+        return app_module.get_repos()
+    finally:
+        app_module.DATABASE, app_module.app.config['SHARD_COUNT'] = saved
+
+
+def _exercise(repos):
+    """The same calls on any backend; returns everything read back"""
+    alice = repos.users.add('alice', 'alice@example.com', password_hash='h1')
+    bob = repos.users.add('bob', 'bob@example.com', password_hash='h2', pattern_hash='p1')
+    try:
+        repos.users.add('alice', 'other@example.com')
+        assert False, 'duplicate username accepted'
+    except repositories.DuplicateError:
+        pass
+    try:
+        repos.users.add('carol', 'bob@example.com')
+        assert False, 'duplicate email accepted'
+    except repositories.DuplicateError:
+        pass
+    repos.users.set_responder_opt_in(alice, True)
+
+    phases = []
+    for i in range(50):
+        repos.locations.add(alice, 28.6 + i * 0.0001, 77.2, phase=lambda name: _Phase(phases, name))
+    repos.locations.add(bob, 19.07, 72.87)
+    repos.complaints.add(alice, 'Broken light', 'Dark lane', 'safety', latitude=28.6139, longitude=77.2090)
+    repos.complaints.add(alice, 'Followed', 'Near the stop', 'harassment')
+
+    def points(user_id, **kwargs):
+        return [(lat, lon) for lat, lon, _ in repos.locations.history(user_id, START, END, **kwargs)]
+
+    return {
+        'login': [repos.users.find_by_login(login) and repos.users.find_by_login(login)['id']
+                  for login in ('alice', 'bob@example.com', 'nobody')],
+        'hashes': (repos.users.find_by_login('alice')['password_hash'],
+                   repos.users.find_by_login('bob')['pattern_hash']),
+        'phases': sorted(set(phases)),
+        'track': points(alice),
+        'bob': points(bob),
+        'bbox': points(alice, bbox=(28.6, 77.0, 28.60105, 77.5)),
+        'simplified': len(points(alice, max_points=10)),
+        'zoomed': len(points(alice, zoom=3)),
+        'empty': points(12345),
+        'latest': [repos.locations.latest(user_id, since) and tuple(repos.locations.latest(user_id, since))
+                   for user_id, since in ((alice, START), (bob, START), (alice, END), (12345, START))],
+        'complaints': [(c['title'], c['category'], c['status']) for c in repos.complaints.for_user(alice)],
+        'none': repos.complaints.for_user(bob),
+    }
+
+
+class _Phase:
+    def __init__(self, phases, name):
+        phases.append(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_backends_agree():
+    """Test that both backends give the same answers"""
+    with tempfile.TemporaryDirectory() as directory:
+        sqlite_result = _exercise(_sqlite_repos(directory))
+    memory_result = _exercise(repositories.memory_repositories())
+
+    assert sqlite_result['login'] == [1, 2, None]
+    assert sqlite_result['hashes'] == ('h1', 'p1')
+    assert len(sqlite_result['track']) == 50 and sqlite_result['bob'] == [(19.07, 72.87)]
+    assert len(sqlite_result['bbox']) == 11
+    assert sqlite_result['latest'] == [(28.6 + 49 * 0.0001, 77.2), (19.07, 72.87), None, None]
+    assert 2 <= sqlite_result['simplified'] <= 12 and sqlite_result['zoomed'] <= 2
+    # Both filed in the same second: either order is newest first
+    assert sorted(sqlite_result['complaints']) == [('Broken light', 'safety', 'pending'),
+                                                   ('Followed', 'harassment', 'pending')]
+    assert sqlite_result['phases'] == ['commit', 'connect', 'insert']
+    assert memory_result['phases'] == ['insert']
+    for key in sqlite_result:
+        if key not in ('complaints', 'phases'):
+            assert sqlite_result[key] == memory_result[key], (key, sqlite_result[key], memory_result[key])
+    assert memory_result['complaints'][0][0] == 'Followed'
+    print("✓ SQLite and memory repositories agree")
+
+
+def test_thread_connections():
+    """Test that SQLite repositories reuse one connection per thread"""
+    opened = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'test.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE emergency_tips (id INTEGER PRIMARY KEY, title TEXT, content TEXT, '
+                     'category TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)')
+        conn.execute("INSERT INTO emergency_tips (title, content, category) VALUES ('Tip', 'Stay lit', 'night')")
+        conn.commit()
+        conn.close()
+
+        def connect():
+            conn = sqlite3.connect(path)
+            opened.append(conn)
+            return conn
+
+        tips = repositories.SqliteTipRepo(connect)
+        for _ in range(10):
+            assert [t['title'] for t in tips.all()] == ['Tip']
+        thread = threading.Thread(target=tips.all)
+        thread.start()
+        thread.join()
+        assert len(opened) == 2
+
+        # A failed write is rolled back, not left open on the shared connection
+        users = repositories.SqliteUserRepo(connect)
+        try:
+            users.add('alice', 'alice@example.com')
+            assert False, 'insert into a missing table succeeded'
+        except sqlite3.OperationalError:
+            pass
+        assert not opened[-1].in_transaction
+        print("✓ One connection per thread, rolled back on errors")
+
+
+def test_app_on_memory_repositories():
+    """Test the routes with every table in memory"""
+    import app as app_module
+    repos = repositories.memory_repositories()
+    repos.shelters.add({'name': 'Central Shelter', 'latitude': 28.61, 'longitude': 77.21, 'capacity': 40})
+    repos.tips.add({'title': 'Share your route', 'content': 'Tell someone', 'category': 'travel'})
+    app_module.app.config['REPOSITORIES'] = repos
+    responses.invalidate()
+    datasets.forget()
+    # Whatever ran before, the app's own tables start out empty
+    saved = app_module.DATABASE
+    app_module.DATABASE = db_location.memory('test_app_on_memory_repositories')
+    try:
+        with app_module.app.test_client() as client:
+            client.post('/register', json={'username': 'memuser', 'email': 'mem@example.com',
+                                           'password': 'password123'})
+            duplicate = json.loads(client.post('/register', json={'username': 'memuser', 'email': 'x@example.com',
+                                                                  'password': 'password123'}).data)
+            assert not duplicate['success']
+            assert not json.loads(client.post('/login', json={'username': 'memuser',
+                                                              'password': 'wrong'}).data)['success']
+            assert json.loads(client.post('/login', json={'username': 'mem@example.com',
+                                                          'password': 'password123'}).data)['success']
+            client.post('/api/complaints', json={'title': 'Broken light', 'description': 'Dark lane',
+                                                 'category': 'safety'})
+            history = json.loads(client.get('/api/complaints/history').data)
+            assert [c['title'] for c in history] == ['Broken light']
+            shelters = json.loads(client.get('/api/shelters').data)
+            assert [s['name'] for s in shelters] == ['Central Shelter']
+            repos.shelters.add({'name': 'North Shelter', 'latitude': 28.70, 'longitude': 77.10, 'capacity': 25})
+            shelters = json.loads(client.get('/api/shelters').data)
+            assert [s['name'] for s in shelters] == ['Central Shelter', 'North Shelter']
+            tips = json.loads(client.get('/api/tips').data)
+            assert [t['title'] for t in tips] == ['Share your route']
+        print("✓ Routes run on memory repositories")
+    finally:
+        db_location.release(app_module.DATABASE)
+        app_module.DATABASE = saved
+        app_module.app.config.pop('REPOSITORIES', None)
+        responses.invalidate()
+        datasets.forget()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Repositories")
+    print("=" * 50)
+
+    tests = [
+        ("Backends Agree", test_backends_agree),
+        ("Thread Connections", test_thread_connections),
+        ("App On Memory Repositories", test_app_on_memory_repositories),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the nearby responder index
+"""
+
+import sys
+import os
+import json
+import random
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import geo
+import responders
+
+NOW = 1717279200.0
+
+
+class Clock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _filled_index(count, clock):
+    index = responders.ResponderIndex(clock=clock)
+    rng = random.Random(4)
+    positions = {}
+    for user_id in range(1, count + 1):
+        index.set_opt_in(user_id, True)
+        lat, lon = 28.4 + rng.random() * 0.4, 76.9 + rng.random() * 0.5
+        index.update(user_id, lat, lon)
+        positions[user_id] = (lat, lon)
+    return index, positions
+
+
+def test_nearest_matches_brute_force():
+    """Test k-nearest results against a full scan"""
+    clock = Clock()
+    index, positions = _filled_index(5000, clock)
+    rng = random.Random(5)
+    for _ in range(50):
+        lat, lon = 28.4 + rng.random() * 0.4, 76.9 + rng.random() * 0.5
+        found = index.nearest(lat, lon, k=5, radius_m=3000, exclude=1)
+        expected = sorted((geo.haversine_m(lat, lon, *p), u) for u, p in positions.items() if u != 1)
+        expected = [u for d, u in expected if d <= 3000][:5]
+        assert [u for u, _, _ in found] == expected
+        for user_id, distance, age in found:
+            assert abs(distance - geo.haversine_m(lat, lon, *positions[user_id])) < 5 and age == 0
+    print("✓ k-nearest matches a full scan")
+
+
+def test_moves_opt_out_and_staleness():
+    """Test that moves, opt-outs and silence take users out of results"""
+    clock = Clock()
+    index = responders.ResponderIndex(clock=clock)
+    assert not index.update(1, 28.61, 77.21)
+    for user_id in (1, 2, 3):
+        index.set_opt_in(user_id, True)
+    index.update(1, 28.610, 77.210)
+    index.update(2, 28.611, 77.211)
+    index.update(3, 28.700, 77.300)
+    assert [u for u, _, _ in index.nearest(28.610, 77.210, k=3)] == [1, 2]
+
+    # Moving across cells keeps the buckets consistent
+    index.update(1, 28.699, 77.299)
+    assert [u for u, _, _ in index.nearest(28.610, 77.210, k=3)] == [2]
+    assert [u for u, _, _ in index.nearest(28.700, 77.300, k=3)] == [3, 1]
+
+    index.set_opt_in(3, False)
+    assert not index.update(3, 28.700, 77.300)
+    assert [u for u, _, _ in index.nearest(28.700, 77.300, k=3)] == [1]
+
+    # User 2 goes quiet
+    clock.now += responders.STALE_SECONDS - 10
+    index.update(1, 28.699, 77.299)
+    clock.now += 20
+    assert index.nearest(28.610, 77.210) == []
+    assert len(index) == 1
+    print("✓ Moves, opt-outs and stale users handled")
+
+
+def test_memory_per_user():
+    """Test that a tracked user costs a few dozen bytes"""
+    index, _ = _filled_index(100000, Clock())
+    per_user = index.memory_bytes() / 100000
+    assert per_user < 40, per_user
+    print(f"✓ {per_user:.1f} bytes per tracked user")
+
+
+def test_sos_api():
+    """Test opt-in, position updates from /api/location and SOS alerts"""
+    import app as app_module
+    from alerts import alert_queue
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            responders.index = responders.ResponderIndex()
+            conn = sqlite3.connect(app_module.DATABASE)
+            conn.executemany('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+                             [(i, f'user{i}', f'user{i}@example.com', 'x') for i in (1, 2, 3, 4)])
+            conn.commit()
+            conn.close()
+            for user_id in (1, 2, 3, 4):
+                alert_queue.drain(user_id)
+
+            with app_module.app.test_client() as client:
+                assert client.post('/api/sos', json={'latitude': 28.61, 'longitude': 77.21}).status_code == 401
+                # Users 2 and 3 volunteer; 4 does not
+                for user_id, lat in ((2, 28.612), (3, 28.640), (4, 28.611)):
+                    with client.session_transaction() as sess:
+                        sess['user_id'] = user_id
+                    if user_id != 4:
+                        assert json.loads(client.post('/api/responders/opt-in', json={}).data)['enabled']
+                    client.post('/api/location', json={'latitude': lat, 'longitude': 77.21})
+
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                result = json.loads(client.post('/api/sos', json={'latitude': 28.61, 'longitude': 77.21}).data)
+                assert result['notified'] == 2
+                assert [r['distance_m'] for r in result['responders']] == [222, 3336]
+                event = alert_queue.drain(2)[0]
+                assert event['kind'] == 'sos_nearby' and event['from_user_id'] == 1
+                assert alert_queue.drain(4) == []
+                assert client.post('/api/sos', json={'latitude': 'here'}).status_code == 400
+
+                # Another worker rebuilds the same view from the database
+                other = responders.ResponderIndex()
+                other.sync(app_module.get_db_connection)
+                assert [u for u, _, _ in other.nearest(28.61, 77.21)] == [2, 3]
+
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 2
+                client.post('/api/responders/opt-in', json={'enabled': False})
+                other.sync(app_module.get_db_connection, force=True)
+                assert [u for u, _, _ in other.nearest(28.61, 77.21)] == [3]
+            print("✓ SOS reaches nearby opted-in responders")
+        finally:
+            app_module.DATABASE = original
+            responders.index = responders.ResponderIndex()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Nearby Responders")
+    print("=" * 50)
+
+    tests = [
+        ("Nearest vs Full Scan", test_nearest_matches_brute_force),
+        ("Moves, Opt-out, Staleness", test_moves_opt_out_and_staleness),
+        ("Memory per User", test_memory_per_user),
+        ("SOS API", test_sos_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
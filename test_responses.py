@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test script to verify JSON serialization, compression and cached payloads
+"""
+
+import sys
+import os
+import gzip
+import json
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import responses
+
+
+def test_cached_list_endpoints():
+    """Test that shelters and tips are served compressed, cacheable and revalidatable"""
+    from app import app, init_db
+    init_db()
+    responses.invalidate()
+    # A fresh database only holds the sample shelters and tips
+    min_size = app.config['COMPRESS_MIN_SIZE']
+    app.config['COMPRESS_MIN_SIZE'] = 256
+    try:
+        with app.test_client() as client:
+            plain = client.get('/api/shelters')
+            compressed = client.get('/api/shelters', headers={'Accept-Encoding': 'gzip'})
+            etag = compressed.headers['ETag']
+            revalidated = client.get('/api/shelters', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+            # The gzip validator doesn't match the identity representation
+            identity = client.get('/api/shelters', headers={'If-None-Match': etag})
+            tips = client.get('/api/tips', headers={'Accept-Encoding': 'gzip'})
+    finally:
+        app.config['COMPRESS_MIN_SIZE'] = min_size
+        responses.invalidate()
+
+    shelters = json.loads(plain.get_data())
+    assert shelters and {'id', 'name', 'latitude', 'longitude', 'capacity', 'rating'} <= set(shelters[0])
+    assert plain.headers['Cache-Control'].startswith('public')
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed.get_data())) == shelters
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert revalidated.status_code == 304
+    assert etag.endswith('-gzip"') and identity.status_code == 200
+    assert identity.headers['ETag'] == plain.headers['ETag'] != etag
+    assert tips.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(tips.get_data()))[0].keys() == {'id', 'title', 'content', 'category'}
+    print("✓ List endpoints cached, compressed and revalidated")
+
+
+def test_cache_invalidation():
+    """Test that invalidate() forces a rebuild"""
+    calls = []
+
+    def build():
+        calls.append(1)
+        return responses.dumps({'n': len(calls)})
+
+    responses.invalidate('unit')
+    first = responses.cached_payload('unit', build)
+    assert responses.cached_payload('unit', build) is first
+    responses.invalidate('unit')
+    assert responses.cached_payload('unit', build).body != first.body
+    assert len(calls) == 2
+    print("✓ Cached payloads invalidated")
+
+
+def test_preflight_max_age():
+    """Test that CORS preflights can be cached by the browser"""
+    from app import app
+    with app.test_client() as client:
+        response = client.options('/api/tips', headers={
+            'Origin': 'http://example.com',
+            'Access-Control-Request-Method': 'GET',
+        })
+    assert response.headers.get('Access-Control-Max-Age') == '7200'
+    print("✓ Preflight responses carry Access-Control-Max-Age")
+
+
+def main():
+    """Run all tests"""
+    print("Testing Response Helpers")
+    print("=" * 50)
+
+    tests = [
+        ("Cached List Endpoints", test_cached_list_endpoints),
+        ("Cache Invalidation", test_cache_invalidation),
+        ("Preflight Max Age", test_preflight_max_age),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Test script to verify route safety scoring
+"""
+
+import sys
+import os
+import json
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import route_safety
+
+NOW = datetime(2024, 6, 1, 22, 0, tzinfo=timezone.utc)
+# Two ways from A to B, 1 km apart at the midpoint
+ROUTE_EAST = [(28.600, 77.300), (28.610, 77.310), (28.620, 77.300)]
+ROUTE_WEST = [(28.600, 77.300), (28.610, 77.290), (28.620, 77.300)]
+
+
+def test_band_weights():
+    """Test that reports from the same time of day weigh most, wrapping around midnight"""
+    weights = route_safety.band_weights(0)
+    assert weights[0] == 1.0
+    assert weights[1] == weights[5] == 0.5
+    assert weights[3] == min(weights)
+    print("✓ Time-of-day weights correct")
+
+
+def test_scoring():
+    """Test that incidents lower segment scores by recency and time of day"""
+    grid = route_safety.SafetyGrid()
+    for _ in range(5):
+        grid.add_incident(28.610, 77.310, NOW - timedelta(days=2))
+    east = grid.score_route(ROUTE_EAST, NOW)
+    west = grid.score_route(ROUTE_WEST, NOW)
+    assert len(east['segments']) == 2
+    assert east['score'] < west['score'] == 80.0
+    assert east['segments'][0]['incident_weight'] > 0
+
+    # The same reports count less in the morning and once they are a year old
+    morning = grid.score_route(ROUTE_EAST, NOW.replace(hour=10))
+    later = grid.score_route(ROUTE_EAST, NOW + timedelta(days=365))
+    assert east['score'] < morning['score'] < west['score']
+    assert east['score'] < later['score'] < west['score']
+    print("✓ Incidents lower scores by recency and time of day")
+
+
+def test_shelters():
+    """Test the nearest-shelter lookup and its bonus"""
+    grid = route_safety.SafetyGrid()
+    key = (int(28.610 // route_safety.SHELTER_CELL_DEG), int(77.280 // route_safety.SHELTER_CELL_DEG))
+    grid._shelters = {key: [(28.610, 77.280)]}
+    assert round(grid.nearest_shelter_m(28.610, 77.279)) == 98
+    assert grid.nearest_shelter_m(28.7, 77.290) is None
+    west = grid.score_route(ROUTE_WEST, NOW)
+    east = grid.score_route(ROUTE_EAST, NOW)
+    assert west['score'] > east['score'] == 80.0
+    print("✓ Nearby shelters raise scores")
+
+
+def test_score_api():
+    """Test the endpoint against complaints filed through the API"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            route_safety.grid = route_safety.SafetyGrid()
+            with app_module.app.test_client() as client:
+                assert client.post('/api/routes/score', json={'route': ROUTE_EAST}).status_code == 401
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                before = json.loads(client.post('/api/routes/score', json={'routes': [ROUTE_EAST, ROUTE_WEST]}).data)
+                assert before['routes'][0]['score'] == before['routes'][1]['score']
+
+                for _ in range(3):
+                    client.post('/api/complaints', json={'title': 'Followed', 'description': 'x',
+                                                         'latitude': 28.610, 'longitude': 77.310})
+                route_safety.grid.sync(app_module.get_db_connection, force=True)
+                after = json.loads(client.post('/api/routes/score', json={'routes': [ROUTE_EAST, ROUTE_WEST]}).data)
+                assert after['safest'] == 1
+                assert after['routes'][0]['score'] < after['routes'][1]['score']
+
+                # A fresh worker loads the same incidents from the aggregate
+                fresh = route_safety.SafetyGrid()
+                fresh.sync(app_module.get_db_connection)
+                assert fresh.score_route(ROUTE_EAST)['score'] == route_safety.grid.score_route(ROUTE_EAST)['score']
+
+                assert client.post('/api/routes/score', json={'route': [[1, 2]]}).status_code == 400
+                assert client.post('/api/routes/score', json={'route': ROUTE_EAST, 'time': 'soon'}).status_code == 400
+                assert client.post('/api/routes/score', json={'route': ROUTE_EAST, 'time': 1e20}).status_code == 400
+                assert client.post('/api/routes/score', json={}).status_code == 400
+            print("✓ Route scoring API ranks the safer route")
+        finally:
+            app_module.DATABASE = original
+            route_safety.grid = route_safety.SafetyGrid()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Route Safety")
+    print("=" * 50)
+
+    tests = [
+        ("Band Weights", test_band_weights),
+        ("Incident Scoring", test_scoring),
+        ("Shelter Proximity", test_shelters),
+        ("Score API", test_score_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the background job scheduler and the maintenance jobs
+"""
+
+import sys
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import live_share
+import metrics
+import scheduler
+
+
+def _at(*parts):
+    return datetime(*parts).timestamp()
+
+
+def test_cron():
+    """Test cron parsing and next run times"""
+    daily = scheduler.CronSpec('30 3 * * *')
+    assert daily.next_after(_at(2026, 10, 19, 4, 0)) == _at(2026, 10, 20, 3, 30)
+    assert daily.next_after(_at(2026, 10, 19, 3, 29, 59)) == _at(2026, 10, 19, 3, 30)
+    # Never the minute already running
+    assert daily.next_after(_at(2026, 10, 19, 3, 30, 20)) == _at(2026, 10, 20, 3, 30)
+
+    # Friday 17:50 -> Monday 09:00
+    office = scheduler.CronSpec('*/15 9-17 * * 1-5')
+    assert office.next_after(_at(2026, 10, 23, 17, 50)) == _at(2026, 10, 26, 9, 0)
+    assert office.next_after(_at(2026, 10, 26, 9, 1)) == _at(2026, 10, 26, 9, 15)
+
+    # Both day fields restricted: the 1st of the month or any Sunday (7 is Sunday too)
+    either = scheduler.CronSpec('0 0 1 * 7')
+    assert either.next_after(_at(2026, 10, 19)) == _at(2026, 10, 25)
+    assert either.next_after(_at(2026, 10, 26)) == _at(2026, 11, 1)
+    assert scheduler.CronSpec('0 12 1,15 2 *').next_after(_at(2026, 10, 19)) == _at(2027, 2, 1, 12, 0)
+    assert scheduler.CronSpec('5/20 * * * *').minutes == {5, 25, 45}
+
+    for bad in ('* * * *', '60 * * * *', '*/0 * * * *', '5-1 * * * *', 'x * * * *'):
+        try:
+            scheduler.CronSpec(bad)
+            assert False, f'accepted {bad!r}'
+        except ValueError:
+            pass
+    try:
+        scheduler.CronSpec('0 0 30 2 *').next_after(_at(2026, 10, 19))
+        assert False, '30 February matched'
+    except ValueError:
+        pass
+    print("✓ Cron specs parsed and matched")
+
+
+def test_intervals_and_jitter():
+    """Test that interval jobs run when due, each run delayed by at most the jitter"""
+    now = [1000.0]
+    runs = []
+    jobs = scheduler.Scheduler(clock=lambda: now[0], rng=random.Random(1))
+    job = jobs.every(60, lambda: runs.append(now[0]), name='tick', jitter=10)
+    assert 1060 <= job.next_run <= 1070
+    assert jobs.run_pending(1059) == []
+
+    previous = None
+    for _ in range(20):
+        now[0] = job.next_run
+        assert jobs.run_pending() == ['tick']
+        assert now[0] + 60 <= job.next_run <= now[0] + 70
+        if previous is not None:
+            assert 60 <= now[0] - previous <= 70
+        previous = now[0]
+    assert len(runs) == 20 and job.runs == 20
+
+    # A job that overruns its interval runs once, then waits a whole interval
+    slow = jobs.every(5, lambda: now.__setitem__(0, now[0] + 12), name='slow')
+    now[0] = slow.next_run
+    jobs.run_pending()
+    assert slow.runs == 1 and slow.next_run == now[0] + 5
+    try:
+        jobs.every(5, print, name='slow')
+        assert False, 'duplicate job name accepted'
+    except ValueError:
+        pass
+    print("✓ Interval jobs run on time with jitter")
+
+
+def test_leader_election():
+    """Test that leader jobs run in one scheduler per lock file, and move when the leader stops"""
+    with tempfile.TemporaryDirectory() as directory:
+        lock_path = os.path.join(directory, 'jobs.lock')
+        ran = {'first': [], 'second': []}
+        workers = {}
+        for name in ('first', 'second'):
+            jobs = scheduler.Scheduler(lock_path, clock=lambda: 0.0)
+            jobs.every(10, lambda name=name: ran[name].append('leader'), name='leader', leader=True)
+            jobs.every(10, lambda name=name: ran[name].append('local'), name='local')
+            workers[name] = jobs
+
+        for now in (10, 20):
+            for jobs in workers.values():
+                jobs.run_pending(now)
+        if scheduler.fcntl is None:
+            assert ran['first'] == ran['second'] == ['leader', 'local'] * 2
+        else:
+            assert ran == {'first': ['leader', 'local'] * 2, 'second': ['local'] * 2}
+            assert workers['second'].jobs['leader'].skipped == 2
+
+            # The leader goes away; the other worker takes over at its next due run
+            workers['first'].stop()
+            workers['second'].run_pending(30)
+            assert ran['second'][-2:] == ['leader', 'local']
+            assert not workers['first'].is_leader()
+        workers['second'].stop()
+        print("✓ Leader jobs run in one worker")
+
+
+def _counter(snap, name, **labels):
+    return snap['counters'].get((name, tuple(sorted(labels.items()))), 0)
+
+
+def test_failures_and_thread():
+    """Test that failures are counted and the background thread runs jobs"""
+    before = metrics.snapshot()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+
+    jobs = scheduler.Scheduler(tick=0.01)
+    job = jobs.every(0.02, flaky, name='test_flaky')
+    jobs.start()
+    try:
+        deadline = time.time() + 5
+        while job.runs < 3 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        jobs.stop()
+    assert job.runs >= 3 and job.failures == 1 and job.last_error is None
+    assert jobs._threads == []
+
+    after = metrics.snapshot()
+    assert _counter(after, 'jobs_total', job='test_flaky', status='error') == 1
+    assert (_counter(after, 'jobs_total', job='test_flaky', status='ok')
+            - _counter(before, 'jobs_total', job='test_flaky', status='ok')) == job.runs - 1
+    assert _counter(after, 'job_seconds_total', job='test_flaky') > 0
+    print(f"✓ {job.runs} runs, failure counted")
+
+
+def test_lanes():
+    """Test that a slow job holds back only the jobs in its own lane"""
+    release = threading.Event()
+    jobs = scheduler.Scheduler(tick=0.01)
+    slow = jobs.every(0.01, lambda: release.wait(5), name='test_slow_backup')
+    waiting = jobs.every(0.01, lambda: None, name='test_waiting')
+    timer = jobs.every(0.02, lambda: None, name='test_timers', lane='alerts')
+    jobs.start()
+    try:
+        deadline = time.time() + 5
+        while timer.runs < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        # The slow job is still running and the job queued behind it hasn't had a turn
+        assert timer.runs >= 3 and slow.runs == 0 and waiting.runs == 0
+    finally:
+        release.set()
+        jobs.stop()
+    assert slow.runs == 1
+    jobs.start()
+    try:
+        jobs.every(1, print, name='test_late', lane='late')
+        assert False, 'lane added to a running scheduler'
+    except RuntimeError:
+        pass
+    finally:
+        jobs.stop()
+    print(f"✓ Due timer ran {timer.runs} times during a slow job")
+
+
+def test_maintenance_jobs():
+    """Test the app's maintenance jobs on a sharded database"""
+    import app as app_module
+    saved = app_module.DATABASE, app_module.app.config['SHARD_COUNT']
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.app.config['SHARD_COUNT'] = 2
+            app_module.init_db()
+            conn = sqlite3.connect(app_module.DATABASE)
+            conn.execute('PRAGMA journal_mode = WAL')
+            now = time.time()
+            conn.executemany('INSERT INTO live_shares (user_id, token_hash, expires_at) VALUES (?, ?, ?)', [
+                (1, 'recent', now - 3600), (1, 'old', now - live_share.PRUNE_AFTER - 3600), (1, 'active', now + 60)])
+            conn.commit()
+            conn.close()
+
+            jobs = app_module.create_jobs()
+            assert set(jobs.jobs) >= {'optimize', 'analyze', 'wal_checkpoint', 'prune_live_shares', 'dwell_times'}
+            assert [name for name, job in jobs.jobs.items() if not job.leader] == ['dwell_times']
+            assert [name for name, job in jobs.jobs.items() if job.lane == 'alerts'] == ['timers', 'anomalies']
+            for job in jobs.jobs.values():
+                job.next_run = 0
+            assert sorted(jobs.run_pending(time.time())) == sorted(jobs.jobs)
+            assert not any(job.failures for job in jobs.jobs.values()), [
+                job.last_error for job in jobs.jobs.values()]
+            jobs.stop()
+
+            conn = sqlite3.connect(app_module.DATABASE)
+            remaining = [row[0] for row in conn.execute('SELECT token_hash FROM live_shares ORDER BY id')]
+            stats = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0]
+            conn.close()
+            assert remaining == ['recent', 'active']
+            assert stats == 1
+            print("✓ Maintenance jobs ran on every database")
+        finally:
+            app_module.DATABASE, app_module.app.config['SHARD_COUNT'] = saved
+
+
+def main():
+    """Run all tests"""
+    print("Testing Background Jobs")
+    print("=" * 50)
+
+    tests = [
+        ("Cron", test_cron),
+        ("Intervals And Jitter", test_intervals_and_jitter),
+        ("Leader Election", test_leader_election),
+        ("Failures And Thread", test_failures_and_thread),
+        ("Lanes", test_lanes),
+        ("Maintenance Jobs", test_maintenance_jobs),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
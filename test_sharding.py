@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Test script to verify sharded storage of per-user tables
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+from collections import Counter
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datasets
+import live_share
+import ping_filter
+import responders
+import responses
+import route_safety
+import sharding
+
+USERS = range(1, 9)
+
+
+def _sharded_app(directory, count):
+    """The app on a fresh database spread over count shards, with users 1-8 and staff user 1"""
+    import app as app_module
+    app_module.DATABASE = os.path.join(directory, 'test.db')
+    app_module.app.config['SHARD_COUNT'] = count
+    app_module.app.config['STAFF_USER_IDS'] = {1}
+    app_module.init_db()
+    conn = sqlite3.connect(app_module.DATABASE)
+    conn.executemany('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+                     [(i, f'user{i}', f'user{i}@example.com', 'x') for i in USERS])
+    conn.commit()
+    conn.close()
+    datasets.forget()
+    responses.invalidate()
+    responders.index = responders.ResponderIndex()
+    live_share.shares = live_share.LiveShares()
+    ping_filter.pings = ping_filter.PingFilter()
+    route_safety.grid = route_safety.SafetyGrid()
+    return app_module
+
+
+def _restore(app_module, saved):
+    app_module.DATABASE, shard_count, staff = saved
+    app_module.app.config['SHARD_COUNT'] = shard_count
+    app_module.app.config['STAFF_USER_IDS'] = staff
+    responders.index = responders.ResponderIndex()
+    live_share.shares = live_share.LiveShares()
+    ping_filter.pings = ping_filter.PingFilter()
+    route_safety.grid = route_safety.SafetyGrid()
+    datasets.forget()
+    responses.invalidate()
+
+
+def _saved(app_module):
+    return app_module.DATABASE, app_module.app.config['SHARD_COUNT'], app_module.app.config['STAFF_USER_IDS']
+
+
+def _rows(path, sql):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def test_shard_of():
+    """Test that users spread evenly and always map to the same shard"""
+    spread = Counter(sharding.shard_of(user_id, 4) for user_id in range(1, 40001))
+    assert sorted(spread) == [0, 1, 2, 3]
+    assert max(spread.values()) - min(spread.values()) < 800, spread
+    assert all(sharding.shard_of(u, 4) == sharding.shard_of(u, 4) for u in range(100))
+    assert sharding.shard_of(12345, 1) == 0
+    assert sharding.shard_path('/data/security_system.db', 2) == '/data/security_system.shard2.db'
+    print("✓ Users spread evenly over shards")
+
+
+def test_sharded_api():
+    """Test that writes land in the user's shard and reads and admin queries span shards"""
+    import app as app_module
+    saved = _saved(app_module)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            _sharded_app(directory, 4)
+            shards = app_module.get_shards()
+            assert shards.paths == [os.path.join(directory, f'test.shard{i}.db') for i in range(4)]
+            # Per-user tables are not in the primary database
+            assert not _rows(app_module.DATABASE, "SELECT name FROM sqlite_master WHERE name = 'complaints'")
+
+            with app_module.app.test_client() as client:
+                for user_id in USERS:
+                    with client.session_transaction() as sess:
+                        sess['user_id'] = user_id
+                    client.post('/api/responders/opt-in', json={})
+                    for i in range(3):
+                        client.post('/api/location', json={'latitude': 28.61 + user_id * 0.001 + i * 0.0003,
+                                                           'longitude': 77.21})
+                    client.post('/api/complaints', json={'title': f'Followed near stop {user_id}',
+                                                         'description': 'bus stop', 'category': 'harassment',
+                                                         'latitude': 28.6139, 'longitude': 77.2090})
+                    history = json.loads(client.get('/api/complaints/history').data)
+                    assert [c['title'] for c in history] == [f'Followed near stop {user_id}']
+                    points = json.loads(client.get('/api/location/history').data)['points']
+                    assert len(points) == 3
+
+                for index, path in enumerate(shards.paths):
+                    owners = {row[0] for row in _rows(path, 'SELECT user_id FROM location_tracking')}
+                    assert owners == {u for u in USERS if shards.index_of(u) == index}
+                    # Complaint ids are unique across shards
+                    ids = [row[0] for row in _rows(path, 'SELECT id FROM complaints')]
+                    assert all(i % 4 == index for i in ids)
+
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                stats = json.loads(client.get('/api/admin/shards').data)
+                assert sum(s['locations'] for s in stats) == 24 and sum(s['complaints'] for s in stats) == 8
+
+                first = json.loads(client.get('/api/complaints/search?q=followed&per_page=5').data)
+                second = json.loads(client.get('/api/complaints/search?q=followed&per_page=5&page=2').data)
+                assert first['has_more'] and not second['has_more']
+                found = [r['id'] for r in first['results'] + second['results']]
+                assert len(found) == len(set(found)) == 8
+
+                tile = json.loads(client.get('/api/incidents/heatmap/12/2926/1707').data)['points']
+                assert sum(count for _, _, count in tile) == 8 and len(tile) == 1
+
+                sos = json.loads(client.post('/api/sos', json={'latitude': 28.61, 'longitude': 77.21, 'k': 20}).data)
+                assert sos['notified'] == 7
+
+                created = json.loads(client.post('/api/live-share', json={}).data)
+                # Seeded with the user's three stored pings, whichever seconds they fell in
+                assert len(json.loads(client.get(f"/api/live-share/view/{created['token']}").data)['points']) == 3
+
+                score = json.loads(client.post('/api/routes/score', json={
+                    'routes': [[[28.6139, 77.2090], [28.6145, 77.2095]]]}).data)
+                assert score['success']
+
+                # A fresh worker catches up from every shard
+                other = responders.ResponderIndex()
+                other.sync(app_module.get_db_connection, shard_connects=shards.connectors())
+                assert len(other.nearest(28.61, 77.21, k=20)) == 8
+            shards.close()
+            print("✓ Reads and writes routed to the user's shard")
+        finally:
+            _restore(app_module, saved)
+
+
+def test_layout_guard():
+    """Test that a database cannot be opened with another shard count"""
+    import app as app_module
+    saved = _saved(app_module)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            _sharded_app(directory, 4)
+            app_module.app.config['SHARD_COUNT'] = 2
+            try:
+                app_module.init_db()
+                assert False, 'opened with the wrong shard count'
+            except RuntimeError as e:
+                assert 'SHARD_COUNT=4' in str(e)
+            print("✓ Mismatched shard count refused")
+        finally:
+            _restore(app_module, saved)
+
+
+def test_split():
+    """Test moving an unsharded database into shards"""
+    import app as app_module
+    saved = _saved(app_module)
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module = _sharded_app(directory, 1)
+            conn = sqlite3.connect(app_module.DATABASE)
+            conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude) VALUES (?, ?, ?)',
+                             [(u, 28.6 + i * 0.001, 77.2) for u in USERS for i in range(10)])
+            conn.executemany('INSERT INTO complaints (user_id, title, category, latitude, longitude) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             [(u, f'Broken light {u}', 'safety', 28.6139, 77.2090) for u in USERS])
+            conn.commit()
+            conn.close()
+
+            conn = sqlite3.connect(app_module.DATABASE)
+            titles = dict(conn.execute('SELECT id, title FROM complaints'))
+            conn.close()
+            copied = sharding.split(app_module.DATABASE, 3, batch_size=7)
+            mapping = {new_id: old_id for old_id, new_id in _rows(app_module.DATABASE,
+                                                                    'SELECT old_id, new_id FROM complaint_id_map')}
+            assert 0 < len(mapping) < len(titles) and all(new_id > max(titles) for new_id in mapping)
+            assert copied == {'location_tracking': 80, 'location_archive': 0, 'complaints': 8}
+            try:
+                sharding.split(app_module.DATABASE, 3)
+                assert False, 'split twice'
+            except RuntimeError:
+                pass
+
+            app_module.app.config['SHARD_COUNT'] = 3
+            app_module.init_db()
+            shards = app_module.get_shards()
+            for index, path in enumerate(shards.paths):
+                for user_id, pings in _rows(path, 'SELECT user_id, COUNT(*) FROM location_tracking GROUP BY user_id'):
+                    assert shards.index_of(user_id) == index and pings == 10
+                assert all(i % 3 == index for (i,) in _rows(path, 'SELECT id FROM complaints'))
+                # Ids that fit the shard are kept, the others are mapped
+                for complaint_id, title in _rows(path, 'SELECT id, title FROM complaints'):
+                    old_id = mapping.get(complaint_id, complaint_id)
+                    assert title == titles[old_id]
+                    assert (complaint_id in mapping) == (old_id % 3 != index)
+                _rows(path, "INSERT INTO complaints_fts (complaints_fts) VALUES ('integrity-check')")
+            with app_module.app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                results = json.loads(client.get('/api/complaints/search?q=light&per_page=100').data)['results']
+                assert len(results) == 8
+                tile = json.loads(client.get('/api/incidents/heatmap/12/2926/1707').data)['points']
+                assert sum(count for _, _, count in tile) == 8
+            shards.close()
+            print("✓ Existing rows split into shards")
+        finally:
+            _restore(app_module, saved)
+
+
+def main():
+    """Run all tests"""
+    print("Testing Sharded Storage")
+    print("=" * 50)
+
+    tests = [
+        ("Shard Mapping", test_shard_of),
+        ("Sharded API", test_sharded_api),
+        ("Layout Guard", test_layout_guard),
+        ("Split", test_split),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
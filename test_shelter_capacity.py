@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Test script to verify live shelter capacity and reservations
+"""
+
+import sys
+import os
+import json
+import multiprocessing
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datasets
+import responses
+import shelter_capacity
+
+NOW = 1717279200.0
+
+
+class Clock:
+    def __init__(self, now=NOW):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _temp_database(directory, capacity=3):
+    """A fresh app database whose first shelter has the given capacity"""
+    import app as app_module
+    app_module.DATABASE = os.path.join(directory, 'test.db')
+    app_module.init_db()
+    conn = sqlite3.connect(app_module.DATABASE)
+    conn.execute('UPDATE safe_shelters SET capacity = ? WHERE id = 1', (capacity,))
+    conn.commit()
+    conn.close()
+    datasets.forget()
+    responses.invalidate()
+    return app_module.DATABASE
+
+
+def _tracker(database, clock=None):
+    return shelter_capacity.CapacityTracker(lambda: sqlite3.connect(database), database,
+                                            path=database + '.counters', clock=clock or Clock())
+
+
+def _reserve_in_process(database, attempts, results):
+    tracker = _tracker(database)
+    results.put(sum(tracker.reserve(1, 1) is not None for _ in range(attempts)))
+    tracker.close()
+
+
+def test_reserve_until_full():
+    """Test check-and-reserve, expiry of holds and releases"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            database = _temp_database(directory)
+            clock = Clock()
+            tracker = _tracker(database, clock)
+            first = tracker.reserve(1, 7, seats=2)
+            assert first and tracker.status(1) == {'occupancy': 0, 'held': 2, 'available': 1}
+            assert tracker.reserve(1, 8, seats=2) is None
+            second = tracker.reserve(1, 8)
+            assert second and tracker.reserve(1, 9) is None
+
+            # Cancelling gives places back, once, and only to the owner
+            assert not tracker.release(second['id'], user_id=7)
+            assert tracker.release(second['id'], user_id=8)
+            assert not tracker.release(second['id'], user_id=8)
+            assert tracker.status(1)['available'] == 1
+
+            # Holds lapse on their own
+            clock.now += shelter_capacity.HOLD_MINUTES * 60 + shelter_capacity.BUCKET_SECONDS
+            assert tracker.status(1) == {'occupancy': 0, 'held': 0, 'available': 3}
+            tracker.close(remove=True)
+            print("✓ Reservations stop at capacity and expire")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_arrival_and_occupancy():
+    """Test that arrivals become occupancy and staff counts are saved"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            database = _temp_database(directory, capacity=10)
+            tracker = _tracker(database)
+            reservation = tracker.reserve(1, 7, seats=3)
+            assert tracker.release(reservation['id'], arrived=True)
+            assert tracker.status(1) == {'occupancy': 3, 'held': 0, 'available': 7}
+            tracker.set_occupancy(1, 6)
+            tracker.reserve(1, 8)
+            tracker.close()
+
+            conn = sqlite3.connect(database)
+            assert conn.execute('SELECT occupancy FROM safe_shelters WHERE id = 1').fetchone()[0] == 6
+            statuses = dict(conn.execute('SELECT user_id, status FROM shelter_reservations').fetchall())
+            assert statuses == {7: 'arrived', 8: 'active'}
+            conn.close()
+
+            # A new counters file is rebuilt from the saved rows
+            os.remove(database + '.counters')
+            tracker = _tracker(database)
+            assert tracker.status(1) == {'occupancy': 6, 'held': 1, 'available': 3}
+            tracker.close(remove=True)
+            print("✓ Occupancy and holds survive a restart")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_concurrent_workers():
+    """Test that workers sharing the counters file never overbook"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            database = _temp_database(directory, capacity=25)
+            parent = _tracker(database)
+            context = multiprocessing.get_context('fork')
+            results = context.Queue()
+            workers = [context.Process(target=_reserve_in_process, args=(database, 20, results)) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            granted = sum(results.get(timeout=30) for _ in workers)
+            for worker in workers:
+                worker.join()
+            assert granted == 25, granted
+            assert parent.status(1)['available'] == 0
+            parent.close(remove=True)
+
+            conn = sqlite3.connect(database)
+            assert conn.execute('SELECT SUM(seats) FROM shelter_reservations').fetchone()[0] == 25
+            conn.close()
+            print("✓ 4 workers granted exactly the 25 places")
+        finally:
+            app_module.DATABASE = original
+
+
+def test_api():
+    """Test reservations through the API and the nearest-shelter filter"""
+    import app as app_module
+    original = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            _temp_database(directory, capacity=1)
+            with app_module.app.test_client() as client:
+                assert client.post('/api/shelters/1/reserve').status_code == 401
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                nearest = json.loads(client.get('/api/shelters?lat=28.61&lon=77.21&radius_km=50').data)
+                assert [s['id'] for s in nearest][:1] == [1]
+                assert nearest[0]['available'] == 1 and nearest[0]['distance_m'] < 1000
+
+                response = client.post('/api/shelters/1/reserve', json={})
+                reservation = json.loads(response.data)['reservation']
+                assert json.loads(response.data)['available'] == 0
+                assert client.post('/api/shelters/1/reserve', json={}).status_code == 409
+                nearest = json.loads(client.get('/api/shelters?lat=28.61&lon=77.21&radius_km=50').data)
+                assert 1 not in [s['id'] for s in nearest] and nearest
+
+                assert client.post('/api/shelters/99/reserve', json={}).status_code == 404
+                assert client.post('/api/shelters/1/reserve', json={'seats': 0}).status_code == 400
+                assert client.get('/api/shelters?lat=north&lon=77').status_code == 400
+                assert client.put('/api/shelters/1/occupancy', json={'occupancy': 0}).status_code == 403
+                assert client.delete(f"/api/shelters/reservations/{reservation['id']}").status_code == 200
+                assert client.delete(f"/api/shelters/reservations/{reservation['id']}").status_code == 404
+
+                # Without coordinates the full list is unchanged
+                assert len(json.loads(client.get('/api/shelters').data)) == 3
+            print("✓ Full shelters drop out of nearest results")
+        finally:
+            shelter_capacity.close_all(remove=True)
+            app_module.DATABASE = original
+
+
+def main():
+    """Run all tests"""
+    print("Testing Shelter Capacity")
+    print("=" * 50)
+
+    tests = [
+        ("Reserve Until Full", test_reserve_until_full),
+        ("Arrival and Occupancy", test_arrival_and_occupancy),
+        ("Concurrent Workers", test_concurrent_workers),
+        ("Capacity API", test_api),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
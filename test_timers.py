@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the timing wheel, stored timers and the timer routes
+"""
+
+import sys
+import os
+import json
+import math
+import random
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import responders
+import timers
+from alerts import AlertQueue, alert_queue
+
+
+def test_wheel_matches_brute_force():
+    """Test that a small wheel fires exactly the timers a scan would, across cascades and overflow"""
+    for seed in range(20):
+        rng = random.Random(seed)
+        now = 1000.3
+        # 4 ticks a level, 64 in all: most timers cascade or overflow
+        wheel = timers.TimingWheel(now, resolution=1.0, level_bits=(2, 2, 2))
+        due = {}
+        for step in range(300):
+            choice = rng.random()
+            if choice < 0.5:
+                timer_id = seed * 1000 + step
+                due[timer_id] = now + rng.choice([rng.uniform(-5, 5), rng.uniform(0, 100), rng.uniform(0, 300)])
+                wheel.add(timer_id, due[timer_id])
+            elif choice < 0.6 and due:
+                timer_id = rng.choice(sorted(due))
+                assert wheel.cancel(timer_id) and not wheel.cancel(timer_id)
+                del due[timer_id]
+            else:
+                now += rng.choice([0.3, 1, 2, 7, 40])
+                fired = wheel.advance(now)
+                expected = {t for t, at in due.items() if math.ceil(at) <= math.floor(now)}
+                assert sorted(fired) == sorted(expected), (seed, step)
+                ticks = [math.ceil(due[t]) for t in fired]
+                assert ticks == sorted(ticks), 'fired out of order'
+                for timer_id in fired:
+                    del due[timer_id]
+            assert len(wheel) == len(due)
+    print("✓ Wheel agrees with a scan")
+
+
+def test_wheel_levels():
+    """Test the default wheel with timers on every level and beyond its span"""
+    start = 1_700_000_000.0
+    wheel = timers.TimingWheel(start)
+    offsets = {1: 5, 2: 1000, 3: 100_000, 4: 10_000_000, 5: 3 * 365 * 86400}
+    for timer_id, offset in offsets.items():
+        wheel.add(timer_id, start + offset)
+    wheel.add(6, start + 50)
+    wheel.add(6, start + 60)
+    assert wheel.cancel(6) and len(wheel) == 5
+    wheel.add(7, start - 10)
+    assert wheel.advance(start) == [7]
+
+    for timer_id, offset in offsets.items():
+        assert wheel.advance(start + offset - 1) == [], timer_id
+        assert wheel.advance(start + offset) == [timer_id], timer_id
+    assert len(wheel) == 0
+    # Idle: jumps straight to the target
+    assert wheel.advance(start + 10 * 365 * 86400) == []
+    print("✓ Timers fire on time from every level")
+
+
+def _database(directory):
+    path = os.path.join(directory, 'test.db')
+    conn = sqlite3.connect(path)
+    timers.ensure_schema(conn.cursor())
+    conn.commit()
+    conn.close()
+    return lambda: sqlite3.connect(path)
+
+
+def test_store_and_recovery():
+    """Test firing, cancelling through another worker and reloading after a crash"""
+    with tempfile.TemporaryDirectory() as directory:
+        connect = _database(directory)
+        now = [1000.0]
+        published = []
+
+        def publish(user_id, kind, **details):
+            published.append((user_id, kind, details))
+            return details
+
+        firing = timers.ScheduledTimers(clock=lambda: now[0], publish=publish)
+        other = timers.ScheduledTimers(clock=lambda: now[0], publish=publish)
+        conn = connect()
+        call = other.create(conn, 1, 'fake_call', 1010, {'caller': 'Mom'})
+        walk = other.create(conn, 2, 'check_in', 1300, {'note': 'Walking home'})
+        cancelled = other.create(conn, 2, 'check_in', 1020)
+        later = other.create(conn, 3, 'check_in', 5000)
+        conn.commit()
+        try:
+            other.create(conn, 1, 'party', 1100)
+            assert False, 'unknown kind accepted'
+        except ValueError:
+            pass
+
+        assert firing.fire_due(connect) == [] and len(firing.wheel) == 4
+        # Cancelled by another worker: still in the firing worker's wheel, but never fires
+        assert other.cancel(conn, 2, cancelled['id']) and not other.cancel(conn, 2, cancelled['id'])
+        assert not other.cancel(conn, 1, walk['id'])
+        conn.commit()
+        assert [t['id'] for t in other.pending(conn, 2)] == [walk['id']]
+
+        now[0] = 1030
+        firing.fire_due(connect)
+        assert published == [(1, 'fake_call', {'timer_id': call['id'], 'due_at': 1010, 'late_seconds': 20,
+                                               'caller': 'Mom'})]
+        statuses = dict(conn.execute('SELECT id, status FROM timers'))
+        assert statuses == {call['id']: 'fired', walk['id']: 'pending', cancelled['id']: 'cancelled',
+                            later['id']: 'pending'}
+
+        # Restart: a new worker loads the pending timers and fires what came due while it was down
+        now[0] = 1400
+        restarted = timers.ScheduledTimers(clock=lambda: now[0], publish=publish)
+        restarted.fire_due(connect)
+        assert published[-1] == (2, 'check_in_missed', {'timer_id': walk['id'], 'due_at': 1300,
+                                                        'late_seconds': 100, 'note': 'Walking home'})
+        # The old worker's wheel still has it, but it fires only once
+        firing.fire_due(connect, now=1400)
+        assert len(published) == 2 and len(restarted.wheel) == 1
+        conn.close()
+        print("✓ Timers stored, cancelled, recovered and fired once")
+
+
+def test_timer_routes():
+    """Test scheduling fake calls and check-ins through the API"""
+    import app as app_module
+    saved = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            responders.index = responders.ResponderIndex()
+            with app_module.app.test_client() as client:
+                assert client.post('/api/check-ins', json={'minutes': 30}).status_code == 401
+                client.post('/register', json={'username': 'walker', 'email': 'walker@example.com',
+                                               'password': 'password123'})
+                client.post('/login', json={'username': 'walker', 'password': 'password123'})
+                with client.session_transaction() as sess:
+                    user_id = sess['user_id']
+
+                call = json.loads(client.post('/api/fake-call').data)
+                assert call['success'] and call['message'].endswith('in 10 seconds.')
+                walk = json.loads(client.post('/api/check-ins', json={'minutes': 30, 'note': 'Home by 10:30'}).data)
+                assert walk['success'] and walk['timer']['kind'] == 'check_in'
+                for bad in ({}, {'minutes': 0}, {'minutes': 'soon'}, {'minutes': 10 ** 6}):
+                    assert client.post('/api/check-ins', json=bad).status_code == 400
+                assert client.post('/api/fake-call', json={'delay_seconds': -1}).status_code == 400
+
+                pending = json.loads(client.get('/api/timers').data)
+                assert [(t['kind'], t.get('note')) for t in pending] == [('fake_call', None),
+                                                                         ('check_in', 'Home by 10:30')]
+                assert client.delete(f"/api/timers/{call['timer']['id']}").status_code == 200
+                assert client.delete(f"/api/timers/{call['timer']['id']}").status_code == 404
+
+                # A responder close to where the walker was last seen
+                client.post('/api/location', json={'latitude': 28.61, 'longitude': 77.21})
+                client.post('/register', json={'username': 'helper', 'email': 'helper@example.com',
+                                               'password': 'password123'})
+                client.post('/login', json={'username': 'helper', 'password': 'password123'})
+                with client.session_transaction() as sess:
+                    helper_id = sess['user_id']
+                client.post('/api/responders/opt-in', json={})
+                client.post('/api/location', json={'latitude': 28.612, 'longitude': 77.21})
+                with client.session_transaction() as sess:
+                    sess['user_id'] = user_id
+
+                # Fired into the alert queue once the check-in is missed
+                alert_queue.drain(user_id)
+                alert_queue.drain(helper_id)
+                timers.scheduled = timers.ScheduledTimers()
+                app_module.fire_timers(now=walk['timer']['due_at'] + 1)
+                alerts = json.loads(client.get('/api/alerts').data)
+                assert [(a['kind'], a['note']) for a in alerts] == [('check_in_missed', 'Home by 10:30')]
+                assert json.loads(client.get('/api/timers').data) == []
+                # Stored in the alerts table, so any worker's queue delivers them
+                nearby = AlertQueue(connect=app_module.get_db_connection).drain(helper_id)
+                assert [(e['kind'], e['from_user_id'], e['distance_m']) for e in nearby] == [
+                    ('check_in_missed_nearby', user_id, 222)]
+            print("✓ Fake calls and check-ins scheduled through the API")
+        finally:
+            app_module.DATABASE = saved
+            timers.scheduled = timers.ScheduledTimers()
+            responders.index = responders.ResponderIndex()
+
+
+def main():
+    """Run all tests"""
+    print("Testing Scheduled Timers")
+    print("=" * 50)
+
+    tests = [
+        ("Wheel Matches Brute Force", test_wheel_matches_brute_force),
+        ("Wheel Levels", test_wheel_levels),
+        ("Store And Recovery", test_store_and_recovery),
+        ("Timer Routes", test_timer_routes),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
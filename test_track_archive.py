@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the hour blob archive of location pings
+"""
+
+import sys
+import os
+import json
+import random
+import sqlite3
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import anomaly
+import export
+import location_history
+import sharding
+import track_archive
+
+HOUR = 1_717_228_800  # 2024-06-01 08:00:00 UTC
+
+
+def test_encode_round_trip():
+    """Test that blobs decode to the points encoded, to a millionth of a degree"""
+    rng = random.Random(7)
+    points, seconds = [], HOUR
+    latitude, longitude = -33.86, 151.2
+    for _ in range(500):
+        seconds += rng.choice([0, 1, 5, 30])
+        latitude += rng.choice([0, rng.uniform(-1e-4, 1e-4), rng.uniform(-5, 5)])
+        longitude += rng.uniform(-1e-4, 1e-4)
+        points.append((seconds, latitude, longitude, rng.choice([0, 0, 45, 100000])))
+    points = [p for p in points if p[0] < HOUR + 3600]
+    data = track_archive.encode(points, HOUR)
+
+    decoded = track_archive.decode(data, HOUR)
+    assert decoded == track_archive._decode_python(data, HOUR)
+    assert len(decoded) == len(points)
+    for (s1, lat1, lon1, d1), (s2, lat2, lon2, d2) in zip(points, decoded):
+        assert s1 == s2 and d1 == d2
+        assert abs(lat1 - lat2) <= 0.5e-6 and abs(lon1 - lon2) <= 0.5e-6
+    assert track_archive.decode(b'', HOUR) == []
+
+    # A walk pinged every 5 seconds: about 5 bytes a point
+    walk = [(HOUR + 5 * i, 28.6 + i * 6e-5, 77.2 + i * 2e-5, 0) for i in range(720)]
+    size = len(track_archive.encode(walk, HOUR)) / len(walk)
+    assert size <= 6, size
+    print(f"✓ {len(points)} points round-trip, a walk takes {size:.1f} bytes a point")
+
+
+def _database(directory):
+    path = os.path.join(directory, 'test.db')
+    conn = sqlite3.connect(path)
+    sharding.ensure_schema(conn.cursor())
+    rows = []
+    for i in range(900):
+        # Three hours of user 1 every 12 seconds, with ties and a dwell; user 2 in between.
+        # Positions have six decimals, as archived points read back
+        moment = HOUR + 12 * i
+        rows.append((1, round(28.6 + i * 1e-5, 6), round(77.2 - i * 1e-5, 6), track_archive.to_text(moment), 30 if i % 50 == 0 else 0))
+        if i % 100 == 0:
+            rows.append((1, 28.7, 77.3, track_archive.to_text(moment), 0))
+            rows.append((2, 10.0, 10.0, track_archive.to_text(moment), 0))
+    rows.append((1, None, None, track_archive.to_text(HOUR + 60), 0))
+    conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude, timestamp, dwell_seconds) '
+                     'VALUES (?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    return conn
+
+
+def _read(conn, bbox=None):
+    start, end = track_archive.to_text(HOUR + 1800), track_archive.to_text(HOUR + 3 * 3600)
+    return (list(location_history.query_points(conn, 1, start, end, bbox)),
+            location_history.count_points(conn, 1, start, end, bbox))
+
+
+def test_archive_and_read():
+    """Test that history, export and replay read archived hours like rows"""
+    with tempfile.TemporaryDirectory() as directory:
+        conn = _database(directory)
+        bbox = (28.601, 77.0, 28.605, 77.5)
+        before = [_read(conn), _read(conn, bbox)]
+        exported = [row for page in export.pages(conn, 'locations', 1, page_size=64) for row in page]
+        replayed = anomaly.load_tracks(conn)
+
+        # The last hour is left: it ends after the cutoff
+        moved = track_archive.archive(conn, HOUR + 2 * 3600 + 100, batch=2)
+        assert moved == 600 + 6 + 6
+        assert conn.execute('SELECT COUNT(*) FROM location_archive').fetchone()[0] == 4
+        # The ping without a position stays a row
+        assert conn.execute('SELECT COUNT(*) FROM location_tracking WHERE latitude IS NULL').fetchone()[0] == 1
+
+        assert [_read(conn), _read(conn, bbox)] == before
+        assert before[0][1] == len(before[0][0]) and before[1][1] == len(before[1][0])
+        archived = [row for page in export.pages(conn, 'locations', 1, page_size=64) for row in page]
+        assert [row[1:] for row in archived] == [row[1:] for row in exported]
+        assert [row[0] for row in archived].count(None) == 600 + 6
+        assert anomaly.load_tracks(conn) == replayed
+
+        # A row stored late into an archived hour is read in order, and packed into the hour's blob next time
+        late = (1, 28.65, 77.25, track_archive.to_text(HOUR + 600 + 6))
+        conn.execute('INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) VALUES (?, ?, ?, ?)',
+                     late)
+        conn.commit()
+        points = [row[1:4] for rows in track_archive.hours(conn, 1) for row in rows]
+        assert points.index(late[1:]) == 53 and len(points) == len(exported) + 1
+        assert track_archive.archive(conn, HOUR + 2 * 3600 + 100) == 1
+        assert [row[1:4] for rows in track_archive.hours(conn, 1) for row in rows] == points
+        conn.close()
+        print(f"✓ {moved} pings archived and read back unchanged")
+
+
+def test_archive_job():
+    """Test the app's archive job and the history route over archived pings"""
+    import app as app_module
+    saved = app_module.DATABASE, app_module.app.config['STAFF_USER_IDS'], app_module.app.config['TRACK_ARCHIVE_HOURS']
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            conn = sqlite3.connect(app_module.DATABASE)
+            conn.executemany('INSERT INTO location_tracking (user_id, latitude, longitude, timestamp) '
+                             'VALUES (1, ?, 77.2, ?)',
+                             [(round(28.6 + i * 1e-4, 6), track_archive.to_text(HOUR + 60 * i)) for i in range(120)])
+            conn.commit()
+            conn.close()
+            app_module.app.config['STAFF_USER_IDS'] = {1}
+
+            with app_module.app.test_client() as client:
+                with client.session_transaction() as sess:
+                    sess['user_id'] = 1
+                url = f'/api/location/history?start={HOUR}&end={HOUR + 7200}'
+                expected = json.loads(client.get(url).data)
+                app_module.app.config['TRACK_ARCHIVE_HOURS'] = 1
+                app_module.archive_tracks()
+                conn = sqlite3.connect(app_module.DATABASE)
+                assert conn.execute('SELECT COUNT(*) FROM location_tracking').fetchone()[0] == 0
+                conn.close()
+                assert json.loads(client.get(url).data) == expected and expected['count'] == 120
+                assert json.loads(client.get('/api/admin/shards').data)[0]['locations'] == 120
+            print("✓ Archive job ran, history unchanged")
+        finally:
+            (app_module.DATABASE, app_module.app.config['STAFF_USER_IDS'],
+             app_module.app.config['TRACK_ARCHIVE_HOURS']) = saved
+
+
+def main():
+    """Run all tests"""
+    print("Testing Track Archive")
+    print("=" * 50)
+
+    tests = [
+        ("Encode Round Trip", test_encode_round_trip),
+        ("Archive And Read", test_archive_and_read),
+        ("Archive Job", test_archive_job),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script to verify boot-time warming of caches and indexes
+"""
+
+import sys
+import os
+import json
+import tempfile
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datasets
+import responders
+import responses
+import route_safety
+import shelter_capacity
+
+
+def test_warm_up_fills_caches():
+    """Test that warm-up loads shelters, tips and indexes the first requests then reuse"""
+    import app as app_module
+    saved = app_module.DATABASE
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            app_module.DATABASE = os.path.join(directory, 'test.db')
+            app_module.init_db()
+            responses.invalidate()
+            datasets.forget()
+            route_safety.grid = route_safety.SafetyGrid()
+            responders.index = responders.ResponderIndex()
+
+            timings = app_module.warm_up()
+            for step in ('templates', 'shelters', 'tips', 'assistant', 'route_safety', 'responders',
+                         'geofences', 'shelter_capacity', 'total'):
+                assert step in timings and timings[step] >= 0, step
+            assert timings['total'] >= sum(v for k, v in timings.items() if k != 'total')
+            shelters, tips = responses._cache['shelters'], responses._cache['tips']
+            assert route_safety.grid._last_complaint_ids is not None
+            assert responders.index._last_ping_ids is not None
+
+            with app_module.app.test_client() as client:
+                assert json.loads(client.get('/api/shelters').data)
+                assert json.loads(client.get('/api/tips').data)
+            # Served from the warmed payloads, not rebuilt
+            assert responses._cache['shelters'] is shelters and responses._cache['tips'] is tips
+
+            # A failing step is reported and the others still run
+            tips_payload = app_module.tips_payload
+            app_module.tips_payload = lambda: 1 / 0
+            try:
+                failed = app_module.warm_up()
+            finally:
+                app_module.tips_payload = tips_payload
+            assert 'tips' not in failed and 'shelters' in failed and 'geofences' in failed
+            print(f"✓ Warmed up in {timings['total'] * 1000:.0f}ms")
+        finally:
+            app_module.DATABASE = saved
+            shelter_capacity.close_all(remove=True)
+            responses.invalidate()
+            datasets.forget()
+            route_safety.grid = route_safety.SafetyGrid()
+            responders.index = responders.ResponderIndex()
+
+
+def test_assistant_index():
+    """Test that the compiled keyword index answers like a scan of the knowledge base"""
+    import app as app_module
+    assistant = app_module.AIAssistant()
+    queries = ['I need help now', 'how to file a complaint', 'safety tips for night travel',
+               'is there a women shelter nearby', 'my colleague at the office', 'hello there', 'thanks!',
+               'what does (this) do? [regex] *chars*', '']
+    queries += [keyword.upper() for data in assistant.knowledge_base.values() for keyword in data['keywords']]
+
+    for query in queries:
+        expected = None
+        for data in assistant.knowledge_base.values():
+            if any(keyword in query.lower() for keyword in data['keywords']):
+                expected = data['response']
+                break
+        assert assistant.get_response(query) == (expected or assistant.get_default_response(query)), query
+    assert assistant.build_index() is assistant.build_index()
+    print(f"✓ {len(queries)} queries answered from the index")
+
+
+def main():
+    """Run all tests"""
+    print("Testing Warm-up")
+    print("=" * 50)
+
+    tests = [
+        ("Warm-up Fills Caches", test_warm_up_fills_caches),
+        ("Assistant Index", test_assistant_index),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        print(f"\n{test_name}:")
+        try:
+            test_func()
+            passed += 1
+        except AssertionError as e:
+            print(f"✗ {test_name} failed! {e}")
+
+    print("\n" + "=" * 50)
+    print(f"Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,294 @@
+"""
+Women Security System - Scheduled Timers
+Server-side timers: fake calls that ring after a delay, and safe-walk
+check-ins ("check in by 10:30 pm or alert my contacts") that raise an alert
+unless the user cancels them in time.
+
+Timers are rows in the timers table, so they survive restarts. One worker
+fires them (a leader job in the alerts lane, see create_jobs() in app.py),
+keeping every pending timer id in a hierarchical timing wheel instead of
+polling the table for due rows. The wheel has LEVEL_BITS levels of buckets:
+level 0 holds the timers due in the next 256 ticks of RESOLUTION seconds, one
+bucket a tick, and each higher level holds 64 times longer spans. Adding and
+cancelling a timer is a dict insert or delete. A tick fires one level-0
+bucket; every 256 ticks the next level-1 bucket is spread over level 0, and so
+on up. Timers further out than the wheel's span (about two years) wait in an
+overflow bucket. Catching up after a pause skips the stretches in which
+nothing can come due.
+
+sync() adds timers created by any worker since the last call (the first call
+loads every pending one, which is the crash recovery). A timer cancelled
+through another worker stays in the firing worker's wheel until it comes
+due. Firing first marks due rows fired in one transaction, and only rows that
+were still pending are published. So a cancelled timer never fires, and a
+timer fires once even if two processes race.
+
+Fired timers are published to the alert queue: fake_call for fake calls,
+check_in_missed for missed check-ins. The app keeps the queue in the alerts
+table (see alerts.py), so the event reaches the user through whichever worker
+serves their next poll, not only the firing one. The app's fire_timers() also
+sends a missed check-in to the opted-in responders nearest the user's last
+position, if one was stored in the last CHECK_IN_POSITION_AGE seconds
+(check_in_missed_nearby). Emergency contacts are not notified: a user's
+emergency_contact is a free-text name, with no account or number to reach.
+"""
+
+import json
+import math
+import threading
+import time
+
+from alerts import alert_queue
+
+# Seconds per wheel tick: how late a timer may fire
+RESOLUTION = 1.0
+# Bits of tick number per level, lowest first: 256 ticks, then 64 buckets a level
+LEVEL_BITS = (8, 6, 6, 6)
+# Due timers marked fired per transaction
+FIRE_BATCH = 500
+
+FAKE_CALL_DELAY = 10
+MAX_FAKE_CALL_DELAY = 3600
+MAX_CHECK_IN_MINUTES = 24 * 60
+MAX_PENDING_PER_USER = 20
+# A missed check-in goes to responders near the user's last position if it is at most this old (seconds)
+CHECK_IN_POSITION_AGE = 3600
+
+# Timer kind -> alert kind published when it fires
+ALERT_KINDS = {'fake_call': 'fake_call', 'check_in': 'check_in_missed'}
+
+
+def ensure_schema(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS timers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            due_at REAL NOT NULL,
+            details TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            fired_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timers_pending ON timers (user_id, due_at) WHERE status = 'pending'")
+
+
+class TimingWheel:
+    """Timer ids by due tick; add(), cancel() and each tick of advance() are O(1)"""
+
+    def __init__(self, now, resolution=RESOLUTION, level_bits=LEVEL_BITS):
+        self.resolution = resolution
+        # (shift, upper shift, mask, buckets) of each level, lowest first
+        self._levels = []
+        shift = 0
+        for bits in level_bits:
+            self._levels.append((shift, shift + bits, (1 << bits) - 1, [{} for _ in range(1 << bits)]))
+            shift += bits
+        self._span_bits = shift
+        self._span_mask = (1 << shift) - 1
+        self._overflow = {}
+        self._ready = {}
+        # timer id -> the bucket holding it
+        self._where = {}
+        self._tick = math.floor(now / resolution)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, timer_id):
+        return timer_id in self._where
+
+    def add(self, timer_id, due_at):
+        """Schedule (or move) a timer to fire at the first tick at or after due_at"""
+        if timer_id in self._where:
+            self.cancel(timer_id)
+        self._place(timer_id, math.ceil(due_at / self.resolution))
+
+    def _place(self, timer_id, due):
+        current = self._tick
+        if due <= current:
+            bucket = self._ready
+        else:
+            bucket = self._overflow
+            for shift, upper, mask, buckets in self._levels:
+                # The lowest level whose span around the current tick holds the due tick
+                if due >> upper == current >> upper:
+                    bucket = buckets[(due >> shift) & mask]
+                    break
+        bucket[timer_id] = due
+        self._where[timer_id] = bucket
+
+    def cancel(self, timer_id):
+        """Remove a timer; returns False if it isn't in the wheel"""
+        bucket = self._where.pop(timer_id, None)
+        if bucket is None:
+            return False
+        del bucket[timer_id]
+        return True
+
+    def advance(self, now):
+        """Move to now; returns the ids of the timers that came due, earliest first"""
+        # Added when already due, in any order
+        fired = sorted(self._ready, key=self._ready.get)
+        self._take(self._ready)
+        target = math.floor(now / self.resolution)
+        first_mask, first_buckets = self._levels[0][2:]
+        while self._tick < target:
+            if not self._where:
+                # Nothing scheduled: no buckets to visit on the way
+                self._tick = target
+                break
+            if target - self._tick > first_mask:
+                # Catching up: skip ticks where nothing can come due
+                shift = self._idle_shift()
+                if shift:
+                    boundary = ((self._tick >> shift) + 1) << shift
+                    if boundary > target:
+                        self._tick = target
+                        break
+                    self._tick = boundary - 1
+            self._tick += 1
+            current = self._tick
+            if current & first_mask == 0:
+                self._cascade(current)
+                # Timers due on this very tick come down as ready
+                fired.extend(self._ready)
+                self._take(self._ready)
+            bucket = first_buckets[current & first_mask]
+            if bucket:
+                fired.extend(bucket)
+                self._take(bucket)
+        return fired
+
+    def _idle_shift(self):
+        # Nothing comes due before the next span of the lowest level holding timers
+        for shift, _, _, buckets in self._levels:
+            if any(buckets):
+                return shift
+        return self._span_bits
+
+    def _take(self, bucket):
+        for timer_id in bucket:
+            del self._where[timer_id]
+        bucket.clear()
+
+    def _cascade(self, current):
+        # Entering a new span of a level: spread its bucket for this span over the levels below,
+        # highest level first so what comes down can be spread further
+        if current & self._span_mask == 0 and self._overflow:
+            self._respread(self._overflow)
+        for shift, _, mask, buckets in reversed(self._levels[1:]):
+            if current & ((1 << shift) - 1) == 0:
+                bucket = buckets[(current >> shift) & mask]
+                if bucket:
+                    self._respread(bucket)
+
+    def _respread(self, bucket):
+        entries = list(bucket.items())
+        bucket.clear()
+        for timer_id, due in entries:
+            self._place(timer_id, due)
+
+
+class ScheduledTimers:
+    """Stored timers, and the wheel of the worker that fires them"""
+
+    def __init__(self, clock=time.time, publish=None, resolution=RESOLUTION):
+        self._clock = clock
+        self._publish = publish or alert_queue.publish
+        self._resolution = resolution
+        # Built by the first sync(), in the firing worker only
+        self.wheel = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    def create(self, conn, user_id, kind, due_at, details=None):
+        """Store a pending timer (the caller commits); returns {'id', 'kind', 'due_at'}"""
+        if kind not in ALERT_KINDS:
+            raise ValueError(f'Unknown timer kind: {kind}')
+        cursor = conn.execute('INSERT INTO timers (user_id, kind, due_at, details) VALUES (?, ?, ?, ?)',
+                              (user_id, kind, due_at, json.dumps(details) if details else None))
+        return {'id': cursor.lastrowid, 'kind': kind, 'due_at': due_at}
+
+    def pending(self, conn, user_id):
+        rows = conn.execute('''
+            SELECT id, kind, due_at, details FROM timers
+            WHERE user_id = ? AND status = 'pending' ORDER BY due_at
+        ''', (user_id,)).fetchall()
+        return [{'id': timer_id, 'kind': kind, 'due_at': due_at, **json.loads(details or '{}')}
+                for timer_id, kind, due_at, details in rows]
+
+    def cancel(self, conn, user_id, timer_id):
+        """Cancel a user's pending timer (the caller commits); returns False if there was none"""
+        cancelled = conn.execute('''
+            UPDATE timers SET status = 'cancelled' WHERE id = ? AND user_id = ? AND status = 'pending'
+        ''', (timer_id, user_id)).rowcount
+        if cancelled:
+            with self._lock:
+                if self.wheel is not None:
+                    self.wheel.cancel(timer_id)
+        return bool(cancelled)
+
+    def sync(self, conn):
+        """Add timers created since the last sync to the wheel; the first call loads every pending one"""
+        with self._lock:
+            if self.wheel is None:
+                self.wheel = TimingWheel(self._clock(), self._resolution)
+                # Read first: a timer created in between is loaded twice, which add() allows
+                self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM timers').fetchone()[0]
+                rows = conn.execute("SELECT id, due_at FROM timers WHERE status = 'pending'")
+            else:
+                rows = conn.execute("SELECT id, due_at FROM timers WHERE id > ? AND status = 'pending'",
+                                    (self._last_id,))
+            for timer_id, due_at in rows:
+                self.wheel.add(timer_id, due_at)
+                if timer_id > self._last_id:
+                    self._last_id = timer_id
+
+    def fire_due(self, connect, now=None):
+        """Fire every timer due by now into the alert queue; returns the published events"""
+        now = self._clock() if now is None else now
+        events = []
+        conn = connect()
+        try:
+            self.sync(conn)
+            with self._lock:
+                due = self.wheel.advance(now)
+            for start in range(0, len(due), FIRE_BATCH):
+                try:
+                    rows = self._claim(conn, due[start:start + FIRE_BATCH], now)
+                except Exception:
+                    # Fire them on the next call instead
+                    with self._lock:
+                        for timer_id in due[start:]:
+                            self.wheel.add(timer_id, now)
+                    raise
+                for timer_id, user_id, kind, due_at, details in rows:
+                    events.append(self._publish(user_id, ALERT_KINDS[kind], timer_id=timer_id, due_at=due_at,
+                                                late_seconds=round(max(now - due_at, 0), 3),
+                                                **json.loads(details or '{}')))
+        finally:
+            conn.close()
+        return events
+
+    def _claim(self, conn, timer_ids, now):
+        # Mark the due timers fired; only those still pending (not cancelled) are returned
+        marks = ','.join('?' * len(timer_ids))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(f'''
+                SELECT id, user_id, kind, due_at, details FROM timers
+                WHERE id IN ({marks}) AND status = 'pending' ORDER BY due_at, id
+            ''', timer_ids).fetchall()
+            conn.execute(f"UPDATE timers SET status = 'fired', fired_at = ? WHERE id IN ({marks}) AND status = 'pending'",
+                         [now] + timer_ids)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return rows
+
+
+scheduled = ScheduledTimers()
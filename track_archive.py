@@ -0,0 +1,253 @@
+"""
+Women Security System - Track Archive
+Packs a user's location pings into one BLOB per user-hour once they are
+ARCHIVE_AFTER old (a leader job, see create_jobs() in app.py), instead of a
+row per ping plus its entry in idx_location_user_time.
+
+A blob is four varints a point, in time order: seconds since the previous
+point (the first: since the hour started), latitude and longitude in
+millionths of a degree (about 11 cm) as differences from the previous point
+(the first: from 0), and dwell seconds (see ping_filter.py). Values are
+zigzag encoded (0, -1, 1, -2 -> 0, 1, 2, 3) and written 7 bits a byte, so a
+ping a few seconds and meters from the previous one takes 4-6 bytes. Ping
+ids are not kept: archived points read back with id None.
+
+Readers (location_history.py, export.py) walk a user's hours in time order
+with hours(). Each hour is read by one statement returning its blob and any
+rows still in the table, so an hour archived while a read is under way is
+seen either as rows or as its blob, never as neither or both. With numpy
+installed blobs are decoded with array operations; otherwise a Python loop
+gives the same points.
+"""
+
+import heapq
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HOUR = 3600
+# Fixed-point units per degree
+SCALE = 1_000_000
+# Pings are archived once they are this many seconds old
+ARCHIVE_AFTER = 48 * 3600
+# User-hours packed per transaction
+ARCHIVE_BATCH = 200
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Only rows whose position and time can be encoded are archived
+_PACKABLE = '''
+    typeof(latitude) IN ('real', 'integer') AND typeof(longitude) IN ('real', 'integer')
+    AND strftime('%s', timestamp) IS NOT NULL
+'''
+_NO_MAX_ID = 2 ** 63 - 1
+# 'MM:SS' of every second of an hour: archived timestamps are the hour's prefix plus one of these
+_MINUTE_SECONDS = [f'{second // 60:02d}:{second % 60:02d}' for second in range(HOUR)]
+
+# The first hour at or after a time holding archived or stored points
+NEXT_HOUR = '''
+    SELECT MIN(hour) FROM (
+        SELECT MIN(hour) AS hour FROM location_archive WHERE user_id = ? AND hour >= ?
+        UNION ALL
+        SELECT CAST(strftime('%s', MIN(timestamp)) AS INTEGER) / 3600 * 3600 FROM location_tracking
+        WHERE user_id = ? AND timestamp >= ? AND id <= ?
+    )
+'''
+# One hour: the blob first (NULL timestamp), then the rows in time order
+HOUR_POINTS = '''
+    SELECT NULL, data, NULL, NULL, NULL FROM location_archive WHERE user_id = ? AND hour = ?
+    UNION ALL
+    SELECT id, latitude, longitude, timestamp, {dwell} FROM location_tracking
+    WHERE user_id = ? AND timestamp >= ? AND timestamp < ? AND id <= ?
+    ORDER BY {order}
+'''
+
+
+def ensure_schema(cursor):
+    """Create the archive table; run on every shard next to location_tracking"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS location_archive (
+            user_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            point_count INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (user_id, hour)
+        )
+    ''')
+
+
+def to_text(seconds):
+    """Unix seconds -> the UTC text format used by location_tracking"""
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def to_seconds(text):
+    return int(datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp())
+
+
+# Encoding
+def encode(points, hour):
+    """Blob for (unix seconds, latitude, longitude, dwell seconds) points of one hour, in time order"""
+    out = bytearray()
+    last_time, last_lat, last_lon = hour, 0, 0
+    for seconds, latitude, longitude, dwell in points:
+        lat, lon = round(latitude * SCALE), round(longitude * SCALE)
+        for value in (seconds - last_time, lat - last_lat, lon - last_lon, dwell or 0):
+            value = value * 2 if value >= 0 else -2 * value - 1
+            while value > 0x7f:
+                out.append(value & 0x7f | 0x80)
+                value >>= 7
+            out.append(value)
+        last_time, last_lat, last_lon = seconds, lat, lon
+    return bytes(out)
+
+
+def _decode_numpy(data, hour):
+    raw = np.frombuffer(data, dtype=np.uint8)
+    # Each varint ends at a byte below 0x80; its bytes hold 7 bits each, lowest first
+    ends = raw < 0x80
+    starts = np.flatnonzero(np.concatenate(([True], ends[:-1])))
+    lengths = np.diff(np.append(starts, len(raw)))
+    shifts = (np.arange(len(raw)) - np.repeat(starts, lengths)) * 7
+    values = np.bitwise_or.reduceat((raw & 0x7f).astype(np.int64) << shifts, starts)
+    columns = ((values >> 1) ^ -(values & 1)).reshape(-1, 4)
+    times = hour + np.cumsum(columns[:, 0])
+    lats = np.cumsum(columns[:, 1]) / SCALE
+    lons = np.cumsum(columns[:, 2]) / SCALE
+    return list(zip(times.tolist(), lats.tolist(), lons.tolist(), columns[:, 3].tolist()))
+
+
+def _decode_python(data, hour):
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append((value >> 1) ^ -(value & 1))
+            value = shift = 0
+    points = []
+    seconds, lat, lon = hour, 0, 0
+    for i in range(0, len(values), 4):
+        seconds += values[i]
+        lat += values[i + 1]
+        lon += values[i + 2]
+        points.append((seconds, lat / SCALE, lon / SCALE, values[i + 3]))
+    return points
+
+
+def decode(data, hour):
+    """(unix seconds, latitude, longitude, dwell seconds) points of a blob"""
+    if not data:
+        return []
+    if np is not None:
+        return _decode_numpy(data, hour)
+    return _decode_python(data, hour)
+
+
+# Reading
+def hours(conn, user_id, start=None, end=None, max_id=None, exact=False):
+    """Generator of a user's points hour by hour, in time order, as lists of
+    (id, latitude, longitude, timestamp, dwell seconds); id is None for archived points.
+
+    start and end are inclusive UTC texts; rows with ids above max_id are left out.
+    exact=True reads dwell_seconds and orders rows of the same second by id, as
+    exports need; otherwise rows are read from the covering index alone, with dwell 0.
+    """
+    max_id = _NO_MAX_ID if max_id is None else max_id
+    if exact:
+        query = HOUR_POINTS.format(dwell='dwell_seconds', order='4, 1')
+    else:
+        query = HOUR_POINTS.format(dwell='0', order='4')
+    first = 0 if start is None else to_seconds(start)
+    last = None if end is None else to_seconds(end)
+    hour = first - first % HOUR
+    while last is None or hour <= last:
+        hour = conn.execute(NEXT_HOUR, (user_id, hour, user_id, to_text(hour), max_id)).fetchone()[0]
+        if hour is None or (last is not None and hour > last):
+            return
+        rows = conn.execute(query, (user_id, hour, user_id, to_text(hour), to_text(hour + HOUR), max_id)).fetchall()
+        if rows and rows[0][3] is None:
+            prefix = to_text(hour)[:-5]
+            archived = [(None, latitude, longitude, prefix + _MINUTE_SECONDS[seconds - hour], stay)
+                        for seconds, latitude, longitude, stay in decode(rows[0][1], hour)]
+            # Rows left in an archived hour are rare: stored late, or copied in by a restore
+            rows = list(heapq.merge(archived, rows[1:], key=lambda row: row[3])) if len(rows) > 1 else archived
+        if hour < first or (last is not None and hour + HOUR > last + 1):
+            rows = [row for row in rows if (start is None or row[3] >= start) and (end is None or row[3] <= end)]
+        if rows:
+            yield rows
+        hour += HOUR
+
+
+def count_points(conn, user_id, start, end, bbox=None):
+    """Archived points of a user from start to end: whole hours by their count, others decoded"""
+    first, last = to_seconds(start), to_seconds(end)
+    total = 0
+    for hour, point_count, data in conn.execute('''
+        SELECT hour, point_count, CASE WHEN ? OR hour < ? OR hour + 3600 > ? + 1 THEN data END
+        FROM location_archive WHERE user_id = ? AND hour > ? AND hour <= ?
+    ''', (bbox is not None, first, last, user_id, first - HOUR, last)):
+        if data is None:
+            total += point_count
+            continue
+        for seconds, latitude, longitude, _ in decode(data, hour):
+            if first <= seconds <= last and (bbox is None or (bbox[0] <= latitude <= bbox[2] and
+                                                              bbox[1] <= longitude <= bbox[3])):
+                total += 1
+    return total
+
+
+def all_points(conn, user_id=None):
+    """(user_id, latitude, longitude, unix seconds) of every archived point, by user and time"""
+    where, params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+    points = []
+    for owner, hour, data in conn.execute(f'SELECT user_id, hour, data FROM location_archive {where} '
+                                          f'ORDER BY user_id, hour', params):
+        points.extend((owner, latitude, longitude, seconds) for seconds, latitude, longitude, _ in decode(data, hour))
+    return points
+
+
+# Archiving
+def archive(conn, before, batch=ARCHIVE_BATCH):
+    """Move pings stored before the hour holding before (unix seconds) into hour blobs; returns points moved"""
+    cutoff = to_text(before - before % HOUR)
+    moved = 0
+    while True:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            user_hours = conn.execute(f'''
+                SELECT DISTINCT user_id, CAST(strftime('%s', timestamp) AS INTEGER) / 3600 * 3600
+                FROM location_tracking WHERE timestamp < ? AND {_PACKABLE} LIMIT ?
+            ''', (cutoff, batch)).fetchall()
+            for user_id, hour in user_hours:
+                moved += _pack(conn, user_id, hour)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if len(user_hours) < batch:
+            return moved
+
+
+def _pack(conn, user_id, hour):
+    # Merge the hour's rows into its blob (usually there is none yet) and delete them
+    bounds = (user_id, to_text(hour), to_text(hour + HOUR))
+    rows = conn.execute(f'''
+        SELECT CAST(strftime('%s', timestamp) AS INTEGER), latitude, longitude, dwell_seconds
+        FROM location_tracking
+        WHERE user_id = ? AND timestamp >= ? AND timestamp < ? AND {_PACKABLE}
+        ORDER BY timestamp, id
+    ''', bounds).fetchall()
+    existing = conn.execute('SELECT data FROM location_archive WHERE user_id = ? AND hour = ?',
+                            (user_id, hour)).fetchone()
+    points = list(heapq.merge(decode(existing[0], hour), rows, key=lambda p: p[0])) if existing else rows
+    conn.execute('INSERT OR REPLACE INTO location_archive (user_id, hour, point_count, data) VALUES (?, ?, ?, ?)',
+                 (user_id, hour, len(points), encode(points, hour)))
+    conn.execute(f'''
+        DELETE FROM location_tracking WHERE user_id = ? AND timestamp >= ? AND timestamp < ? AND {_PACKABLE}
+    ''', bounds)
+    return len(rows)